@@ -48,6 +48,23 @@ osapi_opts = [
     cfg.StrOpt('osapi_glance_link_prefix',
                help='Base URL that will be presented to users in links '
                     'to glance resources'),
+    cfg.BoolOpt('osapi_pagination_token',
+                default=False,
+                help='Use an opaque token holding the sort values of the '
+                     'last server, instead of its UUID, as the marker of '
+                     'the next link of the server lists. This saves looking '
+                     'the marker up when getting the next page. UUID '
+                     'markers are still accepted. This is ignored with '
+                     'cells.'),
+    cfg.IntOpt('osapi_stream_chunk_size',
+               default=0,
+               min=0,
+               help='Number of servers fetched from the database and '
+                    'serialized at a time when listing servers. Lists which '
+                    'may hold more servers than this are streamed chunk by '
+                    'chunk, which bounds the memory used by the API for '
+                    'large values of osapi_max_limit and sends the first '
+                    'servers sooner. 0 disables streaming.'),
 ]
 CONF = cfg.CONF
 CONF.register_opts(osapi_opts)
@@ -432,6 +449,15 @@ class ViewBuilder(object):
                                             collection_name),
         }]
 
+    def _get_marker(self, request, item, id_key):
+        """Return the marker of the next link following an item."""
+        if id_key in item:
+            return item[id_key]
+        elif 'id' in item:
+            return item["id"]
+        else:
+            return item["flavorid"]
+
     def _get_next_link(self, request, identifier, collection_name):
         """Return href string with proper limit and marker params."""
         params = request.params.copy()
@@ -471,18 +497,22 @@ class ViewBuilder(object):
         3) 'limit' param is NOT specified but the number of items is
         CONF.osapi_max_limit.
         """
+        last_item = items[-1] if items else None
+        return self._get_collection_links_after(request, len(items),
+                                                last_item, collection_name,
+                                                id_key)
+
+    def _get_collection_links_after(self, request, count, last_item,
+                                    collection_name, id_key="uuid"):
+        """Retrieve 'next' link of a collection from its number of items
+        and its last item, see _get_collection_links.
+        """
         links = []
         max_items = min(
             int(request.params.get("limit", CONF.osapi_max_limit)),
             CONF.osapi_max_limit)
-        if max_items and max_items == len(items):
-            last_item = items[-1]
-            if id_key in last_item:
-                last_item_id = last_item[id_key]
-            elif 'id' in last_item:
-                last_item_id = last_item["id"]
-            else:
-                last_item_id = last_item["flavorid"]
+        if max_items and max_items == count:
+            last_item_id = self._get_marker(request, last_item, id_key)
             links.append({
                 "rel": "next",
                 "href": self._get_next_link(request,
@@ -42,6 +42,7 @@ from nova.i18n import _
 from nova.i18n import _LW
 from nova.image import glance
 from nova import objects
+from nova.objects import instance as instance_obj
 from nova import utils
 
 ALIAS = 'servers'
@@ -383,18 +384,38 @@ class ServersController(wsgi.Controller):
         limit, marker = common.get_limit_and_marker(req)
         sort_keys, sort_dirs = common.get_sort_params(req.params)
 
-        expected_attrs = ['pci_devices']
         if is_detail:
             # merge our expected attrs with what the view builder needs for
             # showing details
             expected_attrs = self._view_builder.get_show_expected_attrs(
-                                                                expected_attrs)
-
+                                                            ['pci_devices'])
+            fields = None
+        else:
+            # only load what the view builder needs for the index
+            expected_attrs = []
+            fields = self._view_builder.get_index_fields()
+
+        def get_all(limit, marker):
+            # The instances are only read to build the response, so they
+            # are kept in their compact form.
+            return instance_obj.compact_instances(self.compute_api.get_all(
+                elevated or context, search_opts=search_opts,
+                limit=limit, marker=marker, want_objects=True,
+                expected_attrs=expected_attrs, sort_keys=sort_keys,
+                sort_dirs=sort_dirs, fields=fields))
+
+        # NOTE: Filtering on IP addresses happens after the instances are
+        # fetched, so the lists filtered that way are never streamed as a
+        # chunk could come short of servers while more are left. The first
+        # chunk is fetched here, so that a bad marker or filter is still
+        # reported with an error status.
+        chunk_size = CONF.osapi_stream_chunk_size
+        stream = (chunk_size and limit > chunk_size and
+                  req.streaming_allowed and
+                  'ip' not in search_opts and 'ip6' not in search_opts)
         try:
-            instance_list = self.compute_api.get_all(elevated or context,
-                    search_opts=search_opts, limit=limit, marker=marker,
-                    want_objects=True, expected_attrs=expected_attrs,
-                    sort_keys=sort_keys, sort_dirs=sort_dirs)
+            instance_list = get_all(limit=chunk_size if stream else limit,
+                                    marker=marker)
         except exception.MarkerNotFound:
             msg = _('marker [%s] not found') % marker
             raise exc.HTTPBadRequest(explanation=msg)
@@ -403,6 +424,18 @@ class ServersController(wsgi.Controller):
                       search_opts['flavor'])
             instance_list = objects.InstanceList()
 
+        if stream and len(instance_list) == chunk_size:
+            instance_lists = self._get_instance_chunks(
+                req, get_all, instance_list, limit, is_detail)
+            if is_detail:
+                chunks, trailer = self._view_builder.detail_chunks(
+                    req, instance_lists)
+            else:
+                chunks, trailer = self._view_builder.index_chunks(
+                    req, instance_lists)
+            return wsgi.StreamingResponseObject('servers', next(chunks),
+                                                chunks, trailer)
+
         if is_detail:
             instance_list.fill_faults()
             response = self._view_builder.detail(req, instance_list)
@@ -411,6 +444,31 @@ class ServersController(wsgi.Controller):
         req.cache_db_instances(instance_list)
         return response
 
+    @staticmethod
+    def _get_instance_chunks(req, get_all, instance_list, limit, is_detail):
+        """Yields the instances of a streamed list of servers by chunks.
+
+        :param req: HTTP request. The instances of each chunk are cached in
+            this request in place of those of the previous chunk.
+        :param get_all: Function getting the instances from a marker
+        :param instance_list: The first chunk of instances
+        :param limit: Maximum number of instances to list
+        :param is_detail: True if the details of the instances are shown
+        """
+        chunk_size = CONF.osapi_stream_chunk_size
+        remaining = limit
+        while True:
+            if is_detail:
+                instance_list.fill_faults()
+            req.uncache_db_items('instances')
+            req.cache_db_instances(instance_list)
+            yield instance_list
+            remaining -= len(instance_list)
+            if len(instance_list) < chunk_size or not remaining:
+                return
+            instance_list = get_all(limit=min(chunk_size, remaining),
+                                    marker=instance_list[-1].uuid)
+
     def _get_server(self, context, req, instance_uuid, is_detail=False):
         """Utility function for looking up an instance by uuid.
 
@@ -16,6 +16,7 @@
 
 import hashlib
 
+from oslo_config import cfg
 from oslo_log import log as logging
 
 from nova.api.openstack import api_version_request
@@ -23,10 +24,13 @@ from nova.api.openstack import common
 from nova.api.openstack.compute.views import addresses as views_addresses
 from nova.api.openstack.compute.views import flavors as views_flavors
 from nova.api.openstack.compute.views import images as views_images
+from nova import db
 from nova.i18n import _LW
 from nova.objects import base as obj_base
 from nova import utils
 
+CONF = cfg.CONF
+CONF.import_opt('enable', 'nova.cells.opts', group='cells')
 
 LOG = logging.getLogger(__name__)
 
@@ -84,6 +88,14 @@ class ViewBuilder(common.ViewBuilder):
             },
         }
 
+    def get_index_fields(self):
+        """Returns the list of instance fields used by index
+
+        This should be used when getting the instances from the database for
+        the index, so that only these fields are loaded.
+        """
+        return ['uuid', 'display_name']
+
     def get_show_expected_attrs(self, expected_attrs=None):
         """Returns a list of lazy-loadable expected attributes used by show
 
@@ -170,6 +182,58 @@ class ViewBuilder(common.ViewBuilder):
 
         return servers_dict
 
+    def index_chunks(self, request, instance_lists):
+        """Show a list of servers without many details, chunk by chunk."""
+        coll_name = self._collection_name
+        return self._list_view_chunks(self.basic, request, instance_lists,
+                                      coll_name)
+
+    def detail_chunks(self, request, instance_lists):
+        """Detailed view of a list of instances, chunk by chunk."""
+        coll_name = self._collection_name + '/detail'
+        return self._list_view_chunks(self.show, request, instance_lists,
+                                      coll_name)
+
+    def _list_view_chunks(self, func, request, instance_lists, coll_name):
+        """Provide a view for a list of servers coming in chunks.
+
+        This is the counterpart of _list_view for lists which are streamed,
+        where only a chunk of the servers is held in memory at a time.
+
+        :param func: Function used to format the server data
+        :param request: API request
+        :param instance_lists: Iterable of the lists of servers of each chunk
+        :param coll_name: Name of collection, used to generate the next link
+                          for a pagination query
+        :returns: A tuple of an iterator of the server data of each chunk in
+                  dictionary format, and of a function returning the rest of
+                  the server data once the iterator is exhausted
+        """
+        seen = {'count': 0, 'last': None}
+
+        def _chunks():
+            for servers in instance_lists:
+                if servers:
+                    seen['count'] += len(servers)
+                    seen['last'] = servers[-1]
+                yield dict(servers=[func(request, server)["server"]
+                                    for server in servers])
+
+        def _trailer():
+            servers_links = self._get_collection_links_after(
+                request, seen['count'], seen['last'], coll_name)
+            if servers_links:
+                return dict(servers_links=servers_links)
+            return {}
+
+        return _chunks(), _trailer
+
+    def _get_marker(self, request, item, id_key):
+        if CONF.osapi_pagination_token and not CONF.cells.enable:
+            sort_keys, sort_dirs = common.get_sort_params(request.params)
+            return db.instance_pagination_token(item, sort_keys, sort_dirs)
+        return super(ViewBuilder, self)._get_marker(request, item, id_key)
+
     @staticmethod
     def _get_metadata(instance):
         # FIXME(danms): Transitional support for objects
@@ -27,6 +27,7 @@ import webob
 
 from nova.api.openstack import api_version_request as api_version
 from nova.api.openstack import versioned_method
+from nova.db import profiler as db_profiler
 from nova import exception
 from nova import i18n
 from nova.i18n import _
@@ -94,6 +95,10 @@ class Request(wsgi.Request):
         self._extension_data = {'db_items': {}}
         if not hasattr(self, 'api_version_request'):
             self.api_version_request = api_version.APIVersionRequest()
+        if not hasattr(self, 'streaming_allowed'):
+            # Cleared by the resource when an extension of the method can
+            # only process the response once
+            self.streaming_allowed = True
 
     def cache_db_items(self, key, items, item_key='id'):
         """Allow API methods to store objects from a DB query to be
@@ -107,6 +112,12 @@ class Request(wsgi.Request):
         for item in items:
             db_items[item[item_key]] = item
 
+    def uncache_db_items(self, key):
+        """Forget the objects stored for a key, so that those of the next
+        chunk of a streamed response can take their place.
+        """
+        self._extension_data['db_items'].pop(key, None)
+
     def get_db_items(self, key):
         """Allow an API extension to get previously stored objects within
         the same API request.
@@ -486,6 +497,111 @@ class ResponseObject(object):
         return self._headers.copy()
 
 
+class StreamingResponseObject(ResponseObject):
+    """A response object for a collection serialized chunk by chunk.
+
+    The items of the collection come in chunks, each being a dict holding
+    a list of items under the collection name. The first chunk is the
+    wrapped object, so that the extensions of the method process it like
+    any other response and can still turn it into a fault. The extensions
+    then process each following chunk as it is produced, while the body
+    is being sent, and the keys of the dict returned by trailer are
+    appended to the body once all the chunks have been sent.
+
+    Only the first chunk and the one being serialized are held in memory.
+    The body is sent without a Content-Length, and is cut short if
+    producing a chunk after the first one fails or if an extension fails
+    on it. Controllers must only return this object if the
+    streaming_allowed attribute of the request is set, as the generator
+    extensions can't process more than one chunk.
+    """
+
+    def __init__(self, collection_name, first_chunk, chunks, trailer=None,
+                 code=None, headers=None, **serializers):
+        super(StreamingResponseObject, self).__init__(
+            first_chunk, code=code, headers=headers, **serializers)
+        self.collection_name = collection_name
+        self.chunks = chunks
+        self.trailer = trailer
+        # Set by the resource to run the post-processing extensions on a
+        # ResponseObject wrapping a chunk
+        self.post_process = None
+
+    def _post_process_chunk(self, chunk):
+        """Run the post-processing extensions on a chunk.
+
+        Returns False if one of them failed.
+        """
+        if self.post_process is None:
+            return True
+        chunk_obj = ResponseObject(chunk)
+        chunk_obj.media_type = self.media_type
+        chunk_obj.serializer = self.serializer
+        response = self.post_process(chunk_obj)
+        if response is not None:
+            LOG.error(_LE("Extension failed on a chunk of the %(name)s "
+                          "collection, cutting the response short: "
+                          "%(response)s"),
+                      {'name': self.collection_name, 'response': response})
+            return False
+        return True
+
+    def _iter_body(self, serializer):
+        name = self.collection_name
+        yield utils.utf8('{%s: [' % serializer.serialize(name))
+        separator = ''
+        chunk = self.obj
+        chunks = iter(self.chunks)
+        while True:
+            items = chunk[name]
+            if items:
+                yield utils.utf8(separator + ', '.join(
+                    serializer.serialize(item) for item in items))
+                separator = ', '
+            try:
+                chunk = next(chunks)
+            except StopIteration:
+                break
+            except Exception:
+                # The status and the headers are sent already, so the
+                # error can only be logged
+                LOG.exception(_LE("Failed to get a chunk of the %s "
+                                  "collection, cutting the response "
+                                  "short"), name)
+                return
+            if not self._post_process_chunk(chunk):
+                # Leave the body unterminated so that it can't be mistaken
+                # for the complete collection
+                return
+        yield utils.utf8(']')
+        trailer = self.trailer() if self.trailer is not None else {}
+        for key, value in trailer.items():
+            yield utils.utf8(', %s: %s' % (serializer.serialize(key),
+                                          serializer.serialize(value)))
+        yield utils.utf8('}')
+
+    def serialize(self, request, content_type, default_serializers=None):
+        """Serializes the wrapped collection.
+
+        Returns a webob.Response object whose body is produced as it is
+        sent.
+        """
+
+        if self.serializer:
+            serializer = self.serializer
+        else:
+            _mtype, _serializer = self.get_serializer(content_type,
+                                                      default_serializers)
+            serializer = _serializer()
+
+        response = webob.Response(app_iter=self._iter_body(serializer))
+        response.status_int = self.code
+        for hdr, value in self._headers.items():
+            response.headers[hdr] = utils.utf8(value)
+        response.headers['Content-Type'] = utils.utf8(content_type)
+        return response
+
+
 def action_peek_json(body):
     """Determine action to invoke."""
 
@@ -767,8 +883,11 @@ class Resource(wsgi.Application):
         #            function.  If we try to audit __call__(), we can
         #            run into troubles due to the @webob.dec.wsgify()
         #            decorator.
-        return self._process_stack(request, action, action_args,
-                               content_type, body, accept)
+        operation = '%s %s.%s' % (request.method,
+                                  type(self.controller).__name__, action)
+        with db_profiler.Operation(operation):
+            return self._process_stack(request, action, action_args,
+                                       content_type, body, accept)
 
     def _process_stack(self, request, action, action_args,
                        content_type, body, accept):
@@ -829,6 +948,11 @@ class Resource(wsgi.Application):
         # Run pre-processing extensions
         response, post = self.pre_process_extensions(extensions,
                                                      request, action_args)
+        post = list(post)
+        # A generator extension runs its post-processing once, so it
+        # can't process the chunks of a streamed response
+        request.streaming_allowed = not any(inspect.isgenerator(ext)
+                                            for ext in post)
 
         if not response:
             try:
@@ -860,6 +984,15 @@ class Resource(wsgi.Application):
                 # Process post-processing extensions
                 response = self.post_process_extensions(post, resp_obj,
                                                         request, action_args)
+                if isinstance(resp_obj, StreamingResponseObject):
+                    # The following chunks are processed as they are
+                    # sent, by the extensions which are plain functions
+                    # and so can be called again for each of them
+                    chunk_post = [ext for ext in post
+                                  if not inspect.isgenerator(ext)]
+                    resp_obj.post_process = functools.partial(
+                        self.post_process_extensions, chunk_post,
+                        request=request, action_args=action_args)
 
             if resp_obj and not response:
                 response = resp_obj.serialize(request, accept,
@@ -55,8 +55,10 @@
 from __future__ import print_function
 
 import argparse
+import glob
 import os
 import sys
+import time
 import urllib
 
 import decorator
@@ -65,6 +67,7 @@ from oslo_config import cfg
 from oslo_db import exception as db_exc
 from oslo_log import log as logging
 import oslo_messaging as messaging
+from oslo_serialization import jsonutils
 from oslo_utils import importutils
 import six
 
@@ -74,12 +77,15 @@ from nova import config
 from nova import context
 from nova import db
 from nova.db import migration
+from nova.db import profiler as db_profiler
 from nova import exception
 from nova.i18n import _
 from nova import objects
 from nova.openstack.common import cliutils
 from nova import quota
 from nova import rpc
+from nova.scheduler import profiler
+from nova.scheduler import rpcapi as scheduler_rpcapi
 from nova import servicegroup
 from nova import utils
 from nova import version
@@ -920,6 +926,37 @@ class HostCommands(object):
             print("%-25s\t%-15s" % (h['host'], h['availability_zone']))
 
 
+class SchedulerCommands(object):
+    """Class for inspecting the schedulers."""
+
+    @args('--kind', metavar='<stage|filter|weigher>',
+          help='Only show this kind of records')
+    def profile(self, kind=None):
+        """Show the time spent by a scheduler in each stage, filter and
+        weigher over the requests it profiled. scheduler_profiling must be
+        set on the scheduler. The percentiles are bucket upper bounds.
+        """
+        ctxt = context.get_admin_context()
+        stats = scheduler_rpcapi.SchedulerAPI().get_profile_stats(ctxt)
+        print(_("Profiled requests: %d") % stats.pop('requests'))
+        fmt = "%-8s %-36s %8s %10s %8s %8s %10s %10s %10s"
+        print(fmt % (_('Kind'), _('Name'), _('Count'), _('Mean ms'),
+                     _('p50 ms'), _('p99 ms'), _('Hosts in'), _('Hosts out'),
+                     _('DB queries')))
+        for record_kind in ('stage', 'filter', 'weigher'):
+            if kind and kind != record_kind:
+                continue
+            for name, histogram in sorted(
+                    six.iteritems(stats.get(record_kind, {}))):
+                print(fmt % (record_kind, name, histogram['count'],
+                             '%.2f' % (histogram['sum_ms'] /
+                                       max(1, histogram['count'])),
+                             profiler.percentile_ms(histogram, 50),
+                             profiler.percentile_ms(histogram, 99),
+                             histogram['hosts_in'], histogram['hosts_out'],
+                             histogram['db_queries']))
+
+
 class DbCommands(object):
     """Class for managing the main database."""
 
@@ -939,7 +976,22 @@ class DbCommands(object):
             help='Maximum number of deleted rows to archive')
     @args('--verbose', action='store_true', dest='verbose', default=False,
           help='Print how many rows were archived per table.')
-    def archive_deleted_rows(self, max_rows, verbose=False):
+    @args('--until-complete', action='store_true', dest='until_complete',
+          default=False,
+          help='Archive batches of max_rows rows, 1000 by default, until no '
+               'deleted rows are left, printing the progress.')
+    @args('--workers', metavar='<number>', default=1,
+          help='Number of tables not depending on each other archived '
+               'concurrently.')
+    @args('--sleep', metavar='<seconds>', default=0,
+          help='Seconds to wait between two batches, to limit the '
+               'replication lag.')
+    @args('--marks-file', metavar='<path>', dest='marks_file',
+          help='File keeping where the archiving of each table stopped, so '
+               'that the next run resumes from there.')
+    def archive_deleted_rows(self, max_rows, verbose=False,
+                             until_complete=False, workers=1, sleep=0,
+                             marks_file=None):
         """Move up to max_rows deleted rows from production tables to shadow
         tables.
         """
@@ -948,7 +1000,51 @@ class DbCommands(object):
             if max_rows < 0:
                 print(_("Must supply a positive value for max_rows"))
                 return(1)
-        table_to_rows_archived = db.archive_deleted_rows(max_rows)
+        elif until_complete:
+            max_rows = 1000
+        workers = int(workers)
+        if workers < 1:
+            print(_("Must supply a positive value for workers"))
+            return(1)
+        sleep = float(sleep)
+
+        marks = None
+        if marks_file:
+            marks = {}
+            if os.path.exists(marks_file):
+                with open(marks_file) as f:
+                    marks = jsonutils.loads(f.read())
+        elif until_complete:
+            marks = {}
+
+        table_to_rows_archived = {}
+        total_rows_archived = 0
+        start = time.time()
+        while True:
+            full_pass = not marks
+            results = db.archive_deleted_rows(max_rows, marks=marks,
+                                              workers=workers)
+            for tablename, rows in six.iteritems(results):
+                table_to_rows_archived[tablename] = (
+                    table_to_rows_archived.get(tablename, 0) + rows)
+                total_rows_archived += rows
+            if marks_file:
+                with open(marks_file, 'w') as f:
+                    f.write(jsonutils.dumps(marks))
+            if not until_complete:
+                break
+            elapsed = time.time() - start
+            print(_("Archived %(rows)d rows in %(elapsed).1f seconds "
+                    "(%(rate).1f rows/sec)") %
+                  {'rows': total_rows_archived, 'elapsed': elapsed,
+                   'rate': total_rows_archived / max(elapsed, 0.001)})
+            # Nothing left once a pass over every table from its start
+            # archived nothing
+            if not results and full_pass:
+                break
+            if sleep:
+                time.sleep(sleep)
+
         if verbose:
             if table_to_rows_archived:
                 cliutils.print_dict(table_to_rows_archived, _('Table'),
@@ -985,6 +1081,66 @@ class DbCommands(object):
             print(_('There were no records found where '
                     'instance_uuid was NULL.'))
 
+    @args('--dir', metavar='<path>', dest='report_dir',
+          help='Directory of the profiling reports, [database]/'
+               'profiling_report_dir by default.')
+    @args('--sort', metavar='<calls|statements|rows|time|per-request>',
+          default='statements',
+          choices=('calls', 'statements', 'rows', 'time', 'per-request'),
+          help='Column the functions are sorted by.')
+    @args('--top', metavar='<number>', default=20,
+          help='Number of functions and slow statements shown.')
+    def profile_report(self, report_dir=None, sort='statements', top=20):
+        """Show the DB API functions issuing the most SQL statements, and
+        the slowest statements, in the profiling reports of all the
+        processes. [database]/profiling must be set on the services. The
+        percentiles are bucket upper bounds.
+        """
+        report_dir = report_dir or CONF.database.profiling_report_dir
+        if not report_dir:
+            print(_('No profiling report directory given.'))
+            return 1
+        reports = []
+        for path in sorted(glob.glob(os.path.join(report_dir, '*.json'))):
+            with open(path) as f:
+                reports.append(jsonutils.loads(f.read()))
+        if not reports:
+            print(_('No profiling report found in %s.') % report_dir)
+            return 1
+        stats = db_profiler.merge_reports(reports)
+        top = int(top)
+        sort_keys = {'calls': 'count', 'statements': 'statements',
+                     'rows': 'rows', 'time': 'sum_ms',
+                     'per-request': 'max_calls_per_request'}
+        functions = sorted(six.iteritems(stats['functions']),
+                           key=lambda item: item[1][sort_keys[sort]],
+                           reverse=True)[:top]
+
+        print(_("Processes: %d") % len(reports))
+        fmt = "%-40s %8s %10s %10s %8s %10s %8s %8s %12s"
+        print(fmt % (_('Function'), _('Calls'), _('Statements'),
+                     _('Stmts/call'), _('Rows'), _('Mean ms'), _('p50 ms'),
+                     _('p99 ms'), _('Max/request')))
+        for name, histogram in functions:
+            calls = max(1, histogram['count'])
+            print(fmt % (name, histogram['count'], histogram['statements'],
+                         '%.1f' % (histogram['statements'] / float(calls)),
+                         histogram['rows'],
+                         '%.2f' % (histogram['sum_ms'] / calls),
+                         profiler.percentile_ms(histogram, 50),
+                         profiler.percentile_ms(histogram, 99),
+                         histogram['max_calls_per_request']))
+
+        if stats['slow_statements']:
+            print()
+            print(_("Slowest statements:"))
+            for statement in stats['slow_statements'][:top]:
+                print("%10.1f ms  %s  %s  %s" % (
+                    statement['elapsed_ms'], statement['function'],
+                    statement['operation'] or '-',
+                    statement['request_id'] or '-'))
+                print("    %s" % statement['statement'][:200])
+
 
 class ApiDbCommands(object):
     """Class for managing the api database."""
@@ -1321,6 +1477,7 @@ CATEGORIES = {
     'logs': GetLogCommands,
     'network': NetworkCommands,
     'project': ProjectCommands,
+    'scheduler': SchedulerCommands,
     'service': ServiceCommands,
     'shell': ShellCommands,
     'vm': VmCommands,
@@ -1966,7 +1966,7 @@ class API(base.Base):
 
     def get_all(self, context, search_opts=None, limit=None, marker=None,
                 want_objects=False, expected_attrs=None, sort_keys=None,
-                sort_dirs=None):
+                sort_dirs=None, fields=None):
         """Get all instances filtered by one of the given parameters.
 
         If there is no filter and the context is an admin, it will retrieve
@@ -1980,6 +1980,11 @@ class API(base.Base):
         secondary sort ket, etc.). For each sort key, the associated sort
         direction is based on the list of sort directions in the 'sort_dirs'
         parameter.
+
+        If 'fields' is given, only these fields and the 'expected_attrs' are
+        loaded, instead of all the fields and the metadata, system metadata,
+        info cache and security groups. The other fields are lazy-loaded if
+        accessed.
         """
 
         # TODO(bcwaldon): determine the best argument for target here
@@ -2055,10 +2060,12 @@ class API(base.Base):
         if filter_ip and limit:
             LOG.debug('Removing limit for DB query due to IP filter')
             limit = None
+        if filter_ip and fields is not None:
+            expected_attrs = list(expected_attrs or []) + ['info_cache']
 
         inst_models = self._get_instances_by_filters(context, filters,
                 limit=limit, marker=marker, expected_attrs=expected_attrs,
-                sort_keys=sort_keys, sort_dirs=sort_dirs)
+                sort_keys=sort_keys, sort_dirs=sort_dirs, fields=fields)
 
         if filter_ip:
             inst_models = self._ip_filter(inst_models, filters, orig_limit)
@@ -2101,14 +2108,19 @@ class API(base.Base):
 
     def _get_instances_by_filters(self, context, filters,
                                   limit=None, marker=None, expected_attrs=None,
-                                  sort_keys=None, sort_dirs=None):
-        fields = ['metadata', 'system_metadata', 'info_cache',
-                  'security_groups']
+                                  sort_keys=None, sort_dirs=None, fields=None):
+        if fields is not None:
+            return objects.InstanceList.get_by_filters(
+                context, filters=filters, limit=limit, marker=marker,
+                expected_attrs=list(expected_attrs or []),
+                sort_keys=sort_keys, sort_dirs=sort_dirs, fields=fields)
+        attrs = ['metadata', 'system_metadata', 'info_cache',
+                 'security_groups']
         if expected_attrs:
-            fields.extend(expected_attrs)
+            attrs.extend(expected_attrs)
         return objects.InstanceList.get_by_filters(
             context, filters=filters, limit=limit, marker=marker,
-            expected_attrs=fields, sort_keys=sort_keys, sort_dirs=sort_dirs)
+            expected_attrs=attrs, sort_keys=sort_keys, sort_dirs=sort_dirs)
 
     # NOTE(melwitt): We don't check instance lock for backup because lock is
     #                intended to prevent accidental change/delete of instances
@@ -217,7 +217,8 @@ class Claim(NopClaim):
                         host_topology, requested_topology,
                         limits=limit,
                         pci_requests=pci_requests.requests,
-                        pci_stats=pci_stats))
+                        pci_stats=pci_stats,
+                        cache=hardware.get_numa_fit_cache()))
 
             if requested_topology and not instance_topology:
                 if pci_requests.requests:
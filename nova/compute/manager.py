@@ -479,6 +479,32 @@ def object_compat(function):
     return decorated_function
 
 
+def _power_state_needs_sync(db_instance, vm_power_state):
+    """Whether the power state of a virtual machine doesn't match the
+    database record of its instance, so that _sync_instance_power_state()
+    would update the record or act on the instance.
+    """
+    if db_instance.task_state is not None:
+        # Skipped until the task is done
+        return False
+    if vm_power_state != db_instance.power_state:
+        return True
+    vm_state = db_instance.vm_state
+    if vm_state == vm_states.ACTIVE:
+        return vm_power_state != power_state.RUNNING
+    elif vm_state == vm_states.STOPPED:
+        return vm_power_state not in (power_state.NOSTATE,
+                                      power_state.SHUTDOWN,
+                                      power_state.CRASHED)
+    elif vm_state == vm_states.PAUSED:
+        return vm_power_state in (power_state.SHUTDOWN,
+                                  power_state.CRASHED)
+    elif vm_state in (vm_states.SOFT_DELETED, vm_states.DELETED):
+        return vm_power_state not in (power_state.NOSTATE,
+                                      power_state.SHUTDOWN)
+    return False
+
+
 class InstanceEvents(object):
     def __init__(self):
         self._events = {}
@@ -1533,9 +1559,19 @@ class ComputeManager(manager.Manager):
         building_insts = objects.InstanceList.get_by_filters(context,
                            filters, expected_attrs=[], use_slave=True)
 
-        for instance in building_insts:
-            if timeutils.is_older_than(instance.created_at, timeout):
-                self._set_instance_obj_error_state(context, instance)
+        timed_out = objects.InstanceList(context=context, objects=[
+            instance for instance in building_insts
+            if timeutils.is_older_than(instance.created_at, timeout)])
+        if not timed_out:
+            return
+
+        for instance in timed_out:
+            instance.vm_state = vm_states.ERROR
+        # NOTE: The instances which finished building since they were
+        # listed are left alone.
+        not_saved = timed_out.save_many(expected_vm_state=vm_states.BUILDING)
+        for instance in timed_out:
+            if instance.uuid not in not_saved:
                 LOG.warning(_LW("Instance build timed out. Set to error "
                                 "state."), instance=instance)
 
@@ -5974,12 +6010,25 @@ class ComputeManager(manager.Manager):
         number of virtual machines known by the database, we proceed in a lazy
         loop, one database record at a time, checking if the hypervisor has the
         same power state as is in the database.
+
+        If the driver can return the power states of all its virtual machines
+        at once, they are compared with the database records first, and only
+        the instances whose power state doesn't match are checked again and
+        synced one by one.
         """
         db_instances = objects.InstanceList.get_by_host(context, self.host,
                                                         expected_attrs=[],
                                                         use_slave=True)
+        # Most of the instances are only read, the others are refreshed
+        # before being synced.
+        obj_instance.compact_instances(db_instances)
 
-        num_vm_instances = self.driver.get_num_instances()
+        try:
+            vm_power_states = self.driver.get_power_states()
+            num_vm_instances = len(vm_power_states)
+        except NotImplementedError:
+            vm_power_states = None
+            num_vm_instances = self.driver.get_num_instances()
         num_db_instances = len(db_instances)
 
         if num_vm_instances != num_db_instances:
@@ -6007,17 +6056,29 @@ class ComputeManager(manager.Manager):
 
             self._syncs_in_progress.pop(db_instance.uuid)
 
+        num_in_sync = 0
         for db_instance in db_instances:
             # process syncs asynchronously - don't want instance locking to
             # block entire periodic task thread
             uuid = db_instance.uuid
-            if uuid in self._syncs_in_progress:
+            if (vm_power_states is not None and
+                    not _power_state_needs_sync(
+                        db_instance, vm_power_states.get(
+                            uuid, power_state.NOSTATE))):
+                num_in_sync += 1
+            elif uuid in self._syncs_in_progress:
                 LOG.debug('Sync already in progress for %s' % uuid)
             else:
                 LOG.debug('Triggering sync for uuid %s' % uuid)
                 self._syncs_in_progress[uuid] = True
                 self._sync_power_pool.spawn_n(_sync, db_instance)
 
+        if vm_power_states is not None:
+            LOG.debug('Power state of %(count)d of %(total)d instances to '
+                      'sync with the hypervisor',
+                      {'count': num_db_instances - num_in_sync,
+                       'total': num_db_instances})
+
     def _query_driver_power_state_and_sync(self, context, db_instance):
         if db_instance.task_state is not None:
             LOG.info(_LI("During sync_power_state the instance has a "
@@ -19,11 +19,16 @@ scheduler with useful information about availability through the ComputeNode
 model.
 """
 import copy
+import functools
+import time
 
+from oslo_concurrency import lockutils
 from oslo_config import cfg
 from oslo_log import log as logging
 from oslo_serialization import jsonutils
+from oslo_utils import excutils
 from oslo_utils import importutils
+from oslo_utils import uuidutils
 
 from nova.compute import claims
 from nova.compute import monitors
@@ -31,7 +36,7 @@ from nova.compute import resources as ext_resources
 from nova.compute import task_states
 from nova.compute import vm_states
 from nova import exception
-from nova.i18n import _, _LI, _LW
+from nova.i18n import _, _LE, _LI, _LW
 from nova import objects
 from nova.objects import base as obj_base
 from nova.objects import migration as migration_obj
@@ -60,6 +65,26 @@ resource_tracker_opts = [
                      'openstack-dev mailing list. There is no future planned '
                      'support for the tracking of custom resources.',
                 deprecated_for_removal=True),
+    cfg.IntOpt('full_resource_audit_interval',
+               default=0,
+               help='Seconds between two full audits of the resources of a '
+                    'compute node, which query the hypervisor and compute '
+                    'the usage again from all the instances and migrations '
+                    'of the node. In between, the periodic '
+                    'update_available_resource task only compares the usage '
+                    'tracked from the claims and the instance events with '
+                    'the instances and migrations of the node in the '
+                    'database, and runs a full audit if they differ. The '
+                    'values only the hypervisor knows, like the free disk '
+                    'and the host metrics, are then only refreshed at this '
+                    'interval. 0 runs a full audit every time.'),
+    cfg.IntOpt('compute_node_save_interval_ms',
+               default=0,
+               help='Milliseconds during which the changes of the resource '
+                    'usage of a compute node are gathered before its record '
+                    'is saved in the background, once for all of them. 0 '
+                    'saves the record in each claim, while holding the '
+                    'resources lock of the node.'),
 ]
 
 allocation_ratio_opts = [
@@ -92,6 +117,20 @@ LOG = logging.getLogger(__name__)
 COMPUTE_RESOURCE_SEMAPHORE = "compute_resources"
 
 CONF.import_opt('my_ip', 'nova.netconf')
+CONF.import_opt('scheduler_tracks_compute_node_changes',
+                'nova.scheduler.host_manager')
+
+
+def _synchronized(func):
+    """Decorate a method of ResourceTracker to run it holding
+    COMPUTE_RESOURCE_SEMAPHORE for the node of the tracker, so that the
+    claims on the different nodes of a host don't wait for each other.
+    """
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        with lockutils.lock(self.semaphore_name):
+            return func(self, *args, **kwargs)
+    return wrapper
 
 
 def _instance_in_resize_state(instance):
@@ -124,6 +163,7 @@ class ResourceTracker(object):
         self.driver = driver
         self.pci_tracker = None
         self.nodename = nodename
+        self.semaphore_name = '%s-%s' % (COMPUTE_RESOURCE_SEMAPHORE, nodename)
         self.compute_node = None
         self.stats = importutils.import_object(CONF.compute_stats_class)
         self.tracked_instances = {}
@@ -136,8 +176,21 @@ class ResourceTracker(object):
         self.scheduler_client = scheduler_client.SchedulerClient()
         self.ram_allocation_ratio = CONF.ram_allocation_ratio
         self.cpu_allocation_ratio = CONF.cpu_allocation_ratio
+        self.send_compute_node_updates = (
+            CONF.scheduler_tracks_compute_node_changes)
+        # Incremented for each update sent to the Scheduler, so that it can
+        # detect the updates it missed. The epoch tells it when the counter
+        # starts again, like when the service restarts.
+        self.scheduler_generation = 0
+        self.scheduler_epoch = uuidutils.generate_uuid()
+        # Time of the last full audit, and the instances of the migrations
+        # in progress it found or which were claimed since
+        self.last_full_audit = None
+        self.known_migration_uuids = set()
+        # Instances claimed but not saved with this node yet, by uuid
+        self.pending_claims = {}
+        self._save_scheduled = False
 
-    @utils.synchronized(COMPUTE_RESOURCE_SEMAPHORE)
     def instance_claim(self, context, instance_ref, limits=None):
         """Indicate that some resources are needed for an upcoming compute
         instance build operation.
@@ -153,6 +206,11 @@ class ResourceTracker(object):
         :returns: A Claim ticket representing the reserved resources.  It can
                   be used to revert the resource usage if an error occurs
                   during the instance build.
+
+        Only the test of the claim and the accounting of its resources hold
+        the resources lock of the node. The instance is saved with its host
+        and node afterwards, and is kept in pending_claims meanwhile so that
+        an audit running before it is saved still counts it.
         """
         if self.disabled:
             # compute_driver doesn't support resource tracking, just
@@ -177,15 +235,27 @@ class ResourceTracker(object):
                   "MB", {'flavor': instance_ref.memory_mb,
                           'overhead': overhead['memory_mb']})
 
+        claim = self._claim_instance(context, instance_ref, overhead, limits)
+        try:
+            instance_ref.save()
+        except Exception:
+            with excutils.save_and_reraise_exception():
+                self._drop_pending_claim(instance_ref.uuid)
+                claim.abort()
+        self._drop_pending_claim(instance_ref.uuid)
+        return claim
+
+    @_synchronized
+    def _claim_instance(self, context, instance_ref, overhead, limits):
         claim = claims.Claim(context, instance_ref, self, self.compute_node,
                              overhead=overhead, limits=limits)
 
-        # self._set_instance_host_and_node() will save instance_ref to the DB
-        # so set instance_ref['numa_topology'] first.  We need to make sure
-        # that numa_topology is saved while under COMPUTE_RESOURCE_SEMAPHORE
-        # so that the resource audit knows about any cpus we've pinned.
+        # The instance is counted by the audits from pending_claims until it
+        # is saved, so its numa_topology has to be set first for the audits
+        # to know about any cpus we've pinned.
         instance_ref.numa_topology = claim.claimed_numa_topology
-        self._set_instance_host_and_node(context, instance_ref)
+        self._set_instance_host_and_node(context, instance_ref, save=False)
+        self.pending_claims[instance_ref.uuid] = instance_ref
 
         # Mark resources in-use and update stats
         self._update_usage_from_instance(context, instance_ref)
@@ -196,7 +266,11 @@ class ResourceTracker(object):
 
         return claim
 
-    @utils.synchronized(COMPUTE_RESOURCE_SEMAPHORE)
+    @_synchronized
+    def _drop_pending_claim(self, uuid):
+        self.pending_claims.pop(uuid, None)
+
+    @_synchronized
     def rebuild_claim(self, context, instance, limits=None, image_meta=None,
                       migration=None):
         """Create a claim for a rebuild operation."""
@@ -205,7 +279,7 @@ class ResourceTracker(object):
                                 move_type='evacuation', limits=limits,
                                 image_meta=image_meta, migration=migration)
 
-    @utils.synchronized(COMPUTE_RESOURCE_SEMAPHORE)
+    @_synchronized
     def resize_claim(self, context, instance, instance_type,
                      image_meta=None, limits=None):
         """Create a claim for a resize or cold-migration move."""
@@ -255,6 +329,7 @@ class ResourceTracker(object):
                                  image_meta, self, self.compute_node,
                                  overhead=overhead, limits=limits)
         claim.migration = migration
+        self.known_migration_uuids.add(instance.uuid)
         instance.migration_context = claim.create_migration_context()
         instance.save()
 
@@ -305,17 +380,19 @@ class ResourceTracker(object):
         migration.status = 'pre-migrating'
         migration.save()
 
-    def _set_instance_host_and_node(self, context, instance):
+    def _set_instance_host_and_node(self, context, instance, save=True):
         """Tag the instance as belonging to this host.  This should be done
         while the COMPUTE_RESOURCES_SEMAPHORE is held so the resource claim
-        will not be lost if the audit process starts.
+        will not be lost if the audit process starts, unless the instance is
+        added to pending_claims until it is saved.
         """
         instance.host = self.host
         instance.launched_on = self.host
         instance.node = self.nodename
-        instance.save()
+        if save:
+            instance.save()
 
-    @utils.synchronized(COMPUTE_RESOURCE_SEMAPHORE)
+    @_synchronized
     def abort_instance_claim(self, context, instance):
         """Remove usage from the given instance."""
         # flag the instance as deleted to revert the resource usage
@@ -325,12 +402,13 @@ class ResourceTracker(object):
 
         self._update(context.elevated())
 
-    @utils.synchronized(COMPUTE_RESOURCE_SEMAPHORE)
+    @_synchronized
     def drop_move_claim(self, context, instance, instance_type=None,
                         image_meta=None, prefix='new_'):
         """Remove usage for an incoming/outgoing migration."""
         if instance['uuid'] in self.tracked_migrations:
             migration, itype = self.tracked_migrations.pop(instance['uuid'])
+            self.known_migration_uuids.discard(instance['uuid'])
 
             if not instance_type:
                 ctxt = context.elevated()
@@ -360,7 +438,7 @@ class ResourceTracker(object):
 
             instance.drop_migration_context()
 
-    @utils.synchronized(COMPUTE_RESOURCE_SEMAPHORE)
+    @_synchronized
     def update_usage(self, context, instance):
         """Update the resource usage and stats after a change in an
         instance
@@ -464,7 +542,76 @@ class ResourceTracker(object):
         Add in resource claims in progress to account for operations that have
         declared a need for resources, but not necessarily retrieved them from
         the hypervisor layer yet.
+
+        If full_resource_audit_interval is set, this full audit only runs at
+        that interval or when the usage tracked since the previous one
+        drifted from the database.
+        """
+        if not self._full_audit_due() and not self._usage_drifted(context):
+            return
+        self._audit_available_resource(context)
+
+    def _full_audit_due(self):
+        interval = CONF.full_resource_audit_interval
+        return (self.disabled or not interval or
+                self.last_full_audit is None or
+                time.time() - self.last_full_audit >= interval)
+
+    def _usage_drifted(self, context):
+        """Check the usage tracked from the claims and the instance events
+        against the instances and migrations of the node in the database.
+
+        This loads the instances without any of their joined attributes and
+        only holds COMPUTE_RESOURCE_SEMAPHORE for the comparison in memory,
+        so that it doesn't stall the claims like a full audit.
         """
+        instances = objects.InstanceList.get_by_host_and_node(
+            context, self.host, self.nodename, expected_attrs=[])
+        migrations = objects.MigrationList.get_in_progress_by_host_and_node(
+            context, self.host, self.nodename)
+        reason = self._find_drift(instances, migrations)
+        if reason:
+            LOG.info(_LI("Resource usage of node %(node)s drifted from the "
+                         "database: %(reason)s. Running a full audit."),
+                     {'node': self.nodename, 'reason': reason})
+            return True
+        LOG.debug("Resource usage of node %s is in sync with the database",
+                  self.nodename)
+        return False
+
+    @_synchronized
+    def _find_drift(self, instances, migrations):
+        """Return why the tracked usage doesn't match the instances and
+        migrations given, or None if it does.
+        """
+        states = getattr(self.stats, 'states', {})
+        uuids = set()
+        for instance in instances:
+            if instance.vm_state == vm_states.DELETED:
+                continue
+            uuids.add(instance.uuid)
+            tracked = self.tracked_instances.get(instance.uuid)
+            if tracked is None:
+                return 'instance %s is not tracked' % instance.uuid
+            for field in ('memory_mb', 'vcpus', 'root_gb', 'ephemeral_gb'):
+                if tracked.get(field) != instance[field]:
+                    return 'instance %s changed flavor' % instance.uuid
+            state = states.get(instance.uuid)
+            if state is not None and (
+                    state['vm_state'] != instance.vm_state or
+                    state['task_state'] != instance.task_state):
+                return 'instance %s changed state' % instance.uuid
+        gone = set(self.tracked_instances) - uuids - set(self.pending_claims)
+        if gone:
+            return 'instances %s are not on the node anymore' % (
+                ', '.join(sorted(gone)))
+        migration_uuids = set(migration.instance_uuid
+                              for migration in migrations)
+        if migration_uuids != self.known_migration_uuids:
+            return 'the migrations in progress changed'
+        return None
+
+    def _audit_available_resource(self, context):
         LOG.info(_LI("Auditing locally available compute resources for "
                      "node %(node)s"),
                  {'node': self.nodename})
@@ -491,7 +638,7 @@ class ResourceTracker(object):
 
         self._update_available_resource(context, resources)
 
-    @utils.synchronized(COMPUTE_RESOURCE_SEMAPHORE)
+    @_synchronized
     def _update_available_resource(self, context, resources):
 
         # initialise the compute node object, creating it
@@ -518,6 +665,11 @@ class ResourceTracker(object):
             expected_attrs=['system_metadata',
                             'numa_topology'])
 
+        # Count the claims whose instance isn't saved with this node yet
+        pending = self._get_pending_claims(instances)
+        if pending:
+            instances = list(instances) + pending
+
         # Now calculate usage based on instance utilization:
         self._update_usage_from_instances(context, instances)
 
@@ -526,6 +678,8 @@ class ResourceTracker(object):
                 context, self.host, self.nodename)
 
         self._update_usage_from_migrations(context, migrations)
+        self.known_migration_uuids = set(migration.instance_uuid
+                                         for migration in migrations)
 
         # Detect and account for orphaned instances that may exist on the
         # hypervisor, but are not in the DB:
@@ -552,9 +706,15 @@ class ResourceTracker(object):
 
         # update the compute_node
         self._update(context)
+        self.last_full_audit = time.time()
         LOG.info(_LI('Compute_service record updated for %(host)s:%(node)s'),
                      {'host': self.host, 'node': self.nodename})
 
+    def _get_pending_claims(self, instances):
+        uuids = set(instance.uuid for instance in instances)
+        return [instance for uuid, instance in self.pending_claims.items()
+                if uuid not in uuids]
+
     def _get_compute_node(self, context):
         """Returns compute node for the host and nodename."""
         try:
@@ -656,13 +816,101 @@ class ResourceTracker(object):
     def _update(self, context):
         """Update partial stats locally and populate them to Scheduler."""
         self._write_ext_resources(self.compute_node)
+        if CONF.compute_node_save_interval_ms > 0:
+            self._schedule_save(context)
+            if self.pci_tracker:
+                self.pci_tracker.save(context)
+            return
         if not self._resource_change():
             return
+        # NOTE: saving the compute node resets its changes, so they need to
+        # be collected first
+        changed_fields = self.compute_node.obj_what_changed()
         # Persist the stats to the Scheduler
         self.scheduler_client.update_resource_stats(self.compute_node)
+        self._send_compute_node_update(context, changed_fields)
         if self.pci_tracker:
             self.pci_tracker.save(context)
 
+    def _schedule_save(self, context):
+        """Save the compute node in the background, once for all the changes
+        made in the next compute_node_save_interval_ms.
+        """
+        if self._save_scheduled:
+            return
+        self._save_scheduled = True
+        utils.spawn_n(self._save_later, context)
+
+    def _save_later(self, context):
+        time.sleep(CONF.compute_node_save_interval_ms / 1000.0)
+        compute_node, changed_fields = self._get_changes_to_save()
+        if compute_node is not None:
+            try:
+                self.scheduler_client.update_resource_stats(compute_node)
+                self._send_compute_node_update(context, changed_fields,
+                                               compute_node)
+            except Exception:
+                LOG.exception(_LE("Failed to save the resource usage of "
+                                  "node %s, it will be saved again"),
+                              self.nodename)
+                self._restore_changes(changed_fields)
+        self._finish_save(context)
+
+    @_synchronized
+    def _get_changes_to_save(self):
+        """Return a copy of the compute node to save and the fields which
+        changed, or None if it didn't change since the last save.
+        """
+        if not self._resource_change():
+            return None, None
+        changed_fields = self.compute_node.obj_what_changed()
+        # The copy is saved without holding the lock, while the claims keep
+        # changing the compute node.
+        compute_node = copy.deepcopy(self.compute_node)
+        self.compute_node.obj_reset_changes()
+        return compute_node, changed_fields
+
+    @_synchronized
+    def _restore_changes(self, changed_fields):
+        for field in changed_fields:
+            if self.compute_node.obj_attr_is_set(field):
+                setattr(self.compute_node, field,
+                        getattr(self.compute_node, field))
+        self.old_resources = objects.ComputeNode()
+
+    @_synchronized
+    def _finish_save(self, context):
+        """Schedule the next save if the compute node changed during this
+        one, or if it failed.
+
+        The save stays scheduled until it is finished, so that two saves of
+        the node never overlap and the older copy can't be saved last.
+        """
+        self._save_scheduled = False
+        if not obj_base.obj_equal_prims(self.compute_node, self.old_resources):
+            self._schedule_save(context)
+
+    def _send_compute_node_update(self, context, changed_fields,
+                                  compute_node=None):
+        """Sends the fields of the compute node which changed with the last
+        save to the Scheduler.
+        """
+        if not self.send_compute_node_updates:
+            return
+        compute_node = compute_node or self.compute_node
+        self.scheduler_generation += 1
+        delta = objects.ComputeNode(
+            host=compute_node.host,
+            hypervisor_hostname=compute_node.hypervisor_hostname)
+        for field in set(changed_fields) | set(['updated_at']):
+            if (field in ('id', 'created_at', 'deleted_at', 'deleted') or
+                    not compute_node.obj_attr_is_set(field)):
+                continue
+            setattr(delta, field, getattr(compute_node, field))
+        self.scheduler_client.update_compute_node(
+            context.elevated(), delta, self.scheduler_generation,
+            epoch=self.scheduler_epoch)
+
     def _update_usage(self, usage, sign=1):
         mem_usage = usage['memory_mb']
 
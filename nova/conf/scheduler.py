@@ -27,6 +27,18 @@ host_subset_size_opt = cfg.IntOpt("scheduler_host_subset_size",
              "least 1. Any value less than 1 will be ignored, and 1 will be "
              "used instead")
 
+batch_placement_opt = cfg.BoolOpt("scheduler_batch_placement",
+        default=False,
+        help="When a request asks for several instances, filter and weigh "
+             "the hosts once for the whole request and then place the "
+             "instances one after the other from a priority queue, instead "
+             "of filtering and weighing all the hosts again for each "
+             "instance. After each placement, only the host which was "
+             "chosen is run through all the filters and weighed again, and "
+             "the filters which depend on the previous placements of the "
+             "request (like the server group ones) are run again on the "
+             "remaining hosts.")
+
 bm_default_filter_opt = cfg.ListOpt("baremetal_scheduler_default_filters",
         default=[
             "RetryFilter",
@@ -68,6 +80,63 @@ host_mgr_default_filt_opt = cfg.ListOpt("scheduler_default_filters",
         help="Which filter class names to use for filtering hosts when not "
              "specified in the request.")
 
+host_mgr_vectorized_filt_opt = cfg.BoolOpt(
+        "scheduler_use_vectorized_filters",
+        default=False,
+        help="Evaluate the filters which support it (RamFilter, CoreFilter, "
+             "DiskFilter, NumInstancesFilter, IoOpsFilter, ComputeFilter and "
+             "their aggregate variants) against all hosts at once using a "
+             "columnar snapshot of the host states, instead of calling them "
+             "host by host. Filters without a batch path are still run host "
+             "by host. Requires the numpy library.")
+
+host_mgr_vectorized_wgt_opt = cfg.BoolOpt(
+        "scheduler_use_vectorized_weighers",
+        default=False,
+        help="Compute, normalize and sum the weights of all hosts as arrays "
+             "using a columnar snapshot of the host states, and only keep "
+             "the best scheduler_host_subset_size hosts instead of sorting "
+             "all of them. RAMWeigher, IoOpsWeigher, MetricsWeigher and the "
+             "server group soft-affinity weighers have a batch path, other "
+             "weighers are still run host by host. Requires the numpy "
+             "library.")
+
+host_mgr_filter_workers_opt = cfg.IntOpt("scheduler_filter_workers",
+        default=0,
+        help="Number of worker processes to run the expensive filters "
+             "(NUMATopologyFilter, PciPassthroughFilter and JsonFilter) in. "
+             "The workers are started by the first filtering pass and reused "
+             "by the following ones, the hosts are split between them and "
+             "sent to them pickled. A value of 0 or 1 runs all the filters "
+             "in the scheduler process.")
+
+host_mgr_filter_worker_min_hosts_opt = cfg.IntOpt(
+        "scheduler_filter_worker_min_hosts",
+        default=200,
+        help="Minimum number of hosts to hand to each filter worker process. "
+             "Filtering fewer hosts than this in total is done in the "
+             "scheduler process, as sending the hosts to the workers would "
+             "cost more than it saves.")
+
+host_mgr_order_filt_by_cost_opt = cfg.BoolOpt(
+        "scheduler_order_filters_by_cost",
+        default=False,
+        help="Run the filters by increasing cost estimate instead of in the "
+             "order of scheduler_default_filters, so that the cheap filters "
+             "reduce the number of hosts the expensive ones have to check. "
+             "Filters with the same cost keep their configured order.")
+
+host_mgr_adaptive_filt_order_opt = cfg.BoolOpt(
+        "scheduler_adaptive_filter_ordering",
+        default=False,
+        help="Reorder the filters for each request by the time they took "
+             "per host and the fraction of hosts they let through on the "
+             "previous requests (exponentially decayed), so that the "
+             "filters which remove the most hosts for the least time run "
+             "first. Filters which have to run in a given position, like "
+             "RetryFilter, are not moved. This takes precedence over "
+             "scheduler_order_filters_by_cost.")
+
 host_mgr_sched_wgt_cls_opt = cfg.ListOpt("scheduler_weight_classes",
         default=["nova.scheduler.weights.all_weighers"],
         help="Which weight class names to use for weighing hosts")
@@ -77,6 +146,24 @@ host_mgr_tracks_inst_chg_opt = cfg.BoolOpt("scheduler_tracks_instance_changes",
         help="Determines if the Scheduler tracks changes to instances to help "
              "with its filtering decisions.")
 
+host_mgr_tracks_cn_chg_opt = cfg.BoolOpt(
+        "scheduler_tracks_compute_node_changes",
+        default=False,
+        help="Determines if the compute nodes push the changes of their "
+             "resources to the Scheduler, which then keeps its view of the "
+             "compute nodes up to date in memory instead of reloading all "
+             "of them from the database for each request. This must be set "
+             "on both the compute and the scheduler nodes.")
+
+host_mgr_cn_resync_opt = cfg.IntOpt(
+        "scheduler_compute_node_resync_interval",
+        default=600,
+        help="When scheduler_tracks_compute_node_changes is set, the "
+             "interval in seconds after which the Scheduler reloads all the "
+             "compute nodes from the database anyway, so that lost updates "
+             "and deleted compute nodes are eventually noticed. A value of 0 "
+             "or less disables the periodic reload.")
+
 rpc_sched_topic_opt = cfg.StrOpt("scheduler_topic",
         default="scheduler",
         help="The topic scheduler nodes listen on")
@@ -105,6 +192,21 @@ driver_period_opt = cfg.IntOpt("scheduler_driver_task_period",
              "with the value of service_down_time, but exactly how they "
              "interact will depend on your choice of scheduler driver.")
 
+profiling_opt = cfg.BoolOpt("scheduler_profiling",
+        default=False,
+        help="Record, for each request, the time spent loading the hosts, in "
+             "each filter and in each weigher, with the number of hosts in "
+             "and out and the database queries issued. The records are "
+             "logged and aggregated into histograms, which can be fetched "
+             "with 'nova-manage scheduler profile'.")
+
+profiling_notifications_opt = cfg.BoolOpt(
+        "scheduler_profiling_notifications",
+        default=False,
+        help="Send the profile of each request as a "
+             "scheduler.select_destinations.profile notification instead of "
+             "logging it. Only used if scheduler_profiling is set.")
+
 disk_allocation_ratio_opt = cfg.FloatOpt("disk_allocation_ratio",
         default=1.0,
         help="Virtual disk to physical disk allocation ratio")
@@ -227,16 +329,27 @@ soft_anti_affinity_weight_opt = cfg.FloatOpt(
 
 
 SIMPLE_OPTS = [host_subset_size_opt,
+               batch_placement_opt,
                bm_default_filter_opt,
                use_bm_filters_opt,
                host_mgr_avail_filt_opt,
                host_mgr_default_filt_opt,
+               host_mgr_vectorized_filt_opt,
+               host_mgr_vectorized_wgt_opt,
+               host_mgr_filter_workers_opt,
+               host_mgr_filter_worker_min_hosts_opt,
+               host_mgr_order_filt_by_cost_opt,
+               host_mgr_adaptive_filt_order_opt,
                host_mgr_sched_wgt_cls_opt,
                host_mgr_tracks_inst_chg_opt,
+               host_mgr_tracks_cn_chg_opt,
+               host_mgr_cn_resync_opt,
                rpc_sched_topic_opt,
                sched_driver_host_mgr_opt,
                driver_opt,
                driver_period_opt,
+               profiling_opt,
+               profiling_notifications_opt,
                scheduler_json_config_location_opt,
                disk_allocation_ratio_opt,
                isolated_img_opt,
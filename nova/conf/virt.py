@@ -37,8 +37,35 @@ Related options:
 
 * None""")
 
+numa_fit_cache_size = cfg.IntOpt(
+    'numa_fit_cache_size',
+    default=1024,
+    min=0,
+    help="""Number of instance NUMA topology fits to remember.
 
-ALL_OPTS = [vcpu_pin_set]
+Fitting an instance NUMA topology onto a host tries every permutation of the
+host NUMA cells, which is repeated for every host with the same free
+resources. The results are kept in a least recently used cache keyed on the
+free resources of the host cells, the requested instance topology and the
+limits.
+
+Possible values:
+
+* 0 to disable the cache.
+* A positive integer, the maximum number of results kept.
+
+Services which consume this:
+
+* nova-scheduler
+* nova-compute
+
+Related options:
+
+* None""")
+
+
+ALL_OPTS = [vcpu_pin_set,
+            numa_fit_cache_size]
 
 
 def register_opts(conf):
@@ -32,6 +32,7 @@ from oslo_db import concurrency
 from oslo_log import log as logging
 
 from nova.cells import rpcapi as cells_rpcapi
+from nova.db import profiler
 from nova.i18n import _LE
 
 
@@ -53,7 +54,8 @@ CONF.register_opts(db_opts)
 _BACKEND_MAPPING = {'sqlalchemy': 'nova.db.sqlalchemy.api'}
 
 
-IMPL = concurrency.TpoolDbapiWrapper(CONF, backend_mapping=_BACKEND_MAPPING)
+IMPL = profiler.ProfiledDbapi(
+    concurrency.TpoolDbapiWrapper(CONF, backend_mapping=_BACKEND_MAPPING))
 
 LOG = logging.getLogger(__name__)
 
@@ -676,7 +678,8 @@ def instance_get_all(context, columns_to_join=None):
 
 def instance_get_all_by_filters(context, filters, sort_key='created_at',
                                 sort_dir='desc', limit=None, marker=None,
-                                columns_to_join=None, use_slave=False):
+                                columns_to_join=None, use_slave=False,
+                                columns=None):
     """Get all instances that match all filters."""
     # Note: This function exists for backwards compatibility since calls to
     # the instance layer coming in over RPC may specify the single sort
@@ -686,21 +689,33 @@ def instance_get_all_by_filters(context, filters, sort_key='created_at',
                                             sort_dir, limit=limit,
                                             marker=marker,
                                             columns_to_join=columns_to_join,
-                                            use_slave=use_slave)
+                                            use_slave=use_slave,
+                                            columns=columns)
 
 
 def instance_get_all_by_filters_sort(context, filters, limit=None,
                                      marker=None, columns_to_join=None,
                                      use_slave=False, sort_keys=None,
-                                     sort_dirs=None):
+                                     sort_dirs=None, columns=None):
     """Get all instances that match all filters sorted by multiple keys.
 
-    sort_keys and sort_dirs must be a list of strings.
+    sort_keys and sort_dirs must be a list of strings. If columns is given,
+    only these columns of the instances are loaded.
     """
     return IMPL.instance_get_all_by_filters_sort(
         context, filters, limit=limit, marker=marker,
         columns_to_join=columns_to_join, use_slave=use_slave,
-        sort_keys=sort_keys, sort_dirs=sort_dirs)
+        sort_keys=sort_keys, sort_dirs=sort_dirs, columns=columns)
+
+
+def instance_pagination_token(instance, sort_keys=None, sort_dirs=None):
+    """Return an opaque marker for the instances sorted after an instance.
+
+    It can be given to instance_get_all_by_filters_sort() with the same
+    sort keys and directions instead of the instance UUID.
+    """
+    return IMPL.instance_pagination_token(instance, sort_keys=sort_keys,
+                                          sort_dirs=sort_dirs)
 
 
 def instance_get_active_by_window_joined(context, begin, end=None,
@@ -784,6 +799,23 @@ def instance_update_and_get_original(context, instance_uuid, values,
     return rv
 
 
+def instance_update_many_and_get_original(context, updates,
+                                          columns_to_join=None):
+    """Set the given properties on several instances in one transaction.
+
+    :param context: = request context object
+    :param updates: = dict mapping instance uuids to dicts of column values
+
+    :returns: a tuple of a dict mapping the uuids of the updated instances to
+              tuples of the form (old_instance_ref, new_instance_ref), and of
+              a dict mapping the uuids of the instances which were not
+              updated, because they lost a race on their expected values or
+              don't exist, to the error raised for them
+    """
+    return IMPL.instance_update_many_and_get_original(
+        context, updates, columns_to_join=columns_to_join)
+
+
 def instance_add_security_group(context, instance_id, security_group_id):
     """Associate the given security group with the given instance."""
     return IMPL.instance_add_security_group(context, instance_id,
@@ -1061,6 +1093,14 @@ def quota_get_all(context, project_id):
     return IMPL.quota_get_all(context, project_id)
 
 
+def quota_get_all_limits(context, project_id, user_id=None, quota_class=None):
+    """Retrieve the default, quota class, project and user quota limits
+    which apply to a project and user.
+    """
+    return IMPL.quota_get_all_limits(context, project_id, user_id=user_id,
+                                     quota_class=quota_class)
+
+
 def quota_update(context, project_id, resource, limit, user_id=None):
     """Update a quota or raise if it does not exist."""
     return IMPL.quota_update(context, project_id, resource, limit,
@@ -1145,6 +1185,35 @@ def reservation_rollback(context, reservations, project_id=None, user_id=None):
                                      user_id=user_id)
 
 
+def quota_reserve_optimistic(context, resources, quotas, user_quotas, deltas,
+                             expire, until_refresh, max_age, project_id=None,
+                             user_id=None):
+    """Check quotas and create appropriate reservations without locking
+    the quota usages while checking them.
+    """
+    return IMPL.quota_reserve_optimistic(context, resources, quotas,
+                                         user_quotas, deltas, expire,
+                                         until_refresh, max_age,
+                                         project_id=project_id,
+                                         user_id=user_id)
+
+
+def reservation_commit_optimistic(context, reservations, project_id=None,
+                                  user_id=None):
+    """Commit quota reservations made by quota_reserve_optimistic()."""
+    return IMPL.reservation_commit_optimistic(context, reservations,
+                                              project_id=project_id,
+                                              user_id=user_id)
+
+
+def reservation_rollback_optimistic(context, reservations, project_id=None,
+                                    user_id=None):
+    """Roll back quota reservations made by quota_reserve_optimistic()."""
+    return IMPL.reservation_rollback_optimistic(context, reservations,
+                                                project_id=project_id,
+                                                user_id=user_id)
+
+
 def quota_destroy_all_by_project_and_user(context, project_id, user_id):
     """Destroy all quotas associated with a given project and user."""
     return IMPL.quota_destroy_all_by_project_and_user(context,
@@ -1161,6 +1230,11 @@ def reservation_expire(context):
     return IMPL.reservation_expire(context)
 
 
+def reservation_expire_optimistic(context):
+    """Roll back any expired reservations without locking them first."""
+    return IMPL.reservation_expire_optimistic(context)
+
+
 ###################
 
 
@@ -1926,10 +2000,14 @@ def task_log_get(context, task_name, period_beginning,
 ####################
 
 
-def archive_deleted_rows(max_rows=None):
+def archive_deleted_rows(max_rows=None, marks=None, workers=1):
     """Move up to max_rows rows from production tables to corresponding shadow
     tables.
 
+    :param marks: dict that maps table name to the key of the last row
+                  archived from that table, updated as rows are archived so
+                  that the following calls resume each table from there
+    :param workers: number of tables archived concurrently
     :returns: dict that maps table name to number of rows archived from that
               table, for example:
 
@@ -1942,7 +2020,8 @@ def archive_deleted_rows(max_rows=None):
         }
 
     """
-    return IMPL.archive_deleted_rows(max_rows=max_rows)
+    return IMPL.archive_deleted_rows(max_rows=max_rows, marks=marks,
+                                     workers=workers)
 
 
 ####################
@@ -0,0 +1,402 @@
+# Copyright (c) 2016 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Profiling of the calls to the DB API.
+
+When [database]/profiling is set, each call to a function of the DB API is
+recorded along with the SQL statements it issued, the rows it returned and
+its latency. The statements slower than [database]/profiling_slow_statement_ms
+are captured with the API route or RPC method they were issued for. The
+records of a process are logged, and written as JSON to
+[database]/profiling_report_dir for "nova-manage db profile_report", every
+[database]/profiling_report_interval seconds.
+
+The largest number of calls made to a function for a single request is kept
+too, which shows the functions called once per instance or per volume of a
+request instead of once for all of them.
+"""
+
+import bisect
+import collections
+import functools
+import os
+import sys
+import threading
+import time
+
+from oslo_config import cfg
+from oslo_context import context as common_context
+from oslo_log import log as logging
+from oslo_serialization import jsonutils
+from oslo_utils import timeutils
+import six
+from sqlalchemy.engine import Engine
+from sqlalchemy import event
+
+from nova.i18n import _LI
+from nova.i18n import _LW
+
+profiler_opts = [
+    cfg.BoolOpt('profiling',
+                default=False,
+                help='Record the calls to the functions of the DB API with '
+                     'the SQL statements they issue, the rows they return '
+                     'and their latency, and capture the slow statements. '
+                     'The records of each process are logged and written to '
+                     'profiling_report_dir every profiling_report_interval '
+                     'seconds.'),
+    cfg.FloatOpt('profiling_slow_statement_ms',
+                 default=100.0,
+                 help='Milliseconds above which a SQL statement is captured '
+                      'as slow. Only used if profiling is set.'),
+    cfg.IntOpt('profiling_report_interval',
+               default=600,
+               help='Seconds between two reports of the profiling records '
+                    'of a process, or 0 to never report them. Only used if '
+                    'profiling is set.'),
+    cfg.StrOpt('profiling_report_dir',
+               help='Directory where each process writes its profiling '
+                    'records as JSON, to be read by "nova-manage db '
+                    'profile_report". The records are only logged if '
+                    'unset.'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(profiler_opts, 'database')
+
+LOG = logging.getLogger(__name__)
+
+# Upper bounds of the histogram buckets, in milliseconds. The last bucket
+# has no upper bound. The histograms have the format of those of
+# nova.scheduler.profiler.
+BUCKETS_MS = (0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000,
+              10000)
+
+# Number of slow statements kept
+MAX_SLOW_STATEMENTS = 100
+# Number of the latest requests whose calls are counted, to find the largest
+# number of calls made to a function for a request
+MAX_REQUESTS = 100
+# Characters of a slow statement which are kept
+MAX_STATEMENT_LENGTH = 1000
+
+# Label of the statements issued outside of the DB API functions, like the
+# ones of the objects reading the API database directly
+NO_FUNCTION = '<none>'
+
+# Greenthread local once eventlet has patched threading
+_local = threading.local()
+_listening_for_statements = False
+
+
+class FunctionStats(object):
+    """Records of the calls to a DB API function."""
+
+    def __init__(self):
+        self.calls = 0
+        self.statements = 0
+        self.rows = 0
+        self.sum_ms = 0.0
+        self.buckets = [0] * (len(BUCKETS_MS) + 1)
+        self.max_calls_per_request = 0
+        # Calls by API route or RPC method
+        self.operations = collections.Counter()
+
+    def add_call(self, elapsed, rows, operation):
+        elapsed_ms = elapsed * 1000
+        self.calls += 1
+        self.rows += rows
+        self.sum_ms += elapsed_ms
+        self.buckets[bisect.bisect_left(BUCKETS_MS, elapsed_ms)] += 1
+        self.operations[operation] += 1
+
+    def to_dict(self):
+        return {'count': self.calls,
+                'statements': self.statements,
+                'rows': self.rows,
+                'sum_ms': self.sum_ms,
+                'buckets': [[bound, count] for bound, count in
+                            zip(BUCKETS_MS + (None,), self.buckets)],
+                'max_calls_per_request': self.max_calls_per_request,
+                'operations': dict(self.operations)}
+
+
+class ProfileStats(object):
+    """Records of all the DB API calls of the process."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.started_at = timeutils.utcnow()
+        self.reported_at = time.time()
+        self.functions = collections.defaultdict(FunctionStats)
+        self.slow_statements = collections.deque(maxlen=MAX_SLOW_STATEMENTS)
+        # request_id -> function -> calls, for the latest requests
+        self._requests = collections.OrderedDict()
+
+    def add_call(self, function, elapsed, rows, operation, request_id):
+        stats = self.functions[function]
+        stats.add_call(elapsed, rows, operation)
+        if request_id is None:
+            return
+        calls = self._requests.pop(request_id, None)
+        if calls is None:
+            calls = collections.Counter()
+            if len(self._requests) >= MAX_REQUESTS:
+                self._requests.popitem(last=False)
+        self._requests[request_id] = calls
+        calls[function] += 1
+        stats.max_calls_per_request = max(stats.max_calls_per_request,
+                                          calls[function])
+
+    def add_statement(self, function, statement, elapsed, operation,
+                      request_id):
+        self.functions[function].statements += 1
+        elapsed_ms = elapsed * 1000
+        if elapsed_ms >= CONF.database.profiling_slow_statement_ms:
+            self.slow_statements.append({
+                'statement': statement[:MAX_STATEMENT_LENGTH],
+                'elapsed_ms': elapsed_ms,
+                'function': function,
+                'operation': operation,
+                'request_id': request_id,
+                'time': timeutils.utcnow().isoformat()})
+
+    def to_dict(self):
+        return {'started_at': self.started_at.isoformat(),
+                'functions': {name: stats.to_dict() for name, stats
+                              in six.iteritems(self.functions)},
+                'slow_statements': list(self.slow_statements)}
+
+
+_STATS = ProfileStats()
+
+
+def get_stats():
+    """Return the records of the DB API calls made by this process.
+
+    The result is a dict with the time the records started at, the
+    FunctionStats.to_dict() of each function by name, and the list of the
+    latest slow statements.
+    """
+    return _STATS.to_dict()
+
+
+def reset_stats():
+    _STATS.reset()
+
+
+def _get_report_path():
+    return os.path.join(CONF.database.profiling_report_dir, '%s-%s-%d.json' % (
+        os.path.basename(sys.argv[0]) or 'nova', CONF.host, os.getpid()))
+
+
+def report():
+    """Log the functions issuing the most statements and write all the
+    records to profiling_report_dir, if set.
+    """
+    stats = get_stats()
+    top = sorted(six.iteritems(stats['functions']),
+                 key=lambda item: item[1]['statements'], reverse=True)[:10]
+    LOG.info(_LI("DB API calls issuing the most statements since "
+                 "%(started_at)s: %(top)s. %(slow)d slow statements "
+                 "captured."),
+             {'started_at': stats['started_at'],
+              'top': ', '.join('%s (%d calls, %d statements)' %
+                               (name, function['count'],
+                                function['statements'])
+                               for name, function in top),
+              'slow': len(stats['slow_statements'])})
+    if CONF.database.profiling_report_dir:
+        path = _get_report_path()
+        try:
+            with open(path + '.tmp', 'w') as f:
+                f.write(jsonutils.dumps(stats))
+            os.rename(path + '.tmp', path)
+        except (IOError, OSError) as e:
+            LOG.warning(_LW("Could not write the DB API profiling report "
+                            "%(path)s: %(error)s"),
+                        {'path': path, 'error': e})
+
+
+def _maybe_report():
+    interval = CONF.database.profiling_report_interval
+    now = time.time()
+    if interval and now - _STATS.reported_at >= interval:
+        _STATS.reported_at = now
+        report()
+
+
+def get_operation():
+    """Return the API route or RPC method being run, if known."""
+    return getattr(_local, 'operation', None)
+
+
+class Operation(object):
+    """Context manager labelling the DB API calls made in its block with
+    the API route or RPC method being run.
+    """
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        if CONF.database.profiling:
+            self._previous = get_operation()
+            _local.operation = self.name
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if CONF.database.profiling:
+            _local.operation = self._previous
+
+
+def _get_request_id(args):
+    context = args[0] if args else None
+    request_id = getattr(context, 'request_id', None)
+    if request_id is None:
+        context = common_context.get_current()
+        request_id = getattr(context, 'request_id', None)
+    return request_id
+
+
+def _count_rows(result):
+    if result is None:
+        return 0
+    if isinstance(result, (list, tuple, set)):
+        return len(result)
+    return 1
+
+
+def _profiled_call(name, func, *args, **kwargs):
+    _listen_for_statements()
+    calls = getattr(_local, 'calls', None)
+    if calls is None:
+        calls = _local.calls = []
+    calls.append(name)
+    rows = 0
+    start = time.time()
+    try:
+        result = func(*args, **kwargs)
+        rows = _count_rows(result)
+        return result
+    finally:
+        calls.pop()
+        _STATS.add_call(name, time.time() - start, rows, get_operation(),
+                        _get_request_id(args))
+        _maybe_report()
+
+
+class ProfiledDbapi(object):
+    """Wrapper of the DB API backend recording the calls to its functions
+    when profiling is set.
+    """
+
+    def __init__(self, backend):
+        self._backend = backend
+
+    def __getattr__(self, key):
+        attr = getattr(self._backend, key)
+        if not CONF.database.profiling or not callable(attr):
+            return attr
+        return functools.partial(_profiled_call, key, attr)
+
+
+class _ProfiledEndpoint(object):
+    """Proxy of an RPC endpoint labelling the calls made by its methods
+    with their name.
+    """
+
+    def __init__(self, endpoint, topic):
+        self._endpoint = endpoint
+        self._topic = topic
+
+    def __getattr__(self, key):
+        attr = getattr(self._endpoint, key)
+        if key.startswith('_') or not callable(attr):
+            return attr
+
+        @functools.wraps(attr)
+        def wrapper(*args, **kwargs):
+            with Operation('rpc:%s.%s' % (self._topic, key)):
+                return attr(*args, **kwargs)
+        return wrapper
+
+
+def profiled_endpoints(endpoints, topic):
+    """Return the RPC endpoints to serve, labelling the DB API calls of
+    their methods if profiling is set.
+    """
+    if not CONF.database.profiling:
+        return endpoints
+    return [_ProfiledEndpoint(endpoint, topic) for endpoint in endpoints]
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context,
+                           executemany):
+    if not CONF.database.profiling:
+        return
+    conn.info.setdefault('nova_profiler_started', []).append(time.time())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany):
+    started = conn.info.get('nova_profiler_started')
+    if not started:
+        return
+    elapsed = time.time() - started.pop()
+    calls = getattr(_local, 'calls', None)
+    function = calls[-1] if calls else NO_FUNCTION
+    _STATS.add_statement(function, statement, elapsed, get_operation(),
+                         _get_request_id(()))
+
+
+def _listen_for_statements():
+    global _listening_for_statements
+    if not _listening_for_statements:
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        _listening_for_statements = True
+
+
+def merge_reports(reports):
+    """Merge the records written by several processes into one."""
+    merged = {'functions': {}, 'slow_statements': []}
+    for stats in reports:
+        for name, function in six.iteritems(stats['functions']):
+            total = merged['functions'].get(name)
+            if total is None:
+                merged['functions'][name] = dict(
+                    function, buckets=[list(bucket) for bucket
+                                       in function['buckets']],
+                    operations=dict(function['operations']))
+                continue
+            for key in ('count', 'statements', 'rows', 'sum_ms'):
+                total[key] += function[key]
+            total['max_calls_per_request'] = max(
+                total['max_calls_per_request'],
+                function['max_calls_per_request'])
+            for bucket, (bound, count) in zip(total['buckets'],
+                                              function['buckets']):
+                bucket[1] += count
+            for operation, count in six.iteritems(function['operations']):
+                total['operations'][operation] = (
+                    total['operations'].get(operation, 0) + count)
+        merged['slow_statements'].extend(stats['slow_statements'])
+    merged['slow_statements'].sort(key=lambda s: s['elapsed_ms'],
+                                   reverse=True)
+    return merged
@@ -17,6 +17,7 @@
 
 """Implementation of SQLAlchemy backend."""
 
+import base64
 import collections
 import copy
 import datetime
@@ -25,20 +26,24 @@ import inspect
 import sys
 import uuid
 
+import eventlet
 from oslo_config import cfg
 from oslo_db import api as oslo_db_api
 from oslo_db import exception as db_exc
 from oslo_db import options as oslo_db_options
 from oslo_db.sqlalchemy import enginefacade
+from oslo_db.sqlalchemy import engines
 from oslo_db.sqlalchemy import update_match
 from oslo_db.sqlalchemy import utils as sqlalchemyutils
 from oslo_log import log as logging
+from oslo_serialization import jsonutils
 from oslo_utils import excutils
 from oslo_utils import timeutils
 from oslo_utils import uuidutils
 import six
 from six.moves import range
 from sqlalchemy import and_
+from sqlalchemy import DateTime
 from sqlalchemy.exc import NoSuchTableError
 from sqlalchemy import MetaData
 from sqlalchemy import or_
@@ -46,6 +51,7 @@ from sqlalchemy.orm import aliased
 from sqlalchemy.orm import contains_eager
 from sqlalchemy.orm import joinedload
 from sqlalchemy.orm import joinedload_all
+from sqlalchemy.orm import load_only
 from sqlalchemy.orm import noload
 from sqlalchemy.orm import undefer
 from sqlalchemy.schema import Table
@@ -62,6 +68,7 @@ from nova.compute import task_states
 from nova.compute import vm_states
 import nova.context
 from nova.db.sqlalchemy import models
+from nova.db.sqlalchemy import replicas
 from nova import exception
 from nova.i18n import _, _LI, _LE, _LW
 from nova import quota
@@ -75,6 +82,36 @@ db_opts = [
                     'Should be empty, "project" or "global".'),
 ]
 
+replica_opts = [
+    cfg.ListOpt('replica_connections',
+                default=[],
+                secret=True,
+                help='The SQLAlchemy connection strings of read replicas of '
+                     'the database, which are used along with '
+                     'slave_connection for the reads allowed to go to a '
+                     'slave database.'),
+    cfg.BoolOpt('route_reads_to_replicas',
+                default=False,
+                help='If True, all the database API calls which only read '
+                     'go to the replicas, not only those asked to with '
+                     'use_slave. The reads of a request which wrote to the '
+                     'database still go to the primary database.'),
+    cfg.IntOpt('replica_max_lag',
+               default=0,
+               min=0,
+               help='Replication lag in seconds above which a replica is '
+                    'not read from. 0 means no bound, in which case the lag '
+                    'is not checked and only the replicas which cannot be '
+                    'reached are not read from. Checking the lag of a MySQL '
+                    'replica requires the REPLICATION CLIENT privilege.'),
+    cfg.IntOpt('replica_lag_check_interval',
+               default=10,
+               min=1,
+               help='Interval in seconds between the checks of the '
+                    'replication lag of each replica, and before reading '
+                    'again from a replica which could not be reached.'),
+]
+
 api_db_opts = [
     cfg.StrOpt('connection',
                help='The SQLAlchemy connection string to use to connect to '
@@ -126,8 +163,10 @@ api_db_opts = [
 CONF = cfg.CONF
 CONF.register_opts(db_opts)
 CONF.register_opts(oslo_db_options.database_opts, 'database')
+CONF.register_opts(replica_opts, 'database')
 CONF.register_opts(api_db_opts, group='api_database')
 CONF.import_opt('until_refresh', 'nova.quota')
+CONF.import_opt('quota_limits_cache_ttl', 'nova.quota')
 
 LOG = logging.getLogger(__name__)
 
@@ -156,13 +195,77 @@ def _get_db_conf(conf_group):
 
 
 def configure(conf):
+    global _REPLICA_POOL
     main_context_manager.configure(**_get_db_conf(conf.database))
     api_context_manager.configure(**_get_db_conf(conf.api_database))
+    _REPLICA_POOL = None
+
+
+_REPLICA_POOL = None
+
+
+def _have_replicas():
+    return bool(CONF.database.slave_connection or
+                CONF.database.replica_connections)
+
+
+def _get_replica_pool():
+    global _REPLICA_POOL
+    if _REPLICA_POOL is None:
+        conf_group = CONF.database
+        pool = []
+        if conf_group.slave_connection:
+            # Share the engine of the enginefacade async reader
+            pool.append(replicas.Replica(
+                'slave_connection',
+                main_context_manager.get_legacy_facade().get_engine(
+                    use_slave=True)))
+        kw = _get_db_conf(conf_group)
+        for i, connection in enumerate(conf_group.replica_connections):
+            engine = engines.create_engine(
+                connection,
+                sqlite_fk=kw['sqlite_fk'],
+                mysql_sql_mode=kw['mysql_sql_mode'],
+                idle_timeout=kw['idle_timeout'],
+                connection_debug=kw['connection_debug'],
+                max_pool_size=kw['max_pool_size'],
+                max_overflow=kw['max_overflow'],
+                pool_timeout=kw['pool_timeout'],
+                sqlite_synchronous=kw['sqlite_synchronous'],
+                connection_trace=kw['connection_trace'],
+                max_retries=kw['max_retries'],
+                retry_interval=kw['retry_interval'])
+            pool.append(replicas.Replica('replica_connections[%d]' % i,
+                                         engine))
+        _REPLICA_POOL = replicas.ReplicaPool(
+            pool, max_lag=conf_group.replica_max_lag,
+            check_interval=conf_group.replica_lag_check_interval)
+    return _REPLICA_POOL
+
+
+def _get_replica_pool_if_any():
+    if not _have_replicas():
+        return None
+    return _get_replica_pool()
+
+
+def _get_replica(use_slave):
+    """Return the replica to read from, or None for the primary database.
+
+    This is the replica picked by read_only() for the current call, if any,
+    or one picked from the pool if use_slave is set.
+    """
+    replica = replicas.get_current_replica()
+    if replica is None and use_slave and _have_replicas():
+        replica = _get_replica_pool().pick()
+    return replica
 
 
 def get_engine(use_slave=False):
-    return main_context_manager.get_legacy_facade().get_engine(
-        use_slave=use_slave)
+    replica = _get_replica(use_slave)
+    if replica is not None:
+        return replica.engine
+    return main_context_manager.get_legacy_facade().get_engine()
 
 
 def get_api_engine():
@@ -170,8 +273,10 @@ def get_api_engine():
 
 
 def get_session(use_slave=False, **kwargs):
-    return main_context_manager.get_legacy_facade().get_session(
-        use_slave=use_slave, **kwargs)
+    replica = _get_replica(use_slave)
+    if replica is not None:
+        return replica.get_session(**kwargs)
+    return main_context_manager.get_legacy_facade().get_session(**kwargs)
 
 
 def get_api_session(**kwargs):
@@ -184,8 +289,11 @@ PER_PROJECT_QUOTAS = ['fixed_ips', 'floating_ips', 'networks']
 
 
 def get_backend():
-    """The backend is this module itself."""
-    return sys.modules[__name__]
+    """The backend is this module itself, whose functions mark the request
+    context they are given when they write, if there are replicas.
+    """
+    return replicas.WriteTrackingBackend(sys.modules[__name__],
+                                         _get_replica_pool_if_any)
 
 
 def require_context(f):
@@ -234,6 +342,42 @@ def require_aggregate_exists(f):
     return wrapper
 
 
+def read_only(f):
+    """Decorator marking a DB API function which only reads.
+
+    If route_reads_to_replicas is set, the sessions the function gets go to
+    a replica picked from the pool, unless the context wrote to the primary
+    database or is in a transaction. If the replica cannot be reached, the
+    function is run again against the primary database.
+
+    The first argument to the wrapped function must be the context.
+    """
+
+    @functools.wraps(f)
+    def wrapper(*args, **kwargs):
+        if (not CONF.database.route_reads_to_replicas or
+                replicas.get_current_replica() is not None or
+                not _have_replicas() or hasattr(args[0], 'session')):
+            return f(*args, **kwargs)
+
+        replica = _get_replica_pool().pick(args[0])
+        if replica is None:
+            return f(*args, **kwargs)
+
+        replicas.set_current_replica(replica)
+        try:
+            return f(*args, **kwargs)
+        except db_exc.DBConnectionError:
+            LOG.warning(_LW("Could not read from database replica %s, "
+                            "reading from the primary database"),
+                        replica.name)
+            replica.mark_unavailable()
+        finally:
+            replicas.set_current_replica(None)
+        return f(*args, **kwargs)
+    return wrapper
+
+
 def select_db_reader_mode(f):
     """Decorator to select synchronous or asynchronous reader mode.
 
@@ -290,7 +434,7 @@ def model_query(context, model,
         session = context.session
 
     if session is None:
-        if CONF.database.slave_connection == '':
+        if not _have_replicas():
             use_slave = False
         session = get_session(use_slave=use_slave)
 
@@ -743,6 +887,7 @@ def certificate_get_all_by_user_and_project(context, user_id, project_id):
 
 
 @require_context
+@read_only
 def floating_ip_get(context, id):
     try:
         result = model_query(context, models.FloatingIp, project_only=True).\
@@ -760,6 +905,7 @@ def floating_ip_get(context, id):
 
 
 @require_context
+@read_only
 def floating_ip_get_pools(context):
     pools = []
     for result in model_query(context, models.FloatingIp,
@@ -988,6 +1134,7 @@ def floating_ip_get_all_by_host(context, host):
 
 
 @require_context
+@read_only
 def floating_ip_get_all_by_project(context, project_id):
     nova.context.authorize_project_context(context, project_id)
     # TODO(tr3buchet): why do we not want auto_assigned floating IPs here?
@@ -999,6 +1146,7 @@ def floating_ip_get_all_by_project(context, project_id):
 
 
 @require_context
+@read_only
 def floating_ip_get_by_address(context, address):
     return _floating_ip_get_by_address(context, address)
 
@@ -1030,6 +1178,7 @@ def _floating_ip_get_by_address(context, address, session=None):
 
 
 @require_context
+@read_only
 def floating_ip_get_by_fixed_address(context, fixed_address):
     return model_query(context, models.FloatingIp).\
                        outerjoin(models.FixedIp,
@@ -1040,6 +1189,7 @@ def floating_ip_get_by_fixed_address(context, fixed_address):
 
 
 @require_context
+@read_only
 def floating_ip_get_by_fixed_ip_id(context, fixed_ip_id):
     return model_query(context, models.FloatingIp).\
                 filter_by(fixed_ip_id=fixed_ip_id).\
@@ -1284,6 +1434,7 @@ def fixed_ip_disassociate_all_by_timeout(context, host, time):
 
 
 @require_context
+@read_only
 def fixed_ip_get(context, id, get_network=False):
     query = model_query(context, models.FixedIp).filter_by(id=id)
     if get_network:
@@ -1312,6 +1463,7 @@ def fixed_ip_get_all(context):
 
 
 @require_context
+@read_only
 def fixed_ip_get_by_address(context, address, columns_to_join=None):
     return _fixed_ip_get_by_address(context, address,
                                     columns_to_join=columns_to_join)
@@ -1353,6 +1505,7 @@ def _fixed_ip_get_by_address(context, address, session=None,
 
 
 @require_context
+@read_only
 def fixed_ip_get_by_floating_address(context, floating_address):
     return model_query(context, models.FixedIp).\
                        join(models.FloatingIp,
@@ -1364,6 +1517,7 @@ def fixed_ip_get_by_floating_address(context, floating_address):
 
 
 @require_context
+@read_only
 def fixed_ip_get_by_instance(context, instance_uuid):
     if not uuidutils.is_uuid_like(instance_uuid):
         raise exception.InvalidUUID(uuid=instance_uuid)
@@ -1401,6 +1555,7 @@ def fixed_ip_get_by_host(context, host):
 
 
 @require_context
+@read_only
 def fixed_ip_get_by_network_host(context, network_id, host):
     result = model_query(context, models.FixedIp, read_deleted="no").\
                  filter_by(network_id=network_id).\
@@ -1414,6 +1569,7 @@ def fixed_ip_get_by_network_host(context, network_id, host):
 
 
 @require_context
+@read_only
 def fixed_ips_by_virtual_interface(context, vif_id):
     result = model_query(context, models.FixedIp, read_deleted="no").\
                  filter_by(virtual_interface_id=vif_id).\
@@ -1467,6 +1623,7 @@ def _virtual_interface_query(context, session=None, use_slave=False):
 
 
 @require_context
+@read_only
 def virtual_interface_get(context, vif_id):
     """Gets a virtual interface from the table.
 
@@ -1479,6 +1636,7 @@ def virtual_interface_get(context, vif_id):
 
 
 @require_context
+@read_only
 def virtual_interface_get_by_address(context, address):
     """Gets a virtual interface from the table.
 
@@ -1496,6 +1654,7 @@ def virtual_interface_get_by_address(context, address):
 
 
 @require_context
+@read_only
 def virtual_interface_get_by_uuid(context, vif_uuid):
     """Gets a virtual interface from the table.
 
@@ -1508,6 +1667,7 @@ def virtual_interface_get_by_uuid(context, vif_uuid):
 
 
 @require_context
+@read_only
 @require_instance_exists_using_uuid
 def virtual_interface_get_by_instance(context, instance_uuid, use_slave=False):
     """Gets all virtual interfaces for instance.
@@ -1522,6 +1682,7 @@ def virtual_interface_get_by_instance(context, instance_uuid, use_slave=False):
 
 
 @require_context
+@read_only
 def virtual_interface_get_by_instance_and_network(context, instance_uuid,
                                                   network_id):
     """Gets virtual interface for instance that's associated with network."""
@@ -1545,6 +1706,7 @@ def virtual_interface_delete_by_instance(context, instance_uuid):
 
 
 @require_context
+@read_only
 def virtual_interface_get_all(context):
     """Get all vifs."""
     vif_refs = _virtual_interface_query(context).all()
@@ -1742,6 +1904,7 @@ def instance_destroy(context, instance_uuid, constraint=None):
 
 
 @require_context
+@read_only
 def instance_get_by_uuid(context, uuid, columns_to_join=None, use_slave=False):
     return _instance_get_by_uuid(context, uuid,
             columns_to_join=columns_to_join, use_slave=use_slave)
@@ -1762,6 +1925,7 @@ def _instance_get_by_uuid(context, uuid, session=None,
 
 
 @require_context
+@read_only
 def instance_get(context, instance_id, columns_to_join=None):
     try:
         result = _build_instance_get(context, columns_to_join=columns_to_join
@@ -1805,7 +1969,8 @@ def _build_instance_get(context, session=None,
 def _instances_fill_metadata(context, instances,
                              manual_joins=None, use_slave=False):
     """Selectively fill instances with manually-joined metadata. Note that
-    instance will be converted to a dict.
+    instance will be converted to a dict, and that its metadata and system
+    metadata are dicts of their keys and values.
 
     :param context: security context
     :param instances: list of instances to fill
@@ -1818,17 +1983,15 @@ def _instances_fill_metadata(context, instances,
     if manual_joins is None:
         manual_joins = ['metadata', 'system_metadata']
 
-    meta = collections.defaultdict(list)
+    meta = collections.defaultdict(dict)
     if 'metadata' in manual_joins:
-        for row in _instance_metadata_get_multi(context, uuids,
-                                                use_slave=use_slave):
-            meta[row['instance_uuid']].append(row)
+        meta = _instance_metadata_get_multi_dicts(context, uuids,
+                                                  use_slave=use_slave)
 
-    sys_meta = collections.defaultdict(list)
+    sys_meta = collections.defaultdict(dict)
     if 'system_metadata' in manual_joins:
-        for row in _instance_system_metadata_get_multi(context, uuids,
-                                                       use_slave=use_slave):
-            sys_meta[row['instance_uuid']].append(row)
+        sys_meta = _instance_system_metadata_get_multi_dicts(
+            context, uuids, use_slave=use_slave)
 
     pcidevs = collections.defaultdict(list)
     if 'pci_devices' in manual_joins:
@@ -1871,6 +2034,7 @@ def _manual_join_columns(columns_to_join):
 
 
 @require_context
+@read_only
 def instance_get_all(context, columns_to_join=None):
     if columns_to_join is None:
         columns_to_join_new = ['info_cache', 'security_groups']
@@ -1892,9 +2056,10 @@ def instance_get_all(context, columns_to_join=None):
 
 
 @require_context
+@read_only
 def instance_get_all_by_filters(context, filters, sort_key, sort_dir,
                                 limit=None, marker=None, columns_to_join=None,
-                                use_slave=False):
+                                use_slave=False, columns=None):
     """Return instances matching all filters sorted by the primary key.
 
     See instance_get_all_by_filters_sort for more information.
@@ -1906,13 +2071,16 @@ def instance_get_all_by_filters(context, filters, sort_key, sort_dir,
                                             columns_to_join=columns_to_join,
                                             use_slave=use_slave,
                                             sort_keys=[sort_key],
-                                            sort_dirs=[sort_dir])
+                                            sort_dirs=[sort_dir],
+                                            columns=columns)
 
 
 @require_context
+@read_only
 def instance_get_all_by_filters_sort(context, filters, limit=None, marker=None,
                                      columns_to_join=None, use_slave=False,
-                                     sort_keys=None, sort_dirs=None):
+                                     sort_keys=None, sort_dirs=None,
+                                     columns=None):
     """Return instances that match all filters sorted the the given keys.
     Deleted instances will be returned by default, unless there's a filter that
     says otherwise.
@@ -1963,6 +2131,10 @@ def instance_get_all_by_filters_sort(context, filters, limit=None, marker=None,
     |        'tags-any: [some-any-tag, some-another-any-tag]
     |    }
 
+    If columns is given, only these columns of the instances are loaded,
+    along with the id and the joined columns. The instances are then
+    returned without the other columns.
+
     """
     # NOTE(mriedem): If the limit is 0 there is no point in even going
     # to the database since nothing is going to be returned anyway.
@@ -1973,7 +2145,7 @@ def instance_get_all_by_filters_sort(context, filters, limit=None, marker=None,
                                                sort_dirs,
                                                default_dir='desc')
 
-    if CONF.database.slave_connection == '':
+    if not _have_replicas():
         use_slave = False
 
     session = get_session(use_slave=use_slave)
@@ -1991,6 +2163,10 @@ def instance_get_all_by_filters_sort(context, filters, limit=None, marker=None,
             query_prefix = query_prefix.options(undefer(column))
         else:
             query_prefix = query_prefix.options(joinedload(column))
+    if columns is not None:
+        columns = [column for column in columns
+                   if column in models.Instance.__table__.columns]
+        query_prefix = query_prefix.options(load_only(*columns))
 
     # Note: order_by is done in the sqlalchemy.utils.py paginate_query(),
     # no need to do it here as well
@@ -2082,22 +2258,135 @@ def instance_get_all_by_filters_sort(context, filters, limit=None, marker=None,
 
     # paginate query
     if marker is not None:
-        try:
-            marker = _instance_get_by_uuid(
-                    context.elevated(read_deleted='yes'), marker,
-                    session=session)
-        except exception.InstanceNotFound:
-            raise exception.MarkerNotFound(marker)
+        marker_values = _instance_marker_values(context, session, marker,
+                                                sort_keys, sort_dirs)
+        query_prefix = _keyset_filter(query_prefix, models.Instance,
+                                      sort_keys, sort_dirs, marker_values)
     try:
         query_prefix = sqlalchemyutils.paginate_query(query_prefix,
                                models.Instance, limit,
                                sort_keys,
-                               marker=marker,
                                sort_dirs=sort_dirs)
     except db_exc.InvalidSortKey:
         raise exception.InvalidSortKey()
 
-    return _instances_fill_metadata(context, query_prefix.all(), manual_joins)
+    instances = query_prefix.all()
+    if columns is not None:
+        instances = [_instance_projection(instance, columns,
+                                          columns_to_join_new)
+                     for instance in instances]
+    return _instances_fill_metadata(context, instances, manual_joins)
+
+
+def _instance_projection(instance, columns, columns_to_join):
+    """Return a dict of the columns of an instance loaded with load_only()
+    and of its joined relationships, without touching the other columns
+    which would be loaded one instance at a time.
+    """
+    keys = set(columns)
+    keys.add('id')
+    keys.update(column.split('.')[0] for column in columns_to_join)
+    return {key: instance[key] for key in keys}
+
+
+def _keyset_filter(query, model, sort_keys, sort_dirs, marker_values):
+    """Filter a query on the rows sorted after the marker values.
+
+    This is the criteria sqlalchemyutils.paginate_query() builds from a
+    marker, (k1 > v1) OR (k1 = v1 AND k2 > v2) OR ..., with an extra bound on
+    the first sort key which lets the database seek into an index on the sort
+    keys instead of scanning the rows before the marker.
+    """
+    criteria = []
+    for i, (sort_key, sort_dir) in enumerate(zip(sort_keys, sort_dirs)):
+        crit_attrs = [getattr(model, key) == value for key, value
+                      in zip(sort_keys[:i], marker_values[:i])]
+        model_attr = getattr(model, sort_key)
+        if sort_dir == 'desc':
+            crit_attrs.append(model_attr < marker_values[i])
+        else:
+            crit_attrs.append(model_attr > marker_values[i])
+        criteria.append(and_(*crit_attrs))
+    query = query.filter(or_(*criteria))
+    if marker_values[0] is not None:
+        model_attr = getattr(model, sort_keys[0])
+        if sort_dirs[0] == 'desc':
+            query = query.filter(model_attr <= marker_values[0])
+        else:
+            query = query.filter(model_attr >= marker_values[0])
+    return query
+
+
+def instance_pagination_token(instance, sort_keys=None, sort_dirs=None):
+    """Return an opaque marker for the instances sorted after an instance.
+
+    The token holds the values of the sort keys of the instance, so
+    instance_get_all_by_filters_sort() can use it without looking the marker
+    instance up. It also holds the instance UUID, which is looked up instead
+    if the token is given with other sort keys.
+    """
+    sort_keys, sort_dirs = process_sort_params(sort_keys, sort_dirs,
+                                               default_dir='desc')
+    values = []
+    for key in sort_keys:
+        value = instance[key]
+        if isinstance(value, datetime.datetime):
+            value = timeutils.normalize_time(value).isoformat()
+        values.append(value)
+    token = jsonutils.dumps({'keys': sort_keys, 'dirs': sort_dirs,
+                             'values': values, 'uuid': instance['uuid']})
+    return base64.urlsafe_b64encode(token.encode('utf-8')).decode('ascii')
+
+
+def _decode_instance_pagination_token(marker):
+    """Return the dict in a token from instance_pagination_token(), or None
+    if the marker isn't such a token.
+    """
+    try:
+        token = jsonutils.loads(base64.urlsafe_b64decode(
+            marker.encode('ascii')).decode('utf-8'))
+    except (TypeError, ValueError, UnicodeError):
+        return None
+    if (not isinstance(token, dict) or
+            set(token) != set(['keys', 'dirs', 'values', 'uuid'])):
+        return None
+    return token
+
+
+def _instance_marker_values(context, session, marker, sort_keys, sort_dirs):
+    """Return the values of the sort keys of the marker of an instance list.
+
+    The marker is either a token from instance_pagination_token() for the
+    same sort keys, or an instance UUID. For a UUID only the sort key columns
+    of the instance are read.
+    """
+    columns = models.Instance.__table__.columns
+    for key in sort_keys:
+        if key not in columns:
+            raise exception.InvalidSortKey()
+
+    token = _decode_instance_pagination_token(marker)
+    if token is not None:
+        if token['keys'] == sort_keys and token['dirs'] == sort_dirs:
+            values = []
+            for key, value in zip(sort_keys, token['values']):
+                if (value is not None and
+                        isinstance(columns[key].type, DateTime)):
+                    value = timeutils.normalize_time(
+                        timeutils.parse_isotime(value))
+                values.append(value)
+            return values
+        marker = token['uuid']
+
+    values = model_query(context, models.Instance,
+                         args=[getattr(models.Instance, key)
+                               for key in sort_keys],
+                         session=session, read_deleted='yes').\
+        filter_by(uuid=marker).\
+        first()
+    if values is None:
+        raise exception.MarkerNotFound(marker)
+    return list(values)
 
 
 def _tag_instance_filter(context, query, filters):
@@ -2327,6 +2616,7 @@ def process_sort_params(sort_keys, sort_dirs,
 
 
 @require_context
+@read_only
 def instance_get_active_by_window_joined(context, begin, end=None,
                                          project_id=None, host=None,
                                          use_slave=False,
@@ -2435,6 +2725,7 @@ def instance_get_all_by_grantee_security_groups(context, group_ids):
 
 
 @require_context
+@read_only
 def instance_floating_address_get_all(context, instance_uuid):
     if not uuidutils.is_uuid_like(instance_uuid):
         raise exception.InvalidUUID(uuid=instance_uuid)
@@ -2512,6 +2803,131 @@ def instance_update_and_get_original(context, instance_uuid, values,
                                  expected, original=instance_ref))
 
 
+@require_context
+@_retry_instance_update()
+def instance_update_many_and_get_original(context, updates,
+                                          columns_to_join=None):
+    """Set the given properties on several instances in one transaction.
+
+    The instances are read with a single query and their expected values
+    checked against it, then the instances getting the same values are
+    updated by a single statement matching their expected values again.
+
+    :param context: = request context object
+    :param updates: = dict mapping instance uuids to dicts of column values,
+                      which may hold 'expected_task_state' and
+                      'expected_vm_state' like those given to
+                      instance_update_and_get_original()
+
+    :returns: a tuple of a dict mapping the uuids of the updated instances to
+              tuples of the form (old_instance_ref, new_instance_ref), and of
+              a dict mapping the uuids of the instances which were not updated
+              to the error raised by instance_update_and_get_original(), for
+              those which lost a race on their expected values or don't exist
+    """
+    results = {}
+    errors = {}
+    session = get_session()
+    with session.begin():
+        originals = {instance['uuid']: instance for instance in
+                     _build_instance_get(context, session=session,
+                                         columns_to_join=columns_to_join).
+                     filter(models.Instance.uuid.in_(list(updates))).all()}
+
+        # Instance uuids grouped by the values of their update
+        groups = collections.OrderedDict()
+        group_updates = {}
+        metadata_updates = {}
+        for instance_uuid, values in six.iteritems(updates):
+            original = originals.get(instance_uuid)
+            if original is None:
+                errors[instance_uuid] = exception.InstanceNotFound(
+                    instance_id=instance_uuid)
+                continue
+            values = dict(values)
+            expected = _instance_update_expected(values, None)
+            error = _instance_update_conflict(instance_uuid, expected,
+                                              original)
+            if error is not None:
+                errors[instance_uuid] = error
+                continue
+
+            metadata_updates[instance_uuid] = (
+                values.pop('metadata', None),
+                values.pop('system_metadata', None))
+            _handle_objects_related_type_conversions(values)
+            if 'hostname' in values:
+                _validate_unique_server_name(context, session,
+                                             values['hostname'])
+            try:
+                key = (tuple(sorted(six.iteritems(values))),
+                       tuple(sorted((field, tuple(expected_values))
+                                    for field, expected_values in
+                                    six.iteritems(expected))))
+                hash(key)
+            except TypeError:
+                key = instance_uuid
+            groups.setdefault(key, []).append(instance_uuid)
+            group_updates[key] = (values, expected)
+
+        for key, instance_uuids in six.iteritems(groups):
+            values, expected = group_updates[key]
+            results.update((instance_uuid,
+                            copy.copy(originals[instance_uuid]))
+                           for instance_uuid in instance_uuids)
+            if not values:
+                continue
+            query = model_query(context, models.Instance, project_only=True,
+                                session=session).\
+                filter(models.Instance.uuid.in_(instance_uuids))
+            for field, expected_values in six.iteritems(expected):
+                column = getattr(models.Instance, field)
+                criteria = [column.in_([value for value in expected_values
+                                        if value is not None])]
+                if None in expected_values:
+                    criteria.append(column == null())
+                query = query.filter(or_(*criteria))
+            if query.update(values, synchronize_session=False) != len(
+                    instance_uuids):
+                # The instances changed since they were read, but the read
+                # view of this transaction can't tell how. Go round again.
+                raise exception.UnknownInstanceUpdateConflict(
+                    instance_uuid=', '.join(instance_uuids), expected={},
+                    actual={})
+
+        if not results:
+            return results, errors
+
+        refresh_columns = list(columns_to_join or
+                               ['metadata', 'system_metadata'])
+        for metadata, system_metadata in six.itervalues(metadata_updates):
+            if metadata is not None and 'metadata' not in refresh_columns:
+                refresh_columns.append('metadata')
+            if (system_metadata is not None and
+                    'system_metadata' not in refresh_columns):
+                refresh_columns.append('system_metadata')
+        # NOTE: This overwrites the instances read above, whose shallow
+        # copies keep the original values.
+        instances = _build_instance_get(context, session=session,
+                                        columns_to_join=refresh_columns).\
+            filter(models.Instance.uuid.in_(list(results))).\
+            populate_existing().all()
+        for instance_ref in instances:
+            instance_uuid = instance_ref['uuid']
+            metadata, system_metadata = metadata_updates[instance_uuid]
+            if metadata is not None:
+                _instance_metadata_update_in_place(context, instance_ref,
+                                                   'metadata',
+                                                   models.InstanceMetadata,
+                                                   metadata, session)
+            if system_metadata is not None:
+                _instance_metadata_update_in_place(
+                    context, instance_ref, 'system_metadata',
+                    models.InstanceSystemMetadata, system_metadata, session)
+            results[instance_uuid] = (results[instance_uuid], instance_ref)
+    return results, errors
+
+
 # NOTE(danms): This updates the instance's metadata list in-place and in
 # the database to avoid stale data and refresh issues. It assumes the
 # delete=True behavior of instance_metadata_update(...)
@@ -2546,11 +2962,10 @@ def _instance_metadata_update_in_place(context, instance, metadata_type, model,
         instance[metadata_type].append(newitem)
 
 
-def _instance_update(context, session, instance_uuid, values, expected,
-                     original=None):
-    if not uuidutils.is_uuid_like(instance_uuid):
-        raise exception.InvalidUUID(instance_uuid)
-
+def _instance_update_expected(values, expected):
+    """Return the values expected by an update of an instance, taking the
+    'expected_' values out of the values of the update.
+    """
     if expected is None:
         expected = {}
     else:
@@ -2569,6 +2984,54 @@ def _instance_update(context, session, instance_uuid, values, expected,
                 expected[field] = [None]
             else:
                 expected[field] = sqlalchemyutils.to_list(value)
+    return expected
+
+
+def _instance_update_conflict(instance_uuid, expected, original):
+    """Return the error of an update of an instance whose values don't
+    match the expected ones, or None if they match.
+    """
+    conflicts_expected = {}
+    conflicts_actual = {}
+    for (field, expected_values) in six.iteritems(expected):
+        actual = original[field]
+        if actual not in expected_values:
+            conflicts_expected[field] = expected_values
+            conflicts_actual[field] = actual
+
+    if len(conflicts_actual) == 0:
+        return None
+
+    # Exception properties
+    exc_props = {
+        'instance_uuid': instance_uuid,
+        'expected': conflicts_expected,
+        'actual': conflicts_actual
+    }
+
+    # Task state gets special handling for convenience. We raise the
+    # specific error UnexpectedDeletingTaskStateError or
+    # UnexpectedTaskStateError as appropriate
+    if 'task_state' in conflicts_actual:
+        conflict_task_state = conflicts_actual['task_state']
+        if conflict_task_state == task_states.DELETING:
+            exc = exception.UnexpectedDeletingTaskStateError
+        else:
+            exc = exception.UnexpectedTaskStateError
+
+    # Everything else is an InstanceUpdateConflict
+    else:
+        exc = exception.InstanceUpdateConflict
+
+    return exc(**exc_props)
+
+
+def _instance_update(context, session, instance_uuid, values, expected,
+                     original=None):
+    if not uuidutils.is_uuid_like(instance_uuid):
+        raise exception.InvalidUUID(instance_uuid)
+
+    expected = _instance_update_expected(values, expected)
 
     # Values which need to be updated separately
     metadata = values.pop('metadata', None)
@@ -2611,43 +3074,17 @@ def _instance_update(context, session, instance_uuid, values, expected,
             original = _instance_get_by_uuid(context, instance_uuid,
                                              session=session)
 
-        conflicts_expected = {}
-        conflicts_actual = {}
-        for (field, expected_values) in six.iteritems(expected):
-            actual = original[field]
-            if actual not in expected_values:
-                conflicts_expected[field] = expected_values
-                conflicts_actual[field] = actual
-
-        # Exception properties
-        exc_props = {
-            'instance_uuid': instance_uuid,
-            'expected': conflicts_expected,
-            'actual': conflicts_actual
-        }
+        exc = _instance_update_conflict(instance_uuid, expected, original)
 
         # There was a conflict, but something (probably the MySQL read view,
         # but possibly an exceptionally unlikely second race) is preventing us
         # from seeing what it is. When we go round again we'll get a fresh
         # transaction and a fresh read view.
-        if len(conflicts_actual) == 0:
-            raise exception.UnknownInstanceUpdateConflict(**exc_props)
-
-        # Task state gets special handling for convenience. We raise the
-        # specific error UnexpectedDeletingTaskStateError or
-        # UnexpectedTaskStateError as appropriate
-        if 'task_state' in conflicts_actual:
-            conflict_task_state = conflicts_actual['task_state']
-            if conflict_task_state == task_states.DELETING:
-                exc = exception.UnexpectedDeletingTaskStateError
-            else:
-                exc = exception.UnexpectedTaskStateError
-
-        # Everything else is an InstanceUpdateConflict
-        else:
-            exc = exception.InstanceUpdateConflict
+        if exc is None:
+            raise exception.UnknownInstanceUpdateConflict(
+                instance_uuid=instance_uuid, expected={}, actual={})
 
-        raise exc(**exc_props)
+        raise exc
 
     if metadata is not None:
         _instance_metadata_update_in_place(context, instance_ref,
@@ -2954,11 +3391,13 @@ def _network_get(context, network_id, session=None, project_only='allow_none'):
 
 
 @require_context
+@read_only
 def network_get(context, network_id, project_only='allow_none'):
     return _network_get(context, network_id, project_only=project_only)
 
 
 @require_context
+@read_only
 def network_get_all(context, project_only):
     result = model_query(context, models.Network, read_deleted="no",
                          project_only=project_only).all()
@@ -2970,6 +3409,7 @@ def network_get_all(context, project_only):
 
 
 @require_context
+@read_only
 def network_get_all_by_uuids(context, network_uuids, project_only):
     result = model_query(context, models.Network, read_deleted="no",
                          project_only=project_only).\
@@ -3155,6 +3595,7 @@ def network_update(context, network_id, values):
 
 
 @require_context
+@read_only
 def quota_get(context, project_id, resource, user_id=None):
     model = models.ProjectUserQuota if user_id else models.Quota
     query = model_query(context, model).\
@@ -3175,6 +3616,7 @@ def quota_get(context, project_id, resource, user_id=None):
 
 
 @require_context
+@read_only
 def quota_get_all_by_project_and_user(context, project_id, user_id):
     user_quotas = model_query(context, models.ProjectUserQuota,
                               (models.ProjectUserQuota.resource,
@@ -3191,6 +3633,7 @@ def quota_get_all_by_project_and_user(context, project_id, user_id):
 
 
 @require_context
+@read_only
 def quota_get_all_by_project(context, project_id):
     rows = model_query(context, models.Quota, read_deleted="no").\
                    filter_by(project_id=project_id).\
@@ -3204,6 +3647,7 @@ def quota_get_all_by_project(context, project_id):
 
 
 @require_context
+@read_only
 def quota_get_all(context, project_id):
     result = model_query(context, models.ProjectUserQuota).\
                    filter_by(project_id=project_id).\
@@ -3212,6 +3656,98 @@ def quota_get_all(context, project_id):
     return result
 
 
+class _QuotaLimitsCache(object):
+    """Quota limits read by quota_get_all_limits(), by project, user and
+    quota class, kept for quota_limits_cache_ttl seconds.
+    """
+
+    def __init__(self):
+        # (project_id, user_id, quota_class) -> (read_at, limits)
+        self._entries = {}
+        # Bumped by every invalidation, so that limits read from the
+        # database before a change aren't cached after it.
+        self.generation = 0
+
+    def get(self, key, ttl):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        read_at, limits = entry
+        if timeutils.is_older_than(read_at, ttl):
+            del self._entries[key]
+            return None
+        return limits
+
+    def set(self, key, limits, generation):
+        if generation == self.generation:
+            self._entries[key] = (timeutils.utcnow(), limits)
+
+    def invalidate(self, project_id=None):
+        """Forget the limits of a project, or of all the projects."""
+        self.generation += 1
+        if project_id is None:
+            self._entries.clear()
+            return
+        for key in list(self._entries):
+            if key[0] == project_id:
+                del self._entries[key]
+
+
+_QUOTA_LIMITS_CACHE = _QuotaLimitsCache()
+
+
+def _quota_limits_query(context, model, kind, **filters):
+    return model_query(context, model,
+                       (sql.literal_column("'%s'" % kind).label('kind'),
+                        model.resource, model.hard_limit),
+                       read_deleted="no").\
+        filter_by(**filters)
+
+
+def _quota_get_all_limits(context, project_id, user_id, quota_class):
+    limits = {'default': {'class_name': _DEFAULT_QUOTA_NAME},
+              'class': {'class_name': quota_class},
+              'project': {'project_id': project_id},
+              'user': {'project_id': project_id, 'user_id': user_id}}
+    queries = [
+        _quota_limits_query(context, models.QuotaClass, 'default',
+                            class_name=_DEFAULT_QUOTA_NAME),
+        _quota_limits_query(context, models.Quota, 'project',
+                            project_id=project_id)]
+    if quota_class:
+        queries.append(_quota_limits_query(context, models.QuotaClass,
+                                           'class', class_name=quota_class))
+    if user_id:
+        queries.append(_quota_limits_query(context, models.ProjectUserQuota,
+                                           'user', project_id=project_id,
+                                           user_id=user_id))
+    for kind, resource, hard_limit in queries[0].union_all(*queries[1:]):
+        limits[kind][resource] = hard_limit
+    return limits
+
+
+# NOTE: This always reads from the primary database, so that the limits which
+# are cached aren't older than those seen by the process which changed them.
+@require_context
+def quota_get_all_limits(context, project_id, user_id=None, quota_class=None):
+    """Return the default, quota class, project and user quota limits.
+
+    They are read in a single query, or taken from the cache if
+    quota_limits_cache_ttl is set.
+    """
+    ttl = CONF.quota_limits_cache_ttl
+    key = (project_id, user_id, quota_class)
+    limits = _QUOTA_LIMITS_CACHE.get(key, ttl) if ttl > 0 else None
+    if limits is None:
+        generation = _QUOTA_LIMITS_CACHE.generation
+        limits = _quota_get_all_limits(context, project_id, user_id,
+                                       quota_class)
+        if ttl > 0:
+            _QUOTA_LIMITS_CACHE.set(key, limits, generation)
+    # The callers are free to change what they get
+    return copy.deepcopy(limits)
+
+
 def quota_create(context, project_id, resource, limit, user_id=None):
     per_user = user_id and resource not in PER_PROJECT_QUOTAS
     quota_ref = models.ProjectUserQuota() if per_user else models.Quota()
@@ -3224,6 +3760,7 @@ def quota_create(context, project_id, resource, limit, user_id=None):
         quota_ref.save()
     except db_exc.DBDuplicateEntry:
         raise exception.QuotaExists(project_id=project_id, resource=resource)
+    _QUOTA_LIMITS_CACHE.invalidate(project_id)
     return quota_ref
 
 
@@ -3243,12 +3780,14 @@ def quota_update(context, project_id, resource, limit, user_id=None):
                                                      user_id=user_id)
         else:
             raise exception.ProjectQuotaNotFound(project_id=project_id)
+    _QUOTA_LIMITS_CACHE.invalidate(project_id)
 
 
 ###################
 
 
 @require_context
+@read_only
 def quota_class_get(context, class_name, resource):
     result = model_query(context, models.QuotaClass, read_deleted="no").\
                      filter_by(class_name=class_name).\
@@ -3274,6 +3813,7 @@ def quota_class_get_default(context):
 
 
 @require_context
+@read_only
 def quota_class_get_all_by_name(context, class_name):
     rows = model_query(context, models.QuotaClass, read_deleted="no").\
                    filter_by(class_name=class_name).\
@@ -3292,6 +3832,7 @@ def quota_class_create(context, class_name, resource, limit):
     quota_class_ref.resource = resource
     quota_class_ref.hard_limit = limit
     quota_class_ref.save()
+    _QUOTA_LIMITS_CACHE.invalidate()
     return quota_class_ref
 
 
@@ -3303,12 +3844,14 @@ def quota_class_update(context, class_name, resource, limit):
 
     if not result:
         raise exception.QuotaClassNotFound(class_name=class_name)
+    _QUOTA_LIMITS_CACHE.invalidate()
 
 
 ###################
 
 
 @require_context
+@read_only
 def quota_usage_get(context, project_id, resource, user_id=None):
     query = model_query(context, models.QuotaUsage, read_deleted="no").\
                      filter_by(project_id=project_id).\
@@ -3349,11 +3892,13 @@ def _quota_usage_get_all(context, project_id, user_id=None):
 
 
 @require_context
+@read_only
 def quota_usage_get_all_by_project_and_user(context, project_id, user_id):
     return _quota_usage_get_all(context, project_id, user_id=user_id)
 
 
 @require_context
+@read_only
 def quota_usage_get_all_by_project(context, project_id):
     return _quota_usage_get_all(context, project_id)
 
@@ -3419,14 +3964,15 @@ def _reservation_create(uuid, usage, project_id, user_id, resource,
 # on reservations.
 
 def _get_project_user_quota_usages(context, session, project_id,
-                                   user_id):
-    rows = model_query(context, models.QuotaUsage,
-                       read_deleted="no",
-                       session=session).\
+                                   user_id, lock=True):
+    query = model_query(context, models.QuotaUsage,
+                        read_deleted="no",
+                        session=session).\
         filter_by(project_id=project_id).\
-        order_by(models.QuotaUsage.id.asc()).\
-        with_lockmode('update').\
-        all()
+        order_by(models.QuotaUsage.id.asc())
+    if lock:
+        query = query.with_lockmode('update')
+    rows = query.all()
     proj_result = dict()
     user_result = dict()
     # Get the total count of in_use,reserved
@@ -3564,6 +4110,36 @@ def _calculate_overquota(project_quotas, user_quotas, deltas,
     return overs
 
 
+def _raise_over_quota(project_quotas, user_quotas, deltas, overs,
+                      project_usages, user_usages):
+    if project_quotas == user_quotas:
+        usages = project_usages
+    else:
+        # NOTE(mriedem): user_usages is a dict of resource keys to
+        # QuotaUsage sqlalchemy dict-like objects and doen't log well
+        # so convert the user_usages values to something useful for
+        # logging. Remove this if we ever change how
+        # _get_project_user_quota_usages returns the user_usages values.
+        user_usages = {k: dict(in_use=v['in_use'], reserved=v['reserved'],
+                               total=v['total'])
+                  for k, v in user_usages.items()}
+        usages = user_usages
+    usages = {k: dict(in_use=v['in_use'], reserved=v['reserved'])
+              for k, v in usages.items()}
+    LOG.debug('Raise OverQuota exception because: '
+              'project_quotas: %(project_quotas)s, '
+              'user_quotas: %(user_quotas)s, deltas: %(deltas)s, '
+              'overs: %(overs)s, project_usages: %(project_usages)s, '
+              'user_usages: %(user_usages)s',
+              {'project_quotas': project_quotas,
+               'user_quotas': user_quotas,
+               'overs': overs, 'deltas': deltas,
+               'project_usages': project_usages,
+               'user_usages': user_usages})
+    raise exception.OverQuota(overs=sorted(overs), quotas=user_quotas,
+                              usages=usages)
+
+
 @require_context
 @oslo_db_api.wrap_db_retry(max_retries=5, retry_on_deadlock=True)
 def quota_reserve(context, resources, project_quotas, user_quotas, deltas,
@@ -3684,32 +4260,8 @@ def quota_reserve(context, resources, project_quotas, user_quotas, deltas,
                         "resources: %s"), unders)
 
     if overs:
-        if project_quotas == user_quotas:
-            usages = project_usages
-        else:
-            # NOTE(mriedem): user_usages is a dict of resource keys to
-            # QuotaUsage sqlalchemy dict-like objects and doen't log well
-            # so convert the user_usages values to something useful for
-            # logging. Remove this if we ever change how
-            # _get_project_user_quota_usages returns the user_usages values.
-            user_usages = {k: dict(in_use=v['in_use'], reserved=v['reserved'],
-                                   total=v['total'])
-                      for k, v in user_usages.items()}
-            usages = user_usages
-        usages = {k: dict(in_use=v['in_use'], reserved=v['reserved'])
-                  for k, v in usages.items()}
-        LOG.debug('Raise OverQuota exception because: '
-                  'project_quotas: %(project_quotas)s, '
-                  'user_quotas: %(user_quotas)s, deltas: %(deltas)s, '
-                  'overs: %(overs)s, project_usages: %(project_usages)s, '
-                  'user_usages: %(user_usages)s',
-                  {'project_quotas': project_quotas,
-                   'user_quotas': user_quotas,
-                   'overs': overs, 'deltas': deltas,
-                   'project_usages': project_usages,
-                   'user_usages': user_usages})
-        raise exception.OverQuota(overs=sorted(overs), quotas=user_quotas,
-                                  usages=usages)
+        _raise_over_quota(project_quotas, user_quotas, deltas, overs,
+                          project_usages, user_usages)
 
     return reservations
 
@@ -3758,6 +4310,249 @@ def reservation_rollback(context, reservations, project_id=None, user_id=None):
         reservation_query.soft_delete(synchronize_session=False)
 
 
+def _retry_quota_usage_update():
+    """Wrap with oslo_db_api.wrap_db_retry, and also retry on
+    QuotaUsageConflict.
+    """
+    exception_checker = \
+        lambda exc: isinstance(exc, (exception.QuotaUsageConflict,))
+    return oslo_db_api.wrap_db_retry(max_retries=5, retry_on_deadlock=True,
+                                     exception_checker=exception_checker)
+
+
+# NOTE: The optimistic variants of the quota functions below don't lock the
+# quota usages while checking them. The usages are read, refreshed and
+# checked without locks, and only written at the end of the transaction with
+# UPDATEs which apply the change relatively and only match the row if it
+# still satisfies the limits and, when the usage was refreshed, still has the
+# in_use value which was read. An UPDATE which matches no row raises
+# QuotaUsageConflict and the whole call is retried. Concurrent reservations
+# in the same project therefore only wait for each other while their UPDATEs
+# run, instead of for each other's whole transaction. As everywhere else, the
+# quota usages are updated before the reservations.
+
+def _quota_usage_totals(context, project_id, resources):
+    """Return the in_use + reserved totals of the project by resource."""
+    total = func.sum(models.QuotaUsage.in_use + models.QuotaUsage.reserved)
+    rows = model_query(context, models.QuotaUsage,
+                       (models.QuotaUsage.resource, total),
+                       read_deleted="no").\
+        filter_by(project_id=project_id).\
+        filter(models.QuotaUsage.resource.in_(resources)).\
+        group_by(models.QuotaUsage.resource).\
+        all()
+    return {resource: int(total or 0) for resource, total in rows}
+
+
+@require_context
+@_retry_quota_usage_update()
+def quota_reserve_optimistic(context, resources, project_quotas, user_quotas,
+                             deltas, expire, until_refresh, max_age,
+                             project_id=None, user_id=None):
+    elevated = context.elevated()
+    if project_id is None:
+        project_id = context.project_id
+    if user_id is None:
+        user_id = context.user_id
+
+    session = get_session()
+    with session.begin():
+        project_usages, user_usages = _get_project_user_quota_usages(
+                context, session, project_id, user_id, lock=False)
+        # The usages are only changed in memory from now on, the changes are
+        # written with conditional UPDATEs below.
+        session.expunge_all()
+        read_usages = {res: usage.in_use
+                       for res, usage in user_usages.items()}
+        # Totals of the other users of the project, by resource
+        others = {res: usage['total'] - (user_usages[res].total
+                                         if res in user_usages else 0)
+                  for res, usage in project_usages.items()}
+
+        def _create_usage_if_missing(res):
+            if _create_quota_usage_if_missing(user_usages, res,
+                                              until_refresh, project_id,
+                                              user_id, session):
+                session.expunge(user_usages[res])
+                return True
+            return False
+
+        # Handle usage refresh, as quota_reserve() does
+        refreshed = set()
+        decremented = set()
+        work = set(deltas.keys())
+        while work:
+            resource = work.pop()
+            created = _create_usage_if_missing(resource)
+            usage = user_usages[resource]
+            until_refresh_before = usage.until_refresh
+            refresh = created or _is_quota_refresh_needed(usage, max_age)
+            if usage.until_refresh != until_refresh_before:
+                decremented.add(resource)
+
+            if refresh:
+                sync = QUOTA_SYNC_FUNCTIONS[resources[resource].sync]
+                updates = sync(elevated, project_id, user_id, session)
+                for res, in_use in updates.items():
+                    _create_usage_if_missing(res)
+                    _refresh_quota_usages(user_usages[res], until_refresh,
+                                          in_use)
+                    refreshed.add(res)
+                    work.discard(res)
+
+        unders = [res for res, delta in deltas.items()
+                  if delta < 0 and
+                  delta + user_usages[res].in_use < 0]
+
+        for key, value in user_usages.items():
+            if key not in project_usages:
+                project_usages[key] = value
+
+        overs = _calculate_overquota(project_quotas, user_quotas, deltas,
+                                     project_usages, user_usages)
+
+        # Write the usages. The usages are refreshed even when over quota,
+        # as quota_reserve() does.
+        for res, usage in sorted(user_usages.items(),
+                                 key=lambda item: item[1].id):
+            values = {}
+            query = model_query(context, models.QuotaUsage,
+                                read_deleted="no", session=session).\
+                filter_by(id=usage.id)
+            in_use = models.QuotaUsage.in_use
+            if res in refreshed:
+                values['in_use'] = usage.in_use
+                values['until_refresh'] = usage.until_refresh
+                in_use = usage.in_use
+                query = query.filter(
+                    models.QuotaUsage.in_use == read_usages.get(res, 0))
+            elif res in decremented:
+                values['until_refresh'] = models.QuotaUsage.until_refresh - 1
+
+            delta = deltas.get(res, 0)
+            if not overs and delta > 0:
+                values['reserved'] = models.QuotaUsage.reserved + delta
+                total = in_use + models.QuotaUsage.reserved + delta
+                if user_quotas[res] >= 0:
+                    query = query.filter(total <= user_quotas[res])
+                if project_quotas[res] >= 0:
+                    # The usages of the other users of the project are
+                    # checked again after the commit.
+                    query = query.filter(
+                        total <= project_quotas[res] - others.get(res, 0))
+
+            if values and not query.update(values,
+                                           synchronize_session=False):
+                raise exception.QuotaUsageConflict(project_id=project_id)
+
+        # Create the reservations in a single statement
+        if not overs:
+            reservations = []
+            rows = []
+            for res, delta in deltas.items():
+                reservation_uuid = str(uuid.uuid4())
+                rows.append({'uuid': reservation_uuid,
+                             'usage_id': user_usages[res].id,
+                             'project_id': project_id,
+                             'user_id': user_id,
+                             'resource': res,
+                             'delta': delta,
+                             'expire': expire})
+                reservations.append(reservation_uuid)
+            if rows:
+                session.execute(models.Reservation.__table__.insert(), rows)
+
+    if unders:
+        LOG.warning(_LW("Change will make usage less than 0 for the following "
+                        "resources: %s"), unders)
+
+    if overs:
+        _raise_over_quota(project_quotas, user_quotas, deltas, overs,
+                          project_usages, user_usages)
+
+    # The UPDATEs only saw the usages of the other users of the project as
+    # they were read, so a concurrent reservation of another user may have
+    # taken the project over its limit. Check it again now that both are
+    # committed and give the reservations back if so.
+    recheck = [res for res, delta in deltas.items()
+               if delta > 0 and res not in PER_PROJECT_QUOTAS and
+               project_quotas[res] >= 0]
+    if recheck:
+        totals = _quota_usage_totals(context, project_id, recheck)
+        overs = [res for res in recheck
+                 if totals.get(res, 0) > project_quotas[res]]
+        if overs:
+            reservation_rollback_optimistic(context, reservations,
+                                            project_id=project_id,
+                                            user_id=user_id)
+            usages = {res: dict(in_use=project_usages[res]['in_use'],
+                                reserved=project_usages[res]['reserved'])
+                      for res in deltas}
+            raise exception.OverQuota(overs=sorted(overs),
+                                      quotas=user_quotas, usages=usages)
+
+    return reservations
+
+
+def _release_reservations(context, session, reservation_query, commit):
+    """Give back the reserved quantities of reservations, adding their
+    deltas to the usages if commit is True, and delete them.
+    """
+    rows = reservation_query.all()
+    if not rows:
+        return
+    # usage_id -> [reserved, in_use] changes
+    changes = collections.defaultdict(lambda: [0, 0])
+    for reservation in rows:
+        if reservation.delta >= 0:
+            changes[reservation.usage_id][0] -= reservation.delta
+        if commit:
+            changes[reservation.usage_id][1] += reservation.delta
+
+    for usage_id in sorted(changes):
+        reserved, in_use = changes[usage_id]
+        if reserved or in_use:
+            model_query(context, models.QuotaUsage, read_deleted="no",
+                        session=session).\
+                filter_by(id=usage_id).\
+                update({'reserved': models.QuotaUsage.reserved + reserved,
+                        'in_use': models.QuotaUsage.in_use + in_use},
+                       synchronize_session=False)
+
+    deleted = model_query(context, models.Reservation, read_deleted="no",
+                          session=session).\
+        filter(models.Reservation.id.in_([r.id for r in rows])).\
+        soft_delete(synchronize_session=False)
+    if deleted != len(rows):
+        # Some of them were released concurrently, start again without
+        # them.
+        raise exception.QuotaUsageConflict(project_id=rows[0].project_id)
+
+
+@require_context
+@_retry_quota_usage_update()
+def reservation_commit_optimistic(context, reservations, project_id=None,
+                                  user_id=None):
+    session = get_session()
+    with session.begin():
+        query = model_query(context, models.Reservation, read_deleted="no",
+                            session=session).\
+            filter(models.Reservation.uuid.in_(reservations))
+        _release_reservations(context, session, query, commit=True)
+
+
+@require_context
+@_retry_quota_usage_update()
+def reservation_rollback_optimistic(context, reservations, project_id=None,
+                                    user_id=None):
+    session = get_session()
+    with session.begin():
+        query = model_query(context, models.Reservation, read_deleted="no",
+                            session=session).\
+            filter(models.Reservation.uuid.in_(reservations))
+        _release_reservations(context, session, query, commit=False)
+
+
 def quota_destroy_all_by_project_and_user(context, project_id, user_id):
     session = get_session()
     with session.begin():
@@ -3778,6 +4573,7 @@ def quota_destroy_all_by_project_and_user(context, project_id, user_id):
                 filter_by(project_id=project_id).\
                 filter_by(user_id=user_id).\
                 soft_delete(synchronize_session=False)
+    _QUOTA_LIMITS_CACHE.invalidate(project_id)
 
 
 def quota_destroy_all_by_project(context, project_id):
@@ -3802,6 +4598,7 @@ def quota_destroy_all_by_project(context, project_id):
                     session=session, read_deleted="no").\
                 filter_by(project_id=project_id).\
                 soft_delete(synchronize_session=False)
+    _QUOTA_LIMITS_CACHE.invalidate(project_id)
 
 
 @oslo_db_api.wrap_db_retry(max_retries=5, retry_on_deadlock=True)
@@ -3821,6 +4618,16 @@ def reservation_expire(context):
         reservation_query.soft_delete(synchronize_session=False)
 
 
+@_retry_quota_usage_update()
+def reservation_expire_optimistic(context):
+    session = get_session()
+    with session.begin():
+        query = model_query(context, models.Reservation, read_deleted="no",
+                            session=session).\
+            filter(models.Reservation.expire < timeutils.utcnow())
+        _release_reservations(context, session, query, commit=False)
+
+
 ###################
 
 
@@ -4007,6 +4814,7 @@ def block_device_mapping_update_or_create(context, values, legacy=True):
 
 
 @require_context
+@read_only
 def block_device_mapping_get_all_by_instance_uuids(context, instance_uuids,
                                                    use_slave=False):
     if not instance_uuids:
@@ -4019,6 +4827,7 @@ def block_device_mapping_get_all_by_instance_uuids(context, instance_uuids,
 
 
 @require_context
+@read_only
 def block_device_mapping_get_all_by_instance(context, instance_uuid,
                                              use_slave=False):
     return _block_device_mapping_get_query(context, use_slave=use_slave).\
@@ -4027,6 +4836,7 @@ def block_device_mapping_get_all_by_instance(context, instance_uuid,
 
 
 @require_context
+@read_only
 def block_device_mapping_get_by_volume_id(context, volume_id,
         columns_to_join=None):
     return _block_device_mapping_get_query(context,
@@ -4107,11 +4917,13 @@ def _security_group_get_by_names(context, session, project_id, group_names):
 
 
 @require_context
+@read_only
 def security_group_get_all(context):
     return _security_group_get_query(context).all()
 
 
 @require_context
+@read_only
 def security_group_get(context, security_group_id, columns_to_join=None):
     query = _security_group_get_query(context, project_only=True).\
                     filter_by(id=security_group_id)
@@ -4131,6 +4943,7 @@ def security_group_get(context, security_group_id, columns_to_join=None):
 
 
 @require_context
+@read_only
 def security_group_get_by_name(context, project_id, group_name,
                                columns_to_join=None):
     query = _security_group_get_query(context,
@@ -4153,6 +4966,7 @@ def security_group_get_by_name(context, project_id, group_name,
 
 
 @require_context
+@read_only
 def security_group_get_by_project(context, project_id):
     return _security_group_get_query(context, read_deleted="no").\
                         filter_by(project_id=project_id).\
@@ -4160,6 +4974,7 @@ def security_group_get_by_project(context, project_id):
 
 
 @require_context
+@read_only
 def security_group_get_by_instance(context, instance_uuid):
     return _security_group_get_query(context, read_deleted="no").\
                    join(models.SecurityGroup.instances).\
@@ -4168,6 +4983,7 @@ def security_group_get_by_instance(context, instance_uuid):
 
 
 @require_context
+@read_only
 def security_group_in_use(context, group_id):
     session = get_session()
     with session.begin():
@@ -4331,6 +5147,7 @@ def _security_group_rule_get_query(context, session=None):
 
 
 @require_context
+@read_only
 def security_group_rule_get(context, security_group_rule_id):
     result = (_security_group_rule_get_query(context).
                          filter_by(id=security_group_rule_id).
@@ -4344,6 +5161,7 @@ def security_group_rule_get(context, security_group_rule_id):
 
 
 @require_context
+@read_only
 def security_group_rule_get_by_security_group(context, security_group_id,
                                               columns_to_join=None):
     if columns_to_join is None:
@@ -4357,6 +5175,7 @@ def security_group_rule_get_by_security_group(context, security_group_id,
 
 
 @require_context
+@read_only
 def security_group_rule_get_by_instance(context, instance_uuid):
     return (_security_group_rule_get_query(context).
             join('parent_group', 'instances').
@@ -4381,6 +5200,7 @@ def security_group_rule_destroy(context, security_group_rule_id):
 
 
 @require_context
+@read_only
 def security_group_rule_count_by_group(context, security_group_id):
     return (model_query(context, models.SecurityGroupIngressRule,
                    read_deleted="no").
@@ -4397,6 +5217,7 @@ def _security_group_rule_get_default_query(context, session=None):
 
 
 @require_context
+@read_only
 def security_group_default_rule_get(context, security_group_rule_default_id):
     result = _security_group_rule_get_default_query(context).\
                         filter_by(id=security_group_rule_default_id).\
@@ -4430,6 +5251,7 @@ def security_group_default_rule_create(context, values):
 
 
 @require_context
+@read_only
 def security_group_default_rule_list(context):
     return _security_group_rule_get_default_query(context).\
                                     all()
@@ -4751,6 +5573,7 @@ def _flavor_get_query(context, session=None, read_deleted=None):
 
 
 @require_context
+@read_only
 def flavor_get_all(context, inactive=False, filters=None,
                    sort_key='flavorid', sort_dir='asc', limit=None,
                    marker=None):
@@ -4825,6 +5648,7 @@ def _flavor_get_id_from_flavor(context, flavor_id, session=None):
 
 
 @require_context
+@read_only
 def flavor_get(context, id):
     """Returns a dict describing specific flavor."""
     result = _flavor_get_query(context).\
@@ -4836,6 +5660,7 @@ def flavor_get(context, id):
 
 
 @require_context
+@read_only
 def flavor_get_by_name(context, name):
     """Returns a dict describing specific flavor."""
     result = _flavor_get_query(context).\
@@ -4847,6 +5672,7 @@ def flavor_get_by_name(context, name):
 
 
 @require_context
+@read_only
 def flavor_get_by_flavor_id(context, flavor_id, read_deleted):
     """Returns a dict describing specific flavor_id."""
     result = _flavor_get_query(context, read_deleted=read_deleted).\
@@ -4934,6 +5760,7 @@ def _flavor_extra_specs_get_query(context, flavor_id, session=None):
 
 
 @require_context
+@read_only
 def flavor_extra_specs_get(context, flavor_id):
     rows = _flavor_extra_specs_get_query(context, flavor_id).all()
     return {row['key']: row['value'] for row in rows}
@@ -5047,6 +5874,44 @@ def _instance_metadata_get_multi(context, instance_uuids,
             models.InstanceMetadata.instance_uuid.in_(instance_uuids))
 
 
+def _metadata_get_multi_dicts(context, model, instance_uuids,
+                              include_deleted, use_slave=False):
+    """Return a dict of the metadata dicts of the instances, by uuid.
+
+    This reads (instance_uuid, key, value) rows with a Core select rather
+    than ORM objects, which are costly to build for the many metadata rows
+    of a list of instances.
+    """
+    metadata = collections.defaultdict(dict)
+    if not instance_uuids:
+        return metadata
+
+    table = model.__table__
+    query = sql.select([table.c.instance_uuid, table.c.key, table.c.value]).\
+        where(table.c.instance_uuid.in_(instance_uuids))
+    if not include_deleted:
+        query = query.where(table.c.deleted == 0)
+
+    if hasattr(context, 'session'):
+        session = context.session
+    else:
+        if not _have_replicas():
+            use_slave = False
+        session = get_session(use_slave=use_slave)
+    for instance_uuid, key, value in session.execute(query):
+        metadata[instance_uuid][key] = value
+    return metadata
+
+
+def _instance_metadata_get_multi_dicts(context, instance_uuids,
+                                       use_slave=False):
+    # NOTE: The deleted items are always left out, as metadata_to_dict()
+    # does with those of the rows.
+    return _metadata_get_multi_dicts(context, models.InstanceMetadata,
+                                     instance_uuids, include_deleted=False,
+                                     use_slave=use_slave)
+
+
 def _instance_metadata_get_query(context, instance_uuid, session=None):
     return model_query(context, models.InstanceMetadata, session=session,
                        read_deleted="no").\
@@ -5054,6 +5919,7 @@ def _instance_metadata_get_query(context, instance_uuid, session=None):
 
 
 @require_context
+@read_only
 def instance_metadata_get(context, instance_uuid):
     rows = _instance_metadata_get_query(context, instance_uuid).all()
     return {row['key']: row['value'] for row in rows}
@@ -5114,6 +5980,13 @@ def _instance_system_metadata_get_multi(context, instance_uuids,
             models.InstanceSystemMetadata.instance_uuid.in_(instance_uuids))
 
 
+def _instance_system_metadata_get_multi_dicts(context, instance_uuids,
+                                              use_slave=False):
+    return _metadata_get_multi_dicts(context, models.InstanceSystemMetadata,
+                                     instance_uuids, include_deleted=True,
+                                     use_slave=use_slave)
+
+
 def _instance_system_metadata_get_query(context, instance_uuid, session=None):
     return model_query(context, models.InstanceSystemMetadata,
                        session=session).\
@@ -5121,6 +5994,7 @@ def _instance_system_metadata_get_query(context, instance_uuid, session=None):
 
 
 @require_context
+@read_only
 def instance_system_metadata_get(context, instance_uuid):
     rows = _instance_system_metadata_get_query(context, instance_uuid).all()
     return {row['key']: row['value'] for row in rows}
@@ -5212,6 +6086,7 @@ def agent_build_update(context, agent_build_id, values):
 ####################
 
 @require_context
+@read_only
 def bw_usage_get(context, uuid, start_period, mac, use_slave=False):
     values = {'start_period': start_period}
     values = convert_objects_related_datetimes(values, 'start_period')
@@ -5224,6 +6099,7 @@ def bw_usage_get(context, uuid, start_period, mac, use_slave=False):
 
 
 @require_context
+@read_only
 def bw_usage_get_by_uuids(context, uuids, start_period, use_slave=False):
     values = {'start_period': start_period}
     values = convert_objects_related_datetimes(values, 'start_period')
@@ -5291,6 +6167,7 @@ def bw_usage_update(context, uuid, mac, start_period, bw_in, bw_out,
 
 
 @require_context
+@read_only
 def vol_get_usage_by_time(context, begin):
     """Return volumes usage that have been updated after a specified time."""
     return model_query(context, models.VolumeUsage, read_deleted="yes").\
@@ -5927,6 +6804,7 @@ def ec2_instance_create(context, instance_uuid, id=None):
 
 
 @require_context
+@read_only
 def ec2_instance_get_by_uuid(context, instance_uuid):
     result = _ec2_instance_get_query(context).\
                     filter_by(uuid=instance_uuid).\
@@ -5939,6 +6817,7 @@ def ec2_instance_get_by_uuid(context, instance_uuid):
 
 
 @require_context
+@read_only
 def ec2_instance_get_by_id(context, instance_id):
     result = _ec2_instance_get_query(context).\
                     filter_by(id=instance_id).\
@@ -5951,6 +6830,7 @@ def ec2_instance_get_by_id(context, instance_id):
 
 
 @require_context
+@read_only
 def get_instance_uuid_by_ec2_id(context, ec2_id):
     result = ec2_instance_get_by_id(context, ec2_id)
     return result['uuid']
@@ -6030,10 +6910,16 @@ def task_log_end_task(context, task_name, period_beginning, period_ending,
             raise exception.TaskNotRunning(task_name=task_name, host=host)
 
 
-def _archive_deleted_rows_for_table(tablename, max_rows):
+def _archive_deleted_rows_for_table(tablename, max_rows, marks=None):
     """Move up to max_rows rows from one tables to the corresponding
     shadow table.
 
+    When marks is given, the rows are looked for from the key of the last
+    row archived from the table, which is kept in marks under the name of
+    the table, and the rows are archived by range of keys. The mark of the
+    table is removed once no rows are left past it, so that the next pass
+    over the table catches the rows deleted behind it meanwhile.
+
     :returns: number of rows archived
     """
     # NOTE(guochbo): There is a circular import, nova.db.sqlalchemy.utils
@@ -6064,20 +6950,40 @@ def _archive_deleted_rows_for_table(tablename, max_rows):
         column = table.c.domain
     else:
         column = table.c.id
-    # NOTE(guochbo): Use DeleteFromSelect to avoid
-    # database's limit of maximum parameter in one SQL statement.
     deleted_column = table.c.deleted
     columns = [c.name for c in table.c]
-    insert = shadow_table.insert(inline=True).\
-        from_select(columns,
-                    sql.select([table],
-                               deleted_column != deleted_column.default.arg).
-                    order_by(column).limit(max_rows))
-    query_delete = sql.select([column],
-                          deleted_column != deleted_column.default.arg).\
-                          order_by(column).limit(max_rows)
-
-    delete_statement = db_utils.DeleteFromSelect(table, query_delete, column)
+    if marks is None:
+        # NOTE(guochbo): Use DeleteFromSelect to avoid
+        # database's limit of maximum parameter in one SQL statement.
+        insert = shadow_table.insert(inline=True).\
+            from_select(columns,
+                        sql.select([table],
+                                   deleted_column !=
+                                   deleted_column.default.arg).
+                        order_by(column).limit(max_rows))
+        query_delete = sql.select([column],
+                              deleted_column != deleted_column.default.arg).\
+                              order_by(column).limit(max_rows)
+
+        delete_statement = db_utils.DeleteFromSelect(table, query_delete,
+                                                     column)
+    else:
+        criteria = [deleted_column != deleted_column.default.arg]
+        if tablename in marks:
+            criteria.append(column > marks[tablename])
+        last_key = None
+        if max_rows is not None:
+            keys = [row[0] for row in conn.execute(
+                sql.select([column], and_(*criteria)).
+                order_by(column).limit(max_rows))]
+            if not keys:
+                marks.pop(tablename, None)
+                return rows_archived
+            last_key = keys[-1]
+            criteria.append(column <= last_key)
+        insert = shadow_table.insert(inline=True).\
+            from_select(columns, sql.select([table], and_(*criteria)))
+        delete_statement = table.delete().where(and_(*criteria))
     try:
         # Group the insert and delete in a transaction.
         with conn.begin():
@@ -6090,17 +6996,56 @@ def _archive_deleted_rows_for_table(tablename, max_rows):
         LOG.warning(_LW("IntegrityError detected when archiving table "
                      "%(tablename)s: %(error)s"),
                  {'tablename': tablename, 'error': six.text_type(ex)})
+        if marks is not None:
+            # Start over on the next pass over the table
+            marks.pop(tablename, None)
         return rows_archived
 
     rows_archived = result_delete.rowcount
+    if marks is not None:
+        if last_key is None or len(keys) < max_rows:
+            # The end of the table was reached
+            marks.pop(tablename, None)
+        else:
+            marks[tablename] = last_key
 
     return rows_archived
 
 
-def archive_deleted_rows(max_rows=None):
+def _archive_table_levels():
+    """Group the tables to archive by level of dependency.
+
+    The tables of a level only reference tables of the following levels, so
+    that archiving the levels in order archives the rows referencing other
+    rows first, and the tables of a level can be archived concurrently.
+
+    :returns: list of lists of table names
+    """
+    depths = {}
+    for table in models.BASE.metadata.sorted_tables:
+        parents = [fk.column.table.name for fk in table.foreign_keys
+                   if fk.column.table is not table]
+        depths[table.name] = 1 + max([depths[parent] for parent in parents]
+                                     or [-1])
+    levels = {}
+    for tablename, depth in six.iteritems(depths):
+        levels.setdefault(depth, []).append(tablename)
+    return [sorted(levels[depth]) for depth in sorted(levels, reverse=True)]
+
+
+def archive_deleted_rows(max_rows=None, marks=None, workers=1):
     """Move up to max_rows rows from production tables to the corresponding
     shadow tables.
 
+    The tables are archived in the order of their foreign keys, the rows
+    referencing other rows first. Up to workers tables not depending on each
+    other are archived concurrently, sharing max_rows between them.
+
+    :param marks: dict that maps table name to the key of the last row
+                  archived from that table, which is updated as rows are
+                  archived. Passing the same dict to the following calls
+                  resumes each table where the previous call stopped instead
+                  of scanning it from the start.
     :returns: dict that maps table name to number of rows archived from that
               table, for example:
 
@@ -6114,25 +7059,37 @@ def archive_deleted_rows(max_rows=None):
 
     """
     table_to_rows_archived = {}
-    total_rows_archived = 0
-    meta = MetaData(get_engine(use_slave=True))
-    meta.reflect()
-    # Reverse sort the tables so we get the leaf nodes first for processing.
-    for table in reversed(meta.sorted_tables):
-        tablename = table.name
-        # skip the special sqlalchemy-migrate migrate_version table and any
-        # shadow tables
-        if (tablename == 'migrate_version' or
-                tablename.startswith(_SHADOW_TABLE_PREFIX)):
-            continue
+    remaining = {'rows': max_rows}
+
+    def _archive(tablename, share):
+        # NOTE: The rows are reserved before archiving and the unused ones
+        # given back after, so concurrent tables never go over max_rows.
+        rows = remaining['rows']
+        if rows is not None:
+            rows = min(rows, share)
+            if not rows:
+                return
+            remaining['rows'] -= rows
         rows_archived = _archive_deleted_rows_for_table(
-            tablename, max_rows=max_rows - total_rows_archived)
-        total_rows_archived += rows_archived
+            tablename, max_rows=rows, marks=marks)
+        if rows is not None:
+            remaining['rows'] += rows - rows_archived
         # Only report results for tables that had updates.
         if rows_archived:
             table_to_rows_archived[tablename] = rows_archived
-        if total_rows_archived >= max_rows:
-            break
+
+    pool = eventlet.GreenPool(workers)
+    for tablenames in _archive_table_levels():
+        if remaining['rows'] is not None:
+            if remaining['rows'] <= 0:
+                break
+            share = -(-remaining['rows'] // min(workers, len(tablenames)))
+        else:
+            share = None
+        threads = [pool.spawn(_archive, tablename, share)
+                   for tablename in tablenames]
+        for thread in threads:
+            thread.wait()
     return table_to_rows_archived
 
 
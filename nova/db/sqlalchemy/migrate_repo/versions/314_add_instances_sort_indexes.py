@@ -0,0 +1,35 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from sqlalchemy import Index, MetaData, Table
+
+
+INDEXES = [
+    ('instances_created_at_id_idx', ('created_at', 'id')),
+    ('instances_display_name_id_idx', ('display_name', 'id')),
+    ('instances_project_id_created_at_idx', ('project_id', 'created_at')),
+]
+
+
+def upgrade(migrate_engine):
+    """Add indexes matching the common sort keys of the instance lists,
+    so the database can seek to the marker of a page.
+    """
+    meta = MetaData(bind=migrate_engine)
+    instances = Table('instances', meta, autoload=True)
+
+    existing = set(index.name for index in instances.indexes)
+    for name, columns in INDEXES:
+        if name not in existing:
+            index = Index(name, *[getattr(instances.c, column)
+                                  for column in columns])
+            index.create(migrate_engine)
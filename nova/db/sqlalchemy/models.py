@@ -209,6 +209,12 @@ class Instance(BASE, NovaBase, models.SoftDeleteMixin):
               'host', 'node', 'deleted'),
         Index('instances_host_deleted_cleaned_idx',
               'host', 'deleted', 'cleaned'),
+        Index('instances_created_at_id_idx',
+              'created_at', 'id'),
+        Index('instances_display_name_id_idx',
+              'display_name', 'id'),
+        Index('instances_project_id_created_at_idx',
+              'project_id', 'created_at'),
         schema.UniqueConstraint('uuid', name='uniq_instances0uuid'),
     )
     injected_files = []
@@ -0,0 +1,282 @@
+# Copyright (c) 2016 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Routing of database reads to read replicas.
+
+A ReplicaPool picks the replica a read goes to: the one with the fewest
+connections in use among those whose replication lag, measured in the
+background every replica_lag_check_interval seconds, doesn't exceed
+replica_max_lag. Once a request context has written to the primary database,
+its reads stay on the primary so that it reads its own writes. Both the
+context given to the DB API function which wrote and the current one of the
+thread are marked, since the DB API calls which don't say which context they
+are for read with the current one.
+"""
+
+import functools
+import threading
+import time
+
+from oslo_context import context as common_context
+from oslo_db.sqlalchemy import orm
+from oslo_log import log as logging
+from sqlalchemy.engine import Engine
+from sqlalchemy import event
+
+from nova.i18n import _LE
+from nova.i18n import _LW
+
+LOG = logging.getLogger(__name__)
+
+# Attribute of the request contexts which wrote to the primary database
+_WROTE_ATTR = '_db_wrote_to_primary'
+
+_READ_STATEMENTS = ('SELECT', 'SHOW')
+
+# Greenthread local once eventlet has patched threading
+_local = threading.local()
+_replica_engines = set()
+_listening_for_writes = False
+
+
+def _mysql_lag(conn):
+    status = conn.execute('SHOW SLAVE STATUS').first()
+    if status is None:
+        # Not replicating, so as up to date as it gets
+        return 0
+    return status['Seconds_Behind_Master']
+
+
+def _postgresql_lag(conn):
+    return conn.execute(
+        'SELECT CASE WHEN pg_is_in_recovery() '
+        'THEN EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) '
+        'ELSE 0 END').scalar()
+
+
+# Lag queries by dialect name. The replicas of the other dialects are taken
+# as never lagging.
+_LAG_QUERIES = {
+    'mysql': _mysql_lag,
+    'postgresql': _postgresql_lag,
+}
+
+
+class Replica(object):
+    """A read replica of the main database.
+
+    The lag is in seconds, None when it is unknown because the replica
+    couldn't be reached or isn't replicating.
+    """
+
+    def __init__(self, name, engine):
+        self.name = name
+        self.engine = engine
+        self.in_use = 0
+        self.lag = None
+        self._maker = orm.get_maker(engine=engine, autocommit=True,
+                                    expire_on_commit=False)
+        event.listen(engine, 'checkout', self._checkout)
+        event.listen(engine, 'checkin', self._checkin)
+
+    def _checkout(self, dbapi_connection, connection_record,
+                  connection_proxy):
+        self.in_use += 1
+
+    def _checkin(self, dbapi_connection, connection_record):
+        self.in_use -= 1
+
+    def get_session(self, **kwargs):
+        return self._maker(**kwargs)
+
+    def check_lag(self):
+        lag_query = _LAG_QUERIES.get(self.engine.dialect.name)
+        if lag_query is None:
+            self.lag = 0
+            return
+        try:
+            with self.engine.connect() as conn:
+                lag = lag_query(conn)
+        except Exception as e:
+            LOG.warning(_LW("Could not get the replication lag of database "
+                            "replica %(name)s: %(error)s"),
+                        {'name': self.name, 'error': e})
+            lag = None
+        else:
+            if lag is None:
+                LOG.warning(_LW("Database replica %s is not replicating"),
+                            self.name)
+        self.lag = lag
+
+    def mark_unavailable(self):
+        """Stop reading from the replica until its lag is checked again."""
+        self.lag = None
+
+    def is_available(self, max_lag):
+        return self.lag is not None and (not max_lag or self.lag <= max_lag)
+
+
+class ReplicaPool(object):
+    """Replicas among which the reads are balanced.
+
+    The replicas are picked from the lag measured by the last refresh,
+    which runs in the background from the first pick on.
+
+    :param replicas: list of Replica
+    :param max_lag: lag in seconds above which a replica isn't read from, or
+                    0 for no bound, in which case the lag isn't checked
+    :param check_interval: seconds between the refreshes of the lag of the
+                           replicas
+    """
+
+    def __init__(self, replicas, max_lag=0, check_interval=10):
+        self.replicas = replicas
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self._next = 0
+        self._refreshing = False
+        if replicas:
+            _listen_for_writes(replicas)
+        if not max_lag:
+            # Without a bound the lag doesn't matter, the replicas are only
+            # skipped once they couldn't be reached.
+            for replica in replicas:
+                replica.lag = 0
+
+    def pick(self, context=None):
+        """Return the replica to read from for a request context, or None
+        if the read has to go to the primary database.
+        """
+        if not self.replicas or has_written(context):
+            return None
+
+        self._start_refresh()
+        # Start from a different replica each time so that the idle ones
+        # are used in turn.
+        self._next = (self._next + 1) % len(self.replicas)
+        candidates = [replica for replica in (self.replicas[self._next:] +
+                                              self.replicas[:self._next])
+                      if replica.is_available(self.max_lag)]
+        if not candidates:
+            LOG.debug('No database replica is available, reading from the '
+                      'primary database')
+            return None
+        return min(candidates, key=lambda replica: replica.in_use)
+
+    def refresh(self):
+        """Check the lag of the replicas, or only try again those which
+        couldn't be reached if the lag isn't bounded.
+        """
+        for replica in self.replicas:
+            if self.max_lag:
+                replica.check_lag()
+            elif replica.lag is None:
+                replica.lag = 0
+
+    def _refresh_periodically(self):
+        while True:
+            try:
+                self.refresh()
+            except Exception:
+                LOG.exception(_LE("Failed to refresh the replication lag of "
+                                  "the database replicas"))
+            time.sleep(self.check_interval)
+
+    def _start_refresh(self):
+        if self._refreshing:
+            return
+        self._refreshing = True
+        # A greenthread once eventlet has patched threading
+        thread = threading.Thread(target=self._refresh_periodically,
+                                  name='db-replica-lag')
+        thread.daemon = True
+        thread.start()
+
+
+def has_written(context=None):
+    """Return whether the given request context, or the current one of the
+    thread, wrote to the primary database.
+    """
+    for ctxt in (context, common_context.get_current()):
+        if ctxt is not None and getattr(ctxt, _WROTE_ATTR, False):
+            return True
+    return False
+
+
+def set_current_replica(replica):
+    """Set the replica the reads of the thread go to, None for the primary
+    database.
+    """
+    _local.replica = replica
+
+
+def get_current_replica():
+    return getattr(_local, 'replica', None)
+
+
+def _mark_write(conn, cursor, statement, parameters, context, executemany):
+    if conn.engine in _replica_engines:
+        return
+    if statement.lstrip()[:6].upper().startswith(_READ_STATEMENTS):
+        return
+    for ctxt in (getattr(_local, 'context', None),
+                 common_context.get_current()):
+        if ctxt is not None:
+            setattr(ctxt, _WROTE_ATTR, True)
+
+
+def _tracking_writes(func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        context = args[0] if args else kwargs.get('context')
+        if not isinstance(context, common_context.RequestContext):
+            return func(*args, **kwargs)
+        previous = getattr(_local, 'context', None)
+        _local.context = context
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _local.context = previous
+    return wrapper
+
+
+class WriteTrackingBackend(object):
+    """Wrapper of the DB API backend marking the request context given to
+    each of its functions which writes to the primary database.
+
+    :param backend: the DB API backend module
+    :param get_pool: callable returning the ReplicaPool, or None when there
+                     are no replicas and so nothing to track
+    """
+
+    def __init__(self, backend, get_pool):
+        self._backend = backend
+        self._get_pool = get_pool
+
+    def __getattr__(self, key):
+        attr = getattr(self._backend, key)
+        if (key.startswith('_') or not callable(attr) or
+                self._get_pool() is None):
+            return attr
+        return _tracking_writes(attr)
+
+
+def _listen_for_writes(replicas):
+    global _listening_for_writes
+    _replica_engines.update(replica.engine for replica in replicas)
+    if not _listening_for_writes:
+        event.listen(Engine, 'before_cursor_execute', _mark_write)
+        _listening_for_writes = True
@@ -1060,6 +1060,11 @@ class OverQuota(NovaException):
     msg_fmt = _("Quota exceeded for resources: %(overs)s")
 
 
+class QuotaUsageConflict(NovaException):
+    msg_fmt = _("Quota usage of project %(project_id)s changed while being "
+                "updated")
+
+
 class SecurityGroupNotFound(NotFound):
     msg_fmt = _("Security group %(security_group_id)s not found.")
 
@@ -17,9 +17,18 @@
 Filter support
 """
 
+import os
+import signal
+import struct
+import time
+
+from eventlet import greenio
+from eventlet.green import os as green_os
 from oslo_log import log as logging
+from six.moves import cPickle as pickle
+from six.moves import range
 
-from nova.i18n import _LI
+from nova.i18n import _LE, _LI, _LW
 from nova import loadables
 
 LOG = logging.getLogger(__name__)
@@ -44,10 +53,57 @@ class BaseFilter(object):
             if self._filter_one(obj, spec_obj):
                 yield obj
 
+    def filter_array(self, obj_table, spec_obj):
+        """Return a boolean mask of the rows of obj_table which pass.
+
+        Override this in a subclass which can evaluate all the objects at
+        once against a columnar table (see the handler's
+        _get_object_table()). Returning None means that there is no batch
+        path for this filter and that filter_all() should be used instead.
+        """
+        return None
+
     # Set to true in a subclass if a filter only needs to be run once
     # for each request rather than for each instance
     run_filter_once_per_request = False
 
+    # Relative estimate of the cost of running the filter on one object, used
+    # to run the cheap filters before the expensive ones when ordering by
+    # cost is enabled
+    cost = 1
+
+    # Set to true in a subclass if the filter has to run in its configured
+    # position, whatever the filters are reordered by
+    pinned = False
+
+    # Set to true in a subclass if _filter_one() is expensive enough to be
+    # worth running in worker processes, and has no side effect on the
+    # objects besides the ones applied by apply_worker_result()
+    run_in_worker = False
+
+    def filter_in_worker(self, obj, spec_obj):
+        """Evaluate obj in a worker process.
+
+        The worker works on its own copy of obj, so anything else than the
+        returned value is lost. The filter, obj, spec_obj and the returned
+        value must be picklable, and the returned value false if obj doesn't
+        pass the filter.
+        """
+        return bool(self._filter_one(obj, spec_obj))
+
+    def apply_worker_result(self, obj, result):
+        """Apply the result of filter_in_worker() on an object which passed.
+
+        Override this in a subclass whose _filter_one() records something on
+        the objects.
+        """
+        pass
+
+    # Set to true in a subclass if the result of a filter for an object can
+    # change when another object is chosen for a previous instance of the
+    # same request, e.g. because it looks at where those instances went
+    depends_on_previous_placements = False
+
     def run_filter_for_index(self, index):
         """Return True if the filter needs to be run for the "index-th"
         instance in a request.  Only need to override this if a filter
@@ -59,12 +115,313 @@ class BaseFilter(object):
             return True
 
 
+class FilterStats(object):
+    """Exponentially decayed cost and pass rate of a filter.
+
+    The cost is the wall time spent per object, the pass rate the fraction
+    of the objects which passed. Each new observation weighs (1 - decay) in
+    the averages.
+    """
+
+    def __init__(self, decay):
+        self.decay = decay
+        self.cost = None
+        self.pass_rate = None
+
+    def update(self, elapsed, count_in, count_out):
+        if not count_in:
+            return
+        cost = float(elapsed) / count_in
+        pass_rate = float(count_out) / count_in
+        if self.cost is None:
+            self.cost = cost
+            self.pass_rate = pass_rate
+        else:
+            self.cost = self.decay * self.cost + (1 - self.decay) * cost
+            self.pass_rate = (self.decay * self.pass_rate +
+                              (1 - self.decay) * pass_rate)
+
+    def rank(self):
+        """Return the expected cost of the filter per object it removes.
+
+        Running the filters by increasing rank minimizes the expected cost
+        of the whole filtering, if their results are independent.
+        """
+        if self.pass_rate >= 1:
+            return float('inf')
+        return self.cost / (1 - self.pass_rate)
+
+
+def order_filters(filters, key):
+    """Sort filters by key, leaving the pinned ones where they are.
+
+    The sort is stable, so the filters with the same key keep their
+    configured order and the result only depends on the keys.
+    """
+    ordered = iter(sorted((f for f in filters if not f.pinned), key=key))
+    return [f if f.pinned else next(ordered) for f in filters]
+
+
+# Header of the messages between a WorkerPool and its workers: the length of
+# the pickled data which follows
+_MESSAGE_HEADER = struct.Struct('!Q')
+
+
+def _send(wfile, obj):
+    data = pickle.dumps(obj, pickle.HIGHEST_PROTOCOL)
+    wfile.write(_MESSAGE_HEADER.pack(len(data)))
+    wfile.write(data)
+    wfile.flush()
+
+
+def _receive(rfile):
+    header = rfile.read(_MESSAGE_HEADER.size)
+    if len(header) < _MESSAGE_HEADER.size:
+        raise EOFError()
+    size, = _MESSAGE_HEADER.unpack(header)
+    data = rfile.read(size)
+    if len(data) < size:
+        raise EOFError()
+    return pickle.loads(data)
+
+
+def _serve(rfile, wfile):
+    """Run the calls sent by the pool until it closes the pipe."""
+    while True:
+        try:
+            func, objs = _receive(rfile)
+        except EOFError:
+            return
+        try:
+            result = (True, [func(obj) for obj in objs])
+        except Exception:
+            LOG.exception(_LE("Filter worker %d failed"), os.getpid())
+            result = (False, None)
+        _send(wfile, result)
+
+
+class _Worker(object):
+    """A worker process of a WorkerPool, and the pipes to talk to it.
+
+    :param close_fds: file descriptors of the parent the worker closes
+    """
+
+    def __init__(self, close_fds):
+        request_rfd, request_wfd = os.pipe()
+        result_rfd, result_wfd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            # NOTE: the worker must never go back to the code of the parent,
+            # whatever happens. It doesn't use the eventlet hub either, its
+            # pipes are read and written blocking.
+            status = 1
+            try:
+                for fd in [request_wfd, result_rfd] + list(close_fds):
+                    os.close(fd)
+                with os.fdopen(request_rfd, 'rb') as rfile:
+                    with os.fdopen(result_wfd, 'wb') as wfile:
+                        _serve(rfile, wfile)
+                status = 0
+            finally:
+                os._exit(status)
+        os.close(request_rfd)
+        os.close(result_wfd)
+        self.pid = pid
+        self.alive = True
+        self._requests = greenio.GreenPipe(request_wfd, 'wb')
+        self._results = greenio.GreenPipe(result_rfd, 'rb')
+
+    def fileno(self):
+        return [self._requests.fileno(), self._results.fileno()]
+
+    def submit(self, func, objs):
+        """Send a call to the worker, return False if it failed."""
+        try:
+            _send(self._requests, (func, objs))
+        except (pickle.PicklingError, TypeError, AttributeError):
+            # The call can't be sent, the worker is still fine
+            return False
+        except (IOError, OSError):
+            self.stop()
+            return False
+        return True
+
+    def get_result(self):
+        """Return the results of the call sent, or None if it failed."""
+        try:
+            ok, results = _receive(self._results)
+        except (EOFError, IOError, OSError, pickle.UnpicklingError):
+            self.stop()
+            return None
+        return results if ok else None
+
+    def stop(self):
+        if not self.alive:
+            return
+        self.alive = False
+        for pipe in (self._requests, self._results):
+            try:
+                pipe.close()
+            except (IOError, OSError):
+                pass
+        try:
+            os.kill(self.pid, signal.SIGKILL)
+        except OSError:
+            pass
+        # Reaped without blocking the other greenthreads
+        try:
+            green_os.waitpid(self.pid, 0)
+        except OSError:
+            pass
+
+
+class WorkerPool(object):
+    """Runs a function over a list of objects in worker processes.
+
+    The workers are forked by the first call and serve all the following
+    ones. The function and the objects are pickled to them, and their
+    results pickled back, through green pipes so that the other
+    greenthreads of this process keep running meanwhile. The calls made
+    while all the workers are busy, or whose function can't be pickled, run
+    in this process. A worker which fails is replaced on the next call, and
+    its objects run in this process.
+    """
+
+    def __init__(self, workers, min_objects_per_worker=1):
+        self.workers = workers
+        self.min_objects_per_worker = max(1, min_objects_per_worker)
+        self._pid = None
+        self._all = []
+        self._idle = []
+
+    def _num_workers(self, num_objs):
+        return min(self.workers, num_objs // self.min_objects_per_worker)
+
+    def _acquire(self, num_workers):
+        if self._pid != os.getpid():
+            # Forked since the workers were started, they belong to the
+            # parent.
+            self._pid = os.getpid()
+            self._all = []
+            self._idle = []
+        while len(self._all) < self.workers:
+            worker = _Worker([fd for other in self._all
+                              for fd in other.fileno()])
+            self._all.append(worker)
+            self._idle.append(worker)
+        workers = self._idle[:num_workers]
+        del self._idle[:num_workers]
+        return workers
+
+    def _release(self, workers):
+        for worker in workers:
+            if worker.alive:
+                self._idle.append(worker)
+            else:
+                self._all.remove(worker)
+
+    def map(self, func, objs):
+        """Return [func(obj) for obj in objs], in the order of objs."""
+        objs = list(objs)
+        num_workers = self._num_workers(len(objs))
+        workers = self._acquire(num_workers) if num_workers >= 2 else []
+        if len(workers) < 2:
+            self._release(workers)
+            return [func(obj) for obj in objs]
+
+        try:
+            shard_size = -(-len(objs) // len(workers))
+            shards = [objs[i:i + shard_size]
+                      for i in range(0, len(objs), shard_size)]
+            submitted = [worker.submit(func, shard)
+                         for worker, shard in zip(workers, shards)]
+            results = []
+            for worker, shard, sent in zip(workers, shards, submitted):
+                shard_results = worker.get_result() if sent else None
+                if shard_results is None:
+                    LOG.warning(_LW("Could not run %(count)d objects in "
+                                    "filter worker %(pid)d, running them "
+                                    "locally"),
+                                {'pid': worker.pid, 'count': len(shard)})
+                    shard_results = [func(obj) for obj in shard]
+                results.extend(shard_results)
+            return results
+        finally:
+            self._release(workers)
+
+
+class _FilterInWorker(object):
+    """Picklable call of BaseFilter.filter_in_worker() for a request."""
+
+    def __init__(self, filter_, spec_obj):
+        self.filter_ = filter_
+        self.spec_obj = spec_obj
+
+    def __call__(self, obj):
+        return self.filter_.filter_in_worker(obj, self.spec_obj)
+
+
 class BaseFilterHandler(loadables.BaseLoader):
     """Base class to handle loading filter classes.
 
     This class should be subclassed where one needs to use filters.
     """
 
+    # Weight of the previous observations in the filter statistics
+    stats_decay = 0.9
+
+    def __init__(self, loadable_cls_type):
+        super(BaseFilterHandler, self).__init__(loadable_cls_type)
+        # FilterStats of each filter, by class name
+        self.filter_stats = {}
+
+    def get_filter_stats(self, filter_):
+        cls_name = filter_.__class__.__name__
+        stats = self.filter_stats.get(cls_name)
+        if stats is None:
+            stats = FilterStats(self.stats_decay)
+            self.filter_stats[cls_name] = stats
+        return stats
+
+    def _filter_done(self, filter_, elapsed, count_in, count_out):
+        """Called after each filter run, with the time it took and the
+        number of objects it was given and returned.
+        """
+        self.get_filter_stats(filter_).update(elapsed, count_in, count_out)
+
+    def _get_executor(self):
+        """Return an executor for the filters which can run in workers.
+
+        Override this in a subclass to enable BaseFilter.filter_in_worker().
+        Returning None means that all the filters run in this process.
+        """
+        return None
+
+    def _order_filters(self, filters):
+        """Return the filters in the order they should be run.
+
+        Override this in a subclass to reorder the filters, the default is
+        the order they were passed in.
+        """
+        return filters
+
+    def _filter_in_workers(self, executor, filter_, objs, spec_obj):
+        passed = []
+        for obj, result in zip(objs, executor.map(
+                _FilterInWorker(filter_, spec_obj), objs)):
+            if result:
+                filter_.apply_worker_result(obj, result)
+                passed.append(obj)
+        return passed
+
+    def _get_object_table(self, objs):
+        """Return a columnar table of objs for filters with a batch path.
+
+        Override this in a subclass to enable BaseFilter.filter_array().
+        Returning None means that all the filters are run object by object.
+        """
+        return None
+
     def get_filtered_objects(self, filters, objs, spec_obj, index=0):
         list_objs = list(objs)
         LOG.debug("Starting with %d host(s)", len(list_objs))
@@ -78,16 +435,36 @@ class BaseFilterHandler(loadables.BaseLoader):
         part_filter_results = []
         full_filter_results = []
         log_msg = "%(cls_name)s: (start: %(start)s, end: %(end)s)"
-        for filter_ in filters:
+        obj_table = self._get_object_table(list_objs)
+        executor = self._get_executor()
+        for filter_ in self._order_filters(filters):
             if filter_.run_filter_for_index(index):
                 cls_name = filter_.__class__.__name__
                 start_count = len(list_objs)
-                objs = filter_.filter_all(list_objs, spec_obj)
-                if objs is None:
-                    LOG.debug("Filter %s says to stop filtering", cls_name)
-                    return
-                list_objs = list(objs)
+                start_time = time.time()
+                mask = None
+                if obj_table is not None:
+                    if obj_table.objs is not list_objs:
+                        # A filter without a batch path ran since the table
+                        # was last narrowed, catch up with its result.
+                        obj_table = obj_table.select(list_objs)
+                    mask = filter_.filter_array(obj_table, spec_obj)
+                if mask is not None:
+                    obj_table = obj_table.compress(mask)
+                    list_objs = obj_table.objs
+                elif executor is not None and filter_.run_in_worker:
+                    list_objs = self._filter_in_workers(executor, filter_,
+                                                        list_objs, spec_obj)
+                else:
+                    objs = filter_.filter_all(list_objs, spec_obj)
+                    if objs is None:
+                        LOG.debug("Filter %s says to stop filtering",
+                                  cls_name)
+                        return
+                    list_objs = list(objs)
                 end_count = len(list_objs)
+                self._filter_done(filter_, time.time() - start_time,
+                                  start_count, end_count)
                 part_filter_results.append(log_msg % {"cls_name": cls_name,
                         "start": start_count, "end": end_count})
                 if list_objs:
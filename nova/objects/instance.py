@@ -55,6 +55,9 @@ INSTANCE_OPTIONAL_ATTRS = (_INSTANCE_OPTIONAL_JOINED_FIELDS +
 # These are fields that most query calls load by default
 INSTANCE_DEFAULT_FIELDS = ['metadata', 'system_metadata',
                            'info_cache', 'security_groups']
+# These are columns which are always loaded when a list of instances is
+# loaded with only some fields
+_INSTANCE_PROJECTION_COLUMNS = ['id', 'uuid', 'deleted', 'created_at']
 
 
 def _expected_cols(expected_attrs):
@@ -190,6 +193,9 @@ class Instance(base.NovaPersistentObject, base.NovaObject,
     def __init__(self, *args, **kwargs):
         super(Instance, self).__init__(*args, **kwargs)
         self._reset_metadata_tracking()
+        # Fields left out when loaded from the database with only some
+        # fields, which are loaded together when one of them is accessed
+        self._unloaded_fields = set()
 
     def _reset_metadata_tracking(self, fields=None):
         if fields is None or 'system_metadata' in fields:
@@ -262,10 +268,14 @@ class Instance(base.NovaPersistentObject, base.NovaObject,
         self.obj_reset_changes(['flavor', 'old_flavor', 'new_flavor'])
 
     @staticmethod
-    def _from_db_object(context, instance, db_inst, expected_attrs=None):
+    def _from_db_object(context, instance, db_inst, expected_attrs=None,
+                        columns=None):
         """Method to help with migration to objects.
 
         Converts a database entity to a formal object.
+
+        If columns is given, the database entity only has these columns and
+        the other fields are lazy-loaded when accessed.
         """
         instance._context = context
         if expected_attrs is None:
@@ -274,6 +284,8 @@ class Instance(base.NovaPersistentObject, base.NovaObject,
         for field in instance.fields:
             if field in INSTANCE_OPTIONAL_ATTRS:
                 continue
+            elif columns is not None and field not in columns:
+                instance._unloaded_fields.add(field)
             elif field == 'deleted':
                 instance.deleted = db_inst['deleted'] == db_inst['id']
             elif field == 'cleaned':
@@ -596,6 +608,40 @@ class Instance(base.NovaPersistentObject, base.NovaObject,
                             expected_task_state,
                             admin_state_reset)
 
+        updates = self._save_objects_and_get_updates(context)
+
+        if not updates:
+            if cells_update_from_api:
+                _handle_cell_update_from_api()
+            return
+
+        if expected_task_state is not None:
+            updates['expected_task_state'] = expected_task_state
+        if expected_vm_state is not None:
+            updates['expected_vm_state'] = expected_vm_state
+
+        expected_attrs = self._get_save_expected_attrs()
+        old_ref, inst_ref = db.instance_update_and_get_original(
+                context, self.uuid, updates,
+                columns_to_join=_expected_cols(expected_attrs))
+        self._from_db_object(context, self, inst_ref,
+                             expected_attrs=expected_attrs)
+
+        if cells_update_from_api:
+            _handle_cell_update_from_api()
+        elif cell_type == 'compute':
+            if self._sync_cells:
+                cells_api = cells_rpcapi.CellsAPI()
+                cells_api.instance_update_at_top(context, stale_instance)
+
+        self._send_update_notification(context, old_ref)
+
+        self.obj_reset_changes()
+
+    def _save_objects_and_get_updates(self, context):
+        """Save the object fields of the instance and return the updates of
+        its other fields, for save() and InstanceList.save_many().
+        """
         updates = {}
         changes = self.obj_what_changed()
 
@@ -626,11 +672,6 @@ class Instance(base.NovaPersistentObject, base.NovaObject,
                 else:
                     updates[field] = self[field]
 
-        if not updates:
-            if cells_update_from_api:
-                _handle_cell_update_from_api()
-            return
-
         # Cleaned needs to be turned back into an int here
         if 'cleaned' in updates:
             if updates['cleaned']:
@@ -638,11 +679,10 @@ class Instance(base.NovaPersistentObject, base.NovaObject,
             else:
                 updates['cleaned'] = 0
 
-        if expected_task_state is not None:
-            updates['expected_task_state'] = expected_task_state
-        if expected_vm_state is not None:
-            updates['expected_vm_state'] = expected_vm_state
+        return updates
 
+    def _get_save_expected_attrs(self):
+        """Return the attributes to load back when saving the instance."""
         expected_attrs = [attr for attr in _INSTANCE_OPTIONAL_JOINED_FIELDS
                                if self.obj_attr_is_set(attr)]
         if 'pci_devices' in expected_attrs:
@@ -657,36 +697,21 @@ class Instance(base.NovaPersistentObject, base.NovaObject,
         if 'system_metadata' not in expected_attrs:
             expected_attrs.append('system_metadata')
             expected_attrs.append('flavor')
-        old_ref, inst_ref = db.instance_update_and_get_original(
-                context, self.uuid, updates,
-                columns_to_join=_expected_cols(expected_attrs))
-        self._from_db_object(context, self, inst_ref,
-                             expected_attrs=expected_attrs)
-
-        if cells_update_from_api:
-            _handle_cell_update_from_api()
-        elif cell_type == 'compute':
-            if self._sync_cells:
-                cells_api = cells_rpcapi.CellsAPI()
-                cells_api.instance_update_at_top(context, stale_instance)
-
-        def _notify():
-            # NOTE(danms): We have to be super careful here not to trigger
-            # any lazy-loads that will unmigrate or unbackport something. So,
-            # make a copy of the instance for notifications first.
-            new_ref = self.obj_clone()
-
-            notifications.send_update(context, old_ref, new_ref)
+        return expected_attrs
 
+    def _send_update_notification(self, context, old_ref):
         # NOTE(alaski): If cell synchronization is blocked it means we have
         # already run this block of code in either the parent or child of this
         # cell.  Therefore this notification has already been sent.
         if not self._sync_cells:
-            _notify = lambda: None  # noqa: F811
+            return
 
-        _notify()
+        # NOTE(danms): We have to be super careful here not to trigger
+        # any lazy-loads that will unmigrate or unbackport something. So,
+        # make a copy of the instance for notifications first.
+        new_ref = self.obj_clone()
 
-        self.obj_reset_changes()
+        notifications.send_update(context, old_ref, new_ref)
 
     @base.remotable
     def refresh(self, use_slave=False):
@@ -827,8 +852,19 @@ class Instance(base.NovaPersistentObject, base.NovaObject,
             objects.MigrationContext._destroy(self._context, self.uuid)
             self.migration_context = None
 
+    def _load_unloaded_fields(self):
+        with utils.temporary_mutation(self._context, read_deleted='yes'):
+            instance = self.__class__.get_by_uuid(self._context,
+                                                  uuid=self.uuid,
+                                                  expected_attrs=[])
+        for field in self._unloaded_fields:
+            self[field] = instance[field]
+        self.obj_reset_changes(self._unloaded_fields)
+        self._unloaded_fields = set()
+
     def obj_load_attr(self, attrname):
-        if attrname not in INSTANCE_OPTIONAL_ATTRS:
+        if (attrname not in INSTANCE_OPTIONAL_ATTRS and
+                attrname not in self._unloaded_fields):
             raise exception.ObjectActionError(
                 action='obj_load_attr',
                 reason='attribute %s not lazy-loadable' % attrname)
@@ -845,7 +881,9 @@ class Instance(base.NovaPersistentObject, base.NovaObject,
 
         # NOTE(danms): We handle some fields differently here so that we
         # can be more efficient
-        if attrname == 'fault':
+        if attrname in self._unloaded_fields:
+            self._load_unloaded_fields()
+        elif attrname == 'fault':
             self._load_fault()
         elif attrname == 'numa_topology':
             self._load_numa_topology()
@@ -939,7 +977,120 @@ class Instance(base.NovaPersistentObject, base.NovaObject,
             self._normalize_cell_name()
 
 
-def _make_instance_list(context, inst_list, db_inst_list, expected_attrs):
+# Positions of the fields in the values of the compact instances, by the
+# tuple of the fields set. They are shared by all the compact instances with
+# the same fields set, like those of a list loaded with the same attributes.
+_COMPACT_LAYOUTS = {}
+
+
+class CompactInstance(Instance):
+    """Instance holding the values of its fields in a tuple until one of
+    them is set.
+
+    An Instance stores each of its fields in an attribute, so most of the
+    memory of a list of instances goes to the attribute dicts. A compact
+    instance keeps its fields out of its attribute dict: their values are
+    kept in a tuple, whose layout is shared by all the compact instances
+    with the same fields set. The first time one of these fields is set or
+    deleted, the instance is promoted to a regular one, with a field per
+    attribute, so that it can be changed and saved like any other. The
+    fields lazy-loaded afterwards are set in attributes without promoting
+    it.
+
+    It isn't registered, and is serialized as an Instance.
+    """
+
+    __slots__ = ('_context', '_changed_fields', '_orig_metadata',
+                 '_orig_system_metadata', '_unloaded_fields',
+                 '_compact_layout', '_compact_values')
+
+    def __init__(self, *args, **kwargs):
+        self._compact_layout = None
+        self._compact_values = None
+        super(CompactInstance, self).__init__(*args, **kwargs)
+
+    @classmethod
+    def obj_name(cls):
+        return Instance.obj_name()
+
+    @classmethod
+    def from_instance(cls, instance):
+        """Return the compact form of an Instance."""
+        compact = cls.__new__(cls)
+        names = []
+        values = []
+        for name, value in sorted(instance.__dict__.items()):
+            if name.startswith('_obj_'):
+                names.append(name)
+                values.append(value)
+            else:
+                setattr(compact, name, value)
+        names = tuple(names)
+        layout = _COMPACT_LAYOUTS.get(names)
+        if layout is None:
+            layout = _COMPACT_LAYOUTS.setdefault(
+                names, {name: index for index, name in enumerate(names)})
+        compact._compact_layout = layout
+        compact._compact_values = tuple(values)
+        return compact
+
+    def _promote(self):
+        layout = self._compact_layout
+        values = self._compact_values
+        self._compact_layout = None
+        self._compact_values = None
+        for name, index in layout.items():
+            setattr(self, name, values[index])
+
+    def __getattr__(self, name):
+        # Only called for the attributes which aren't found otherwise, like
+        # the fields of a compact instance
+        if not name.startswith('_compact_'):
+            layout = self._compact_layout
+            if layout is not None and name in layout:
+                return self._compact_values[layout[name]]
+        raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        layout = getattr(self, '_compact_layout', None)
+        if layout is not None and name in layout:
+            self._promote()
+        super(CompactInstance, self).__setattr__(name, value)
+
+    def __delattr__(self, name):
+        layout = getattr(self, '_compact_layout', None)
+        if layout is not None and name in layout:
+            self._promote()
+        super(CompactInstance, self).__delattr__(name)
+
+
+def compact_instances(instances):
+    """Replace the instances of a list by their compact form.
+
+    For the large lists of instances which are mostly only read, like those
+    listed by the API or the periodic tasks. An instance is only copied to
+    a regular Instance again when one of its fields is set.
+
+    The compact instances only save memory as long as none of their fields
+    is set. Instance has an attribute dict, which its subclasses can't do
+    without, so a promoted instance holds its fields in a dict like a
+    regular one, in addition to the slots of CompactInstance. It then uses
+    about as much memory as an Instance, so the lists whose instances are
+    mostly changed gain nothing from being compacted.
+
+    :param instances: InstanceList or list of instances, changed in place
+    :returns: instances
+    """
+    objs = (instances.objects if isinstance(instances, InstanceList)
+            else instances)
+    for index, instance in enumerate(objs):
+        if type(instance) is Instance:
+            objs[index] = CompactInstance.from_instance(instance)
+    return instances
+
+
+def _make_instance_list(context, inst_list, db_inst_list, expected_attrs,
+                        columns=None):
     get_fault = expected_attrs and 'fault' in expected_attrs
     inst_faults = {}
     if get_fault:
@@ -958,7 +1109,7 @@ def _make_instance_list(context, inst_list, db_inst_list, expected_attrs):
     for db_inst in db_inst_list:
         inst_obj = inst_cls._from_db_object(
                 context, inst_cls(context), db_inst,
-                expected_attrs=expected_attrs)
+                expected_attrs=expected_attrs, columns=columns)
         if get_fault:
             inst_obj.fault = inst_faults.get(inst_obj.uuid, None)
         inst_list.objects.append(inst_obj)
@@ -969,7 +1120,9 @@ def _make_instance_list(context, inst_list, db_inst_list, expected_attrs):
 @base.NovaObjectRegistry.register
 class InstanceList(base.ObjectListBase, base.NovaObject):
     # Version 2.0: Initial Version
-    VERSION = '2.0'
+    # Version 2.1: Add fields to get_by_filters()
+    # Version 2.2: Add save_many()
+    VERSION = '2.2'
 
     fields = {
         'objects': fields.ListOfObjectsField('Instance'),
@@ -979,19 +1132,31 @@ class InstanceList(base.ObjectListBase, base.NovaObject):
     def get_by_filters(cls, context, filters,
                        sort_key='created_at', sort_dir='desc', limit=None,
                        marker=None, expected_attrs=None, use_slave=False,
-                       sort_keys=None, sort_dirs=None):
+                       sort_keys=None, sort_dirs=None, fields=None):
+        # NOTE: When fields is given, only these fields are loaded from the
+        # instances table, along with the ones needed to identify and page
+        # through the instances. The others are lazy-loaded if accessed.
+        kwargs = {}
+        columns = None
+        if fields is not None:
+            columns = set(_INSTANCE_PROJECTION_COLUMNS)
+            columns.update(field for field in fields
+                           if field not in INSTANCE_OPTIONAL_ATTRS)
+            columns.update(sort_keys or [sort_key])
+            columns = kwargs['columns'] = sorted(columns)
         if sort_keys or sort_dirs:
             db_inst_list = db.instance_get_all_by_filters_sort(
                 context, filters, limit=limit, marker=marker,
                 columns_to_join=_expected_cols(expected_attrs),
-                use_slave=use_slave, sort_keys=sort_keys, sort_dirs=sort_dirs)
+                use_slave=use_slave, sort_keys=sort_keys, sort_dirs=sort_dirs,
+                **kwargs)
         else:
             db_inst_list = db.instance_get_all_by_filters(
                 context, filters, sort_key, sort_dir, limit=limit,
                 marker=marker, columns_to_join=_expected_cols(expected_attrs),
-                use_slave=use_slave)
+                use_slave=use_slave, **kwargs)
         return _make_instance_list(context, cls(), db_inst_list,
-                                   expected_attrs)
+                                   expected_attrs, columns=columns)
 
     @base.remotable_classmethod
     def get_by_host(cls, context, host, expected_attrs=None, use_slave=False):
@@ -1117,3 +1282,74 @@ class InstanceList(base.ObjectListBase, base.NovaObject):
             instance.obj_reset_changes(['fault'])
 
         return faults_by_uuid.keys()
+
+    @base.remotable
+    def save_many(self, expected_vm_state=None, expected_task_state=None):
+        """Save the updates of all the instances of the list.
+
+        This is like calling save() on each instance, except that the
+        instances are updated in a single database transaction, and that an
+        instance whose in-database copy doesn't match expected_task_state
+        or expected_vm_state, or which no longer exists, is left unsaved
+        instead of raising an error.
+
+        :param:expected_task_state: Optional tuple of valid task states
+        for the instances to be in
+        :param:expected_vm_state: Optional tuple of valid vm states
+        for the instances to be in
+        :returns: A list of the uuids of the instances which were not saved
+        """
+        if cells_opts.get_cell_type() is not None:
+            # NOTE: Each instance has to be synced with the other cells, so
+            # just save them one by one.
+            not_saved = []
+            for instance in self:
+                try:
+                    instance.save(expected_vm_state=expected_vm_state,
+                                  expected_task_state=expected_task_state)
+                except (exception.InstanceNotFound,
+                        exception.InstanceUpdateConflict) as e:
+                    LOG.debug('Instance not saved: %s', e, instance=instance)
+                    not_saved.append(instance.uuid)
+            return not_saved
+
+        updates = {}
+        expected_attrs = set()
+        not_saved = []
+        for instance in self:
+            instance._sync_cells = not instance._cell_name_blocks_sync()
+            try:
+                instance_updates = instance._save_objects_and_get_updates(
+                    self._context)
+            except exception.InstanceNotFound as e:
+                LOG.debug('Instance not saved: %s', e, instance=instance)
+                not_saved.append(instance.uuid)
+                continue
+            if not instance_updates:
+                continue
+            if expected_task_state is not None:
+                instance_updates['expected_task_state'] = expected_task_state
+            if expected_vm_state is not None:
+                instance_updates['expected_vm_state'] = expected_vm_state
+            updates[instance.uuid] = instance_updates
+            expected_attrs.update(instance._get_save_expected_attrs())
+
+        if not updates:
+            return not_saved
+
+        results, errors = db.instance_update_many_and_get_original(
+            self._context, updates,
+            columns_to_join=_expected_cols(sorted(expected_attrs)))
+        for instance in self:
+            if instance.uuid in errors:
+                LOG.debug('Instance not saved: %s', errors[instance.uuid],
+                          instance=instance)
+                not_saved.append(instance.uuid)
+            elif instance.uuid in results:
+                old_ref, inst_ref = results[instance.uuid]
+                instance._from_db_object(
+                    self._context, instance, inst_ref,
+                    expected_attrs=instance._get_save_expected_attrs())
+                instance._send_update_notification(self._context, old_ref)
+                instance.obj_reset_changes()
+        return not_saved
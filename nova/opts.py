@@ -34,6 +34,7 @@ import nova.consoleauth.rpcapi
 import nova.crypto
 import nova.db.api
 import nova.db.base
+import nova.db.profiler
 import nova.db.sqlalchemy.api
 import nova.exception
 import nova.image.download.file
@@ -103,7 +104,12 @@ def list_opts():
         ('cinder', nova.volume.cinder.cinder_opts),
         ('api_database', nova.db.sqlalchemy.api.api_db_opts),
         ('conductor', nova.conductor.api.conductor_opts),
-        ('database', nova.db.sqlalchemy.api.oslo_db_options.database_opts),
+        ('database',
+         itertools.chain(
+             nova.db.sqlalchemy.api.oslo_db_options.database_opts,
+             nova.db.sqlalchemy.api.replica_opts,
+             nova.db.profiler.profiler_opts,
+         )),
         ('glance', nova.image.glance.glance_opts),
         ('image_file_url', [nova.image.download.file.opt_group]),
         ('keymgr',
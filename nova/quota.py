@@ -93,9 +93,22 @@ quota_opts = [
                     'Note that quotas are not updated on a periodic task, '
                     'they will update on a new reservation if max_age has '
                     'passed since the last reservation'),
+    cfg.IntOpt('quota_limits_cache_ttl',
+               default=0,
+               help='Number of seconds the quota limits of a project, user '
+                    'and quota class are cached for by each process once '
+                    'read from the database. Changes to the limits made '
+                    'through the process itself are seen at once, changes '
+                    'made through other processes may take this long to be '
+                    'seen. This defaults to 0(off), which reads the limits '
+                    'at every quota check.'),
     cfg.StrOpt('quota_driver',
                default='nova.quota.DbQuotaDriver',
-               help='Default driver to use for quota checks'),
+               help='Default driver to use for quota checks. '
+                    'nova.quota.OptimisticDbQuotaDriver checks the same '
+                    'quotas without locking the quota usages, which lets '
+                    'the reservations made at once in a project run '
+                    'concurrently'),
     ]
 
 CONF = cfg.CONF
@@ -133,8 +146,12 @@ class DbQuotaDriver(object):
         :param resources: A dictionary of the registered resources.
         """
 
+        return self._resolve_defaults(resources,
+                                      db.quota_class_get_default(context))
+
+    @staticmethod
+    def _resolve_defaults(resources, default_quotas):
         quotas = {}
-        default_quotas = db.quota_class_get_default(context)
         for resource in resources.values():
             quotas[resource.name] = default_quotas.get(resource.name,
                                                        resource.default)
@@ -166,7 +183,7 @@ class DbQuotaDriver(object):
 
     def _process_quotas(self, context, resources, project_id, quotas,
                         quota_class=None, defaults=True, usages=None,
-                        remains=False):
+                        remains=False, limits=None):
         modified_quotas = {}
         # Get the quotas for the appropriate class.  If the project ID
         # matches the one in the context, we use the quota_class from
@@ -174,12 +191,20 @@ class DbQuotaDriver(object):
         # any)
         if project_id == context.project_id:
             quota_class = context.quota_class
-        if quota_class:
-            class_quotas = db.quota_class_get_all_by_name(context, quota_class)
+        if (limits is not None and
+                limits['class']['class_name'] == quota_class):
+            # Already read along with the project quotas
+            class_quotas = limits['class'] if quota_class else {}
+            default_quotas = self._resolve_defaults(resources,
+                                                    limits['default'])
         else:
-            class_quotas = {}
+            if quota_class:
+                class_quotas = db.quota_class_get_all_by_name(context,
+                                                              quota_class)
+            else:
+                class_quotas = {}
 
-        default_quotas = self.get_defaults(context, resources)
+            default_quotas = self.get_defaults(context, resources)
 
         for resource in resources.values():
             # Omit default/quota class values
@@ -215,7 +240,7 @@ class DbQuotaDriver(object):
     def get_user_quotas(self, context, resources, project_id, user_id,
                         quota_class=None, defaults=True,
                         usages=True, project_quotas=None,
-                        user_quotas=None):
+                        user_quotas=None, limits=None):
         """Given a list of resources, retrieve the quotas for the given
         user and project.
 
@@ -237,7 +262,12 @@ class DbQuotaDriver(object):
         :param project_quotas: Quotas dictionary for the specified project.
         :param user_quotas: Quotas dictionary for the specified project
                             and user.
+        :param limits: All the quota limits of the project and user, as
+                       returned by db.quota_get_all_limits().
         """
+        if limits is not None:
+            project_quotas = project_quotas or limits['project']
+            user_quotas = user_quotas or limits['user']
         if user_quotas:
             user_quotas = user_quotas.copy()
         else:
@@ -257,11 +287,13 @@ class DbQuotaDriver(object):
                                                          user_id)
         return self._process_quotas(context, resources, project_id,
                                     user_quotas, quota_class,
-                                    defaults=defaults, usages=user_usages)
+                                    defaults=defaults, usages=user_usages,
+                                    limits=limits)
 
     def get_project_quotas(self, context, resources, project_id,
                            quota_class=None, defaults=True,
-                           usages=True, remains=False, project_quotas=None):
+                           usages=True, remains=False, project_quotas=None,
+                           limits=None):
         """Given a list of resources, retrieve the quotas for the given
         project.
 
@@ -282,7 +314,11 @@ class DbQuotaDriver(object):
         :param remains: If True, the current remains of the project will
                         will be returned.
         :param project_quotas: Quotas dictionary for the specified project.
+        :param limits: All the quota limits of the project, as returned by
+                       db.quota_get_all_limits().
         """
+        if limits is not None:
+            project_quotas = project_quotas or limits['project']
         project_quotas = project_quotas or db.quota_get_all_by_project(
             context, project_id)
         project_usages = None
@@ -293,7 +329,7 @@ class DbQuotaDriver(object):
         return self._process_quotas(context, resources, project_id,
                                     project_quotas, quota_class,
                                     defaults=defaults, usages=project_usages,
-                                    remains=remains)
+                                    remains=remains, limits=limits)
 
     def _is_unlimited_value(self, v):
         """A helper method to check for unlimited value.
@@ -359,7 +395,7 @@ class DbQuotaDriver(object):
         return settable_quotas
 
     def _get_quotas(self, context, resources, keys, has_sync, project_id=None,
-                    user_id=None, project_quotas=None):
+                    user_id=None, project_quotas=None, limits=None):
         """A helper method which retrieves the quotas for the specific
         resources identified by keys, and which apply to the current
         context.
@@ -378,6 +414,8 @@ class DbQuotaDriver(object):
                         is admin and admin wants to impact on
                         common user.
         :param project_quotas: Quotas dictionary for the specified project.
+        :param limits: All the quota limits of the project and user, as
+                       returned by db.quota_get_all_limits().
         """
 
         # Filter resources
@@ -403,7 +441,8 @@ class DbQuotaDriver(object):
             quotas = self.get_user_quotas(context, sub_resources,
                                           project_id, user_id,
                                           context.quota_class, usages=False,
-                                          project_quotas=project_quotas)
+                                          project_quotas=project_quotas,
+                                          limits=limits)
         else:
             LOG.debug('Getting quotas for project %(project_id)s. Resources: '
                       '%(keys)s', {'project_id': project_id, 'keys': keys})
@@ -412,7 +451,8 @@ class DbQuotaDriver(object):
                                              project_id,
                                              context.quota_class,
                                              usages=False,
-                                             project_quotas=project_quotas)
+                                             project_quotas=project_quotas,
+                                             limits=limits)
 
         return {k: v['limit'] for k, v in quotas.items()}
 
@@ -459,14 +499,18 @@ class DbQuotaDriver(object):
             user_id = context.user_id
 
         # Get the applicable quotas
-        project_quotas = db.quota_get_all_by_project(context, project_id)
+        limits = db.quota_get_all_limits(context, project_id, user_id,
+                                         context.quota_class)
+        project_quotas = limits['project']
         quotas = self._get_quotas(context, resources, values.keys(),
                                   has_sync=False, project_id=project_id,
-                                  project_quotas=project_quotas)
+                                  project_quotas=project_quotas,
+                                  limits=limits)
         user_quotas = self._get_quotas(context, resources, values.keys(),
                                        has_sync=False, project_id=project_id,
                                        user_id=user_id,
-                                       project_quotas=project_quotas)
+                                       project_quotas=project_quotas,
+                                       limits=limits)
 
         # Check the quotas and construct a list of the resources that
         # would be put over limit by the desired values
@@ -553,20 +597,24 @@ class DbQuotaDriver(object):
         # NOTE(Vek): We're not worried about races at this point.
         #            Yes, the admin may be in the process of reducing
         #            quotas, but that's a pretty rare thing.
-        project_quotas = db.quota_get_all_by_project(context, project_id)
+        limits = db.quota_get_all_limits(context, project_id, user_id,
+                                         context.quota_class)
+        project_quotas = limits['project']
         LOG.debug('Quota limits for project %(project_id)s: '
                   '%(project_quotas)s', {'project_id': project_id,
                                          'project_quotas': project_quotas})
 
         quotas = self._get_quotas(context, resources, deltas.keys(),
                                   has_sync=True, project_id=project_id,
-                                  project_quotas=project_quotas)
+                                  project_quotas=project_quotas,
+                                  limits=limits)
         LOG.debug('Quotas for project %(project_id)s after resource sync: '
                   '%(quotas)s', {'project_id': project_id, 'quotas': quotas})
         user_quotas = self._get_quotas(context, resources, deltas.keys(),
                                        has_sync=True, project_id=project_id,
                                        user_id=user_id,
-                                       project_quotas=project_quotas)
+                                       project_quotas=project_quotas,
+                                       limits=limits)
         LOG.debug('Quotas for project %(project_id)s and user %(user_id)s '
                   'after resource sync: %(quotas)s',
                   {'project_id': project_id, 'user_id': user_id,
@@ -577,6 +625,11 @@ class DbQuotaDriver(object):
         #            which means access to the session.  Since the
         #            session isn't available outside the DBAPI, we
         #            have to do the work there.
+        return self._reserve(context, resources, quotas, user_quotas,
+                             deltas, expire, project_id, user_id)
+
+    def _reserve(self, context, resources, quotas, user_quotas, deltas,
+                 expire, project_id, user_id):
         return db.quota_reserve(context, resources, quotas, user_quotas,
                                 deltas, expire,
                                 CONF.until_refresh, CONF.max_age,
@@ -690,6 +743,83 @@ class DbQuotaDriver(object):
         db.reservation_expire(context)
 
 
+class OptimisticDbQuotaDriver(DbQuotaDriver):
+    """Driver to perform quota checks without locking the quota usages.
+
+    DbQuotaDriver locks all the quota usages of the project while it checks
+    and reserves quotas, which serializes the reservations made in a project
+    and makes them retry on deadlocks when there are many of them at once.
+    This driver reads the usages without locks and writes them back with
+    conditional UPDATEs, retrying when a concurrent change gets in the way,
+    and creates the reservations of a request in a single statement. The
+    quotas and usages are stored like with DbQuotaDriver so one driver can
+    be swapped for the other.
+    """
+
+    def _reserve(self, context, resources, quotas, user_quotas, deltas,
+                 expire, project_id, user_id):
+        return db.quota_reserve_optimistic(context, resources, quotas,
+                                           user_quotas, deltas, expire,
+                                           CONF.until_refresh, CONF.max_age,
+                                           project_id=project_id,
+                                           user_id=user_id)
+
+    def commit(self, context, reservations, project_id=None, user_id=None):
+        """Commit reservations.
+
+        :param context: The request context, for access checks.
+        :param reservations: A list of the reservation UUIDs, as
+                             returned by the reserve() method.
+        :param project_id: Specify the project_id if current context
+                           is admin and admin wants to impact on
+                           common user's tenant.
+        :param user_id: Specify the user_id if current context
+                        is admin and admin wants to impact on
+                        common user.
+        """
+        if project_id is None:
+            project_id = context.project_id
+        if user_id is None:
+            user_id = context.user_id
+
+        db.reservation_commit_optimistic(context, reservations,
+                                         project_id=project_id,
+                                         user_id=user_id)
+
+    def rollback(self, context, reservations, project_id=None, user_id=None):
+        """Roll back reservations.
+
+        :param context: The request context, for access checks.
+        :param reservations: A list of the reservation UUIDs, as
+                             returned by the reserve() method.
+        :param project_id: Specify the project_id if current context
+                           is admin and admin wants to impact on
+                           common user's tenant.
+        :param user_id: Specify the user_id if current context
+                        is admin and admin wants to impact on
+                        common user.
+        """
+        if project_id is None:
+            project_id = context.project_id
+        if user_id is None:
+            user_id = context.user_id
+
+        db.reservation_rollback_optimistic(context, reservations,
+                                           project_id=project_id,
+                                           user_id=user_id)
+
+    def expire(self, context):
+        """Expire reservations.
+
+        Explores all currently existing reservations and rolls back
+        any that have expired.
+
+        :param context: The request context, for access checks.
+        """
+
+        db.reservation_expire_optimistic(context)
+
+
 class NoopQuotaDriver(object):
     """Driver that turns quotas calls into no-ops and pretends that quotas
     for all resources are unlimited.  This can be used if you do not
@@ -0,0 +1,100 @@
+# Copyright (c) 2016 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Inverted index of the aggregate metadata used by the aggregate filters.
+"""
+
+import collections
+
+import six
+
+
+class AggregateIndex(object):
+    """Maps aggregate metadata keys and values to the hosts which have them.
+
+    The values are split on commas and stripped, the same way
+    nova.scheduler.filters.utils.aggregate_metadata_get_by_host() does, so
+    that a filter can compute the set of hosts which pass it once for a
+    request instead of going through the aggregates of each host.
+
+    A host can get the same key or value from several aggregates, so each
+    (key, value) keeps a count of the aggregates giving it to each host.
+    """
+
+    def __init__(self):
+        # (key, value) -> {host: number of aggregates}
+        self._hosts_by_value = {}
+        # key -> {value: {host: number of aggregates}}, with the same dicts
+        self._values_by_key = collections.defaultdict(dict)
+        # aggregate id -> (hosts, [(key, value)]) as indexed
+        self._entries = {}
+
+    @staticmethod
+    def _split_metadata(metadata):
+        entries = set()
+        for key, values in six.iteritems(metadata):
+            for value in values.split(','):
+                entries.add((key, value.strip()))
+        return entries
+
+    def update_aggregate(self, aggregate):
+        """Index an aggregate, replacing what was indexed for it before."""
+        self.delete_aggregate(aggregate.id)
+        hosts = set(aggregate.hosts)
+        entries = self._split_metadata(aggregate.metadata)
+        for key, value in entries:
+            counts = self._hosts_by_value.get((key, value))
+            if counts is None:
+                counts = self._hosts_by_value[(key, value)] = {}
+                self._values_by_key[key][value] = counts
+            for host in hosts:
+                counts[host] = counts.get(host, 0) + 1
+        self._entries[aggregate.id] = (hosts, entries)
+
+    def delete_aggregate(self, aggregate_id):
+        """Remove what was indexed for an aggregate, if anything."""
+        hosts, entries = self._entries.pop(aggregate_id, ((), ()))
+        for key, value in entries:
+            counts = self._hosts_by_value[(key, value)]
+            for host in hosts:
+                counts[host] -= 1
+                if not counts[host]:
+                    del counts[host]
+            if not counts:
+                del self._hosts_by_value[(key, value)]
+                del self._values_by_key[key][value]
+                if not self._values_by_key[key]:
+                    del self._values_by_key[key]
+
+    def keys(self):
+        """Return the metadata keys over all the aggregates."""
+        return list(self._values_by_key)
+
+    def values(self, key):
+        """Return the values of a key over all the aggregates."""
+        return list(self._values_by_key.get(key, ()))
+
+    def hosts_with_value(self, key, value):
+        """Return the hosts in an aggregate where key contains value."""
+        return set(self._hosts_by_value.get((key, value), ()))
+
+    def hosts_with_key(self, key):
+        """Return the hosts in an aggregate with the key, whatever the value.
+        """
+        hosts = set()
+        for counts in six.itervalues(self._values_by_key.get(key, {})):
+            hosts.update(counts)
+        return hosts
@@ -59,6 +59,11 @@ class SchedulerClient(object):
     def update_resource_stats(self, compute_node):
         self.reportclient.update_resource_stats(compute_node)
 
+    def update_compute_node(self, context, compute_node, generation,
+                            epoch=None):
+        self.queryclient.update_compute_node(context, compute_node,
+                                             generation, epoch=epoch)
+
     def update_instance_info(self, context, host_name, instance_info):
         self.queryclient.update_instance_info(context, host_name,
                                               instance_info)
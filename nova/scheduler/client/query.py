@@ -83,3 +83,22 @@ class SchedulerQueryClient(object):
         """
         self.scheduler_rpcapi.sync_instance_info(context, host_name,
                                                  instance_uuids)
+
+    def update_compute_node(self, context, compute_node, generation,
+                            epoch=None):
+        """Notifies the HostManager of the resources which changed on a
+        compute node.
+
+        :param context: local context
+        :param compute_node: a ComputeNode object with only the changed
+                             fields set, besides host, hypervisor_hostname and
+                             updated_at
+        :param generation: a counter incremented by the compute node for
+                           each update, so that the HostManager can detect
+                           lost updates
+        :param epoch: an identifier of the counter, which changes when it
+                      starts again from 0, like when the compute service
+                      restarts
+        """
+        self.scheduler_rpcapi.update_compute_node(context, compute_node,
+                                                  generation, epoch=epoch)
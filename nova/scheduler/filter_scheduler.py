@@ -19,6 +19,7 @@ You can customize this scheduler by specifying your own Host Filters and
 Weighing Functions.
 """
 
+import heapq
 import random
 
 from oslo_log import log as logging
@@ -29,6 +30,7 @@ from nova import exception
 from nova.i18n import _
 from nova import rpc
 from nova.scheduler import driver
+from nova.scheduler import profiler
 from nova.scheduler import scheduler_options
 
 
@@ -50,7 +52,10 @@ class FilterScheduler(driver.Scheduler):
             dict(request_spec=spec_obj.to_legacy_request_spec_dict()))
 
         num_instances = spec_obj.num_instances
-        selected_hosts = self._schedule(context, spec_obj)
+        with profiler.profile_request(context, spec_obj, self.notifier):
+            with profiler.Stage('schedule') as stage:
+                selected_hosts = self._schedule(context, spec_obj)
+                stage.hosts_out = len(selected_hosts)
 
         # Couldn't fulfill the request_spec
         if len(selected_hosts) < num_instances:
@@ -107,6 +112,8 @@ class FilterScheduler(driver.Scheduler):
         num_instances = spec_obj.num_instances
         # NOTE(sbauza): Adding one field for any out-of-tree need
         spec_obj.config_options = config_options
+        if CONF.scheduler_batch_placement and num_instances > 1:
+            return self._schedule_batch(spec_obj, hosts)
         for num in range(num_instances):
             # Filter local hosts based on requirements ...
             hosts = self.host_manager.get_filtered_hosts(hosts,
@@ -117,15 +124,13 @@ class FilterScheduler(driver.Scheduler):
 
             LOG.debug("Filtered %(hosts)s", {'hosts': hosts})
 
+            scheduler_host_subset_size = max(1,
+                                             CONF.scheduler_host_subset_size)
             weighed_hosts = self.host_manager.get_weighed_hosts(hosts,
-                    spec_obj)
+                    spec_obj, limit=scheduler_host_subset_size)
 
             LOG.debug("Weighed %(hosts)s", {'hosts': weighed_hosts})
 
-            scheduler_host_subset_size = max(1,
-                                             CONF.scheduler_host_subset_size)
-            if scheduler_host_subset_size < len(weighed_hosts):
-                weighed_hosts = weighed_hosts[0:scheduler_host_subset_size]
             chosen_host = random.choice(weighed_hosts)
 
             LOG.debug("Selected host: %(host)s", {'host': chosen_host})
@@ -133,13 +138,92 @@ class FilterScheduler(driver.Scheduler):
 
             # Now consume the resources so the filter/weights
             # will change for the next instance.
-            chosen_host.obj.consume_from_request(spec_obj)
-            if spec_obj.instance_group is not None:
-                spec_obj.instance_group.hosts.append(chosen_host.obj.host)
-                # hosts has to be not part of the updates when saving
-                spec_obj.instance_group.obj_reset_changes(['hosts'])
+            self._consume_selected_host(chosen_host, spec_obj)
         return selected_hosts
 
+    def _schedule_batch(self, spec_obj, hosts):
+        """Place all the instances of a request with a single filtering and
+        weighing pass over the hosts.
+
+        The weighed hosts are kept in a priority queue. Once an instance is
+        placed, only the chosen host is filtered and weighed again before
+        going back to the queue, as it is the only one whose resources
+        changed. The filters which depend on the previous placements of the
+        request are the exception, they are run again on all the queued
+        hosts.
+        """
+        selected_hosts = []
+        num_instances = spec_obj.num_instances
+        hosts = self.host_manager.get_filtered_hosts(hosts, spec_obj,
+                                                     index=0)
+        if not hosts:
+            return selected_hosts
+
+        LOG.debug("Filtered %(hosts)s", {'hosts': hosts})
+
+        weighed_hosts = self.host_manager.get_weighed_hosts(hosts, spec_obj)
+
+        LOG.debug("Weighed %(hosts)s", {'hosts': weighed_hosts})
+
+        # The queue entries are (-weight, sequence, weighed_host), the
+        # sequence keeps the order of the weighed hosts for equal weights,
+        # like the sort done by the weight handler.
+        queue = [(-weighed_host.weight, seq, weighed_host)
+                 for seq, weighed_host in enumerate(weighed_hosts)]
+        heapq.heapify(queue)
+        seq = len(queue)
+
+        scheduler_host_subset_size = max(1, CONF.scheduler_host_subset_size)
+        for num in range(num_instances):
+            if not queue:
+                # Can't get any more locally.
+                break
+
+            subset = [heapq.heappop(queue) for i in
+                      range(min(scheduler_host_subset_size, len(queue)))]
+            chosen_entry = random.choice(subset)
+            for entry in subset:
+                if entry is not chosen_entry:
+                    heapq.heappush(queue, entry)
+            chosen_host = chosen_entry[2]
+
+            LOG.debug("Selected host: %(host)s", {'host': chosen_host})
+            selected_hosts.append(chosen_host)
+
+            self._consume_selected_host(chosen_host, spec_obj)
+            if num + 1 == num_instances:
+                break
+
+            # Check whether the placement changed which hosts can take the
+            # next instance.
+            queued_hosts = self.host_manager.get_refiltered_hosts(
+                [entry[2].obj for entry in queue], spec_obj, index=num + 1)
+            if len(queued_hosts) < len(queue):
+                queued_hosts = set(queued_hosts)
+                queue = [entry for entry in queue
+                         if entry[2].obj in queued_hosts]
+                heapq.heapify(queue)
+
+            if self.host_manager.get_filtered_hosts([chosen_host.obj],
+                                                    spec_obj,
+                                                    index=num + 1):
+                reweighed_host = self.host_manager.get_weighed_host(
+                    chosen_host.obj, spec_obj)
+                heapq.heappush(queue,
+                               (-reweighed_host.weight, seq, reweighed_host))
+                seq += 1
+        return selected_hosts
+
+    def _consume_selected_host(self, chosen_host, spec_obj):
+        """Consume the resources of the instance on the chosen host, so that
+        the filters and weighers account for it for the next instance.
+        """
+        chosen_host.obj.consume_from_request(spec_obj)
+        if spec_obj.instance_group is not None:
+            spec_obj.instance_group.hosts.append(chosen_host.obj.host)
+            # hosts has to be not part of the updates when saving
+            spec_obj.instance_group.obj_reset_changes(['hosts'])
+
     def _get_all_host_states(self, context):
         """Template method, so a subclass can implement caching."""
         return self.host_manager.get_all_host_states(context)
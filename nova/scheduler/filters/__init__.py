@@ -16,7 +16,18 @@
 """
 Scheduler host filters
 """
+import os
+
+from oslo_log import log as logging
+
+import nova.conf
 from nova import filters
+from nova.i18n import _LW
+from nova.scheduler import host_table
+from nova.scheduler import profiler
+
+CONF = nova.conf.CONF
+LOG = logging.getLogger(__name__)
 
 
 class BaseHostFilter(filters.BaseFilter):
@@ -35,6 +46,55 @@ class BaseHostFilter(filters.BaseFilter):
 class HostFilterHandler(filters.BaseFilterHandler):
     def __init__(self):
         super(HostFilterHandler, self).__init__(BaseHostFilter)
+        self._worker_pool = None
+        if (CONF.scheduler_use_vectorized_filters and
+                not host_table.HostStateTable.is_available()):
+            LOG.warning(_LW("scheduler_use_vectorized_filters is set but "
+                            "numpy is not installed, all filters will be "
+                            "run host by host."))
+        if CONF.scheduler_filter_workers > 1 and not hasattr(os, 'fork'):
+            LOG.warning(_LW("scheduler_filter_workers is set but worker "
+                            "processes can't be forked on this platform, "
+                            "all filters will be run in the scheduler "
+                            "process."))
+
+    def _get_object_table(self, objs):
+        if (CONF.scheduler_use_vectorized_filters and
+                host_table.HostStateTable.is_available()):
+            return host_table.HostStateTable(objs)
+        return None
+
+    def _get_executor(self):
+        if CONF.scheduler_filter_workers > 1 and hasattr(os, 'fork'):
+            # The workers are started by the first filtering pass and
+            # reused by the following ones.
+            if self._worker_pool is None:
+                self._worker_pool = filters.WorkerPool(
+                    CONF.scheduler_filter_workers,
+                    CONF.scheduler_filter_worker_min_hosts)
+            return self._worker_pool
+        return None
+
+    def _order_filters(self, host_filters):
+        if CONF.scheduler_adaptive_filter_ordering:
+            return filters.order_filters(host_filters, self._expected_cost)
+        if CONF.scheduler_order_filters_by_cost:
+            return filters.order_filters(host_filters,
+                                         lambda filter_: filter_.cost)
+        return host_filters
+
+    def _expected_cost(self, filter_):
+        stats = self.get_filter_stats(filter_)
+        if stats.cost is None:
+            # Never run yet, so run it early to learn about it
+            return 0
+        return stats.rank()
+
+    def _filter_done(self, filter_, elapsed, count_in, count_out):
+        super(HostFilterHandler, self)._filter_done(filter_, elapsed,
+                                                    count_in, count_out)
+        profiler.record('filter', filter_.__class__.__name__, elapsed,
+                        count_in, count_out)
 
 
 def all_filters():
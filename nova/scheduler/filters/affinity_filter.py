@@ -81,6 +81,9 @@ class _GroupAntiAffinityFilter(filters.BaseHostFilter):
     """Schedule the instance on a different host from a set of group
     hosts.
     """
+    # The hosts of the instance group change with each placement
+    depends_on_previous_placements = True
+
     def host_passes(self, host_state, spec_obj):
         # Only invoke the filter is 'anti-affinity' is configured
         policies = (spec_obj.instance_group.policies
@@ -109,6 +112,9 @@ class ServerGroupAntiAffinityFilter(_GroupAntiAffinityFilter):
 class _GroupAffinityFilter(filters.BaseHostFilter):
     """Schedule the instance on to host from a set of group hosts.
     """
+    # The hosts of the instance group change with each placement
+    depends_on_previous_placements = True
+
     def host_passes(self, host_state, spec_obj):
         # Only invoke the filter is 'affinity' is configured
         policies = (spec_obj.instance_group.policies
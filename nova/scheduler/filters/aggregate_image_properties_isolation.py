@@ -58,3 +58,26 @@ class AggregateImagePropertiesIsolation(filters.BaseHostFilter):
                            'options': options})
                 return False
         return True
+
+    def filter_all(self, filter_obj_list, spec_obj):
+        host_states = list(filter_obj_list)
+        index = utils.aggregate_index_from_hosts(host_states)
+        if index is None:
+            return super(AggregateImagePropertiesIsolation, self).filter_all(
+                host_states, spec_obj)
+
+        cfg_namespace = CONF.aggregate_image_properties_isolation_namespace
+        cfg_separator = CONF.aggregate_image_properties_isolation_separator
+
+        image_props = spec_obj.image.properties if spec_obj.image else {}
+        failed_hosts = set()
+        for key in index.keys():
+            if (cfg_namespace and
+                    not key.startswith(cfg_namespace + cfg_separator)):
+                continue
+            prop = image_props.get(key)
+            if prop:
+                failed_hosts |= (index.hosts_with_key(key) -
+                                 index.hosts_with_value(key, str(prop)))
+        return [host_state for host_state in host_states
+                if host_state.host not in failed_hosts]
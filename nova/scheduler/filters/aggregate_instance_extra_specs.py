@@ -27,6 +27,18 @@ LOG = logging.getLogger(__name__)
 _SCOPE = 'aggregate_instance_extra_specs'
 
 
+def _unscoped_key(key):
+    """Returns the extra spec key without its scope, or None if it belongs
+    to another scope.
+    """
+    scope = key.split(':', 1)
+    if len(scope) > 1:
+        if scope[0] != _SCOPE:
+            return None
+        del scope[0]
+    return scope[0]
+
+
 class AggregateInstanceExtraSpecsFilter(filters.BaseHostFilter):
     """AggregateInstanceExtraSpecsFilter works with InstanceType records."""
 
@@ -50,13 +62,9 @@ class AggregateInstanceExtraSpecsFilter(filters.BaseHostFilter):
 
         for key, req in six.iteritems(instance_type.extra_specs):
             # Either not scope format, or aggregate_instance_extra_specs scope
-            scope = key.split(':', 1)
-            if len(scope) > 1:
-                if scope[0] != _SCOPE:
-                    continue
-                else:
-                    del scope[0]
-            key = scope[0]
+            key = _unscoped_key(key)
+            if key is None:
+                continue
             aggregate_vals = metadata.get(key, None)
             if not aggregate_vals:
                 LOG.debug("%(host_state)s fails instance_type extra_specs "
@@ -74,3 +82,34 @@ class AggregateInstanceExtraSpecsFilter(filters.BaseHostFilter):
                            'aggregate_vals': aggregate_vals})
                 return False
         return True
+
+    def filter_all(self, filter_obj_list, spec_obj):
+        host_states = list(filter_obj_list)
+        instance_type = spec_obj.flavor
+        index = utils.aggregate_index_from_hosts(host_states)
+        if (index is None or
+                not instance_type.obj_attr_is_set('extra_specs') or
+                not instance_type.extra_specs):
+            return super(AggregateInstanceExtraSpecsFilter, self).filter_all(
+                host_states, spec_obj)
+
+        # The hosts with at least one aggregate value matching each extra
+        # spec, checking each distinct value only once
+        passing_hosts = None
+        for key, req in six.iteritems(instance_type.extra_specs):
+            key = _unscoped_key(key)
+            if key is None:
+                continue
+            matching_hosts = set()
+            for aggregate_val in index.values(key):
+                if extra_specs_ops.match(aggregate_val, req):
+                    matching_hosts |= index.hosts_with_value(key,
+                                                             aggregate_val)
+            if passing_hosts is None:
+                passing_hosts = matching_hosts
+            else:
+                passing_hosts &= matching_hosts
+        if passing_hosts is None:
+            return host_states
+        return [host_state for host_state in host_states
+                if host_state.host in passing_hosts]
@@ -51,3 +51,16 @@ class AggregateMultiTenancyIsolation(filters.BaseHostFilter):
             else:
                 LOG.debug("No tenant id's defined on host. Host passes.")
         return True
+
+    def filter_all(self, filter_obj_list, spec_obj):
+        host_states = list(filter_obj_list)
+        index = utils.aggregate_index_from_hosts(host_states)
+        if index is None:
+            return super(AggregateMultiTenancyIsolation, self).filter_all(
+                host_states, spec_obj)
+
+        isolated_hosts = (
+            index.hosts_with_key('filter_tenant_id') -
+            index.hosts_with_value('filter_tenant_id', spec_obj.project_id))
+        return [host_state for host_state in host_states
+                if host_state.host not in isolated_hosts]
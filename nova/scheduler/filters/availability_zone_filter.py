@@ -60,3 +60,22 @@ class AvailabilityZoneFilter(filters.BaseHostFilter):
                        'host_az': host_az})
 
         return hosts_passes
+
+    def filter_all(self, filter_obj_list, spec_obj):
+        host_states = list(filter_obj_list)
+        availability_zone = spec_obj.availability_zone
+        index = utils.aggregate_index_from_hosts(host_states)
+        if not availability_zone or index is None:
+            return super(AvailabilityZoneFilter, self).filter_all(
+                host_states, spec_obj)
+
+        az_hosts = index.hosts_with_value('availability_zone',
+                                          availability_zone)
+        if availability_zone == CONF.default_availability_zone:
+            # The hosts which aren't in any AZ are in the default one
+            zoned_hosts = index.hosts_with_key('availability_zone')
+            return [host_state for host_state in host_states
+                    if (host_state.host in az_hosts or
+                        host_state.host not in zoned_hosts)]
+        return [host_state for host_state in host_states
+                if host_state.host in az_hosts]
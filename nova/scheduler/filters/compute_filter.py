@@ -48,3 +48,22 @@ class ComputeFilter(filters.BaseHostFilter):
                                 "while"), {'host_state': host_state})
                 return False
         return True
+
+    def _service_is_up(self, host_state):
+        if not self.servicegroup_api.service_is_up(host_state.service):
+            LOG.warning(_LW("%(host_state)s has not been heard from in a "
+                            "while"), {'host_state': host_state})
+            return False
+        return True
+
+    def filter_array(self, host_table, spec_obj):
+        """Batch version of host_passes() over a HostStateTable.
+
+        The disabled check is done on the whole table at once, the
+        servicegroup API is only asked about the enabled hosts.
+        """
+        enabled = ~host_table.service_disabled
+        LOG.debug("%(disabled)d of %(hosts)d host(s) are disabled",
+                  {'disabled': len(host_table) - enabled.sum(),
+                   'hosts': len(host_table)})
+        return host_table.map(self._service_is_up, dtype=bool, where=enabled)
@@ -15,6 +15,8 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import functools
+
 from oslo_log import log as logging
 
 from nova.i18n import _LW
@@ -29,6 +31,10 @@ class BaseCoreFilter(filters.BaseHostFilter):
     def _get_cpu_allocation_ratio(self, host_state, spec_obj):
         raise NotImplementedError
 
+    def _get_cpu_allocation_ratio_array(self, host_table, spec_obj):
+        return host_table.map(functools.partial(
+            self._get_cpu_allocation_ratio, spec_obj=spec_obj))
+
     def host_passes(self, host_state, spec_obj):
         """Return True if host has sufficient CPU cores."""
         if not host_state.vcpus_total:
@@ -68,6 +74,34 @@ class BaseCoreFilter(filters.BaseHostFilter):
 
         return True
 
+    def filter_array(self, host_table, spec_obj):
+        """Batch version of host_passes() over a HostStateTable."""
+        instance_vcpus = spec_obj.vcpus
+        host_vcpus = host_table.vcpus_total
+        # Fail safe, see host_passes()
+        unknown = host_vcpus == 0
+        if unknown.any():
+            LOG.warning(_LW("VCPUs not set on %d host(s); assuming CPU "
+                            "collection broken"), unknown.sum())
+
+        cpu_allocation_ratio = self._get_cpu_allocation_ratio_array(
+            host_table, spec_obj)
+        vcpus_total = host_vcpus * cpu_allocation_ratio
+        has_limit = ~unknown & (vcpus_total > 0)
+        host_table.set_limits('vcpu', vcpus_total, has_limit)
+
+        # Do not allow an instance to overcommit against itself, only
+        # against other instances.
+        overcommits_itself = has_limit & (instance_vcpus > host_vcpus)
+        free_vcpus = vcpus_total - host_table.vcpus_used
+        passes = unknown | (~overcommits_itself &
+                            (free_vcpus >= instance_vcpus))
+        LOG.debug("%(passed)d of %(hosts)d host(s) have %(instance_vcpus)d "
+                  "usable vcpus",
+                  {'passed': passes.sum(), 'hosts': len(host_table),
+                   'instance_vcpus': instance_vcpus})
+        return passes
+
 
 class CoreFilter(BaseCoreFilter):
     """CoreFilter filters based on CPU core utilization."""
@@ -75,6 +109,9 @@ class CoreFilter(BaseCoreFilter):
     def _get_cpu_allocation_ratio(self, host_state, spec_obj):
         return host_state.cpu_allocation_ratio
 
+    def _get_cpu_allocation_ratio_array(self, host_table, spec_obj):
+        return host_table.cpu_allocation_ratio
+
 
 class AggregateCoreFilter(BaseCoreFilter):
     """AggregateCoreFilter with per-aggregate CPU subscription flag.
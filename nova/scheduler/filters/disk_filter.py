@@ -13,6 +13,8 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import functools
+
 from oslo_log import log as logging
 
 import nova.conf
@@ -31,6 +33,9 @@ class DiskFilter(filters.BaseHostFilter):
     def _get_disk_allocation_ratio(self, host_state, spec_obj):
         return CONF.disk_allocation_ratio
 
+    def _get_disk_allocation_ratio_array(self, host_table, spec_obj):
+        return CONF.disk_allocation_ratio
+
     def host_passes(self, host_state, spec_obj):
         """Filter based on disk usage."""
         requested_disk = (1024 * (spec_obj.root_gb +
@@ -59,6 +64,29 @@ class DiskFilter(filters.BaseHostFilter):
         host_state.limits['disk_gb'] = disk_gb_limit
         return True
 
+    def filter_array(self, host_table, spec_obj):
+        """Batch version of host_passes() over a HostStateTable."""
+        requested_disk = (1024 * (spec_obj.root_gb +
+                                  spec_obj.ephemeral_gb) +
+                          spec_obj.swap)
+
+        total_usable_disk_mb = host_table.total_usable_disk_gb * 1024
+        disk_allocation_ratio = self._get_disk_allocation_ratio_array(
+            host_table, spec_obj)
+
+        disk_mb_limit = total_usable_disk_mb * disk_allocation_ratio
+        used_disk_mb = total_usable_disk_mb - host_table.free_disk_mb
+        usable_disk_mb = disk_mb_limit - used_disk_mb
+
+        passes = usable_disk_mb >= requested_disk
+        LOG.debug("%(passed)d of %(hosts)d host(s) have %(requested_disk)s MB "
+                  "usable disk",
+                  {'passed': passes.sum(), 'hosts': len(host_table),
+                   'requested_disk': requested_disk})
+
+        host_table.set_limits('disk_gb', disk_mb_limit / 1024, passes)
+        return passes
+
 
 class AggregateDiskFilter(DiskFilter):
     """AggregateDiskFilter with per-aggregate disk allocation ratio flag.
@@ -79,3 +107,7 @@ class AggregateDiskFilter(DiskFilter):
             ratio = CONF.disk_allocation_ratio
 
         return ratio
+
+    def _get_disk_allocation_ratio_array(self, host_table, spec_obj):
+        return host_table.map(functools.partial(
+            self._get_disk_allocation_ratio, spec_obj=spec_obj))
@@ -13,6 +13,8 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import functools
+
 from oslo_log import log as logging
 
 import nova.conf
@@ -31,6 +33,9 @@ class IoOpsFilter(filters.BaseHostFilter):
     def _get_max_io_ops_per_host(self, host_state, spec_obj):
         return CONF.max_io_ops_per_host
 
+    def _get_max_io_ops_per_host_array(self, host_table, spec_obj):
+        return CONF.max_io_ops_per_host
+
     def host_passes(self, host_state, spec_obj):
         """Use information about current vm and task states collected from
         compute node statistics to decide whether to filter.
@@ -46,6 +51,14 @@ class IoOpsFilter(filters.BaseHostFilter):
                          'max_io_ops': max_io_ops})
         return passes
 
+    def filter_array(self, host_table, spec_obj):
+        """Batch version of host_passes() over a HostStateTable."""
+        max_io_ops = self._get_max_io_ops_per_host_array(host_table, spec_obj)
+        passes = host_table.num_io_ops < max_io_ops
+        LOG.debug("%(passed)d of %(hosts)d host(s) pass the I/O ops check",
+                  {'passed': passes.sum(), 'hosts': len(host_table)})
+        return passes
+
 
 class AggregateIoOpsFilter(IoOpsFilter):
     """AggregateIoOpsFilter with per-aggregate the max io operations.
@@ -65,3 +78,7 @@ class AggregateIoOpsFilter(IoOpsFilter):
             value = CONF.max_io_ops_per_host
 
         return value
+
+    def _get_max_io_ops_per_host_array(self, host_table, spec_obj):
+        return host_table.map(functools.partial(
+            self._get_max_io_ops_per_host, spec_obj=spec_obj))
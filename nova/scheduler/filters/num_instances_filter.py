@@ -13,6 +13,8 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import functools
+
 from oslo_log import log as logging
 
 import nova.conf
@@ -31,6 +33,9 @@ class NumInstancesFilter(filters.BaseHostFilter):
     def _get_max_instances_per_host(self, host_state, spec_obj):
         return CONF.max_instances_per_host
 
+    def _get_max_instances_per_host_array(self, host_table, spec_obj):
+        return CONF.max_instances_per_host
+
     def host_passes(self, host_state, spec_obj):
         num_instances = host_state.num_instances
         max_instances = self._get_max_instances_per_host(
@@ -43,6 +48,16 @@ class NumInstancesFilter(filters.BaseHostFilter):
                          'max_instances': max_instances})
         return passes
 
+    def filter_array(self, host_table, spec_obj):
+        """Batch version of host_passes() over a HostStateTable."""
+        max_instances = self._get_max_instances_per_host_array(
+            host_table, spec_obj)
+        passes = host_table.num_instances < max_instances
+        LOG.debug("%(passed)d of %(hosts)d host(s) pass the num_instances "
+                  "check",
+                  {'passed': passes.sum(), 'hosts': len(host_table)})
+        return passes
+
 
 class AggregateNumInstancesFilter(NumInstancesFilter):
     """AggregateNumInstancesFilter with per-aggregate the max num instances.
@@ -64,3 +79,7 @@ class AggregateNumInstancesFilter(NumInstancesFilter):
             value = CONF.max_instances_per_host
 
         return value
+
+    def _get_max_instances_per_host_array(self, host_table, spec_obj):
+        return host_table.map(functools.partial(
+            self._get_max_instances_per_host, spec_obj=spec_obj))
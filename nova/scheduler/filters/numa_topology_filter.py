@@ -22,6 +22,10 @@ LOG = logging.getLogger(__name__)
 class NUMATopologyFilter(filters.BaseHostFilter):
     """Filter on requested NUMA topology."""
 
+    # Fitting the instance tries every permutation of the host cells
+    cost = 10
+    run_in_worker = True
+
     def host_passes(self, host_state, spec_obj):
         ram_ratio = host_state.ram_allocation_ratio
         cpu_ratio = host_state.cpu_allocation_ratio
@@ -39,7 +43,8 @@ class NUMATopologyFilter(filters.BaseHostFilter):
                         host_topology, requested_topology,
                         limits=limits,
                         pci_requests=pci_requests,
-                        pci_stats=host_state.pci_stats))
+                        pci_stats=host_state.pci_stats,
+                        cache=hardware.get_numa_fit_cache()))
             if not instance_topology:
                 LOG.debug("%(host)s, %(node)s fails NUMA topology "
                           "requirements. The instance does not fit on this "
@@ -58,3 +63,13 @@ class NUMATopologyFilter(filters.BaseHostFilter):
             return False
         else:
             return True
+
+    def filter_in_worker(self, host_state, spec_obj):
+        if not self.host_passes(host_state, spec_obj):
+            return False
+        # Send back the limits recorded on the copy of the worker
+        return host_state.limits.get('numa_topology', True)
+
+    def apply_worker_result(self, host_state, result):
+        if result is not True:
+            host_state.limits['numa_topology'] = result
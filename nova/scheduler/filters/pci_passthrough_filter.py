@@ -40,6 +40,9 @@ class PciPassthroughFilter(filters.BaseHostFilter):
 
     """
 
+    cost = 5
+    run_in_worker = True
+
     def host_passes(self, host_state, spec_obj):
         """Return true if the host has the required PCI devices."""
         pci_requests = spec_obj.pci_requests
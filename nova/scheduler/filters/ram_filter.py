@@ -14,6 +14,8 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import functools
+
 from oslo_log import log as logging
 
 from nova.i18n import _LW
@@ -28,6 +30,10 @@ class BaseRamFilter(filters.BaseHostFilter):
     def _get_ram_allocation_ratio(self, host_state, spec_obj):
         raise NotImplementedError
 
+    def _get_ram_allocation_ratio_array(self, host_table, spec_obj):
+        return host_table.map(functools.partial(
+            self._get_ram_allocation_ratio, spec_obj=spec_obj))
+
     def host_passes(self, host_state, spec_obj):
         """Only return hosts with sufficient available RAM."""
         requested_ram = spec_obj.memory_mb
@@ -63,6 +69,28 @@ class BaseRamFilter(filters.BaseHostFilter):
         host_state.limits['memory_mb'] = memory_mb_limit
         return True
 
+    def filter_array(self, host_table, spec_obj):
+        """Batch version of host_passes() over a HostStateTable."""
+        requested_ram = spec_obj.memory_mb
+        total_usable_ram_mb = host_table.total_usable_ram_mb
+        ram_allocation_ratio = self._get_ram_allocation_ratio_array(
+            host_table, spec_obj)
+
+        memory_mb_limit = total_usable_ram_mb * ram_allocation_ratio
+        used_ram_mb = total_usable_ram_mb - host_table.free_ram_mb
+        usable_ram = memory_mb_limit - used_ram_mb
+        # Do not allow an instance to overcommit against itself, only against
+        # other instances.
+        passes = ((total_usable_ram_mb >= requested_ram) &
+                  (usable_ram >= requested_ram))
+        LOG.debug("%(passed)d of %(hosts)d host(s) have %(requested_ram)s MB "
+                  "usable ram",
+                  {'passed': passes.sum(), 'hosts': len(host_table),
+                   'requested_ram': requested_ram})
+
+        host_table.set_limits('memory_mb', memory_mb_limit, passes)
+        return passes
+
 
 class RamFilter(BaseRamFilter):
     """Ram Filter with over subscription flag."""
@@ -70,6 +98,9 @@ class RamFilter(BaseRamFilter):
     def _get_ram_allocation_ratio(self, host_state, spec_obj):
         return host_state.ram_allocation_ratio
 
+    def _get_ram_allocation_ratio_array(self, host_table, spec_obj):
+        return host_table.ram_allocation_ratio
+
 
 class AggregateRamFilter(BaseRamFilter):
     """AggregateRamFilter with per-aggregate ram subscription flag.
@@ -25,6 +25,9 @@ class RetryFilter(filters.BaseHostFilter):
     purposes
     """
 
+    # Never reorder the filter which removes the nodes already tried
+    pinned = True
+
     def host_passes(self, host_state, spec_obj):
         """Skip nodes that have already been attempted."""
         retry = spec_obj.retry
@@ -46,6 +46,17 @@ def aggregate_metadata_get_by_host(host_state, key=None):
     return metadata
 
 
+def aggregate_index_from_hosts(host_states):
+    """Returns the AggregateIndex the HostManager attached to host_states.
+
+    None is returned if the host states don't come with an index, in which
+    case the aggregates of each host have to be looked at.
+    """
+    if not host_states:
+        return None
+    return getattr(host_states[0], 'aggregate_index', None)
+
+
 def validate_num_values(vals, default=None, cast_to=int, based_on=min):
     """Returns a correctly casted value based on a set of values.
 
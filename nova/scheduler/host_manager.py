@@ -36,8 +36,11 @@ from nova import context as context_module
 from nova import exception
 from nova.i18n import _LI, _LW
 from nova import objects
+from nova.objects import instance as instance_obj
 from nova.pci import stats as pci_stats
+from nova.scheduler import aggregate_index
 from nova.scheduler import filters
+from nova.scheduler import profiler
 from nova.scheduler import weights
 from nova import utils
 from nova.virt import hardware
@@ -47,6 +50,7 @@ CONF = nova.conf.CONF
 
 LOG = logging.getLogger(__name__)
 HOST_INSTANCE_SEMAPHORE = "host_instance"
+HOST_COMPUTE_NODE_SEMAPHORE = "host_compute_node"
 
 
 class ReadOnlyDict(IterableUserDict):
@@ -144,6 +148,9 @@ class HostState(object):
         # List of aggregates the host belongs to
         self.aggregates = []
 
+        # AggregateIndex of all the aggregates, set by the HostManager
+        self.aggregate_index = None
+
         # Instances on this host
         self.instances = {}
 
@@ -282,7 +289,8 @@ class HostState(object):
         spec_obj.numa_topology = hardware.numa_fit_instance_to_host(
             host_numa_topology, instance_numa_topology,
             limits=self.limits.get('numa_topology'),
-            pci_requests=pci_requests, pci_stats=self.pci_stats)
+            pci_requests=pci_requests, pci_stats=self.pci_stats,
+            cache=hardware.get_numa_fit_cache())
         if pci_requests:
             instance_cells = None
             if spec_obj.numa_topology:
@@ -337,12 +345,27 @@ class HostManager(object):
         # Dict of set of aggregate IDs keyed by the name of the host belonging
         # to those aggregates
         self.host_aggregates_map = collections.defaultdict(set)
+        # Inverted index of the metadata of the aggregates
+        self.aggregate_index = aggregate_index.AggregateIndex()
         self._init_aggregates()
         self.tracks_instance_changes = CONF.scheduler_tracks_instance_changes
         # Dict of instances and status, keyed by host
         self._instance_info = {}
         if self.tracks_instance_changes:
             self._init_instance_info()
+        self.tracks_compute_node_changes = (
+            CONF.scheduler_tracks_compute_node_changes)
+        # Dict of ComputeNodes and the generation and epoch of the last update
+        # received from them, keyed by (host, node). It is loaded from the
+        # database on the first request and then kept up to date by the
+        # compute nodes.
+        self._compute_node_info = None
+        self._compute_node_info_loaded_at = None
+        # Set of (host, node) which need to be reloaded from the database
+        self._stale_compute_nodes = set()
+        # Cached compute services, and when they were last loaded
+        self._service_refs = None
+        self._service_refs_loaded_at = None
 
     def _load_filters(self):
         return CONF.scheduler_default_filters
@@ -354,6 +377,7 @@ class HostManager(object):
             self.aggs_by_id[agg.id] = agg
             for host in agg.hosts:
                 self.host_aggregates_map[host].add(agg.id)
+            self.aggregate_index.update_aggregate(agg)
 
     def update_aggregates(self, aggregates):
         """Updates internal HostManager information about aggregates."""
@@ -373,6 +397,7 @@ class HostManager(object):
             if (aggregate.id in self.host_aggregates_map[host]
                     and host not in aggregate.hosts):
                 self.host_aggregates_map[host].remove(aggregate.id)
+        self.aggregate_index.update_aggregate(aggregate)
 
     def delete_aggregate(self, aggregate):
         """Deletes internal HostManager information about a specific aggregate.
@@ -382,6 +407,7 @@ class HostManager(object):
         for host in aggregate.hosts:
             if aggregate.id in self.host_aggregates_map[host]:
                 self.host_aggregates_map[host].remove(aggregate.id)
+        self.aggregate_index.delete_aggregate(aggregate.id)
 
     def _init_instance_info(self):
         """Creates the initial view of instances for all hosts.
@@ -412,7 +438,9 @@ class HostManager(object):
                            "deleted": False}
                 result = objects.InstanceList.get_by_filters(context,
                                                              filters)
-                instances = result.objects
+                # The instances are kept for as long as their host sends
+                # its updates, and are only read.
+                instances = instance_obj.compact_instances(result.objects)
                 LOG.debug("Adding %s instances for hosts %s-%s",
                           len(instances), start_node, end_node)
                 for instance in instances:
@@ -531,22 +559,42 @@ class HostManager(object):
         return self.filter_handler.get_filtered_objects(filters,
                 hosts, spec_obj, index)
 
-    def get_weighed_hosts(self, hosts, spec_obj):
-        """Weigh the hosts."""
+    def get_refiltered_hosts(self, hosts, spec_obj, index):
+        """Run the filters which depend on the previous placements of the
+        request again on hosts which already passed all the filters.
+        """
+        filters = [f for f in self.default_filters
+                   if f.depends_on_previous_placements]
+        if not filters:
+            return hosts
+        return self.filter_handler.get_filtered_objects(filters,
+                hosts, spec_obj, index) or []
+
+    def get_weighed_hosts(self, hosts, spec_obj, limit=None):
+        """Weigh the hosts, only returning the best limit ones if set."""
         return self.weight_handler.get_weighed_objects(self.weighers,
-                hosts, spec_obj)
+                hosts, spec_obj, limit=limit)
+
+    def get_weighed_host(self, host, spec_obj):
+        """Weigh a single host against the bounds of the previous weighings.
+        """
+        return self.weight_handler.get_weighed_object(self.weighers,
+                host, spec_obj)
 
     def get_all_host_states(self, context):
         """Returns a list of HostStates that represents all the hosts
         the HostManager knows about. Also, each of the consumable resources
         in HostState are pre-populated and adjusted based on data in the db.
         """
+        with profiler.Stage('get_all_host_states') as stage:
+            host_states = self._update_host_states(context)
+            stage.hosts_out = len(self.host_state_map)
+        return host_states
 
-        service_refs = {service.host: service
-                        for service in objects.ServiceList.get_by_binary(
-                            context, 'nova-compute')}
+    def _update_host_states(self, context):
+        service_refs = self._get_service_refs(context)
         # Get resource usage across the available compute nodes:
-        compute_nodes = objects.ComputeNodeList.get_all(context)
+        compute_nodes = self._get_compute_nodes(context)
         seen_nodes = set()
         for compute in compute_nodes:
             service = service_refs.get(compute.host)
@@ -570,6 +618,7 @@ class HostManager(object):
                               dict(service),
                               self._get_aggregates_info(host),
                               self._get_instance_info(context, compute))
+            host_state.aggregate_index = self.aggregate_index
 
             seen_nodes.add(state_key)
 
@@ -583,6 +632,127 @@ class HostManager(object):
 
         return six.itervalues(self.host_state_map)
 
+    def _get_service_refs(self, context):
+        """Returns the compute services keyed by host.
+
+        When the compute nodes push their changes, the services are only
+        reloaded every report_interval seconds, which is how often the
+        services update their heartbeat anyway.
+        """
+        if (not self.tracks_compute_node_changes or
+                self._service_refs is None or
+                timeutils.is_older_than(self._service_refs_loaded_at,
+                                        CONF.report_interval)):
+            self._service_refs = {
+                service.host: service
+                for service in objects.ServiceList.get_by_binary(
+                    context, 'nova-compute')}
+            self._service_refs_loaded_at = timeutils.utcnow()
+        return self._service_refs
+
+    @utils.synchronized(HOST_COMPUTE_NODE_SEMAPHORE)
+    def _get_compute_nodes(self, context):
+        """Returns the list of ComputeNodes to build the HostStates from.
+
+        If the compute nodes push their changes, the ComputeNodes are only
+        loaded from the database when the Scheduler starts, every
+        scheduler_compute_node_resync_interval seconds and for the nodes
+        which missed an update. Otherwise they are loaded for each request.
+        """
+        if not self.tracks_compute_node_changes:
+            return objects.ComputeNodeList.get_all(context)
+
+        resync_interval = CONF.scheduler_compute_node_resync_interval
+        if (self._compute_node_info is None or
+                (resync_interval > 0 and
+                 timeutils.is_older_than(self._compute_node_info_loaded_at,
+                                         resync_interval))):
+            LOG.debug("Loading all compute nodes from the database")
+            self._compute_node_info = {
+                (compute.host, compute.hypervisor_hostname):
+                    {"compute": compute, "generation": None, "epoch": None}
+                for compute in objects.ComputeNodeList.get_all(context)}
+            self._compute_node_info_loaded_at = timeutils.utcnow()
+            self._stale_compute_nodes = set()
+        else:
+            while self._stale_compute_nodes:
+                host, node = self._stale_compute_nodes.pop()
+                self._reload_compute_node(context, host, node)
+        return [info["compute"]
+                for info in six.itervalues(self._compute_node_info)]
+
+    def _reload_compute_node(self, context, host, node):
+        LOG.debug("Reloading compute node %(host)s:%(node)s from the "
+                  "database", {'host': host, 'node': node})
+        try:
+            compute = objects.ComputeNode.get_by_host_and_nodename(
+                context, host, node)
+        except exception.ComputeHostNotFound:
+            self._compute_node_info.pop((host, node), None)
+            return
+        # The generation is unknown, the next update received is trusted.
+        self._compute_node_info[(host, node)] = {"compute": compute,
+                                                 "generation": None,
+                                                 "epoch": None}
+
+    @utils.synchronized(HOST_COMPUTE_NODE_SEMAPHORE)
+    def update_compute_node(self, context, compute_node, generation,
+                            epoch=None):
+        """Receives the resources which changed on a compute node.
+
+        The cached ComputeNode is patched in place with the fields set on
+        compute_node. If an update was missed (or if the node is unknown),
+        the node is reloaded from the database on the next request instead.
+
+        The generation starts again from 0 when the compute service
+        restarts, which is told by a new epoch. Without an epoch, a
+        generation going back is taken as a restart.
+        """
+        if self._compute_node_info is None:
+            # Nothing loaded yet, the first request will load everything.
+            return
+        state_key = (compute_node.host, compute_node.hypervisor_hostname)
+        info = self._compute_node_info.get(state_key)
+        if info is None:
+            LOG.info(_LI("Received an update from an unknown compute node "
+                         "%(host)s:%(node)s, it will be loaded from the "
+                         "database."),
+                     {'host': state_key[0], 'node': state_key[1]})
+            self._stale_compute_nodes.add(state_key)
+            return
+
+        last_generation = info["generation"]
+        if last_generation is not None:
+            if (epoch != info["epoch"] or
+                    (epoch is None and generation < last_generation)):
+                LOG.info(_LI("Compute node %(host)s:%(node)s restarted, it "
+                             "will be reloaded from the database."),
+                         {'host': state_key[0], 'node': state_key[1]})
+                # The update is still applied until then.
+                self._stale_compute_nodes.add(state_key)
+            elif generation <= last_generation:
+                LOG.debug("Ignoring outdated update %(generation)s from "
+                          "compute node %(host)s:%(node)s",
+                          {'generation': generation, 'host': state_key[0],
+                           'node': state_key[1]})
+                return
+            elif generation != last_generation + 1:
+                LOG.info(_LI("Compute node %(host)s:%(node)s sent update "
+                             "%(generation)s after %(last)s, it will be "
+                             "reloaded from the database."),
+                         {'host': state_key[0], 'node': state_key[1],
+                          'generation': generation, 'last': last_generation})
+                self._stale_compute_nodes.add(state_key)
+                return
+
+        compute = info["compute"]
+        for field in compute_node.obj_fields:
+            if compute_node.obj_attr_is_set(field):
+                setattr(compute, field, getattr(compute_node, field))
+        compute.obj_reset_changes()
+        info["generation"] = generation
+        info["epoch"] = epoch
+
     def _get_aggregates_info(self, host):
         return [self.aggs_by_id[agg_id] for agg_id in
                 self.host_aggregates_map[host]]
@@ -604,15 +774,16 @@ class HostManager(object):
         else:
             # Host is running old version, or updates aren't flowing.
             inst_list = objects.InstanceList.get_by_host(context, host_name)
-            inst_dict = {instance.uuid: instance
-                         for instance in inst_list.objects}
+            inst_dict = {instance.uuid: instance for instance
+                         in instance_obj.compact_instances(inst_list.objects)}
         return inst_dict
 
     def _recreate_instance_info(self, context, host_name):
         """Get the InstanceList for the specified host, and store it in the
         _instance_info dict.
         """
-        instances = objects.InstanceList.get_by_host(context, host_name)
+        instances = instance_obj.compact_instances(
+            objects.InstanceList.get_by_host(context, host_name))
         inst_dict = {instance.uuid: instance for instance in instances}
         host_info = self._instance_info[host_name] = {}
         host_info["instances"] = inst_dict
@@ -627,14 +798,14 @@ class HostManager(object):
         instances with it.
         """
         host_info = self._instance_info.get(host_name)
+        instances = instance_obj.compact_instances(instance_info.objects)
         if host_info:
             inst_dict = host_info.get("instances")
-            for instance in instance_info.objects:
+            for instance in instances:
                 # Overwrite the entry (if any) with the new info.
                 inst_dict[instance.uuid] = instance
             host_info["updated"] = True
         else:
-            instances = instance_info.objects
             if len(instances) > 1:
                 # This is a host sending its full instance list, so use it.
                 host_info = self._instance_info[host_name] = {}
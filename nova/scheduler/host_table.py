@@ -0,0 +1,142 @@
+# Copyright (c) 2016 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Columnar view of HostState objects used by the vectorized filter path.
+"""
+
+from oslo_utils import importutils
+from six.moves import zip
+
+np = importutils.try_import('numpy')
+
+
+def _service_disabled(host_state):
+    return bool(host_state.service['disabled'])
+
+
+class HostStateTable(object):
+    """Columnar (NumPy-array-backed) snapshot of a list of HostStates.
+
+    Each column is read from the HostState objects the first time it is
+    accessed, and is carried over by index when the table is narrowed with
+    compress() or select(), so that a given attribute is read at most once
+    per filtering pass no matter how many filters look at it.
+
+    The table never writes resource values back to the HostStates; filters
+    which need to record limits should use set_limits().
+    """
+
+    # Numeric columns read straight from the HostState attribute of the same
+    # name. Missing (None) values are treated as 0.
+    NUMERIC_COLUMNS = ('free_ram_mb',
+                       'total_usable_ram_mb',
+                       'free_disk_mb',
+                       'total_usable_disk_gb',
+                       'vcpus_total',
+                       'vcpus_used',
+                       'num_instances',
+                       'num_io_ops',
+                       'ram_allocation_ratio',
+                       'cpu_allocation_ratio',
+                       )
+
+    # Boolean columns computed from a HostState by a getter.
+    BOOLEAN_COLUMNS = {'service_disabled': _service_disabled}
+
+    def __init__(self, host_states, columns=None):
+        self.objs = list(host_states)
+        self._columns = columns or {}
+
+    @staticmethod
+    def is_available():
+        """Return True if the NumPy library backing the table is present."""
+        return np is not None
+
+    def __len__(self):
+        return len(self.objs)
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        if name in self.NUMERIC_COLUMNS:
+            column = self._columns.get(name)
+            if column is None:
+                column = np.array([getattr(obj, name) or 0
+                                   for obj in self.objs], dtype=float)
+                self._columns[name] = column
+            return column
+        if name in self.BOOLEAN_COLUMNS:
+            column = self._columns.get(name)
+            if column is None:
+                getter = self.BOOLEAN_COLUMNS[name]
+                column = np.array([getter(obj) for obj in self.objs],
+                                  dtype=bool)
+                self._columns[name] = column
+            return column
+        raise AttributeError(name)
+
+    def map(self, func, dtype=float, where=None):
+        """Build an array by calling func(host_state) for each row.
+
+        This is the escape hatch for values which can't be expressed as a
+        column, like per-aggregate allocation ratios. If a boolean mask is
+        passed as where, func is only called for the selected rows and the
+        other rows are left as zero (or False).
+        """
+        result = np.zeros(len(self.objs), dtype=dtype)
+        if where is None:
+            indexes = range(len(self.objs))
+        else:
+            indexes = np.flatnonzero(where)
+        for i in indexes:
+            result[i] = func(self.objs[i])
+        return result
+
+    def set_limits(self, key, values, mask):
+        """Record host_state.limits[key] for every row selected by mask.
+
+        values can be a scalar or an array with one value per row.
+        """
+        values = np.broadcast_to(values, (len(self.objs),))
+        for obj, value, selected in zip(self.objs, values, mask):
+            if selected:
+                obj.limits[key] = float(value)
+
+    def compress(self, mask):
+        """Return a new table with only the rows selected by mask."""
+        mask = np.asarray(mask, dtype=bool)
+        objs = [obj for obj, selected in zip(self.objs, mask) if selected]
+        columns = {name: column[mask]
+                   for name, column in self._columns.items()}
+        return HostStateTable(objs, columns)
+
+    def select(self, objs):
+        """Return a new table for objs, which must be rows of this table.
+
+        The order of objs is kept. This is used to re-sync the table after a
+        filter without a batch path has been run on the plain object list.
+        """
+        objs = list(objs)
+        positions = {id(obj): i for i, obj in enumerate(self.objs)}
+        try:
+            indexes = np.array([positions[id(obj)] for obj in objs],
+                               dtype=int)
+        except KeyError:
+            # Something unknown was handed back, don't try to be clever.
+            return HostStateTable(objs)
+        columns = {name: column[indexes]
+                   for name, column in self._columns.items()}
+        return HostStateTable(objs, columns)
@@ -29,6 +29,7 @@ from nova import exception
 from nova import manager
 from nova import objects
 from nova import quota
+from nova.scheduler import profiler
 
 
 CONF = nova.conf.CONF
@@ -39,7 +40,7 @@ QUOTAS = quota.QUOTAS
 class SchedulerManager(manager.Manager):
     """Chooses a host to run instances on."""
 
-    target = messaging.Target(version='4.3')
+    target = messaging.Target(version='4.5')
 
     _sentinel = object()
 
@@ -117,3 +118,16 @@ class SchedulerManager(manager.Manager):
         """
         self.driver.host_manager.sync_instance_info(context, host_name,
                                                     instance_uuids)
+
+    def update_compute_node(self, context, compute_node, generation,
+                            epoch=None):
+        """Receives the resources which changed on a compute node, and
+        updates the driver's HostManager with that information.
+        """
+        self.driver.host_manager.update_compute_node(context, compute_node,
+                                                     generation, epoch=epoch)
+
+    def get_profile_stats(self, context):
+        """Returns the histograms of the requests profiled by this scheduler.
+        """
+        return profiler.get_stats()
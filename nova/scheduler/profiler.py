@@ -0,0 +1,265 @@
+# Copyright (c) 2016 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Per request profiling of the scheduler.
+
+When scheduler_profiling is set, the time spent in each stage of a request,
+in each filter and in each weigher is recorded along with the number of
+hosts going in and out and the number of database queries issued. The
+breakdown of each request is logged or sent as a notification, and is
+aggregated into histograms which can be fetched over RPC.
+"""
+
+import bisect
+import contextlib
+import threading
+import time
+
+from oslo_log import log as logging
+import six
+from sqlalchemy.engine import Engine
+from sqlalchemy import event
+
+import nova.conf
+from nova.i18n import _LI
+
+CONF = nova.conf.CONF
+LOG = logging.getLogger(__name__)
+
+# Upper bounds of the histogram buckets, in milliseconds. The last bucket
+# has no upper bound.
+BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000,
+              2500, 5000, 10000)
+
+# Greenthread local once eventlet has patched threading
+_local = threading.local()
+_listening_for_db_queries = False
+
+
+class RequestProfile(object):
+    """Breakdown of the time spent scheduling a request.
+
+    Each record is a dict with the kind ('stage', 'filter' or 'weigher') and
+    the name of what ran, the elapsed time in seconds, the number of hosts
+    in and out (None when it doesn't apply) and the database queries issued.
+    """
+
+    def __init__(self, request_id, instance_uuid=None):
+        self.request_id = request_id
+        self.instance_uuid = instance_uuid
+        self.records = []
+        # Database queries issued so far by the request
+        self.db_queries = 0
+        self._db_queries_mark = 0
+
+    def record(self, kind, name, elapsed, hosts_in=None, hosts_out=None,
+               db_queries=None):
+        """Add a record.
+
+        If db_queries isn't given, the queries issued since the previous
+        record are counted, which is what happens for the filters and
+        weighers as they run one after the other.
+        """
+        if db_queries is None:
+            db_queries = self.db_queries - self._db_queries_mark
+        self._db_queries_mark = self.db_queries
+        self.records.append({'kind': kind,
+                             'name': name,
+                             'elapsed': elapsed,
+                             'hosts_in': hosts_in,
+                             'hosts_out': hosts_out,
+                             'db_queries': db_queries})
+
+    def to_dict(self):
+        return {'request_id': self.request_id,
+                'instance_uuid': self.instance_uuid,
+                'records': self.records}
+
+
+class Histogram(object):
+    """Distribution of the elapsed time of the records of a filter, weigher
+    or stage, along with the totals of their hosts and database queries.
+    """
+
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.sum_ms = 0.0
+        self.hosts_in = 0
+        self.hosts_out = 0
+        self.db_queries = 0
+
+    def add(self, record):
+        elapsed_ms = record['elapsed'] * 1000
+        self.buckets[bisect.bisect_left(BUCKETS_MS, elapsed_ms)] += 1
+        self.count += 1
+        self.sum_ms += elapsed_ms
+        self.hosts_in += record['hosts_in'] or 0
+        self.hosts_out += record['hosts_out'] or 0
+        self.db_queries += record['db_queries']
+
+    def to_dict(self):
+        return {'count': self.count,
+                'sum_ms': self.sum_ms,
+                'buckets': [[bound, count] for bound, count in
+                            zip(BUCKETS_MS + (None,), self.buckets)],
+                'hosts_in': self.hosts_in,
+                'hosts_out': self.hosts_out,
+                'db_queries': self.db_queries}
+
+
+class ProfileStats(object):
+    """Histograms of the records of all the profiled requests."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.requests = 0
+        # kind -> name -> Histogram
+        self.histograms = {}
+
+    def add(self, profile):
+        self.requests += 1
+        for record in profile.records:
+            histograms = self.histograms.setdefault(record['kind'], {})
+            histogram = histograms.get(record['name'])
+            if histogram is None:
+                histogram = histograms[record['name']] = Histogram()
+            histogram.add(record)
+
+    def to_dict(self):
+        stats = {'requests': self.requests}
+        for kind, histograms in six.iteritems(self.histograms):
+            stats[kind] = {name: histogram.to_dict()
+                           for name, histogram in six.iteritems(histograms)}
+        return stats
+
+
+_STATS = ProfileStats()
+
+
+def get_stats():
+    """Return the histograms of the requests profiled by this process.
+
+    The result is a dict with the number of requests and, for each kind of
+    record, a dict of Histogram.to_dict() keyed by name.
+    """
+    return _STATS.to_dict()
+
+
+def reset_stats():
+    _STATS.reset()
+
+
+def percentile_ms(histogram, percent):
+    """Return an upper bound of a percentile of a Histogram.to_dict().
+
+    This is the upper bound of the bucket the percentile falls in, or None
+    if it falls in the last bucket.
+    """
+    rank = histogram['count'] * percent / 100.0
+    seen = 0
+    for bound, count in histogram['buckets']:
+        seen += count
+        if count and seen >= rank:
+            return bound
+    return None
+
+
+def get_current():
+    """Return the RequestProfile of the current request, if profiled."""
+    return getattr(_local, 'profile', None)
+
+
+def record(kind, name, elapsed, hosts_in=None, hosts_out=None):
+    """Add a record to the profile of the current request, if any."""
+    profile = get_current()
+    if profile is not None:
+        profile.record(kind, name, elapsed, hosts_in, hosts_out)
+
+
+class Stage(object):
+    """Context manager recording a stage of the current request, if any.
+
+    The hosts_in and hosts_out attributes can be set inside the block.
+    """
+
+    def __init__(self, name, hosts_in=None):
+        self.name = name
+        self.hosts_in = hosts_in
+        self.hosts_out = None
+        self._profile = get_current()
+
+    def __enter__(self):
+        if self._profile is not None:
+            self._start = time.time()
+            self._db_queries = self._profile.db_queries
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self._profile is not None:
+            self._profile.record(
+                'stage', self.name, time.time() - self._start,
+                self.hosts_in, self.hosts_out,
+                self._profile.db_queries - self._db_queries)
+
+
+def _count_db_query(conn, cursor, statement, parameters, context,
+                    executemany):
+    profile = get_current()
+    if profile is not None:
+        profile.db_queries += 1
+
+
+def _listen_for_db_queries():
+    global _listening_for_db_queries
+    if not _listening_for_db_queries:
+        event.listen(Engine, 'before_cursor_execute', _count_db_query)
+        _listening_for_db_queries = True
+
+
+@contextlib.contextmanager
+def profile_request(context, spec_obj, notifier=None):
+    """Profile the scheduling of a request if scheduler_profiling is set.
+
+    When the block exits, the profile is added to the histograms, then sent
+    as a scheduler.select_destinations.profile notification if
+    scheduler_profiling_notifications is set, or logged otherwise.
+    """
+    if not CONF.scheduler_profiling:
+        yield None
+        return
+
+    _listen_for_db_queries()
+    profile = RequestProfile(context.request_id, spec_obj.instance_uuid)
+    _local.profile = profile
+    start = time.time()
+    try:
+        yield profile
+    finally:
+        _local.profile = None
+        profile.record('stage', 'select_destinations', time.time() - start,
+                       db_queries=profile.db_queries)
+        _STATS.add(profile)
+        if CONF.scheduler_profiling_notifications and notifier is not None:
+            notifier.info(context, 'scheduler.select_destinations.profile',
+                          profile.to_dict())
+        else:
+            LOG.info(_LI("Scheduling profile of request %(request_id)s: "
+                         "%(records)s"),
+                     {'request_id': profile.request_id,
+                      'records': profile.records})
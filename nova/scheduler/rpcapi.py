@@ -87,6 +87,8 @@ class SchedulerAPI(object):
 
         * 4.3 - Modify select_destinations() signature by providing a
                 RequestSpec obj
+        * 4.4 - Added update_compute_node()
+        * 4.5 - Added get_profile_stats()
 
     '''
 
@@ -144,3 +146,19 @@ class SchedulerAPI(object):
         cctxt = self.client.prepare(version='4.2', fanout=True)
         return cctxt.cast(ctxt, 'sync_instance_info', host_name=host_name,
                           instance_uuids=instance_uuids)
+
+    def update_compute_node(self, ctxt, compute_node, generation,
+                            epoch=None):
+        version = '4.4'
+        if not self.client.can_send_version(version):
+            # NOTE: Older schedulers always reload the compute nodes from
+            # the database, there is nothing to tell them.
+            return
+        cctxt = self.client.prepare(version=version, fanout=True)
+        return cctxt.cast(ctxt, 'update_compute_node',
+                          compute_node=compute_node, generation=generation,
+                          epoch=epoch)
+
+    def get_profile_stats(self, ctxt):
+        cctxt = self.client.prepare(version='4.5')
+        return cctxt.call(ctxt, 'get_profile_stats')
@@ -17,8 +17,13 @@
 Scheduler host weights
 """
 
+import nova.conf
+from nova.scheduler import host_table
+from nova.scheduler import profiler
 from nova import weights
 
+CONF = nova.conf.CONF
+
 
 class WeighedHost(weights.WeighedObject):
     def to_dict(self):
@@ -42,6 +47,16 @@ class HostWeightHandler(weights.BaseWeightHandler):
     def __init__(self):
         super(HostWeightHandler, self).__init__(BaseHostWeigher)
 
+    def _get_object_table(self, objs):
+        if (CONF.scheduler_use_vectorized_weighers and
+                host_table.HostStateTable.is_available()):
+            return host_table.HostStateTable(objs)
+        return None
+
+    def _weigher_done(self, weigher, elapsed, count):
+        profiler.record('weigher', weigher.__class__.__name__, elapsed,
+                        count, count)
+
 
 def all_weighers():
     """Return a list of weight plugin classes found in this directory."""
@@ -24,10 +24,13 @@ by preferring the hosts that has less instances from the given group.
 """
 from oslo_config import cfg
 from oslo_log import log as logging
+from oslo_utils import importutils
 
 from nova.i18n import _LW
 from nova.scheduler import weights
 
+np = importutils.try_import('numpy')
+
 CONF = cfg.CONF
 
 LOG = logging.getLogger(__name__)
@@ -52,6 +55,16 @@ class _SoftAffinityWeigherBase(weights.BaseHostWeigher):
 
         return len(member_on_host)
 
+    def weigh_array(self, host_table, request_spec):
+        """Batch version of _weigh_object()."""
+        if (not request_spec.instance_group or
+                self.policy_name not in request_spec.instance_group.policies):
+            return np.zeros(len(host_table))
+
+        members = set(request_spec.instance_group.members)
+        return host_table.map(
+            lambda host_state: len(members.intersection(host_state.instances)))
+
 
 class ServerGroupSoftAffinityWeigher(_SoftAffinityWeigherBase):
     policy_name = 'soft-affinity'
@@ -88,3 +101,8 @@ class ServerGroupSoftAntiAffinityWeigher(_SoftAffinityWeigherBase):
         weight = super(ServerGroupSoftAntiAffinityWeigher, self)._weigh_object(
             host_state, request_spec)
         return -1 * weight
+
+    def weigh_array(self, host_table, request_spec):
+        weights = super(ServerGroupSoftAntiAffinityWeigher, self).weigh_array(
+            host_table, request_spec)
+        return -1 * weights
@@ -39,3 +39,6 @@ class IoOpsWeigher(weights.BaseHostWeigher):
         to be the default.
         """
         return host_state.num_io_ops
+
+    def weigh_array(self, host_table, weight_properties):
+        return host_table.num_io_ops
@@ -26,6 +26,8 @@ in the configuration file as the followings:
     The final weight would be name1.value * 1.0 + name2.value * -1.0.
 """
 
+import functools
+
 import nova.conf
 from nova import exception
 from nova.scheduler import utils
@@ -73,3 +75,9 @@ class MetricsWeigher(weights.BaseHostWeigher):
                         return CONF.metrics.weight_of_unavailable
 
         return value
+
+    def weigh_array(self, host_table, weight_properties):
+        # The metrics are per host lists, there is nothing to vectorize here
+        # but this still saves building a WeighedObject per host.
+        return host_table.map(functools.partial(
+            self._weigh_object, weight_properties=weight_properties))
@@ -31,6 +31,7 @@ from oslo_utils import importutils
 from nova import baserpc
 from nova import conductor
 from nova import context
+from nova.db import profiler as db_profiler
 from nova import debugger
 from nova import exception
 from nova.i18n import _, _LE, _LI, _LW
@@ -209,6 +210,7 @@ class Service(service.Service):
             baserpc.BaseRPCAPI(self.manager.service_name, self.backdoor_port)
         ]
         endpoints.extend(self.manager.additional_endpoints)
+        endpoints = db_profiler.profiled_endpoints(endpoints, self.topic)
 
         serializer = objects_base.NovaObjectSerializer()
 
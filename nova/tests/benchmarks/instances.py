@@ -0,0 +1,177 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Benchmark of the memory used by the lists of instances.
+
+Lists of instances are made from generated database records the way
+InstanceList.get_by_filters() makes them, with the attributes the API joins
+to show the servers in detail. For each list size, the memory used per
+instance is reported for the regular Instances, for their compact form and
+for the compact instances promoted back by setting one of their fields,
+along with the time taken to load the list and to read the fields the API
+views and the periodic tasks read::
+
+    python -m nova.tests.benchmarks.instances --instances 1000,10000
+
+Any other argument is passed to oslo.config.
+"""
+
+from __future__ import print_function
+
+import argparse
+import datetime
+import random
+import time
+import uuid
+
+from six.moves import range
+
+import nova.conf
+from nova.compute import power_state
+from nova.compute import vm_states
+from nova import context as nova_context
+from nova import objects
+from nova.objects import instance as instance_obj
+from nova.tests.benchmarks import scheduler as scheduler_benchmark
+from nova.tests.unit import fake_instance
+
+CONF = nova.conf.CONF
+
+# The attributes joined by the servers API, besides the flavor
+EXPECTED_ATTRS = ['metadata', 'system_metadata', 'info_cache',
+                  'security_groups']
+
+# Fields read for each instance by the servers API views and the periodic
+# tasks
+READ_FIELDS = ('uuid', 'display_name', 'host', 'node', 'vm_state',
+               'task_state', 'power_state', 'image_ref', 'key_name',
+               'created_at', 'updated_at', 'launched_at', 'metadata',
+               'access_ip_v4', 'access_ip_v6', 'locked', 'project_id',
+               'user_id')
+
+FORMS = ('regular', 'compact', 'promoted')
+
+
+def _uuid(rand):
+    return str(uuid.UUID(int=rand.getrandbits(128)))
+
+
+def generate_db_instances(num_instances, seed=0):
+    """Return database records of instances with realistic values."""
+    rand = random.Random(seed)
+    created_at = datetime.datetime(2016, 1, 1)
+    db_instances = []
+    for i in range(num_instances):
+        instance_uuid = _uuid(rand)
+        launched_at = created_at + datetime.timedelta(
+            seconds=rand.randint(30, 300))
+        db_instances.append(fake_instance.fake_db_instance(
+            id=i + 1,
+            uuid=instance_uuid,
+            display_name='server-%d' % i,
+            hostname='server-%d' % i,
+            host='compute%d' % rand.randint(1, 100),
+            node='compute%d.example.org' % rand.randint(1, 100),
+            vm_state=rand.choice([vm_states.ACTIVE, vm_states.STOPPED]),
+            power_state=power_state.RUNNING,
+            image_ref=_uuid(rand),
+            key_name='key-%d' % rand.randint(1, 10),
+            created_at=created_at,
+            updated_at=launched_at,
+            launched_at=launched_at,
+            launched_on='compute%d' % rand.randint(1, 100),
+            reservation_id='r-%s' % _uuid(rand)[:8],
+            memory_mb=2048, vcpus=2, root_gb=20,
+            metadata={'role': rand.choice(['web', 'db', 'cache'])},
+            system_metadata={'image_base_image_ref': _uuid(rand),
+                             'image_min_disk': '20',
+                             'image_disk_format': 'qcow2'},
+            info_cache={'instance_uuid': instance_uuid,
+                        'network_info': '[]',
+                        'created_at': created_at, 'updated_at': None,
+                        'deleted_at': None, 'deleted': False}))
+    return db_instances
+
+
+def load_instances(db_instances, form='regular'):
+    """Return the InstanceList of the database records of instances.
+
+    :param db_instances: database records of the instances
+    :param form: One of FORMS
+    """
+    context = nova_context.get_admin_context()
+    instances = instance_obj._make_instance_list(
+        context, objects.InstanceList(), db_instances, list(EXPECTED_ATTRS))
+    if form != 'regular':
+        instance_obj.compact_instances(instances)
+    if form == 'promoted':
+        for instance in instances:
+            # Like a periodic task updating the instances it lists
+            instance.task_state = instance.task_state
+    return instances
+
+
+def run_benchmark(db_instances, form='regular'):
+    """Load a list of instances and return the measurements.
+
+    :param db_instances: database records of the instances
+    :param form: One of FORMS, the form of the instances measured
+    """
+    start = time.time()
+    instances = load_instances(db_instances, form=form)
+    load_s = time.time() - start
+    start = time.time()
+    for instance in instances:
+        for field in READ_FIELDS:
+            getattr(instance, field)
+    read_s = time.time() - start
+    num_instances = len(instances)
+    return {'form': form,
+            'instances': num_instances,
+            'bytes_per_instance': (
+                scheduler_benchmark._deep_getsizeof(instances.objects) //
+                max(1, num_instances)),
+            'load_ms': load_s * 1000,
+            'read_ms': read_s * 1000}
+
+
+def _print_results(results):
+    columns = ('form', 'instances', 'bytes_per_instance', 'load_ms',
+               'read_ms')
+    print(' '.join('%20s' % column for column in columns))
+    for result in results:
+        print(' '.join('%20.1f' % result[column]
+                       if isinstance(result[column], float)
+                       else '%20s' % result[column]
+                       for column in columns))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Benchmark the memory used by the lists of instances.')
+    parser.add_argument('--instances', default='1000,10000',
+                        help='Comma separated list sizes.')
+    parser.add_argument('--seed', type=int, default=0)
+    args, conf_args = parser.parse_known_args(argv)
+    CONF(conf_args, project='nova', default_config_files=[])
+    objects.register_all()
+
+    results = []
+    for num_instances in [int(size) for size in args.instances.split(',')]:
+        db_instances = generate_db_instances(num_instances, seed=args.seed)
+        for form in FORMS:
+            results.append(run_benchmark(db_instances, form=form))
+    _print_results(results)
+
+
+if __name__ == '__main__':
+    main()
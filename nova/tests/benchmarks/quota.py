@@ -0,0 +1,158 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Benchmark of the quota drivers under contention.
+
+A number of boots are run at once in a new project, each reserving the quota
+of an instance and committing the reservation like the API and the
+conductor do, and the throughput and the latency of the boots are reported
+for each quota driver. The quota limits of the project fit all the boots
+exactly, so that the usages at the end show whether any of them was lost.
+
+The boots run in greenthreads against the database set in the configuration,
+which should be the MySQL or PostgreSQL database of a test deployment, as
+SQLite serializes all the writes anyway::
+
+    python -m nova.tests.benchmarks.quota --config-file bench.conf \\
+        --boots 50 --users 1 --driver locking --driver optimistic
+
+Any other argument, like --config-file, is passed to oslo.config.
+"""
+
+from __future__ import print_function
+
+import argparse
+import collections
+import time
+import uuid
+
+import eventlet
+import six
+from six.moves import range
+
+import nova.conf
+from nova import context as nova_context
+from nova import db
+from nova import quota
+from nova.tests.benchmarks import scheduler as scheduler_benchmark
+
+CONF = nova.conf.CONF
+
+DRIVERS = collections.OrderedDict([
+    ('locking', quota.DbQuotaDriver),
+    ('optimistic', quota.OptimisticDbQuotaDriver),
+])
+
+# Resources reserved by each boot, those of a m1.tiny
+BOOT_DELTAS = {'instances': 1, 'cores': 1, 'ram': 512}
+
+
+def _boot(driver, context):
+    start = time.time()
+    reservations = driver.reserve(context, quota.QUOTAS._resources,
+                                  BOOT_DELTAS)
+    driver.commit(context, reservations)
+    return time.time() - start
+
+
+def run_benchmark(driver_cls, boots=50, users=1):
+    """Run boots at once in a new project and return the measurements.
+
+    :param driver_cls: the quota driver class
+    :param boots: number of boots, all run in parallel
+    :param users: number of users of the project the boots are spread over
+    """
+    driver = driver_cls()
+    admin_context = nova_context.get_admin_context()
+    project_id = 'quota-benchmark-%s' % uuid.uuid4().hex
+    contexts = [nova_context.RequestContext('user%d' % i, project_id)
+                for i in range(users)]
+    for resource, delta in six.iteritems(BOOT_DELTAS):
+        db.quota_create(admin_context, project_id, resource, delta * boots)
+    try:
+        # Create the usages first, like in a project which already has
+        # instances.
+        for context in contexts:
+            driver.rollback(context, driver.reserve(
+                context, quota.QUOTAS._resources, BOOT_DELTAS))
+
+        pool = eventlet.GreenPool(boots)
+        start = time.time()
+        threads = [pool.spawn(_boot, driver, contexts[i % users])
+                   for i in range(boots)]
+        latencies = []
+        failures = 0
+        for thread in threads:
+            try:
+                latencies.append(thread.wait())
+            except Exception:
+                failures += 1
+        elapsed = time.time() - start
+        usages = db.quota_usage_get_all_by_project(admin_context,
+                                                   project_id)
+    finally:
+        driver.destroy_all_by_project(admin_context, project_id)
+
+    latencies.sort()
+    return {'boots': boots,
+            'users': users,
+            'failures': failures,
+            'boots_per_sec': (boots - failures) / elapsed if elapsed else 0.0,
+            'p50_ms': scheduler_benchmark._percentile(latencies, 50) * 1000,
+            'p99_ms': scheduler_benchmark._percentile(latencies, 99) * 1000,
+            'max_ms': latencies[-1] * 1000 if latencies else 0.0,
+            'instances_in_use': usages['instances']['in_use'],
+            'instances_reserved': usages['instances']['reserved']}
+
+
+def _print_results(results):
+    columns = ('driver', 'boots', 'users', 'failures', 'boots_per_sec',
+               'p50_ms', 'p99_ms', 'max_ms', 'instances_in_use',
+               'instances_reserved')
+    print(' '.join('%18s' % column for column in columns))
+    for result in results:
+        print(' '.join('%18.1f' % result[column]
+                       if isinstance(result[column], float)
+                       else '%18s' % result[column]
+                       for column in columns))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Benchmark the quota drivers under contention.')
+    parser.add_argument('--boots', type=int, default=50,
+                        help='Number of boots run at once in the project.')
+    parser.add_argument('--users', type=int, default=1,
+                        help='Number of users of the project.')
+    parser.add_argument('--rounds', type=int, default=3,
+                        help='Number of times each driver is run.')
+    parser.add_argument('--driver', action='append', choices=list(DRIVERS),
+                        help='Driver to run, can be repeated. All of them '
+                             'are run by default.')
+    args, conf_args = parser.parse_known_args(argv)
+    CONF(conf_args, project='nova', default_config_files=[])
+    # Like the nova services, so that the database calls of the boots
+    # interleave.
+    eventlet.monkey_patch(os=False)
+
+    results = []
+    for name in args.driver or DRIVERS:
+        for i in range(args.rounds):
+            result = run_benchmark(DRIVERS[name], boots=args.boots,
+                                   users=args.users)
+            result['driver'] = name
+            results.append(result)
+    _print_results(results)
+
+
+if __name__ == '__main__':
+    main()
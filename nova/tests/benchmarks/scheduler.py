@@ -0,0 +1,542 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Benchmark of the FilterScheduler on synthetic fleets.
+
+The FilterScheduler and the HostManager are run unmodified against generated
+ComputeNodes, Services and Aggregates which stand in for the database. For
+each filter and weigher configuration and each fleet size, a stream of
+RequestSpecs is scheduled and the latency of select_destinations() is
+reported, along with the filtering throughput and the memory used by the
+HostStates.
+
+The request streams are either generated or replayed from a trace, which is
+a file with one JSON serialized RequestSpec primitive per line, the same
+primitive the scheduler receives over RPC::
+
+    python -m nova.tests.benchmarks.scheduler --hosts 1000,5000,20000 \\
+        --requests 200 --record trace.json
+    python -m nova.tests.benchmarks.scheduler --hosts 5000 \\
+        --trace trace.json --configuration default --configuration full
+
+Any other argument, like --config-file, is passed to oslo.config.
+"""
+
+from __future__ import print_function
+
+import argparse
+import collections
+import contextlib
+import math
+import random
+import sys
+import time
+import types
+import uuid
+
+import mock
+from oslo_serialization import jsonutils
+from oslo_utils import timeutils
+import six
+from six.moves import range
+
+import nova.conf
+from nova import context as nova_context
+from nova import exception
+from nova import objects
+from nova.scheduler import filter_scheduler
+from nova.scheduler import host_manager
+from nova.virt import hardware
+
+CONF = nova.conf.CONF
+
+HOST_MANAGER = __name__ + '.BenchmarkHostManager'
+
+# The fraction of the resources of a host which is used. Real fleets are
+# filled by the same flavors, so the hosts fall into a few usage levels.
+USAGE_LEVELS = (0.0, 0.25, 0.5, 0.75)
+
+# Kinds of hosts in a fleet, with their relative share of the fleet
+HOST_PROFILES = collections.OrderedDict([
+    ('general', {'share': 6, 'vcpus': 32, 'memory_mb': 131072,
+                 'local_gb': 2048, 'numa_cells': 0, 'pci_devices': 0}),
+    ('numa', {'share': 3, 'vcpus': 48, 'memory_mb': 262144,
+              'local_gb': 2048, 'numa_cells': 2, 'pci_devices': 0}),
+    ('pci', {'share': 1, 'vcpus': 48, 'memory_mb': 262144,
+             'local_gb': 1024, 'numa_cells': 2, 'pci_devices': 8}),
+])
+
+PCI_VENDOR_ID = '8086'
+PCI_PRODUCT_ID = '154d'
+
+# Flavors of the generated requests, with their relative share of the
+# requests
+FLAVORS = collections.OrderedDict([
+    ('small', {'share': 5, 'vcpus': 1, 'memory_mb': 2048, 'root_gb': 20,
+               'extra_specs': {}}),
+    ('medium', {'share': 4, 'vcpus': 2, 'memory_mb': 4096, 'root_gb': 40,
+                'extra_specs': {}}),
+    ('large', {'share': 2, 'vcpus': 8, 'memory_mb': 16384, 'root_gb': 80,
+               'extra_specs': {}}),
+    ('ssd', {'share': 1, 'vcpus': 2, 'memory_mb': 4096, 'root_gb': 40,
+             'extra_specs': {'aggregate_instance_extra_specs:ssd': 'true'}}),
+    ('pinned', {'share': 1, 'vcpus': 4, 'memory_mb': 8192, 'root_gb': 40,
+                'extra_specs': {'hw:cpu_policy': 'dedicated'}}),
+    ('hugepages', {'share': 1, 'vcpus': 4, 'memory_mb': 8192, 'root_gb': 40,
+                   'extra_specs': {'hw:mem_page_size': 'large'}}),
+    ('sriov', {'share': 1, 'vcpus': 4, 'memory_mb': 8192, 'root_gb': 40,
+               'extra_specs': {}, 'pci_devices': 1}),
+])
+
+NUM_AVAILABILITY_ZONES = 4
+NUM_PROJECTS = 50
+# The projects with hosts of their own, through AggregateMultiTenancyIsolation
+NUM_ISOLATED_PROJECTS = 2
+
+FULL_FILTERS = [
+    'RetryFilter',
+    'AvailabilityZoneFilter',
+    'RamFilter',
+    'DiskFilter',
+    'CoreFilter',
+    'ComputeFilter',
+    'ComputeCapabilitiesFilter',
+    'ImagePropertiesFilter',
+    'AggregateInstanceExtraSpecsFilter',
+    'AggregateMultiTenancyIsolation',
+    'ServerGroupAntiAffinityFilter',
+    'ServerGroupAffinityFilter',
+    'NUMATopologyFilter',
+    'PciPassthroughFilter',
+]
+
+# Filter and weigher configurations, each with the options to set. Unset
+# filters or weighers are left to their configured value.
+CONFIGURATIONS = collections.OrderedDict([
+    ('default', {}),
+    ('full', {'filters': FULL_FILTERS}),
+    ('full-vectorized', {
+        'filters': FULL_FILTERS,
+        'flags': {'scheduler_use_vectorized_filters': True,
+                  'scheduler_use_vectorized_weighers': True}}),
+    ('full-adaptive', {'filters': FULL_FILTERS,
+                       'flags': {'scheduler_adaptive_filter_ordering': True}}),
+    ('full-batch', {'filters': FULL_FILTERS,
+                    'flags': {'scheduler_batch_placement': True}}),
+])
+
+
+def _weighed_choice(rand, choices):
+    """Pick a key of choices, an OrderedDict of dicts with a share."""
+    total = sum(choice['share'] for choice in six.itervalues(choices))
+    point = rand.uniform(0, total)
+    for name, choice in six.iteritems(choices):
+        point -= choice['share']
+        if point <= 0:
+            return name
+    return name
+
+
+def _uuid(rand):
+    return str(uuid.UUID(int=rand.getrandbits(128)))
+
+
+def _host_numa_topology(profile, usage):
+    cells = profile['numa_cells']
+    cell_cpus = profile['vcpus'] // cells
+    cell_memory = profile['memory_mb'] // cells
+    numa_cells = []
+    for cell_id in range(cells):
+        cpus = list(range(cell_id * cell_cpus, (cell_id + 1) * cell_cpus))
+        pinned = set(cpus[:int(cell_cpus * usage)])
+        memory_usage = int(cell_memory * usage)
+        # A quarter of the memory is in 2M pages, and is left free
+        large_pages = cell_memory * 1024 // 4 // 2048
+        small_pages = (cell_memory * 1024 - large_pages * 2048) // 4
+        numa_cells.append(objects.NUMACell(
+            id=cell_id, cpuset=set(cpus), memory=cell_memory,
+            cpu_usage=len(pinned), memory_usage=memory_usage,
+            pinned_cpus=pinned,
+            siblings=[set(cpus[i:i + 2]) for i in range(0, len(cpus), 2)],
+            mempages=[
+                objects.NUMAPagesTopology(size_kb=4, total=small_pages,
+                                          used=memory_usage * 1024 // 4),
+                objects.NUMAPagesTopology(size_kb=2048, total=large_pages,
+                                          used=0)]))
+    return objects.NUMATopology(cells=numa_cells)
+
+
+def _pci_device_pools(profile, usage):
+    cells = profile['numa_cells']
+    free = int(profile['pci_devices'] * (1 - usage)) // cells
+    return objects.PciDevicePoolList(objects=[
+        objects.PciDevicePool(vendor_id=PCI_VENDOR_ID,
+                              product_id=PCI_PRODUCT_ID, numa_node=cell_id,
+                              tags={'dev_type': 'type-PF'}, count=free)
+        for cell_id in range(cells)])
+
+
+class Fleet(object):
+    """A synthetic fleet of compute hosts.
+
+    The hosts are drawn from HOST_PROFILES at one of the USAGE_LEVELS. They
+    are spread over availability zones, a fifth of them is in an aggregate
+    with ssd=true and a few are isolated for some projects.
+    """
+
+    def __init__(self, num_hosts, seed=0):
+        rand = random.Random(seed)
+        now = timeutils.utcnow()
+        self.compute_nodes = []
+        self.services = []
+        self.profiles = collections.Counter()
+        zones = collections.defaultdict(list)
+        ssd_hosts = []
+        isolated_hosts = collections.defaultdict(list)
+        for i in range(num_hosts):
+            host = 'host%05d' % i
+            profile_name = _weighed_choice(rand, HOST_PROFILES)
+            self.profiles[profile_name] += 1
+            profile = HOST_PROFILES[profile_name]
+            usage = rand.choice(USAGE_LEVELS)
+            self.compute_nodes.append(
+                self._compute_node(i + 1, host, profile, usage, now))
+            self.services.append(objects.Service(
+                id=i + 1, host=host, binary='nova-compute', topic='compute',
+                disabled=rand.random() < 0.01, disabled_reason=None,
+                forced_down=False, report_count=1, version=1,
+                created_at=now, updated_at=now, last_seen_up=now))
+            zones['az%d' % (i % NUM_AVAILABILITY_ZONES)].append(host)
+            if rand.random() < 0.2:
+                ssd_hosts.append(host)
+            if rand.random() < 0.02:
+                project = rand.randrange(NUM_ISOLATED_PROJECTS)
+                isolated_hosts['project-%d' % project].append(host)
+
+        self.aggregates = []
+        for zone, hosts in sorted(zones.items()):
+            self._add_aggregate(zone, hosts, {'availability_zone': zone})
+        self._add_aggregate('ssd', ssd_hosts, {'ssd': 'true'})
+        for project, hosts in sorted(isolated_hosts.items()):
+            self._add_aggregate(project, hosts,
+                                {'filter_tenant_id': project})
+
+    @staticmethod
+    def _compute_node(node_id, host, profile, usage, now):
+        vcpus_used = int(profile['vcpus'] * usage)
+        memory_mb_used = int(profile['memory_mb'] * usage)
+        local_gb_used = int(profile['local_gb'] * usage)
+        num_instances = vcpus_used // 2
+        numa_topology = None
+        pci_device_pools = None
+        if profile['numa_cells']:
+            numa_topology = _host_numa_topology(profile, usage)._to_json()
+        if profile['pci_devices']:
+            pci_device_pools = _pci_device_pools(profile, usage)
+        metrics = [{'name': 'cpu.percent', 'value': usage,
+                    'timestamp': now.isoformat(),
+                    'source': 'libvirt.LibvirtDriver'}]
+        return objects.ComputeNode(
+            id=node_id, service_id=node_id, host=host,
+            hypervisor_hostname=host, host_ip='10.0.%d.%d' % divmod(
+                node_id, 256),
+            vcpus=profile['vcpus'], vcpus_used=vcpus_used,
+            memory_mb=profile['memory_mb'], memory_mb_used=memory_mb_used,
+            free_ram_mb=profile['memory_mb'] - memory_mb_used,
+            local_gb=profile['local_gb'], local_gb_used=local_gb_used,
+            free_disk_gb=profile['local_gb'] - local_gb_used,
+            disk_available_least=profile['local_gb'] - local_gb_used,
+            current_workload=0, running_vms=num_instances,
+            hypervisor_type='QEMU', hypervisor_version=2005000, cpu_info='',
+            supported_hv_specs=[objects.HVSpec(arch='x86_64', hv_type='kvm',
+                                               vm_mode='hvm')],
+            numa_topology=numa_topology, pci_device_pools=pci_device_pools,
+            stats={'num_instances': str(num_instances), 'io_workload': '0'},
+            metrics=jsonutils.dumps(metrics),
+            cpu_allocation_ratio=16.0, ram_allocation_ratio=1.5,
+            updated_at=now)
+
+    def _add_aggregate(self, name, hosts, metadata):
+        self.aggregates.append(objects.Aggregate(
+            id=len(self.aggregates) + 1, name=name, hosts=hosts,
+            metadata=metadata))
+
+    def __len__(self):
+        return len(self.compute_nodes)
+
+    @contextlib.contextmanager
+    def patch_database(self):
+        """Make the objects used by the HostManager read this fleet."""
+        compute_nodes = {(compute.host, compute.hypervisor_hostname): compute
+                         for compute in self.compute_nodes}
+        with mock.patch.object(objects.ComputeNodeList, 'get_all',
+                               return_value=self.compute_nodes), \
+                mock.patch.object(
+                    objects.ComputeNode, 'get_by_host_and_nodename',
+                    side_effect=lambda context, host, node:
+                        compute_nodes[(host, node)]), \
+                mock.patch.object(objects.ServiceList, 'get_by_binary',
+                                  return_value=self.services), \
+                mock.patch.object(objects.AggregateList, 'get_all',
+                                  return_value=self.aggregates):
+            yield
+
+
+def generate_requests(num_requests, seed=0):
+    """Return a list of RequestSpec primitives, drawn from FLAVORS."""
+    rand = random.Random(seed)
+    requests = []
+    for i in range(num_requests):
+        name = _weighed_choice(rand, FLAVORS)
+        flavor_spec = FLAVORS[name]
+        flavor = objects.Flavor(
+            id=list(FLAVORS).index(name) + 1, flavorid=name, name=name,
+            vcpus=flavor_spec['vcpus'], memory_mb=flavor_spec['memory_mb'],
+            root_gb=flavor_spec['root_gb'], ephemeral_gb=0, swap=0,
+            rxtx_factor=1.0, vcpu_weight=0, disabled=False, is_public=True,
+            extra_specs=dict(flavor_spec['extra_specs']))
+        image = objects.ImageMeta(properties=objects.ImageMetaProps())
+        pci_requests = None
+        if flavor_spec.get('pci_devices'):
+            pci_requests = objects.InstancePCIRequests(requests=[
+                objects.InstancePCIRequest(
+                    count=flavor_spec['pci_devices'],
+                    spec=[{'vendor_id': PCI_VENDOR_ID,
+                           'product_id': PCI_PRODUCT_ID}])])
+        availability_zone = None
+        if rand.random() < 0.2:
+            availability_zone = 'az%d' % rand.randrange(
+                NUM_AVAILABILITY_ZONES)
+        num_instances = 1
+        if rand.random() < 0.1:
+            num_instances = rand.randint(2, 5)
+        spec_obj = objects.RequestSpec(
+            instance_uuid=_uuid(rand),
+            project_id='project-%d' % rand.randrange(NUM_PROJECTS),
+            num_instances=num_instances, flavor=flavor, image=image,
+            numa_topology=hardware.numa_get_constraints(flavor, image),
+            pci_requests=pci_requests, availability_zone=availability_zone,
+            ignore_hosts=None, force_hosts=None, force_nodes=None,
+            retry=None, instance_group=None, scheduler_hints={})
+        requests.append(spec_obj.obj_to_primitive())
+    return requests
+
+
+def save_trace(path, requests):
+    """Write RequestSpec primitives to a trace file."""
+    with open(path, 'w') as trace:
+        for primitive in requests:
+            trace.write(jsonutils.dumps(primitive) + '\n')
+
+
+def load_trace(path):
+    """Read the RequestSpec primitives of a trace file."""
+    with open(path) as trace:
+        return [jsonutils.loads(line) for line in trace if line.strip()]
+
+
+class BenchmarkHostManager(host_manager.HostManager):
+    """HostManager which records the time spent filtering.
+
+    The instances on the hosts are not modelled, their number comes from
+    the stats of the ComputeNodes.
+    """
+
+    def __init__(self):
+        super(BenchmarkHostManager, self).__init__()
+        self.filter_time = 0.0
+        self.filter_checks = 0
+
+    def _init_instance_info(self):
+        pass
+
+    def _get_instance_info(self, context, compute):
+        return {}
+
+    def get_filtered_hosts(self, hosts, spec_obj, filter_class_names=None,
+                           index=0):
+        hosts = list(hosts)
+        start = time.time()
+        filtered = super(BenchmarkHostManager, self).get_filtered_hosts(
+            hosts, spec_obj, filter_class_names=filter_class_names,
+            index=index)
+        self.filter_time += time.time() - start
+        if filter_class_names is None:
+            filter_count = len(self.default_filters)
+        else:
+            filter_count = len(filter_class_names)
+        self.filter_checks += len(hosts) * filter_count
+        return filtered
+
+
+def _percentile(values, percent):
+    """Return the nearest-rank percentile of a sorted list."""
+    if not values:
+        return 0.0
+    rank = int(math.ceil(percent / 100.0 * len(values)))
+    return values[max(rank, 1) - 1]
+
+
+def _deep_getsizeof(objs):
+    """Return the memory used by objs and everything they reference.
+
+    Objects referenced several times, like the aggregates shared by the
+    HostStates, are only counted once. The attributes in __slots__ are
+    followed like those in __dict__.
+    """
+    seen = set()
+    size = 0
+    pending = list(objs)
+    while pending:
+        obj = pending.pop()
+        if (id(obj) in seen or
+                isinstance(obj, (type, types.ModuleType, types.FunctionType,
+                                 types.MethodType))):
+            continue
+        seen.add(id(obj))
+        size += sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            pending.extend(obj.keys())
+            pending.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            pending.extend(obj)
+        else:
+            if hasattr(obj, '__dict__'):
+                pending.append(obj.__dict__)
+            for cls in type(obj).__mro__:
+                slots = cls.__dict__.get('__slots__', ())
+                if isinstance(slots, six.string_types):
+                    slots = (slots,)
+                pending.extend(getattr(obj, name, None) for name in slots
+                               if not name.startswith('__'))
+    return size
+
+
+def run_benchmark(fleet, requests, configuration, seed=0):
+    """Schedule requests on fleet and return the measurements.
+
+    :param fleet: a Fleet
+    :param requests: a list of RequestSpec primitives
+    :param configuration: a dict like the values of CONFIGURATIONS
+    :param seed: seed of the random host choice of the scheduler
+    """
+    flags = {'scheduler_host_manager': HOST_MANAGER}
+    flags.update(configuration.get('flags', {}))
+    if configuration.get('filters') is not None:
+        flags['scheduler_default_filters'] = configuration['filters']
+    if configuration.get('weighers') is not None:
+        flags['scheduler_weight_classes'] = configuration['weighers']
+    for name, value in six.iteritems(flags):
+        CONF.set_override(name, value)
+    try:
+        with fleet.patch_database():
+            with mock.patch('nova.rpc.get_notifier'):
+                scheduler = filter_scheduler.FilterScheduler()
+            context = nova_context.get_admin_context()
+            random.seed(seed)
+            latencies = []
+            failures = 0
+            for primitive in requests:
+                spec_obj = objects.RequestSpec.obj_from_primitive(primitive)
+                start = time.time()
+                try:
+                    scheduler.select_destinations(context, spec_obj)
+                except exception.NoValidHost:
+                    failures += 1
+                latencies.append(time.time() - start)
+    finally:
+        for name in flags:
+            CONF.clear_override(name)
+
+    manager = scheduler.host_manager
+    host_states = list(manager.host_state_map.values())
+    latencies.sort()
+    filter_checks_per_sec = 0.0
+    if manager.filter_time:
+        filter_checks_per_sec = manager.filter_checks / manager.filter_time
+    return {'hosts': len(fleet),
+            'requests': len(requests),
+            'failures': failures,
+            'p50_ms': _percentile(latencies, 50) * 1000,
+            'p99_ms': _percentile(latencies, 99) * 1000,
+            'max_ms': latencies[-1] * 1000 if latencies else 0.0,
+            'filter_checks_per_sec': filter_checks_per_sec,
+            'host_state_bytes': (_deep_getsizeof(host_states) //
+                                 max(1, len(host_states)))}
+
+
+def _print_results(results):
+    columns = ('configuration', 'hosts', 'requests', 'failures', 'p50_ms',
+               'p99_ms', 'max_ms', 'filter_checks_per_sec',
+               'host_state_bytes')
+    print(' '.join('%22s' % column for column in columns))
+    for result in results:
+        print(' '.join('%22.1f' % result[column]
+                       if isinstance(result[column], float)
+                       else '%22s' % result[column]
+                       for column in columns))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Benchmark the FilterScheduler on synthetic fleets.')
+    parser.add_argument('--hosts', default='1000,5000,20000',
+                        help='Comma separated fleet sizes.')
+    parser.add_argument('--requests', type=int, default=100,
+                        help='Number of requests to generate.')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--trace',
+                        help='Replay the requests of this trace file.')
+    parser.add_argument('--record',
+                        help='Save the requests to this trace file.')
+    parser.add_argument('--configuration', action='append',
+                        choices=list(CONFIGURATIONS),
+                        help='Configuration to run, can be repeated. All '
+                             'of them are run by default.')
+    parser.add_argument('--filters',
+                        help='Comma separated filters of an additional '
+                             '"custom" configuration.')
+    parser.add_argument('--weighers',
+                        help='Comma separated weighers of the "custom" '
+                             'configuration.')
+    args, conf_args = parser.parse_known_args(argv)
+    CONF(conf_args, project='nova', default_config_files=[])
+    objects.register_all()
+
+    if args.trace:
+        requests = load_trace(args.trace)
+    else:
+        requests = generate_requests(args.requests, seed=args.seed)
+    if args.record:
+        save_trace(args.record, requests)
+
+    configurations = collections.OrderedDict(
+        (name, CONFIGURATIONS[name])
+        for name in args.configuration or CONFIGURATIONS)
+    if args.filters or args.weighers:
+        configurations['custom'] = {
+            'filters': args.filters.split(',') if args.filters else None,
+            'weighers': args.weighers.split(',') if args.weighers else None}
+
+    results = []
+    for num_hosts in [int(size) for size in args.hosts.split(',')]:
+        fleet = Fleet(num_hosts, seed=args.seed)
+        for name, configuration in six.iteritems(configurations):
+            result = run_benchmark(fleet, requests, configuration,
+                                   seed=args.seed)
+            result['configuration'] = name
+            results.append(result)
+    _print_results(results)
+
+
+if __name__ == '__main__':
+    main()
@@ -614,6 +614,82 @@ class ServersControllerTest(ControllerTest):
                            'marker': [fakes.get_fake_uuid(2)]}
         self.assertThat(params, matchers.DictMatches(expected_params))
 
+    @mock.patch('nova.db.instance_pagination_token',
+                return_value='fake-token')
+    def test_get_servers_with_limit_pagination_token(self, mock_token):
+        self.flags(osapi_pagination_token=True)
+        req = self.req('/fake/servers?limit=3')
+        res_dict = self.controller.index(req)
+
+        servers_links = res_dict['servers_links']
+        href_parts = urlparse.urlparse(servers_links[0]['href'])
+        params = urlparse.parse_qs(href_parts.query)
+        expected_params = {'limit': ['3'],
+                           'marker': ['fake-token']}
+        self.assertThat(params, matchers.DictMatches(expected_params))
+        instance = mock_token.call_args[0][0]
+        self.assertEqual(fakes.get_fake_uuid(2), instance.uuid)
+        mock_token.assert_called_once_with(instance, ['created_at'],
+                                           ['desc'])
+
+    def test_get_servers_streamed(self):
+        self.flags(osapi_stream_chunk_size=2)
+        req = self.req('/fake/servers?limit=4')
+        res = self.controller.index(req)
+
+        self.assertIsInstance(res, os_wsgi.StreamingResponseObject)
+        self.assertEqual('servers', res.collection_name)
+        chunks = [res.obj] + list(res.chunks)
+        self.assertEqual([[fakes.get_fake_uuid(0), fakes.get_fake_uuid(1)],
+                          [fakes.get_fake_uuid(2), fakes.get_fake_uuid(3)]],
+                         [[s['id'] for s in chunk['servers']]
+                          for chunk in chunks])
+
+        servers_links = res.trailer()['servers_links']
+        self.assertEqual(servers_links[0]['rel'], 'next')
+        href_parts = urlparse.urlparse(servers_links[0]['href'])
+        self.assertEqual('/v2/fake/servers', href_parts.path)
+        params = urlparse.parse_qs(href_parts.query)
+        expected_params = {'limit': ['4'],
+                           'marker': [fakes.get_fake_uuid(3)]}
+        self.assertThat(params, matchers.DictMatches(expected_params))
+
+    def test_get_server_details_streamed(self):
+        self.flags(osapi_stream_chunk_size=2)
+        req = self.req('/fake/servers/detail')
+        res = self.controller.detail(req)
+
+        self.assertIsInstance(res, os_wsgi.StreamingResponseObject)
+        self.assertEqual([fakes.get_fake_uuid(0), fakes.get_fake_uuid(1)],
+                         [s['id'] for s in res.obj['servers']])
+        # The instances of the chunk are cached for the extensions
+        self.assertIsNotNone(req.get_db_instance(fakes.get_fake_uuid(1)))
+        chunks = list(res.chunks)
+        self.assertEqual([[fakes.get_fake_uuid(2), fakes.get_fake_uuid(3)],
+                          [fakes.get_fake_uuid(4)]],
+                         [[s['id'] for s in chunk['servers']]
+                          for chunk in chunks])
+        self.assertIsNone(req.get_db_instance(fakes.get_fake_uuid(1)))
+        self.assertIsNotNone(req.get_db_instance(fakes.get_fake_uuid(4)))
+        self.assertEqual({}, res.trailer())
+
+    def test_get_servers_not_streamed_when_fitting_a_chunk(self):
+        self.flags(osapi_stream_chunk_size=10)
+        req = self.req('/fake/servers/detail')
+        res = self.controller.detail(req)
+
+        self.assertIsInstance(res, dict)
+        self.assertEqual(5, len(res['servers']))
+
+    def test_get_servers_not_streamed_when_not_allowed(self):
+        self.flags(osapi_stream_chunk_size=2)
+        req = self.req('/fake/servers/detail')
+        req.streaming_allowed = False
+        res = self.controller.detail(req)
+
+        self.assertIsInstance(res, dict)
+        self.assertEqual(5, len(res['servers']))
+
     def test_get_servers_with_limit_bad_value(self):
         req = self.req('/fake/servers?limit=aaa')
         self.assertRaises(webob.exc.HTTPBadRequest,
@@ -705,7 +781,8 @@ class ServersControllerTest(ControllerTest):
 
         def fake_get_all(compute_self, context, search_opts=None,
                          limit=None, marker=None, want_objects=False,
-                         expected_attrs=None, sort_keys=None, sort_dirs=None):
+                         expected_attrs=None, sort_keys=None, sort_dirs=None,
+                         fields=None):
             db_list = [fakes.stub_instance(100, uuid=server_uuid)]
             return instance_obj._make_instance_list(
                 context, objects.InstanceList(), db_list, FIELDS)
@@ -723,7 +800,8 @@ class ServersControllerTest(ControllerTest):
 
         def fake_get_all(compute_self, context, search_opts=None,
                          limit=None, marker=None, want_objects=False,
-                         expected_attrs=None, sort_keys=None, sort_dirs=None):
+                         expected_attrs=None, sort_keys=None, sort_dirs=None,
+                         fields=None):
             self.assertIsNotNone(search_opts)
             self.assertIn('image', search_opts)
             self.assertEqual(search_opts['image'], '12345')
@@ -866,7 +944,8 @@ class ServersControllerTest(ControllerTest):
 
         def fake_get_all(compute_self, context, search_opts=None,
                          limit=None, marker=None, want_objects=False,
-                         expected_attrs=None, sort_keys=None, sort_dirs=None):
+                         expected_attrs=None, sort_keys=None, sort_dirs=None,
+                         fields=None):
             self.assertIsNotNone(search_opts)
             self.assertIn('flavor', search_opts)
             # flavor is an integer ID
@@ -903,7 +982,8 @@ class ServersControllerTest(ControllerTest):
 
         def fake_get_all(compute_self, context, search_opts=None,
                          limit=None, marker=None, want_objects=False,
-                         expected_attrs=None, sort_keys=None, sort_dirs=None):
+                         expected_attrs=None, sort_keys=None, sort_dirs=None,
+                         fields=None):
             self.assertIsNotNone(search_opts)
             self.assertIn('vm_state', search_opts)
             self.assertEqual(search_opts['vm_state'], [vm_states.ACTIVE])
@@ -924,7 +1004,8 @@ class ServersControllerTest(ControllerTest):
 
         def fake_get_all(compute_self, context, search_opts=None,
                          limit=None, marker=None, want_objects=False,
-                         expected_attrs=None, sort_keys=None, sort_dirs=None):
+                         expected_attrs=None, sort_keys=None, sort_dirs=None,
+                         fields=None):
             self.assertIsNotNone(search_opts)
             self.assertIn('task_state', search_opts)
             self.assertEqual([task_states.REBOOT_PENDING,
@@ -949,7 +1030,8 @@ class ServersControllerTest(ControllerTest):
 
         def fake_get_all(compute_self, context, search_opts=None,
                          limit=None, marker=None, want_objects=False,
-                         expected_attrs=None, sort_keys=None, sort_dirs=None):
+                         expected_attrs=None, sort_keys=None, sort_dirs=None,
+                         fields=None):
             self.assertIn('vm_state', search_opts)
             self.assertEqual(search_opts['vm_state'],
                              [vm_states.ACTIVE, vm_states.STOPPED])
@@ -983,7 +1065,8 @@ class ServersControllerTest(ControllerTest):
 
         def fake_get_all(compute_self, context, search_opts=None,
                          limit=None, marker=None, want_objects=False,
-                         expected_attrs=None, sort_keys=None, sort_dirs=None):
+                         expected_attrs=None, sort_keys=None, sort_dirs=None,
+                         fields=None):
             self.assertIn('vm_state', search_opts)
             self.assertEqual(search_opts['vm_state'], ['deleted'])
 
@@ -1022,7 +1105,7 @@ class ServersControllerTest(ControllerTest):
             mock.ANY, search_opts=expected_search_opts, limit=mock.ANY,
             expected_attrs=['flavor', 'info_cache', 'metadata', 'pci_devices'],
             marker=mock.ANY, want_objects=mock.ANY,
-            sort_keys=mock.ANY, sort_dirs=mock.ANY)
+            sort_keys=mock.ANY, sort_dirs=mock.ANY, fields=None)
 
     @mock.patch.object(compute_api.API, 'get_all')
     def test_get_servers_deleted_filter_invalid_str(self, mock_get_all):
@@ -1046,18 +1129,20 @@ class ServersControllerTest(ControllerTest):
             mock.ANY, search_opts=expected_search_opts, limit=mock.ANY,
             expected_attrs=['flavor', 'info_cache', 'metadata', 'pci_devices'],
             marker=mock.ANY, want_objects=mock.ANY,
-            sort_keys=mock.ANY, sort_dirs=mock.ANY)
+            sort_keys=mock.ANY, sort_dirs=mock.ANY, fields=None)
 
     def test_get_servers_allows_name(self):
         server_uuid = str(uuid.uuid4())
 
         def fake_get_all(compute_self, context, search_opts=None,
                          limit=None, marker=None, want_objects=False,
-                         expected_attrs=None, sort_keys=None, sort_dirs=None):
+                         expected_attrs=None, sort_keys=None, sort_dirs=None,
+                         fields=None):
             self.assertIsNotNone(search_opts)
             self.assertIn('name', search_opts)
             self.assertEqual(search_opts['name'], 'whee.*')
-            self.assertEqual(['pci_devices'], expected_attrs)
+            self.assertEqual([], expected_attrs)
+            self.assertEqual(['uuid', 'display_name'], fields)
             return objects.InstanceList(
                 objects=[fakes.stub_instance_obj(100, uuid=server_uuid)])
 
@@ -1083,7 +1168,8 @@ class ServersControllerTest(ControllerTest):
 
         def fake_get_all(compute_self, context, search_opts=None,
                          limit=None, marker=None, want_objects=False,
-                         expected_attrs=None, sort_keys=None, sort_dirs=None):
+                         expected_attrs=None, sort_keys=None, sort_dirs=None,
+                         fields=None):
             self.assertIsNotNone(search_opts)
             self.assertIn('changes-since', search_opts)
             changes_since = datetime.datetime(2011, 1, 24, 17, 8, 1,
@@ -1116,7 +1202,8 @@ class ServersControllerTest(ControllerTest):
 
         def fake_get_all(compute_self, context, search_opts=None,
                          limit=None, marker=None, want_objects=False,
-                         expected_attrs=None, sort_keys=None, sort_dirs=None):
+                         expected_attrs=None, sort_keys=None, sort_dirs=None,
+                         fields=None):
             self.assertIsNotNone(search_opts)
             # Allowed by user
             self.assertIn('name', search_opts)
@@ -1146,7 +1233,8 @@ class ServersControllerTest(ControllerTest):
 
         def fake_get_all(compute_self, context, search_opts=None,
                          limit=None, marker=None, want_objects=False,
-                         expected_attrs=None, sort_keys=None, sort_dirs=None):
+                         expected_attrs=None, sort_keys=None, sort_dirs=None,
+                         fields=None):
             self.assertIsNotNone(search_opts)
             # Allowed by user
             self.assertIn('name', search_opts)
@@ -1175,7 +1263,8 @@ class ServersControllerTest(ControllerTest):
 
         def fake_get_all(compute_self, context, search_opts=None,
                          limit=None, marker=None, want_objects=False,
-                         expected_attrs=None, sort_keys=None, sort_dirs=None):
+                         expected_attrs=None, sort_keys=None, sort_dirs=None,
+                         fields=None):
             self.assertIsNotNone(search_opts)
             self.assertIn('ip', search_opts)
             self.assertEqual(search_opts['ip'], '10\..*')
@@ -1198,7 +1287,8 @@ class ServersControllerTest(ControllerTest):
 
         def fake_get_all(compute_self, context, search_opts=None,
                          limit=None, marker=None, want_objects=False,
-                         expected_attrs=None, sort_keys=None, sort_dirs=None):
+                         expected_attrs=None, sort_keys=None, sort_dirs=None,
+                         fields=None):
             self.assertIsNotNone(search_opts)
             self.assertIn('ip6', search_opts)
             self.assertEqual(search_opts['ip6'], 'ffff.*')
@@ -1222,7 +1312,8 @@ class ServersControllerTest(ControllerTest):
 
         def fake_get_all(compute_self, context, search_opts=None,
                          limit=None, marker=None, want_objects=False,
-                         expected_attrs=None, sort_keys=None, sort_dirs=None):
+                         expected_attrs=None, sort_keys=None, sort_dirs=None,
+                         fields=None):
             self.assertIsNotNone(search_opts)
             self.assertIn('ip6', search_opts)
             self.assertEqual(search_opts['ip6'], 'ffff.*')
@@ -1305,8 +1396,25 @@ class ServersControllerTest(ControllerTest):
 
         def fake_get_all(compute_self, context, search_opts=None,
                          limit=None, marker=None, want_objects=False,
-                         expected_attrs=None, sort_keys=None, sort_dirs=None):
-            self.assertEqual(['pci_devices'], expected_attrs)
+                         expected_attrs=None, sort_keys=None, sort_dirs=None,
+                         fields=None):
+            self.assertIn('pci_devices', expected_attrs)
+            self.assertIsNone(fields)
+            return []
+
+        self.stubs.Set(compute_api.API, 'get_all', fake_get_all)
+
+        req = self.req('/fake/servers/detail', use_admin_context=True)
+        self.assertIn('servers', self.controller.detail(req))
+
+    def test_get_servers_index_loads_only_fields(self):
+
+        def fake_get_all(compute_self, context, search_opts=None,
+                         limit=None, marker=None, want_objects=False,
+                         expected_attrs=None, sort_keys=None, sort_dirs=None,
+                         fields=None):
+            self.assertEqual([], expected_attrs)
+            self.assertEqual(['uuid', 'display_name'], fields)
             return []
 
         self.stubs.Set(compute_api.API, 'get_all', fake_get_all)
@@ -982,6 +982,83 @@ class ResourceTest(test.NoDBTestCase):
         self.assertEqual(called, [2])
         self.assertEqual(response, 'foo')
 
+    def _test_streaming_response(self, fail_on_chunk=None):
+        class Controller(object):
+            def index(self, req):
+                return wsgi.StreamingResponseObject(
+                    'tests', {'tests': [1]},
+                    iter([{'tests': [2, 3]}, {'tests': [4]}]),
+                    trailer=lambda: {'tests_links': ['next']})
+
+        chunks = []
+
+        class ControllerExtended(wsgi.Controller):
+            @wsgi.extends
+            def index(self, req, resp_obj):
+                chunks.append(list(resp_obj.obj['tests']))
+                if len(chunks) == fail_on_chunk:
+                    return wsgi.Fault(webob.exc.HTTPInternalServerError())
+                resp_obj.obj['tests'] = [test * 10
+                                         for test in resp_obj.obj['tests']]
+
+        resource = wsgi.Resource(Controller())
+        resource.register_extensions(ControllerExtended())
+        req = wsgi.Request.blank('/tests')
+        response = resource._process_stack(req, 'index', {}, None, b'',
+                                           'application/json')
+        # Only the first chunk is processed before the body is sent
+        self.assertEqual([[1]], chunks)
+        return response, chunks
+
+    def test_resource_streaming_response(self):
+        response, chunks = self._test_streaming_response()
+        self.assertIsInstance(response, webob.Response)
+        self.assertEqual(200, response.status_int)
+        self.assertIsNone(response.content_length)
+        self.assertEqual({'tests': [10, 20, 30, 40], 'tests_links': ['next']},
+                         jsonutils.loads(response.body))
+        self.assertEqual([[1], [2, 3], [4]], chunks)
+
+    def test_resource_streaming_response_fault_first_chunk(self):
+        response, chunks = self._test_streaming_response(fail_on_chunk=1)
+        self.assertIsInstance(response, wsgi.Fault)
+
+    @mock.patch.object(wsgi, 'LOG')
+    def test_resource_streaming_response_fault_next_chunk(self, mock_log):
+        response, chunks = self._test_streaming_response(fail_on_chunk=2)
+        self.assertEqual(b'{"tests": [10', response.body)
+        self.assertEqual([[1], [2, 3]], chunks)
+        self.assertTrue(mock_log.error.called)
+
+    def test_resource_streaming_allowed(self):
+        allowed = []
+
+        class Controller(object):
+            def index(self, req):
+                allowed.append(req.streaming_allowed)
+                return {}
+
+        class ControllerExtended(wsgi.Controller):
+            @wsgi.extends
+            def index(self, req, resp_obj):
+                pass
+
+        class ControllerGeneratorExtended(wsgi.Controller):
+            @wsgi.extends
+            def index(self, req):
+                yield
+
+        resource = wsgi.Resource(Controller())
+        resource.register_extensions(ControllerExtended())
+        req = wsgi.Request.blank('/tests')
+        resource._process_stack(req, 'index', {}, None, b'',
+                                'application/json')
+        resource.register_extensions(ControllerGeneratorExtended())
+        req = wsgi.Request.blank('/tests')
+        resource._process_stack(req, 'index', {}, None, b'',
+                                'application/json')
+        self.assertEqual([True, False], allowed)
+
     def test_resource_exception_handler_type_error(self):
         # A TypeError should be translated to a Fault/HTTP 400.
         def foo(a,):
@@ -1141,6 +1218,50 @@ class ResponseObjectTest(test.NoDBTestCase):
             self.assertEqual(mtype.encode("utf-8"), response.body)
 
 
+class StreamingResponseObjectTest(test.NoDBTestCase):
+    def test_serialize(self):
+        robj = wsgi.StreamingResponseObject(
+            'tests', {'tests': []},
+            iter([{'tests': [{'id': 1}]}, {'tests': []},
+                  {'tests': [{'id': 2}, {'id': 3}]}]),
+            code=202)
+        robj['X-header1'] = 'header1'
+        request = wsgi.Request.blank('/tests')
+        response = robj.serialize(request, 'application/json',
+                                  dict(json=wsgi.JSONDictSerializer))
+        self.assertEqual(b'application/json',
+                         response.headers['Content-Type'])
+        self.assertEqual(b'header1', response.headers['X-header1'])
+        self.assertEqual(202, response.status_int)
+        self.assertIsNone(response.content_length)
+        self.assertEqual(b'{"tests": [{"id": 1}, {"id": 2}, {"id": 3}]}',
+                         response.body)
+
+    @mock.patch.object(wsgi, 'LOG')
+    def test_serialize_chunk_error(self, mock_log):
+        def chunks():
+            yield {'tests': [{'id': 2}]}
+            raise test.TestingException()
+
+        robj = wsgi.StreamingResponseObject(
+            'tests', {'tests': [{'id': 1}]}, chunks(),
+            trailer=lambda: {'tests_links': ['next']})
+        request = wsgi.Request.blank('/tests')
+        response = robj.serialize(request, 'application/json',
+                                  dict(json=wsgi.JSONDictSerializer))
+        # Left unterminated
+        self.assertEqual(b'{"tests": [{"id": 1}, {"id": 2}', response.body)
+        self.assertTrue(mock_log.exception.called)
+
+    def test_serialize_empty(self):
+        robj = wsgi.StreamingResponseObject(
+            'tests', {'tests': []}, iter([]), trailer=lambda: {})
+        request = wsgi.Request.blank('/tests')
+        response = robj.serialize(request, 'application/json',
+                                  dict(json=wsgi.JSONDictSerializer))
+        self.assertEqual({'tests': []}, jsonutils.loads(response.body))
+
+
 class ValidBodyTest(test.NoDBTestCase):
 
     def setUp(self):
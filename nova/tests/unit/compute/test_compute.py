@@ -40,7 +40,6 @@ from oslo_utils import units
 from oslo_utils import uuidutils
 import six
 import testtools
-from testtools import matchers as testtools_matchers
 
 import nova
 from nova import availability_zones
@@ -6598,10 +6597,12 @@ class ComputeTestCase(BaseTestCase):
             mock.patch.object(self.compute.db.sqlalchemy.api,
                               'instance_get_all_by_filters',
                               return_value=instances),
-            mock.patch.object(objects.Instance, 'save'),
+            mock.patch.object(objects.InstanceList, 'save_many',
+                              autospec=True,
+                              return_value=[old_instances[0]['uuid']]),
         ) as (
             instance_get_all_by_filters,
-            conductor_instance_update
+            save_many
         ):
             # run the code
             self.compute._check_instance_build_time(ctxt)
@@ -6614,11 +6615,14 @@ class ComputeTestCase(BaseTestCase):
                                             columns_to_join=[],
                                             use_slave=True,
                                             limit=None)
-            self.assertThat(conductor_instance_update.mock_calls,
-                            testtools_matchers.HasLength(len(old_instances)))
-            for inst in old_instances:
-                conductor_instance_update.assert_has_calls([
-                    mock.call()])
+            self.assertEqual(1, save_many.call_count)
+            saved = save_many.call_args[0][0]
+            self.assertEqual([inst['uuid'] for inst in old_instances],
+                             [inst.uuid for inst in saved])
+            for inst in saved:
+                self.assertEqual(vm_states.ERROR, inst.vm_state)
+            save_many.assert_called_once_with(
+                saved, expected_vm_state=vm_states.BUILDING)
 
     def test_get_resource_tracker_fail(self):
         self.assertRaises(exception.NovaException,
@@ -10207,6 +10211,25 @@ class ComputeAPIIpFilterTestCase(test.NoDBTestCase):
             kwargs = m_get.call_args[1]
             self.assertEqual(1, kwargs['limit'])
 
+    def test_get_all_fields(self):
+        c = context.get_admin_context()
+        with mock.patch('nova.objects.InstanceList.get_by_filters') as m_get:
+            self.compute_api.get_all(c, search_opts={},
+                                     fields=['display_name'])
+            kwargs = m_get.call_args[1]
+            self.assertEqual([], kwargs['expected_attrs'])
+            self.assertEqual(['display_name'], kwargs['fields'])
+
+    def test_get_all_fields_ip_filtering(self):
+        c = context.get_admin_context()
+        # The IP filter needs the info cache
+        with mock.patch('nova.objects.InstanceList.get_by_filters') as m_get:
+            self.compute_api.get_all(c, search_opts={'ip': '.10'},
+                                     fields=['display_name'])
+            kwargs = m_get.call_args[1]
+            self.assertEqual(['info_cache'], kwargs['expected_attrs'])
+            self.assertEqual(['display_name'], kwargs['fields'])
+
 
 def fake_rpc_method(context, method, **kwargs):
     pass
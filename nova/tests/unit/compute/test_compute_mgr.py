@@ -52,6 +52,7 @@ from nova.tests.unit import fake_network_cache_model
 from nova.tests.unit import fake_server_actions
 from nova.tests.unit.objects import test_instance_fault
 from nova.tests.unit.objects import test_instance_info_cache
+from nova.tests import uuidsentinel as uuids
 from nova import utils
 from nova.virt import driver as virt_driver
 from nova.virt import event as virtevent
@@ -1374,6 +1375,60 @@ class ComputeManagerUnitTestCase(test.NoDBTestCase):
                                         use_slave=True)
             mock_spawn.assert_called_once_with(mock.ANY, instance)
 
+    @mock.patch.object(objects.InstanceList, 'get_by_host')
+    def test_sync_power_states_bulk(self, mock_get):
+        def _instance(uuid, vm_state, task_state=None):
+            return objects.Instance(uuid=uuid, vm_state=vm_state,
+                                    power_state=power_state.RUNNING,
+                                    task_state=task_state)
+
+        mock_get.return_value = [
+            _instance(uuids.in_sync, vm_states.ACTIVE),
+            _instance(uuids.missing, vm_states.ACTIVE),
+            _instance(uuids.stopped, vm_states.ACTIVE),
+            _instance(uuids.busy, vm_states.ACTIVE,
+                      task_state=task_states.REBOOTING)]
+        with test.nested(
+            mock.patch.object(self.compute.driver, 'get_power_states',
+                              return_value={
+                                  uuids.in_sync: power_state.RUNNING,
+                                  uuids.stopped: power_state.SHUTDOWN,
+                                  uuids.busy: power_state.SHUTDOWN}),
+            mock.patch.object(self.compute.driver, 'get_num_instances'),
+            mock.patch.object(self.compute._sync_power_pool, 'spawn_n')
+        ) as (mock_get_states, mock_get_num, mock_spawn):
+            self.compute._sync_power_states(mock.sentinel.context)
+        mock_get_states.assert_called_once_with()
+        self.assertFalse(mock_get_num.called)
+        self.assertEqual([uuids.missing, uuids.stopped],
+                         [args[1].uuid for args, kwargs
+                          in mock_spawn.call_args_list])
+
+    def test_power_state_needs_sync(self):
+        for vm_state, db_state, vm_power_state, expected in (
+                (vm_states.ACTIVE, power_state.RUNNING,
+                 power_state.RUNNING, False),
+                (vm_states.ACTIVE, power_state.RUNNING,
+                 power_state.SHUTDOWN, True),
+                # The instance has to be stopped
+                (vm_states.ACTIVE, power_state.SHUTDOWN,
+                 power_state.SHUTDOWN, True),
+                (vm_states.STOPPED, power_state.SHUTDOWN,
+                 power_state.SHUTDOWN, False),
+                (vm_states.STOPPED, power_state.RUNNING,
+                 power_state.RUNNING, True),
+                (vm_states.PAUSED, power_state.PAUSED,
+                 power_state.PAUSED, False),
+                (vm_states.SOFT_DELETED, power_state.RUNNING,
+                 power_state.RUNNING, True),
+                (vm_states.ERROR, power_state.NOSTATE,
+                 power_state.NOSTATE, False)):
+            instance = objects.Instance(vm_state=vm_state,
+                                        power_state=db_state,
+                                        task_state=None)
+            self.assertEqual(expected, manager._power_state_needs_sync(
+                instance, vm_power_state), vm_state)
+
     def _get_sync_instance(self, power_state, vm_state, task_state=None,
                            shutdown_terminate=False):
         instance = objects.Instance()
@@ -47,6 +47,8 @@ class ComputeXenTestCase(stubs.XenAPITestBaseNoDB):
         ctxt = context.get_admin_context()
         instance_list = instance_obj._make_instance_list(ctxt,
                 objects.InstanceList(), [db_instance], None)
+        # Like _sync_power_states() does
+        instance_obj.compact_instances(instance_list)
         instance = instance_list[0]
 
         self.mox.StubOutWithMock(objects.InstanceList, 'get_by_host')
@@ -12,7 +12,9 @@
 
 import copy
 
+import fixtures
 import mock
+from oslo_concurrency import lockutils
 from oslo_utils import units
 
 from nova.compute import arch
@@ -932,6 +934,96 @@ class TestUpdateAvailableResources(BaseTestCase):
                                                  self.rt.compute_node))
 
 
+class TestIncrementalAudit(BaseTestCase):
+
+    def setUp(self):
+        super(TestIncrementalAudit, self).setUp()
+        self.flags(full_resource_audit_interval=3600,
+                   reserved_host_disk_mb=0, reserved_host_memory_mb=0)
+        self._setup_rt()
+        patchers = [
+            mock.patch('nova.objects.ComputeNode.get_by_host_and_nodename',
+                       return_value=_COMPUTE_NODE_FIXTURES[0]),
+            mock.patch('nova.objects.MigrationList.'
+                       'get_in_progress_by_host_and_node',
+                       return_value=[]),
+            mock.patch('nova.objects.InstanceList.get_by_host_and_node')]
+        for patcher in patchers:
+            self.inst_list_mock = patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _audit(self, instances):
+        """Return whether the hypervisor was queried for a full audit."""
+        self.inst_list_mock.return_value = instances
+        self.driver_mock.get_available_resource.reset_mock()
+        with mock.patch.object(self.rt, '_update'):
+            self.rt.update_available_resource(mock.sentinel.ctx)
+        return self.driver_mock.get_available_resource.called
+
+    def test_in_sync(self):
+        self.assertTrue(self._audit(_INSTANCE_FIXTURES))
+        self.assertFalse(self._audit(_INSTANCE_FIXTURES))
+        self.inst_list_mock.assert_called_with(mock.sentinel.ctx, 'fake-host',
+                                               'fake-node', expected_attrs=[])
+        self.assertEqual(128, self.rt.compute_node.memory_mb_used)
+
+    def test_full_audit_due(self):
+        with mock.patch('time.time', return_value=1000):
+            self.assertTrue(self._audit([]))
+        with mock.patch('time.time', return_value=4599):
+            self.assertFalse(self._audit([]))
+        with mock.patch('time.time', return_value=4600):
+            self.assertTrue(self._audit([]))
+
+    def test_full_audit_every_time(self):
+        self.flags(full_resource_audit_interval=0)
+        self.assertTrue(self._audit([]))
+        self.assertTrue(self._audit([]))
+        self.inst_list_mock.assert_called_with(
+            mock.sentinel.ctx, 'fake-host', 'fake-node',
+            expected_attrs=['system_metadata', 'numa_topology'])
+
+    def test_drift_new_instance(self):
+        self.assertTrue(self._audit([]))
+        self.assertTrue(self._audit(_INSTANCE_FIXTURES))
+        self.assertFalse(self._audit(_INSTANCE_FIXTURES))
+
+    def test_drift_instance_gone(self):
+        self._audit(_INSTANCE_FIXTURES)
+        self.assertTrue(self._audit([]))
+
+    def test_drift_instance_resized(self):
+        self._audit(_INSTANCE_FIXTURES)
+        instance = _INSTANCE_FIXTURES[0].obj_clone()
+        instance.memory_mb += 128
+        self.assertTrue(self._audit([instance]))
+
+    def test_drift_instance_state(self):
+        self._audit(_INSTANCE_FIXTURES)
+        instance = _INSTANCE_FIXTURES[0].obj_clone()
+        instance.task_state = task_states.REBOOTING
+        self.assertTrue(self._audit([instance]))
+
+    def test_instance_event_in_sync(self):
+        self._audit(_INSTANCE_FIXTURES)
+        instance = _INSTANCE_FIXTURES[0].obj_clone()
+        instance.vm_state = vm_states.DELETED
+        with mock.patch.object(self.rt, '_update'):
+            self.rt.update_usage(mock.MagicMock(), instance)
+        self.assertFalse(self._audit([]))
+        self.assertEqual(0, self.rt.compute_node.memory_mb_used)
+
+    def test_drift_migrations(self):
+        self._audit([])
+        migration = _MIGRATION_FIXTURES['source-only']
+        self.assertEqual('the migrations in progress changed',
+                         self.rt._find_drift([], [migration]))
+        self.rt.known_migration_uuids.add(migration.instance_uuid)
+        self.assertIsNone(self.rt._find_drift([], [migration]))
+        self.assertEqual('the migrations in progress changed',
+                         self.rt._find_drift([], []))
+
+
 class TestInitComputeNode(BaseTestCase):
 
     @mock.patch('nova.objects.ComputeNode.create')
@@ -1134,6 +1226,37 @@ class TestUpdateComputeNode(BaseTestCase):
         self.assertFalse(service_mock.called)
         urs_mock = self.sched_client_mock.update_resource_stats
         urs_mock.assert_called_once_with(self.rt.compute_node)
+        self.assertFalse(self.sched_client_mock.update_compute_node.called)
+
+    @mock.patch('nova.objects.Service.get_by_compute_host')
+    def test_existing_compute_node_sends_changes(self, service_mock):
+        self.flags(scheduler_tracks_compute_node_changes=True)
+        self._setup_rt()
+        ctx = mock.MagicMock()
+
+        compute = objects.ComputeNode(
+            host='fake-host',
+            hypervisor_hostname='fakenode',
+            free_ram_mb=512,
+            vcpus_used=0,
+        )
+        compute.obj_reset_changes()
+        compute.free_ram_mb = 384
+        compute.vcpus_used = 2
+        self.rt.compute_node = compute
+        self.rt._update(ctx)
+
+        ucn_mock = self.sched_client_mock.update_compute_node
+        ucn_mock.assert_called_once_with(ctx.elevated.return_value,
+                                         mock.ANY, 1,
+                                         epoch=self.rt.scheduler_epoch)
+        delta = ucn_mock.call_args[0][1]
+        self.assertEqual('fake-host', delta.host)
+        self.assertEqual('fakenode', delta.hypervisor_hostname)
+        self.assertEqual(384, delta.free_ram_mb)
+        self.assertEqual(2, delta.vcpus_used)
+        self.assertFalse(delta.obj_attr_is_set('vcpus'))
+        self.assertEqual(1, self.rt.scheduler_generation)
 
 
 class TestInstanceClaim(BaseTestCase):
@@ -1332,6 +1455,138 @@ class TestInstanceClaim(BaseTestCase):
             new_numa = objects.NUMATopology.obj_from_db_obj(new_numa)
             self.assertEqualNUMAHostTopology(expected_numa, new_numa)
 
+    @mock.patch('nova.objects.InstancePCIRequests.get_by_instance_uuid')
+    @mock.patch('nova.objects.MigrationList.get_in_progress_by_host_and_node')
+    def test_claim_pending_until_saved(self, migr_mock, pci_mock):
+        pci_mock.return_value = objects.InstancePCIRequests(requests=[])
+
+        def fake_save():
+            # Saved without holding the lock of the node, and counted by
+            # the audits meanwhile
+            with lockutils.lock(self.rt.semaphore_name):
+                self.assertEqual([self.instance],
+                                 self.rt._get_pending_claims([]))
+            self.assertEqual('fake-node', self.instance.node)
+
+        with mock.patch.object(self.rt, '_update'):
+            with mock.patch.object(self.instance, 'save',
+                                   side_effect=fake_save) as save_mock:
+                self.rt.instance_claim(self.ctx, self.instance, None)
+        save_mock.assert_called_once_with()
+        self.assertEqual({}, self.rt.pending_claims)
+
+    @mock.patch('nova.objects.InstancePCIRequests.get_by_instance_uuid')
+    @mock.patch('nova.objects.MigrationList.get_in_progress_by_host_and_node')
+    def test_claim_save_fails(self, migr_mock, pci_mock):
+        pci_mock.return_value = objects.InstancePCIRequests(requests=[])
+
+        with mock.patch.object(self.rt, '_update'):
+            with mock.patch.object(self.instance, 'save',
+                                   side_effect=test.TestingException):
+                self.assertRaises(test.TestingException,
+                                  self.rt.instance_claim, self.ctx,
+                                  self.instance, None)
+        self.assertEqual({}, self.rt.pending_claims)
+        self.assertEqual({}, self.rt.tracked_instances)
+        self.assertEqual(0, self.rt.compute_node.memory_mb_used)
+
+    @mock.patch('nova.objects.ComputeNode.get_by_host_and_nodename')
+    @mock.patch('nova.objects.InstanceList.get_by_host_and_node',
+                return_value=[])
+    @mock.patch('nova.objects.MigrationList.get_in_progress_by_host_and_node',
+                return_value=[])
+    def test_audit_counts_pending_claims(self, migr_mock, inst_list_mock,
+                                         get_cn_mock):
+        get_cn_mock.return_value = self.rt.compute_node
+        self.rt.pending_claims[self.instance.uuid] = self.instance
+        with mock.patch.object(self.rt, '_update'):
+            self.rt.update_available_resource(self.ctx)
+        self.assertEqual(self.instance.memory_mb,
+                         self.rt.compute_node.memory_mb_used)
+        self.assertIn(self.instance.uuid, self.rt.tracked_instances)
+
+    def test_lock_per_node(self):
+        other_rt = setup_rt('fake-host', 'other-node')[0]
+        self.assertNotEqual(self.rt.semaphore_name, other_rt.semaphore_name)
+
+
+class TestDeferredSave(BaseTestCase):
+
+    def setUp(self):
+        super(TestDeferredSave, self).setUp()
+        self.flags(compute_node_save_interval_ms=200,
+                   scheduler_tracks_compute_node_changes=True)
+        self._setup_rt()
+        self.rt.compute_node = copy.deepcopy(_COMPUTE_NODE_FIXTURES[0])
+        self.rt.compute_node.obj_reset_changes()
+        self.ctx = mock.MagicMock()
+        self.spawn_mock = self.useFixture(
+            fixtures.MockPatch('nova.utils.spawn_n')).mock
+        self.sleep_mock = self.useFixture(
+            fixtures.MockPatch('time.sleep')).mock
+
+    def test_save_coalesced(self):
+        for memory_mb_used in (128, 256):
+            self.rt.compute_node.memory_mb_used = memory_mb_used
+            self.rt._update(self.ctx)
+        self.spawn_mock.assert_called_once_with(self.rt._save_later,
+                                                self.ctx)
+        self.assertFalse(self.sched_client_mock.update_resource_stats.called)
+
+        self.rt._save_later(self.ctx)
+        self.sleep_mock.assert_called_once_with(0.2)
+        saved = self.sched_client_mock.update_resource_stats.call_args[0][0]
+        self.assertIsNot(self.rt.compute_node, saved)
+        self.assertEqual(256, saved.memory_mb_used)
+        self.assertIn('memory_mb_used', saved.obj_what_changed())
+        self.assertEqual(set(), self.rt.compute_node.obj_what_changed())
+        delta = self.sched_client_mock.update_compute_node.call_args[0][1]
+        self.assertEqual(256, delta.memory_mb_used)
+
+        # Nothing changed since
+        self.rt._update(self.ctx)
+        self.rt._save_later(self.ctx)
+        self.assertEqual(
+            1, self.sched_client_mock.update_resource_stats.call_count)
+        self.assertEqual(2, self.spawn_mock.call_count)
+
+    def test_save_fails(self):
+        self.rt.compute_node.memory_mb_used = 128
+        self.rt._update(self.ctx)
+        self.sched_client_mock.update_resource_stats.side_effect = (
+            test.TestingException)
+        self.rt._save_later(self.ctx)
+        self.assertIn('memory_mb_used',
+                      self.rt.compute_node.obj_what_changed())
+        # Saved again without waiting for the next change
+        self.assertEqual(2, self.spawn_mock.call_count)
+
+        self.sched_client_mock.update_resource_stats.side_effect = None
+        self.rt._save_later(self.ctx)
+        saved = self.sched_client_mock.update_resource_stats.call_args[0][0]
+        self.assertIn('memory_mb_used', saved.obj_what_changed())
+        self.assertEqual(2, self.spawn_mock.call_count)
+
+    def test_change_during_save(self):
+        def fake_update_resource_stats(compute_node):
+            # The save in progress isn't overlapped by another one
+            self.rt.compute_node.memory_mb_used = 256
+            self.rt._update(self.ctx)
+            self.assertEqual(1, self.spawn_mock.call_count)
+
+        self.rt.compute_node.memory_mb_used = 128
+        self.rt._update(self.ctx)
+        self.sched_client_mock.update_resource_stats.side_effect = (
+            fake_update_resource_stats)
+        self.rt._save_later(self.ctx)
+        self.assertEqual(2, self.spawn_mock.call_count)
+
+        self.sched_client_mock.update_resource_stats.side_effect = None
+        self.rt._save_later(self.ctx)
+        saved = self.sched_client_mock.update_resource_stats.call_args[0][0]
+        self.assertEqual(256, saved.memory_mb_used)
+        self.assertEqual(2, self.spawn_mock.call_count)
+
 
 @mock.patch('nova.objects.Instance.save')
 @mock.patch('nova.objects.MigrationList.get_in_progress_by_host_and_node')
@@ -26,9 +26,11 @@ import iso8601
 import mock
 import netaddr
 from oslo_config import cfg
+from oslo_context import context as common_context
 from oslo_db import api as oslo_db_api
 from oslo_db import exception as db_exc
 from oslo_db.sqlalchemy import enginefacade
+from oslo_db.sqlalchemy import orm as db_orm
 from oslo_db.sqlalchemy import test_base
 from oslo_db.sqlalchemy import update_match
 from oslo_db.sqlalchemy import utils as sqlalchemyutils
@@ -57,6 +59,7 @@ from nova import context
 from nova import db
 from nova.db.sqlalchemy import api as sqlalchemy_api
 from nova.db.sqlalchemy import models
+from nova.db.sqlalchemy import replicas
 from nova.db.sqlalchemy import types as col_types
 from nova.db.sqlalchemy import utils as db_utils
 from nova import exception
@@ -85,11 +88,12 @@ def _reservation_get(context, uuid):
     return result
 
 
-def _quota_reserve(context, project_id, user_id):
+def _quota_reserve(context, project_id, user_id, reserve=db.quota_reserve):
     """Create sample Quota, QuotaUsage and Reservation objects.
 
     There is no method db.quota_usage_create(), so we have to use
-    db.quota_reserve() for creating QuotaUsage objects.
+    db.quota_reserve(), or the given reserve function, for creating
+    QuotaUsage objects.
 
     Returns reservations uuids.
 
@@ -125,9 +129,9 @@ def _quota_reserve(context, project_id, user_id):
         setattr(sqlalchemy_api, sync_name, get_sync(resource, i))
         sqlalchemy_api.QUOTA_SYNC_FUNCTIONS[sync_name] = getattr(
             sqlalchemy_api, sync_name)
-    return db.quota_reserve(context, resources, quotas, user_quotas, deltas,
-                    timeutils.utcnow(), CONF.until_refresh,
-                    datetime.timedelta(days=1), project_id, user_id)
+    return reserve(context, resources, quotas, user_quotas, deltas,
+                   timeutils.utcnow(), CONF.until_refresh,
+                   datetime.timedelta(days=1), project_id, user_id)
 
 
 class DbTestCase(test.TestCase):
@@ -456,6 +460,77 @@ class UnsupportedDbRegexpTestCase(DbTestCase):
                     marker = insts[-1]['uuid']
                     self.assertEqual(correct[-1]['uuid'], marker)
 
+    def test_instance_get_all_by_filters_sort_keys_paginate_token(self,
+            mock_get_regexp):
+        '''Verifies sort order with pagination on tokens.'''
+        test1_active = self.create_instance_with_args(
+                            display_name='test1',
+                            vm_state=vm_states.ACTIVE)
+        test1_error = self.create_instance_with_args(
+                           display_name='test1',
+                           vm_state=vm_states.ERROR)
+        test2_active = self.create_instance_with_args(
+                            display_name='test2',
+                            vm_state=vm_states.ACTIVE)
+        test2_error = self.create_instance_with_args(
+                           display_name='test2',
+                           vm_state=vm_states.ERROR)
+        sort_keys = ['display_name', 'vm_state', 'created_at']
+        sort_dirs = ['asc', 'desc', 'asc']
+        correct_order = [test1_error, test1_active,
+                         test2_error, test2_active]
+
+        for limit in range(1, 4):
+            marker = None
+            for i in range(0, 5, limit):
+                correct = correct_order[i:i + limit]
+                insts = self._assert_equals_inst_order(
+                    correct, {}, sort_keys=sort_keys, sort_dirs=sort_dirs,
+                    limit=limit, marker=marker)
+                if correct:
+                    marker = db.instance_pagination_token(
+                        insts[-1], sort_keys, sort_dirs)
+                    self.assertNotEqual(insts[-1]['uuid'], marker)
+
+    def test_instance_get_all_by_filters_sort_token_other_keys(self,
+            mock_get_regexp):
+        '''A token for other sort keys falls back to its instance UUID.'''
+        test1 = self.create_instance_with_args(display_name='test1')
+        test2 = self.create_instance_with_args(display_name='test2')
+        test3 = self.create_instance_with_args(display_name='test3')
+        marker = db.instance_pagination_token(test2, ['display_name'],
+                                              ['asc'])
+        self._assert_equals_inst_order([test1], {},
+                                       sort_keys=['display_name'],
+                                       sort_dirs=['desc'], marker=marker)
+        self._assert_equals_inst_order([test3], {},
+                                       sort_keys=['display_name'],
+                                       sort_dirs=['asc'], marker=marker)
+
+    def test_instance_get_all_by_filters_sort_token_deleted_instance(self,
+            mock_get_regexp):
+        test1 = self.create_instance_with_args(display_name='test1')
+        test2 = self.create_instance_with_args(display_name='test2')
+        marker = db.instance_pagination_token(test2)
+        db.instance_destroy(self.context, test2['uuid'])
+        self._assert_equals_inst_order([test1], {}, marker=marker)
+
+    def test_instance_get_all_by_filters_sort_columns(self,
+            mock_get_regexp):
+        '''Verifies only the given columns are returned.'''
+        test1 = self.create_instance_with_args(display_name='test1')
+        result = db.instance_get_all_by_filters_sort(
+            self.context, {}, columns_to_join=['info_cache'],
+            columns=['uuid', 'display_name', 'foo'])
+        self.assertEqual(1, len(result))
+        self.assertEqual(set(['id', 'uuid', 'display_name', 'info_cache',
+                              'metadata', 'system_metadata']),
+                         set(result[0]))
+        self.assertEqual(test1['uuid'], result[0]['uuid'])
+        self.assertEqual('test1', result[0]['display_name'])
+        self.assertEqual(test1['uuid'],
+                         result[0]['info_cache']['instance_uuid'])
+
     def test_instance_get_deleted_by_filters_sort_keys_paginate(self,
             mock_get_regexp):
         '''Verifies sort order with pagination for deleted instances.'''
@@ -571,6 +646,88 @@ class ModelQueryTestCase(DbTestCase):
                                                  None, deleted=False)
 
 
+class ReplicaRoutingTestCase(DbTestCase):
+    def setUp(self):
+        super(ReplicaRoutingTestCase, self).setUp()
+        self.flags(replica_connections=['sqlite://'], group='database')
+        sqlalchemy_api._REPLICA_POOL = None
+        self.addCleanup(setattr, sqlalchemy_api, '_REPLICA_POOL', None)
+        patcher = mock.patch.object(replicas.ReplicaPool, '_start_refresh')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.replica = sqlalchemy_api._get_replica_pool().replicas[0]
+
+        @sqlalchemy_api.read_only
+        def _get_bind(context, use_slave=False):
+            return sqlalchemy_api.get_session(use_slave=use_slave).bind
+        self._get_bind = _get_bind
+
+    def test_not_routed(self):
+        self.assertIsNot(self.replica.engine, self._get_bind(self.context))
+        self.assertIsNot(self.replica.engine,
+                         sqlalchemy_api.get_session().bind)
+
+    def test_use_slave(self):
+        self.assertIs(self.replica.engine,
+                      self._get_bind(self.context, use_slave=True))
+        self.assertIs(self.replica.engine,
+                      sqlalchemy_api.get_engine(use_slave=True))
+
+    def test_routed(self):
+        self.flags(route_reads_to_replicas=True, group='database')
+        self.assertIs(self.replica.engine, self._get_bind(self.context))
+        # Not once the request wrote to the primary database
+        db.instance_create(self.context, {})
+        self.assertIsNot(self.replica.engine, self._get_bind(self.context))
+
+    def test_routed_after_write_not_current_context(self):
+        self.flags(route_reads_to_replicas=True, group='database')
+        admin_context = context.get_admin_context()
+        with mock.patch.object(common_context, 'get_current',
+                               return_value=None):
+            self.assertIs(self.replica.engine, self._get_bind(admin_context))
+            db.instance_create(admin_context, {})
+            self.assertIsNot(self.replica.engine,
+                             self._get_bind(admin_context))
+
+    def test_routed_in_transaction(self):
+        self.flags(route_reads_to_replicas=True, group='database')
+
+        @sqlalchemy_api.main_context_manager.reader
+        def _get_bind_in_transaction(context):
+            return self._get_bind(context)
+
+        self.assertIsNot(self.replica.engine,
+                         _get_bind_in_transaction(self.context))
+
+    def test_routed_replica_unavailable(self):
+        self.flags(route_reads_to_replicas=True, group='database')
+        binds = []
+
+        @sqlalchemy_api.read_only
+        def _read(context):
+            binds.append(sqlalchemy_api.get_session().bind)
+            if len(binds) == 1:
+                raise db_exc.DBConnectionError()
+
+        _read(self.context)
+        self.assertEqual(2, len(binds))
+        self.assertIs(self.replica.engine, binds[0])
+        self.assertIsNot(self.replica.engine, binds[1])
+        self.assertFalse(self.replica.is_available(0))
+
+    def test_routed_instance_get_by_uuid(self):
+        self.flags(route_reads_to_replicas=True, group='database')
+        # The replica is an empty database, read from the primary one
+        facade = sqlalchemy_api.main_context_manager.get_legacy_facade()
+        with mock.patch.object(self.replica, 'get_session',
+                               side_effect=facade.get_session) as m:
+            self.assertRaises(exception.InstanceNotFound,
+                              db.instance_get_by_uuid, self.context,
+                              'a54a8b2c-7ea5-4a74-ab3e-8b2e5d41a0cf')
+        self.assertTrue(m.called)
+
+
 class EngineFacadeTestCase(DbTestCase):
     @mock.patch.object(sqlalchemy_api, 'get_session')
     def test_use_single_context_session_writer(self, mock_get_session):
@@ -1129,17 +1286,18 @@ class SqlAlchemyDbApiNoDbTestCase(test.NoDBTestCase):
         mock_create_facade.assert_called_once_with()
         mock_facade.get_session.assert_called_once_with()
 
-    @mock.patch.object(sqlalchemy_api, '_instance_get_by_uuid')
+    @mock.patch.object(sqlalchemy_api, 'model_query')
+    @mock.patch.object(sqlalchemy_api, '_keyset_filter')
     @mock.patch.object(sqlalchemy_api, '_instances_fill_metadata')
     @mock.patch('oslo_db.sqlalchemy.utils.paginate_query')
     def test_instance_get_all_by_filters_paginated_allows_deleted_marker(
-            self, mock_paginate, mock_fill, mock_get):
+            self, mock_paginate, mock_fill, mock_keyset, mock_query):
         ctxt = mock.MagicMock()
-        ctxt.elevated.return_value = mock.sentinel.elevated
         sqlalchemy_api.instance_get_all_by_filters_sort(ctxt, {}, marker='foo')
-        mock_get.assert_called_once_with(mock.sentinel.elevated,
-                                         'foo', session=mock.ANY)
-        ctxt.elevated.assert_called_once_with(read_deleted='yes')
+        mock_query.assert_called_once_with(ctxt, models.Instance,
+                                           args=mock.ANY, session=mock.ANY,
+                                           read_deleted='yes')
+        mock_query.return_value.filter_by.assert_called_once_with(uuid='foo')
 
 
 class SqlAlchemyDbApiTestCase(DbTestCase):
@@ -1237,10 +1395,11 @@ class SqlAlchemyDbApiTestCase(DbTestCase):
         ctxt = context.get_admin_context()
         sqlalchemy_api.instance_get_all_by_filters(ctxt, {'foo': 'bar'},
             'sort_key', 'sort_dir', limit=100, marker='uuid',
-            columns_to_join='columns', use_slave=True)
+            columns_to_join='columns', use_slave=True, columns=['uuid'])
         mock_get_all_filters_sort.assert_called_once_with(ctxt, {'foo': 'bar'},
             limit=100, marker='uuid', columns_to_join='columns',
-            use_slave=True, sort_keys=['sort_key'], sort_dirs=['sort_dir'])
+            use_slave=True, sort_keys=['sort_key'], sort_dirs=['sort_dir'],
+            columns=['uuid'])
 
     def test_instance_get_all_by_filters_sort_key_invalid(self):
         '''InvalidSortKey raised if an invalid key is given.'''
@@ -1669,6 +1828,140 @@ class ReservationTestCase(test.TestCase, ModelsObjectComparatorMixin):
                                             self.ctxt, 'project1', 'user1'))
 
 
+class OptimisticReservationTestCase(test.TestCase):
+
+    """Tests for the db.api.*_optimistic quota methods."""
+
+    def setUp(self):
+        super(OptimisticReservationTestCase, self).setUp()
+        self.ctxt = context.get_admin_context()
+        self.reservations = _quota_reserve(
+            self.ctxt, 'project1', 'user1',
+            reserve=db.quota_reserve_optimistic)
+
+    def _get_usages(self):
+        return db.quota_usage_get_all_by_project_and_user(
+            self.ctxt, 'project1', 'user1')
+
+    def _reserve(self, deltas):
+        resources = {res: quota.ReservableResource(res, '_sync_%s' % res)
+                     for res in deltas}
+        project_quotas = db.quota_get_all_by_project(self.ctxt, 'project1')
+        user_quotas = db.quota_get_all_by_project_and_user(
+            self.ctxt, 'project1', 'user1')
+        return db.quota_reserve_optimistic(
+            self.ctxt, resources, project_quotas, user_quotas, deltas,
+            timeutils.utcnow() + datetime.timedelta(days=1), None, None,
+            'project1', 'user1')
+
+    def test_quota_reserve(self):
+        expected = {'project_id': 'project1', 'user_id': 'user1',
+                    'resource0': {'reserved': 0, 'in_use': 0},
+                    'resource1': {'reserved': 1, 'in_use': 1},
+                    'fixed_ips': {'reserved': 2, 'in_use': 2}}
+        self.assertEqual(expected, self._get_usages())
+        self.assertEqual(
+            3, len([_reservation_get(self.ctxt, reservation)
+                    for reservation in self.reservations]))
+
+    def test_quota_reserve_existing_usages(self):
+        self._reserve({'resource0': 1})
+        usages = self._get_usages()
+        self.assertEqual({'reserved': 1, 'in_use': 0}, usages['resource0'])
+        self.assertEqual({'reserved': 1, 'in_use': 1}, usages['resource1'])
+
+    def test_quota_reserve_over_quota(self):
+        self.assertRaises(exception.OverQuota, self._reserve,
+                          {'resource1': 1})
+        self.assertEqual({'reserved': 1, 'in_use': 1},
+                         self._get_usages()['resource1'])
+
+    def test_quota_reserve_conflict_retry(self):
+        # Ensure that we retry if a usage changed between being read and
+        # being written
+        orig_update = query.Query.update
+        calls = []
+
+        def _update(self, *args, **kwargs):
+            calls.append(args)
+            if len(calls) == 1:
+                return 0
+            return orig_update(self, *args, **kwargs)
+
+        with mock.patch.object(query.Query, 'update', autospec=True,
+                               side_effect=_update):
+            self._reserve({'resource0': 1})
+        self.assertEqual(2, len(calls))
+        self.assertEqual({'reserved': 1, 'in_use': 0},
+                         self._get_usages()['resource0'])
+
+    def test_quota_reserve_project_recheck(self):
+        # Another user of the project took the project over its limit
+        # between the check and the commit.
+        with mock.patch.object(sqlalchemy_api, '_quota_usage_totals',
+                               return_value={'resource0': 2}):
+            self.assertRaises(exception.OverQuota, self._reserve,
+                              {'resource0': 1})
+        self.assertEqual({'reserved': 0, 'in_use': 0},
+                         self._get_usages()['resource0'])
+
+    def test_reservation_commit(self):
+        db.reservation_commit_optimistic(self.ctxt, self.reservations,
+                                         'project1', 'user1')
+        self.assertRaises(exception.ReservationNotFound,
+            _reservation_get, self.ctxt, self.reservations[0])
+        expected = {'project_id': 'project1', 'user_id': 'user1',
+                    'resource0': {'reserved': 0, 'in_use': 0},
+                    'resource1': {'reserved': 0, 'in_use': 2},
+                    'fixed_ips': {'reserved': 0, 'in_use': 4}}
+        self.assertEqual(expected, self._get_usages())
+
+        # Committing again changes nothing
+        db.reservation_commit_optimistic(self.ctxt, self.reservations,
+                                         'project1', 'user1')
+        self.assertEqual(expected, self._get_usages())
+
+    def test_reservation_rollback(self):
+        db.reservation_rollback_optimistic(self.ctxt, self.reservations,
+                                           'project1', 'user1')
+        self.assertRaises(exception.ReservationNotFound,
+            _reservation_get, self.ctxt, self.reservations[0])
+        expected = {'project_id': 'project1', 'user_id': 'user1',
+                    'resource0': {'reserved': 0, 'in_use': 0},
+                    'resource1': {'reserved': 0, 'in_use': 1},
+                    'fixed_ips': {'reserved': 0, 'in_use': 2}}
+        self.assertEqual(expected, self._get_usages())
+
+    def test_reservation_rollback_conflict_retry(self):
+        # Ensure that we start again if some of the reservations were
+        # released concurrently
+        orig_soft_delete = db_orm.Query.soft_delete
+        calls = []
+
+        def _soft_delete(self, *args, **kwargs):
+            calls.append(args)
+            if len(calls) == 1:
+                return 1
+            return orig_soft_delete(self, *args, **kwargs)
+
+        with mock.patch.object(db_orm.Query, 'soft_delete', autospec=True,
+                               side_effect=_soft_delete):
+            db.reservation_rollback_optimistic(self.ctxt, self.reservations,
+                                               'project1', 'user1')
+        self.assertEqual(2, len(calls))
+        self.assertEqual({'reserved': 0, 'in_use': 1},
+                         self._get_usages()['resource1'])
+
+    def test_reservation_expire(self):
+        db.reservation_expire_optimistic(self.ctxt)
+
+        expected = {'project_id': 'project1', 'user_id': 'user1',
+                    'resource0': {'reserved': 0, 'in_use': 0},
+                    'resource1': {'reserved': 0, 'in_use': 1},
+                    'fixed_ips': {'reserved': 0, 'in_use': 2}}
+        self.assertEqual(expected, self._get_usages())
+
+
 class SecurityGroupRuleTestCase(test.TestCase, ModelsObjectComparatorMixin):
     def setUp(self):
         super(SecurityGroupRuleTestCase, self).setUp()
@@ -2276,6 +2569,33 @@ class InstanceTestCase(test.TestCase, ModelsObjectComparatorMixin):
         self.mox.ReplayAll()
         sqlalchemy_api._instance_system_metadata_get_multi(self.ctxt, [])
 
+    def test_instance_metadata_get_multi_dicts(self):
+        uuids = [self.create_instance_with_args()['uuid'] for i in range(2)]
+        db.instance_metadata_delete(self.ctxt, uuids[0], 'mkey1')
+        meta = sqlalchemy_api._instance_metadata_get_multi_dicts(
+            self.ctxt, uuids + ['fake-uuid'])
+        self.assertEqual({uuids[0]: {'mkey2': 'mval2'},
+                          uuids[1]: self.sample_data['metadata']}, meta)
+        self.assertEqual({}, meta['fake-uuid'])
+
+    def test_instance_system_metadata_get_multi_dicts(self):
+        uuids = [self.create_instance_with_args()['uuid'] for i in range(2)]
+        db.instance_system_metadata_update(self.ctxt, uuids[0],
+                                           {'smkey1': 'smval1'}, True)
+        sys_meta = sqlalchemy_api._instance_system_metadata_get_multi_dicts(
+            self.ctxt, uuids)
+        # The deleted items are kept, as utils.instance_sys_meta() does
+        self.assertEqual({uuids[0]: self.sample_data['system_metadata'],
+                          uuids[1]: self.sample_data['system_metadata']},
+                         sys_meta)
+
+    def test_instance_metadata_get_multi_dicts_no_uuids(self):
+        with mock.patch.object(sqlalchemy_api, 'get_session') as get_session:
+            self.assertEqual(
+                {}, sqlalchemy_api._instance_metadata_get_multi_dicts(
+                    self.ctxt, []))
+        self.assertFalse(get_session.called)
+
     def test_instance_get_all_by_filters_regex(self):
         i1 = self.create_instance_with_args(display_name='test1')
         i2 = self.create_instance_with_args(display_name='teeeest2')
@@ -2585,7 +2905,7 @@ class InstanceTestCase(test.TestCase, ModelsObjectComparatorMixin):
         instance = self.create_instance_with_args()
         result = db.instance_get_all_by_host_and_node(self.ctxt, 'h1', 'n1')
         self.assertEqual(result[0]['uuid'], instance['uuid'])
-        self.assertEqual(result[0]['system_metadata'], [])
+        self.assertEqual({}, result[0]['system_metadata'])
 
     def test_instance_get_all_by_host_and_node(self):
         instance = self.create_instance_with_args(
@@ -2594,7 +2914,7 @@ class InstanceTestCase(test.TestCase, ModelsObjectComparatorMixin):
             self.ctxt, 'h1', 'n1',
             columns_to_join=['system_metadata', 'extra'])
         self.assertEqual(instance['uuid'], result[0]['uuid'])
-        self.assertEqual('bar', result[0]['system_metadata'][0]['value'])
+        self.assertEqual({'foo': 'bar'}, result[0]['system_metadata'])
         self.assertEqual(instance['uuid'], result[0]['extra']['instance_uuid'])
 
     @mock.patch('nova.db.sqlalchemy.api._instances_fill_metadata')
@@ -2989,6 +3309,106 @@ class InstanceTestCase(test.TestCase, ModelsObjectComparatorMixin):
         else:
             self.fail('UnexpectedDeletingTaskStateError was not raised')
 
+    def test_instance_update_many_and_get_original(self):
+        instances = [self.create_instance_with_args(vm_state='building')
+                     for i in range(3)]
+        updates = {instance['uuid']: {'vm_state': 'error'}
+                   for instance in instances[:2]}
+        updates[instances[2]['uuid']] = {'vm_state': 'active',
+                                         'host': 'h2'}
+
+        orig_update = query.Query.update
+        with mock.patch.object(query.Query, 'update', autospec=True,
+                               side_effect=orig_update) as update:
+            results, errors = db.instance_update_many_and_get_original(
+                self.ctxt, updates)
+        # The first two instances are updated together
+        self.assertEqual(2, update.call_count)
+
+        self.assertEqual({}, errors)
+        self.assertEqual(set(updates), set(results))
+        for instance in instances:
+            old_ref, new_ref = results[instance['uuid']]
+            self.assertEqual('building', old_ref['vm_state'])
+            self.assertEqual('h1', old_ref['host'])
+            self.assertEqual(updates[instance['uuid']]['vm_state'],
+                             new_ref['vm_state'])
+        self.assertEqual('h1', results[instances[0]['uuid']][1]['host'])
+        self.assertEqual('h2', results[instances[2]['uuid']][1]['host'])
+        self.assertEqual(
+            'active', db.instance_get_by_uuid(
+                self.ctxt, instances[2]['uuid'])['vm_state'])
+
+    def test_instance_update_many_and_get_original_metadata(self):
+        instances = [self.create_instance_with_args() for i in range(2)]
+        results, errors = db.instance_update_many_and_get_original(
+            self.ctxt, {instances[0]['uuid']: {'metadata': {'mk1': 'mv3'}},
+                        instances[1]['uuid']: {'vm_state': 'error'}})
+        self.assertEqual({}, errors)
+        meta = utils.metadata_to_dict(
+            results[instances[0]['uuid']][1]['metadata'])
+        self.assertEqual({'mk1': 'mv3'}, meta)
+        meta = utils.metadata_to_dict(
+            results[instances[1]['uuid']][1]['metadata'])
+        self.assertEqual(self.sample_data['metadata'], meta)
+
+    def test_instance_update_many_and_get_original_conflicts(self):
+        instances = [self.create_instance_with_args(vm_state='building')
+                     for i in range(3)]
+        deleting = self.create_instance_with_args(
+            task_state=task_states.DELETING)
+        missing = 'b73d3d6c-a1c2-4a34-8e8c-8f3b93b1ff36'
+        updates = {instance['uuid']: {'vm_state': 'error',
+                                      'expected_vm_state': 'building',
+                                      'expected_task_state': None}
+                   for instance in instances + [deleting]}
+        updates[missing] = {'vm_state': 'error'}
+        db.instance_update(self.ctxt, instances[1]['uuid'],
+                           {'vm_state': 'active'})
+
+        results, errors = db.instance_update_many_and_get_original(
+            self.ctxt, updates)
+        self.assertEqual(set([instances[0]['uuid'], instances[2]['uuid']]),
+                         set(results))
+        self.assertEqual(set([instances[1]['uuid'], deleting['uuid'],
+                              missing]), set(errors))
+        self.assertIsInstance(errors[instances[1]['uuid']],
+                              exception.InstanceUpdateConflict)
+        self.assertEqual({'vm_state': 'active'},
+                         errors[instances[1]['uuid']].kwargs['actual'])
+        self.assertIsInstance(errors[deleting['uuid']],
+                              exception.UnexpectedDeletingTaskStateError)
+        self.assertIsInstance(errors[missing], exception.InstanceNotFound)
+        self.assertEqual(
+            'active', db.instance_get_by_uuid(
+                self.ctxt, instances[1]['uuid'])['vm_state'])
+        self.assertIsNone(db.instance_get_by_uuid(
+            self.ctxt, deleting['uuid'])['vm_state'])
+
+    def test_instance_update_many_and_get_original_conflict_race(self):
+        # Ensure that we retry if the update doesn't match all the instances
+        # for no discernable reason
+        instances = [self.create_instance_with_args() for i in range(2)]
+        updates = {instance['uuid']: {'vm_state': 'error',
+                                      'expected_task_state': None}
+                   for instance in instances}
+
+        orig_update = query.Query.update
+        calls = []
+
+        def _update(self, *args, **kwargs):
+            calls.append(args)
+            if len(calls) == 1:
+                return 1
+            return orig_update(self, *args, **kwargs)
+
+        with mock.patch.object(query.Query, 'update', autospec=True,
+                               side_effect=_update):
+            results, errors = db.instance_update_many_and_get_original(
+                self.ctxt, updates)
+        self.assertEqual(2, len(calls))
+        self.assertEqual(set(updates), set(results))
+
     def test_instance_update_unique_name(self):
         context1 = context.RequestContext('user1', 'p1')
         context2 = context.RequestContext('user2', 'p2')
@@ -6981,6 +7401,108 @@ class QuotaTestCase(test.TestCase, ModelsObjectComparatorMixin):
         self.assertRaises(exception.QuotaExists, db.quota_create, self.ctxt,
                           'project1', 'resource1', 42)
 
+    def _create_limits(self):
+        db.quota_class_create(self.ctxt, 'default', 'resource0', 10)
+        db.quota_class_create(self.ctxt, 'class1', 'resource1', 20)
+        db.quota_class_create(self.ctxt, 'class2', 'resource1', 21)
+        db.quota_create(self.ctxt, 'project1', 'resource2', 30)
+        db.quota_create(self.ctxt, 'project2', 'resource2', 31)
+        db.quota_create(self.ctxt, 'project1', 'resource3', 40,
+                        user_id='user1')
+        db.quota_create(self.ctxt, 'project1', 'resource3', 41,
+                        user_id='user2')
+
+    def test_quota_get_all_limits(self):
+        self._create_limits()
+        expected = {
+            'default': {'class_name': 'default', 'resource0': 10},
+            'class': {'class_name': 'class1', 'resource1': 20},
+            'project': {'project_id': 'project1', 'resource2': 30},
+            'user': {'project_id': 'project1', 'user_id': 'user1',
+                     'resource3': 40}}
+        self.assertEqual(expected, db.quota_get_all_limits(
+            self.ctxt, 'project1', 'user1', 'class1'))
+
+        expected['class'] = {'class_name': None}
+        expected['user'] = {'project_id': 'project1', 'user_id': None}
+        self.assertEqual(expected, db.quota_get_all_limits(self.ctxt,
+                                                           'project1'))
+
+    @mock.patch.object(sqlalchemy_api, '_quota_get_all_limits',
+                       wraps=sqlalchemy_api._quota_get_all_limits)
+    def test_quota_get_all_limits_not_cached(self, mock_get):
+        self._create_limits()
+        db.quota_get_all_limits(self.ctxt, 'project1', 'user1')
+        db.quota_get_all_limits(self.ctxt, 'project1', 'user1')
+        self.assertEqual(2, mock_get.call_count)
+
+    @mock.patch.object(sqlalchemy_api, '_quota_get_all_limits',
+                       wraps=sqlalchemy_api._quota_get_all_limits)
+    def test_quota_get_all_limits_cached(self, mock_get):
+        self.flags(quota_limits_cache_ttl=60)
+        self.addCleanup(sqlalchemy_api._QUOTA_LIMITS_CACHE.invalidate)
+        time_fixture = self.useFixture(utils_fixture.TimeFixture())
+        self._create_limits()
+
+        limits = db.quota_get_all_limits(self.ctxt, 'project1', 'user1')
+        limits['project']['resource2'] = 0
+        limits = db.quota_get_all_limits(self.ctxt, 'project1', 'user1')
+        self.assertEqual(30, limits['project']['resource2'])
+        self.assertEqual(1, mock_get.call_count)
+
+        db.quota_get_all_limits(self.ctxt, 'project1', 'user2')
+        self.assertEqual(2, mock_get.call_count)
+
+        time_fixture.advance_time_seconds(61)
+        db.quota_get_all_limits(self.ctxt, 'project1', 'user1')
+        self.assertEqual(3, mock_get.call_count)
+
+    def test_quota_get_all_limits_invalidated(self):
+        self.flags(quota_limits_cache_ttl=60)
+        self.addCleanup(sqlalchemy_api._QUOTA_LIMITS_CACHE.invalidate)
+        self._create_limits()
+
+        def _get_limits():
+            return db.quota_get_all_limits(self.ctxt, 'project1', 'user1',
+                                           'class1')
+
+        _get_limits()
+        db.quota_update(self.ctxt, 'project1', 'resource2', 32)
+        self.assertEqual(32, _get_limits()['project']['resource2'])
+        db.quota_update(self.ctxt, 'project1', 'resource3', 42,
+                        user_id='user1')
+        self.assertEqual(42, _get_limits()['user']['resource3'])
+        db.quota_create(self.ctxt, 'project1', 'resource4', 50)
+        self.assertEqual(50, _get_limits()['project']['resource4'])
+        db.quota_class_update(self.ctxt, 'class1', 'resource1', 22)
+        self.assertEqual(22, _get_limits()['class']['resource1'])
+        db.quota_class_create(self.ctxt, 'default', 'resource5', 60)
+        self.assertEqual(60, _get_limits()['default']['resource5'])
+        db.quota_destroy_all_by_project_and_user(self.ctxt, 'project1',
+                                                 'user1')
+        self.assertNotIn('resource3', _get_limits()['user'])
+        db.quota_destroy_all_by_project(self.ctxt, 'project1')
+        self.assertEqual({'project_id': 'project1'},
+                         _get_limits()['project'])
+
+        # Changes to the other projects don't drop the cached limits
+        with mock.patch.object(sqlalchemy_api, '_quota_get_all_limits',
+                               wraps=sqlalchemy_api._quota_get_all_limits) \
+                as mock_get:
+            db.quota_update(self.ctxt, 'project2', 'resource2', 33)
+            _get_limits()
+        self.assertFalse(mock_get.called)
+
+    def test_quota_limits_cache_set_after_invalidation(self):
+        # Limits read before a change aren't cached after it
+        cache = sqlalchemy_api._QuotaLimitsCache()
+        generation = cache.generation
+        cache.invalidate('project1')
+        cache.set(('project1', None, None), {}, generation)
+        self.assertIsNone(cache.get(('project1', None, None), 60))
+        cache.set(('project1', None, None), {}, cache.generation)
+        self.assertEqual({}, cache.get(('project1', None, None), 60))
+
 
 class QuotaReserveNoDbTestCase(test.NoDBTestCase):
     """Tests quota reserve/refresh operations using mock."""
@@ -8465,6 +8987,98 @@ class ArchiveTestCase(test.TestCase, ModelsObjectComparatorMixin):
             'shadow_consoles'
         )
 
+    def test_archive_deleted_rows_marks(self):
+        ids = []
+        for uuidstr in self.uuidstrs:
+            ins_stmt = self.instance_id_mappings.insert().values(uuid=uuidstr)
+            ids.append(self.conn.execute(ins_stmt).inserted_primary_key[0])
+        update_statement = self.instance_id_mappings.update().\
+                where(self.instance_id_mappings.c.uuid.in_(
+                    self.uuidstrs[1:3])).values(deleted=1)
+        self.conn.execute(update_statement)
+        qsiim = sql.select([self.shadow_instance_id_mappings]).\
+                where(self.shadow_instance_id_mappings.c.uuid.in_(
+                                                            self.uuidstrs))
+        marks = {}
+        results = db.archive_deleted_rows(max_rows=2, marks=marks)
+        self.assertEqual(dict(instance_id_mappings=2), results)
+        self.assertEqual({'instance_id_mappings': ids[2]}, marks)
+        # Delete a row behind the mark
+        update_statement = self.instance_id_mappings.update().\
+                where(self.instance_id_mappings.c.uuid == self.uuidstrs[0])\
+                .values(deleted=1)
+        self.conn.execute(update_statement)
+        # Nothing is left past the mark, which is dropped
+        results = db.archive_deleted_rows(max_rows=2, marks=marks)
+        self.assertEqual({}, results)
+        self.assertEqual({}, marks)
+        # The next pass starts over and catches the row behind the mark
+        results = db.archive_deleted_rows(max_rows=2, marks=marks)
+        self.assertEqual(dict(instance_id_mappings=1), results)
+        self.assertEqual({}, marks)
+        rows = self.conn.execute(qsiim).fetchall()
+        self.assertEqual(3, len(rows))
+        self._assert_shadow_tables_empty_except(
+            'shadow_instance_id_mappings')
+
+    def test_archive_deleted_rows_no_id_column_marks(self):
+        uuidstr0 = self.uuidstrs[0]
+        ins_stmt = self.dns_domains.insert().values(domain=uuidstr0,
+                                                    deleted=True)
+        self.conn.execute(ins_stmt)
+        marks = {}
+        results = db.archive_deleted_rows(max_rows=1, marks=marks)
+        self.assertEqual(dict(dns_domains=1), results)
+        self.assertEqual({'dns_domains': uuidstr0}, marks)
+        qsdd = sql.select([self.shadow_dns_domains],
+                          self.shadow_dns_domains.c.domain == uuidstr0)
+        rows = self.conn.execute(qsdd).fetchall()
+        self.assertEqual(1, len(rows))
+
+    def test_archive_table_levels(self):
+        levels = sqlalchemy_api._archive_table_levels()
+
+        def _level(tablename):
+            for i, tablenames in enumerate(levels):
+                if tablename in tablenames:
+                    return i
+
+        # Tables referencing others come first
+        self.assertLess(_level('consoles'), _level('console_pools'))
+        self.assertLess(_level('security_group_instance_association'),
+                        _level('instances'))
+        self.assertLess(_level('security_group_instance_association'),
+                        _level('security_groups'))
+        self.assertLess(_level('instance_actions_events'),
+                        _level('instance_actions'))
+        self.assertLess(_level('instance_actions'), _level('instances'))
+        # Tables of a level don't reference each other
+        for tablenames in levels:
+            for tablename in tablenames:
+                table = models.BASE.metadata.tables[tablename]
+                for fk in table.foreign_keys:
+                    if fk.column.table is not table:
+                        self.assertNotIn(fk.column.table.name, tablenames)
+
+    @mock.patch.object(sqlalchemy_api, '_archive_table_levels',
+                       return_value=[['a', 'b', 'c'], ['d']])
+    @mock.patch.object(sqlalchemy_api, '_archive_deleted_rows_for_table')
+    def test_archive_deleted_rows_workers(self, mock_archive, mock_levels):
+        archived = dict(a=5, b=1, c=4)
+        mock_archive.side_effect = (
+            lambda tablename, max_rows, marks: min(archived[tablename],
+                                                   max_rows))
+        marks = {}
+        results = db.archive_deleted_rows(max_rows=10, marks=marks,
+                                          workers=2)
+        self.assertEqual(archived, results)
+        # The rows left over by b are used by c, and nothing is left for d
+        mock_archive.assert_has_calls([
+            mock.call('a', max_rows=5, marks=marks),
+            mock.call('b', max_rows=5, marks=marks),
+            mock.call('c', max_rows=4, marks=marks)])
+        self.assertEqual(3, mock_archive.call_count)
+
     def test_archive_deleted_rows_2_tables(self):
         # Add 6 rows to each table
         for uuidstr in self.uuidstrs:
@@ -819,6 +819,17 @@ class NovaMigrationsCheckers(test_migrations.ModelsMigrationsSync,
                         'ix_pci_devices_compute_node_id_parent_addr_deleted',
                         ['compute_node_id', 'parent_addr', 'deleted'])
 
+    def _check_314(self, engine, data):
+        self.assertIndexMembers(engine, 'instances',
+                                'instances_created_at_id_idx',
+                                ['created_at', 'id'])
+        self.assertIndexMembers(engine, 'instances',
+                                'instances_display_name_id_idx',
+                                ['display_name', 'id'])
+        self.assertIndexMembers(engine, 'instances',
+                                'instances_project_id_created_at_idx',
+                                ['project_id', 'created_at'])
+
 
 class TestNovaMigrationsSQLite(NovaMigrationsCheckers,
                                test_base.DbTestCase,
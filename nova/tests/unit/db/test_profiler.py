@@ -0,0 +1,189 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Tests for the profiling of the DB API calls."""
+
+import os
+
+import fixtures
+import mock
+from oslo_serialization import jsonutils
+import sqlalchemy
+
+from nova import context
+from nova.db import profiler
+from nova import test
+
+
+class FakeBackend(object):
+
+    def __init__(self):
+        self.engine = sqlalchemy.create_engine('sqlite://')
+        self.engine.execute('CREATE TABLE t (id INTEGER)')
+
+    def instance_get_all(self, context, rows=3):
+        self.engine.execute('SELECT * FROM t')
+        self.engine.execute('SELECT * FROM t')
+        return list(range(rows))
+
+    def instance_get(self, context):
+        self.engine.execute('SELECT * FROM t')
+        return self.instance_get_all(context, rows=1)[0]
+
+
+class ProfiledDbapiTestCase(test.NoDBTestCase):
+
+    def setUp(self):
+        super(ProfiledDbapiTestCase, self).setUp()
+        self.flags(profiling=True, profiling_report_interval=0,
+                   group='database')
+        profiler.reset_stats()
+        self.addCleanup(profiler.reset_stats)
+        self.backend = FakeBackend()
+        self.api = profiler.ProfiledDbapi(self.backend)
+        self.context = context.RequestContext('fake_user', 'fake_project',
+                                              request_id='req-1')
+
+    def test_disabled(self):
+        self.flags(profiling=False, group='database')
+        self.assertEqual(self.backend.instance_get, self.api.instance_get)
+        self.api.instance_get_all(self.context)
+        self.assertEqual({}, profiler.get_stats()['functions'])
+
+    def test_call(self):
+        self.assertEqual([0, 1, 2], self.api.instance_get_all(self.context))
+        self.assertEqual([], self.api.instance_get_all(self.context, rows=0))
+        function = profiler.get_stats()['functions']['instance_get_all']
+        self.assertEqual(2, function['count'])
+        self.assertEqual(4, function['statements'])
+        self.assertEqual(3, function['rows'])
+        self.assertEqual(2, function['max_calls_per_request'])
+        self.assertEqual({None: 2}, function['operations'])
+        self.assertEqual(len(profiler.BUCKETS_MS) + 1,
+                         len(function['buckets']))
+
+    def test_nested_call(self):
+        self.api.instance_get(self.context)
+        functions = profiler.get_stats()['functions']
+        # The statements of the backend functions it calls directly count
+        # for the function called through the DB API.
+        self.assertEqual(3, functions['instance_get']['statements'])
+        self.assertNotIn('instance_get_all', functions)
+
+    def test_error(self):
+        self.assertRaises(TypeError, self.api.instance_get_all)
+        function = profiler.get_stats()['functions']['instance_get_all']
+        self.assertEqual(1, function['count'])
+        self.assertEqual(0, function['rows'])
+
+    def test_max_calls_per_request(self):
+        other = context.RequestContext('fake_user', 'fake_project',
+                                       request_id='req-2')
+        for ctxt in (self.context, other, other, other, self.context):
+            self.api.instance_get_all(ctxt)
+        function = profiler.get_stats()['functions']['instance_get_all']
+        self.assertEqual(3, function['max_calls_per_request'])
+
+    def test_statement_outside_call(self):
+        self.api.instance_get(self.context)
+        self.backend.engine.execute('SELECT * FROM t')
+        functions = profiler.get_stats()['functions']
+        self.assertEqual(1, functions[profiler.NO_FUNCTION]['statements'])
+
+    def test_slow_statement(self):
+        self.flags(profiling_slow_statement_ms=0, group='database')
+        with profiler.Operation('GET ServersController.show'):
+            self.api.instance_get(self.context)
+        self.assertIsNone(profiler.get_operation())
+        slow = profiler.get_stats()['slow_statements']
+        self.assertEqual(3, len(slow))
+        self.assertEqual('SELECT * FROM t', slow[0]['statement'])
+        self.assertEqual('instance_get', slow[0]['function'])
+        self.assertEqual('GET ServersController.show', slow[0]['operation'])
+        self.assertEqual('req-1', slow[0]['request_id'])
+
+    def test_not_slow_statement(self):
+        self.api.instance_get(self.context)
+        self.assertEqual([], profiler.get_stats()['slow_statements'])
+
+    @mock.patch.object(profiler, 'report')
+    def test_report_interval(self, mock_report):
+        self.flags(profiling_report_interval=60, group='database')
+        with mock.patch('time.time', return_value=profiler._STATS.reported_at):
+            self.api.instance_get_all(self.context)
+        self.assertFalse(mock_report.called)
+        with mock.patch('time.time',
+                        return_value=profiler._STATS.reported_at + 60):
+            self.api.instance_get_all(self.context)
+        mock_report.assert_called_once_with()
+
+    def test_report(self):
+        report_dir = self.useFixture(fixtures.TempDir()).path
+        self.flags(profiling_report_dir=report_dir, group='database')
+        self.api.instance_get_all(self.context)
+        profiler.report()
+        files = os.listdir(report_dir)
+        self.assertEqual(1, len(files))
+        with open(os.path.join(report_dir, files[0])) as f:
+            stats = jsonutils.loads(f.read())
+        self.assertEqual(
+            1, stats['functions']['instance_get_all']['count'])
+
+
+class ProfiledEndpointsTestCase(test.NoDBTestCase):
+
+    class Manager(object):
+        target = 'target'
+
+        def build_instance(self, ctxt):
+            return profiler.get_operation()
+
+    def test_disabled(self):
+        endpoints = [self.Manager()]
+        self.assertIs(endpoints,
+                      profiler.profiled_endpoints(endpoints, 'compute'))
+
+    def test_operation(self):
+        self.flags(profiling=True, group='database')
+        endpoint, = profiler.profiled_endpoints([self.Manager()], 'compute')
+        self.assertEqual('target', endpoint.target)
+        self.assertEqual('rpc:compute.build_instance',
+                         endpoint.build_instance(None))
+        self.assertIsNone(profiler.get_operation())
+
+
+class MergeReportsTestCase(test.NoDBTestCase):
+
+    def _report(self, count, max_calls, elapsed_ms):
+        return {'functions': {'instance_get': {
+                    'count': count, 'statements': count, 'rows': count,
+                    'sum_ms': 1.0 * count,
+                    'buckets': [[1, count], [None, 0]],
+                    'max_calls_per_request': max_calls,
+                    'operations': {'GET ServersController.show': count}}},
+                'slow_statements': [{'elapsed_ms': elapsed_ms}]}
+
+    def test_merge_reports(self):
+        first = self._report(2, 1, 150)
+        result = profiler.merge_reports([first, self._report(3, 2, 300)])
+        function = result['functions']['instance_get']
+        self.assertEqual(5, function['count'])
+        self.assertEqual(5, function['statements'])
+        self.assertEqual(5.0, function['sum_ms'])
+        self.assertEqual([[1, 5], [None, 0]], function['buckets'])
+        self.assertEqual(2, function['max_calls_per_request'])
+        self.assertEqual({'GET ServersController.show': 5},
+                         function['operations'])
+        self.assertEqual([300, 150], [s['elapsed_ms'] for s
+                                      in result['slow_statements']])
+        # The reports merged aren't changed.
+        self.assertEqual(self._report(2, 1, 150), first)
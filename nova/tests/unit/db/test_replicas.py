@@ -0,0 +1,147 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Tests for the routing of database reads to read replicas."""
+
+import fixtures
+import mock
+from oslo_context import context as common_context
+import sqlalchemy
+
+from nova import context
+from nova.db.sqlalchemy import replicas
+from nova import test
+
+
+class ReplicaPoolTestCase(test.NoDBTestCase):
+
+    def setUp(self):
+        super(ReplicaPoolTestCase, self).setUp()
+        self.replicas = [
+            replicas.Replica('r%d' % i, sqlalchemy.create_engine('sqlite://'))
+            for i in range(3)]
+        self.lags = {replica.engine: 0 for replica in self.replicas}
+        patcher = mock.patch.dict(
+            replicas._LAG_QUERIES,
+            {'sqlite': lambda conn: self.lags[conn.engine]})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.thread_mock = self.useFixture(
+            fixtures.MockPatch('threading.Thread')).mock
+
+    def test_pick_least_in_use(self):
+        pool = replicas.ReplicaPool(self.replicas)
+        self.replicas[0].in_use = 2
+        self.replicas[2].in_use = 1
+        self.assertIs(self.replicas[1], pool.pick())
+
+    def test_pick_in_turn(self):
+        pool = replicas.ReplicaPool(self.replicas)
+        self.assertEqual(set(self.replicas),
+                         set(pool.pick() for i in range(3)))
+
+    def test_in_use(self):
+        replica = self.replicas[0]
+        with replica.engine.connect():
+            self.assertEqual(1, replica.in_use)
+        self.assertEqual(0, replica.in_use)
+
+    def test_pick_lagging(self):
+        pool = replicas.ReplicaPool(self.replicas, max_lag=5)
+        self.lags[self.replicas[0].engine] = 6
+        self.lags[self.replicas[1].engine] = None
+        # Nothing is read from the replicas before their lag is known
+        self.assertIsNone(pool.pick())
+
+        pool.refresh()
+        self.assertIs(self.replicas[2], pool.pick())
+        self.assertIs(self.replicas[2], pool.pick())
+        self.assertEqual([6, None, 0],
+                         [replica.lag for replica in self.replicas])
+
+        # The lag is only checked again by the next refresh
+        self.lags[self.replicas[2].engine] = 10
+        self.assertIs(self.replicas[2], pool.pick())
+        pool.refresh()
+        self.assertIsNone(pool.pick())
+
+    def test_refresh_lag_error(self):
+        pool = replicas.ReplicaPool(self.replicas[:1], max_lag=5)
+        with mock.patch.dict(replicas._LAG_QUERIES,
+                             {'sqlite': mock.Mock(side_effect=Exception)}):
+            pool.refresh()
+        self.assertIsNone(pool.pick())
+        self.assertIsNone(self.replicas[0].lag)
+
+    def test_pick_no_bound(self):
+        pool = replicas.ReplicaPool(self.replicas[:1])
+        self.lags[self.replicas[0].engine] = None
+        self.assertIs(self.replicas[0], pool.pick())
+        self.replicas[0].mark_unavailable()
+        self.assertIsNone(pool.pick())
+        pool.refresh()
+        self.assertIs(self.replicas[0], pool.pick())
+
+    def test_pick_starts_refresh(self):
+        pool = replicas.ReplicaPool(self.replicas, max_lag=5,
+                                    check_interval=10)
+        pool.pick()
+        pool.pick()
+        self.thread_mock.assert_called_once_with(
+            target=pool._refresh_periodically, name='db-replica-lag')
+        self.thread_mock.return_value.start.assert_called_once_with()
+
+        with test.nested(
+            mock.patch.object(pool, 'refresh',
+                              side_effect=[Exception, None]),
+            mock.patch('time.sleep', side_effect=[None, StopIteration])
+        ) as (mock_refresh, mock_sleep):
+            self.assertRaises(StopIteration, pool._refresh_periodically)
+        self.assertEqual(2, mock_refresh.call_count)
+        mock_sleep.assert_called_with(10)
+
+    def test_pick_no_replicas(self):
+        self.assertIsNone(replicas.ReplicaPool([]).pick())
+
+    def test_pick_after_write(self):
+        pool = replicas.ReplicaPool(self.replicas)
+        primary = sqlalchemy.create_engine('sqlite://')
+        primary.execute('CREATE TABLE t (id INTEGER)')
+        ctxt = context.RequestContext('fake_user', 'fake_project')
+        primary.execute('SELECT * FROM t')
+        self.replicas[0].engine.execute('CREATE TABLE t (id INTEGER)')
+        self.assertFalse(replicas.has_written(ctxt))
+
+        primary.execute('INSERT INTO t VALUES (1)')
+        self.assertTrue(replicas.has_written(ctxt))
+        self.assertIsNone(pool.pick())
+        self.assertIsNone(pool.pick(ctxt))
+
+    def test_write_marks_given_context(self):
+        replicas.ReplicaPool(self.replicas)
+        primary = sqlalchemy.create_engine('sqlite://')
+        ctxt = context.get_admin_context()
+
+        def _insert(context):
+            primary.execute('CREATE TABLE t (id INTEGER)')
+
+        backend = mock.Mock(insert=_insert)
+        tracking = replicas.WriteTrackingBackend(backend, lambda: True)
+        with mock.patch.object(common_context, 'get_current',
+                               return_value=None):
+            tracking.insert(ctxt)
+        self.assertTrue(replicas.has_written(ctxt))
+
+    def test_write_tracking_no_replicas(self):
+        backend = mock.Mock()
+        tracking = replicas.WriteTrackingBackend(backend, lambda: None)
+        self.assertIs(backend.insert, tracking.insert)
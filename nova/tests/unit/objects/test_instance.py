@@ -1341,6 +1341,26 @@ class _TestInstanceListObject(object):
             self.assertIsInstance(inst_list.objects[i], instance.Instance)
             self.assertEqual(fakes[i]['uuid'], inst_list.objects[i].uuid)
 
+    @mock.patch.object(db, 'instance_get_all_by_filters_sort')
+    def test_get_all_by_filters_fields(self, mock_get_all):
+        fake_inst = self.fake_instance(1)
+        columns = ['created_at', 'deleted', 'display_name', 'host', 'id',
+                   'uuid']
+        mock_get_all.return_value = [
+            {key: fake_inst[key] for key in columns}]
+        inst_list = objects.InstanceList.get_by_filters(
+            self.context, {'foo': 'bar'}, sort_keys=['host'],
+            sort_dirs=['asc'], fields=['display_name', 'metadata'])
+        mock_get_all.assert_called_once_with(
+            self.context, {'foo': 'bar'}, limit=None, marker=None,
+            columns_to_join=None, use_slave=False, sort_keys=['host'],
+            sort_dirs=['asc'], columns=columns)
+        inst = inst_list[0]
+        self.assertEqual(fake_inst['uuid'], inst.uuid)
+        self.assertEqual(fake_inst['display_name'], inst.display_name)
+        self.assertFalse(inst.obj_attr_is_set('hostname'))
+        self.assertFalse(inst.obj_attr_is_set('metadata'))
+
     @mock.patch.object(db, 'instance_get_all_by_filters_sort')
     @mock.patch.object(db, 'instance_get_all_by_filters')
     def test_get_all_by_filters_calls_non_sort(self,
@@ -1591,10 +1611,143 @@ class _TestInstanceListObject(object):
         self.assertEqual(2, len(instances))
         self.assertEqual([1, 2], [x.id for x in instances])
 
+    def _get_instance_list(self, instance_uuids, **updates):
+        return objects.InstanceList(context=self.context, objects=[
+            objects.Instance._from_db_object(
+                self.context, objects.Instance(),
+                self.fake_instance(1, dict(updates, uuid=instance_uuid)))
+            for instance_uuid in instance_uuids])
+
+    @mock.patch.object(notifications, 'send_update')
+    @mock.patch.object(db, 'instance_update_many_and_get_original')
+    def test_save_many(self, mock_update, mock_notify):
+        self.flags(enable=False, group='cells')
+        inst_list = self._get_instance_list(
+            [uuids.instance1, uuids.instance2, uuids.instance3],
+            vm_state='building')
+        # The third instance has no update
+        for inst in inst_list[:2]:
+            inst.vm_state = 'error'
+        old_refs = [self.fake_instance(1, {'uuid': uuids.instance1,
+                                           'vm_state': 'building'}),
+                    self.fake_instance(1, {'uuid': uuids.instance2,
+                                           'vm_state': 'building'})]
+        mock_update.return_value = (
+            {uuids.instance1: (old_refs[0], dict(old_refs[0],
+                                                 vm_state='error'))},
+            {uuids.instance2: exception.InstanceUpdateConflict(
+                instance_uuid=uuids.instance2, expected={}, actual={})})
+
+        not_saved = inst_list.save_many(expected_vm_state='building')
+
+        self.assertEqual([uuids.instance2], not_saved)
+        mock_update.assert_called_once_with(
+            self.context,
+            {uuids.instance1: {'vm_state': 'error',
+                               'expected_vm_state': 'building'},
+             uuids.instance2: {'vm_state': 'error',
+                               'expected_vm_state': 'building'}},
+            columns_to_join=['system_metadata', 'extra', 'extra.flavor'])
+        self.assertEqual(1, mock_notify.call_count)
+        self.assertEqual('error', inst_list[0].vm_state)
+        self.assertEqual(set(), inst_list[0].obj_what_changed())
+        self.assertIn('vm_state', inst_list[1].obj_what_changed())
+
+    @mock.patch.object(db, 'instance_update_many_and_get_original')
+    def test_save_many_no_updates(self, mock_update):
+        self.flags(enable=False, group='cells')
+        inst_list = self._get_instance_list([uuids.instance1])
+        self.assertEqual([], inst_list.save_many())
+        self.assertFalse(mock_update.called)
+
+    @mock.patch.object(db, 'instance_update_many_and_get_original')
+    @mock.patch.object(objects.Instance, 'save')
+    def test_save_many_cells(self, mock_save, mock_update):
+        self.flags(enable=True, cell_type='compute', group='cells')
+        inst_list = self._get_instance_list(
+            [uuids.instance1, uuids.instance2])
+        mock_save.side_effect = [
+            None, exception.UnexpectedTaskStateError(
+                instance_uuid=uuids.instance2, expected={}, actual={})]
+
+        not_saved = inst_list.save_many(expected_task_state=None)
+
+        self.assertEqual([uuids.instance2], not_saved)
+        mock_save.assert_has_calls(
+            [mock.call(expected_vm_state=None, expected_task_state=None)] * 2)
+        self.assertFalse(mock_update.called)
+
+    def test_compact_instances(self):
+        inst_list = self._get_instance_list(
+            [uuids.instance1, uuids.instance2])
+        originals = list(inst_list)
+
+        self.assertIs(inst_list, instance.compact_instances(inst_list))
+        for original, compact in zip(originals, inst_list):
+            self.assertIsInstance(compact, instance.CompactInstance)
+            self.assertEqual(base.obj_to_primitive(original),
+                             base.obj_to_primitive(compact))
+            self.assertEqual('Instance', compact.obj_to_primitive()[
+                'nova_object.name'])
+            self.assertEqual(set(), compact.obj_what_changed())
+        # The layout of the fields is shared
+        self.assertIs(inst_list[0]._compact_layout,
+                      inst_list[1]._compact_layout)
+
+    def test_compact_instances_list(self):
+        compact = instance.compact_instances(
+            self._get_instance_list([uuids.instance1]))[0]
+        instances = [compact, mock.sentinel.instance]
+        instance.compact_instances(instances)
+        self.assertEqual([compact, mock.sentinel.instance], instances)
+
+    def test_compact_instance_promoted(self):
+        inst = instance.compact_instances(
+            self._get_instance_list([uuids.instance1]))[0]
+        display_name = inst.display_name
+        inst.host = 'newhost'
+        self.assertIsNone(inst._compact_values)
+        self.assertEqual('newhost', inst.host)
+        self.assertEqual(display_name, inst.display_name)
+        self.assertEqual(uuids.instance1, inst.uuid)
+        self.assertEqual(set(['host']), inst.obj_what_changed())
+
+    def test_compact_instance_field_added(self):
+        inst = instance.compact_instances(
+            self._get_instance_list([uuids.instance1]))[0]
+        self.assertFalse(inst.obj_attr_is_set('fault'))
+        inst.fault = None
+        inst.obj_reset_changes(['fault'])
+        # Not promoted, as the fields it has didn't change
+        self.assertIsNotNone(inst._compact_values)
+        self.assertIsNone(inst.fault)
+        self.assertEqual(set(), inst.obj_what_changed())
+
 
 class TestInstanceListObject(test_objects._LocalTest,
                              _TestInstanceListObject):
-    pass
+
+    @mock.patch.object(db, 'instance_get_by_uuid')
+    @mock.patch.object(db, 'instance_get_all_by_filters')
+    def test_get_all_by_filters_fields_lazy_load(self, mock_get_all,
+                                                 mock_get):
+        fake_inst = self.fake_instance(1)
+        columns = ['created_at', 'deleted', 'display_name', 'id', 'uuid']
+        mock_get_all.return_value = [
+            {key: fake_inst[key] for key in columns}]
+        mock_get.return_value = fake_inst
+        inst = objects.InstanceList.get_by_filters(
+            self.context, {}, fields=['display_name'])[0]
+        self.assertFalse(inst.obj_attr_is_set('hostname'))
+
+        self.assertEqual(fake_inst['hostname'], inst.hostname)
+        self.assertEqual(fake_inst['host'], inst.host)
+        mock_get.assert_called_once_with(self.context, fake_inst['uuid'],
+                                         columns_to_join=[],
+                                         use_slave=False)
+        self.assertEqual(set(), inst.obj_what_changed())
+        self.assertRaises(exception.ObjectActionError,
+                          inst.obj_load_attr, 'hostname')
 
 
 class TestRemoteInstanceListObject(test_objects._RemoteTest,
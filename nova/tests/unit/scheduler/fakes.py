@@ -19,6 +19,7 @@ Fakes For Scheduler tests.
 import six
 
 from nova import objects
+from nova.scheduler import aggregate_index
 from nova.scheduler import driver
 from nova.scheduler import host_manager
 
@@ -99,6 +100,20 @@ class FakeHostState(host_manager.HostState):
             setattr(self, key, val)
 
 
+def host_states_with_aggregates(aggregates, hosts):
+    """Returns a FakeHostState for each host, with the aggregates it is in
+    and an AggregateIndex of all the aggregates.
+    """
+    index = aggregate_index.AggregateIndex()
+    for aggregate in aggregates:
+        index.update_aggregate(aggregate)
+    return [FakeHostState(host, 'node',
+                          {'aggregates': [agg for agg in aggregates
+                                          if host in agg.hosts],
+                           'aggregate_index': index})
+            for host in hosts]
+
+
 class FakeScheduler(driver.Scheduler):
 
     def select_destinations(self, context, request_spec, filter_properties):
@@ -103,3 +103,49 @@ class TestAggImagePropsIsolationFilter(test.NoDBTestCase):
                 hw_vm_mode='hvm', img_owner_id='wrong')))
         host = fakes.FakeHostState('host1', 'compute', {})
         self.assertTrue(self.filt_cls.host_passes(host, spec_obj))
+
+
+class TestAggImagePropsIsolationFilterIndex(test.NoDBTestCase):
+
+    def setUp(self):
+        super(TestAggImagePropsIsolationFilterIndex, self).setUp()
+        self.filt_cls = aipi.AggregateImagePropertiesIsolation()
+        aggregates = [
+            objects.Aggregate(id=1, hosts=['host1'],
+                              metadata={'hw_vm_mode': 'hvm'}),
+            objects.Aggregate(id=2, hosts=['host2'],
+                              metadata={'hw_vm_mode': 'hvm,xen',
+                                        'hw_cpu_cores': '2'}),
+            objects.Aggregate(id=3, hosts=['host3'],
+                              metadata={'hw_vm_mode': 'xen'}),
+        ]
+        self.hosts = fakes.host_states_with_aggregates(
+            aggregates, ['host1', 'host2', 'host3', 'host4'])
+
+    def _test_filter_all(self, props, expected_hosts):
+        spec_obj = objects.RequestSpec(
+            context=mock.sentinel.ctx,
+            image=objects.ImageMeta(
+                properties=objects.ImageMetaProps(**props)))
+        result = list(self.filt_cls.filter_all(self.hosts, spec_obj))
+        self.assertEqual(expected_hosts, [h.host for h in result])
+        self.assertEqual([h for h in self.hosts
+                          if self.filt_cls.host_passes(h, spec_obj)],
+                         result)
+
+    def test_filter_all(self):
+        self._test_filter_all({'hw_vm_mode': 'hvm'},
+                              ['host1', 'host2', 'host4'])
+
+    def test_filter_all_multi_props(self):
+        self._test_filter_all({'hw_vm_mode': 'xen', 'hw_cpu_cores': 4},
+                              ['host3', 'host4'])
+
+    def test_filter_all_no_props(self):
+        self._test_filter_all({}, ['host1', 'host2', 'host3', 'host4'])
+
+    def test_filter_all_namespace(self):
+        self.flags(aggregate_image_properties_isolation_namespace='hw',
+                   aggregate_image_properties_isolation_separator='_')
+        self._test_filter_all({'hw_vm_mode': 'hvm'},
+                              ['host1', 'host2', 'host4'])
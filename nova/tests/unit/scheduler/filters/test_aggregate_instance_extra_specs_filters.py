@@ -95,3 +95,46 @@ class TestAggregateInstanceExtraSpecsFilter(test.NoDBTestCase):
             'trust:trusted_host': 'true'
         }
         self._do_test_aggregate_filter_extra_specs(especs, passes=False)
+
+
+class TestAggregateInstanceExtraSpecsFilterIndex(test.NoDBTestCase):
+
+    def setUp(self):
+        super(TestAggregateInstanceExtraSpecsFilterIndex, self).setUp()
+        self.filt_cls = agg_specs.AggregateInstanceExtraSpecsFilter()
+        aggregates = [
+            objects.Aggregate(id=1, hosts=['host1', 'host2'],
+                              metadata={'opt1': '1', 'opt2': '2'}),
+            objects.Aggregate(id=2, hosts=['host2', 'host3'],
+                              metadata={'opt1': '3, 4'}),
+        ]
+        self.hosts = fakes.host_states_with_aggregates(
+            aggregates, ['host1', 'host2', 'host3', 'host4'])
+
+    def _test_filter_all(self, extra_specs, expected_hosts):
+        spec_obj = objects.RequestSpec(
+            context=mock.sentinel.ctx,
+            flavor=objects.Flavor(memory_mb=1024, extra_specs=extra_specs))
+        result = list(self.filt_cls.filter_all(self.hosts, spec_obj))
+        self.assertEqual(expected_hosts, [h.host for h in result])
+        self.assertEqual([h for h in self.hosts
+                          if self.filt_cls.host_passes(h, spec_obj)],
+                         result)
+
+    def test_filter_all(self):
+        self._test_filter_all({'opt1': '4'}, ['host2', 'host3'])
+
+    def test_filter_all_multiple_specs(self):
+        self._test_filter_all({'opt1': '1', 'opt2': '2'},
+                              ['host1', 'host2'])
+
+    def test_filter_all_operator(self):
+        self._test_filter_all({'aggregate_instance_extra_specs:opt1': '>= 3'},
+                              ['host2', 'host3'])
+
+    def test_filter_all_other_scope(self):
+        self._test_filter_all({'hw:opt1': '5'},
+                              ['host1', 'host2', 'host3', 'host4'])
+
+    def test_filter_all_no_match(self):
+        self._test_filter_all({'opt1': '5'}, [])
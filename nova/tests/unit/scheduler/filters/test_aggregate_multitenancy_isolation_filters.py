@@ -63,3 +63,26 @@ class TestAggregateMultitenancyIsolationFilter(test.NoDBTestCase):
             context=mock.sentinel.ctx, project_id='my_tenantid')
         host = fakes.FakeHostState('host1', 'compute', {})
         self.assertTrue(self.filt_cls.host_passes(host, spec_obj))
+
+
+class TestAggregateMultitenancyIsolationFilterIndex(test.NoDBTestCase):
+
+    def test_filter_all(self):
+        filt_cls = ami.AggregateMultiTenancyIsolation()
+        aggregates = [
+            objects.Aggregate(id=1, hosts=['host1'],
+                              metadata={'filter_tenant_id': 'tenant1'}),
+            objects.Aggregate(id=2, hosts=['host2'],
+                              metadata={'filter_tenant_id': 'tenant1, t2'}),
+            objects.Aggregate(id=3, hosts=['host3'],
+                              metadata={'filter_tenant_id': 'tenant2'}),
+        ]
+        hosts = fakes.host_states_with_aggregates(
+            aggregates, ['host1', 'host2', 'host3', 'host4'])
+        spec_obj = objects.RequestSpec(context=mock.sentinel.ctx,
+                                       project_id='tenant1')
+        result = list(filt_cls.filter_all(hosts, spec_obj))
+        self.assertEqual(['host1', 'host2', 'host4'],
+                         [h.host for h in result])
+        self.assertEqual([h for h in hosts
+                          if filt_cls.host_passes(h, spec_obj)], result)
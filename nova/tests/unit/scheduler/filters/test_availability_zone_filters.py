@@ -48,3 +48,40 @@ class TestAvailabilityZoneFilter(test.NoDBTestCase):
         request = self._make_zone_request('bad')
         host = fakes.FakeHostState('host1', 'node1', {})
         self.assertFalse(self.filt_cls.host_passes(host, request))
+
+
+class TestAvailabilityZoneFilterIndex(test.NoDBTestCase):
+
+    def setUp(self):
+        super(TestAvailabilityZoneFilterIndex, self).setUp()
+        self.filt_cls = availability_zone_filter.AvailabilityZoneFilter()
+        aggregates = [
+            objects.Aggregate(id=1, hosts=['host1'],
+                              metadata={'availability_zone': 'az1'}),
+            objects.Aggregate(id=2, hosts=['host2'],
+                              metadata={'availability_zone': 'az2,nova'}),
+        ]
+        self.hosts = fakes.host_states_with_aggregates(
+            aggregates, ['host1', 'host2', 'host3'])
+
+    def _test_filter_all(self, zone, expected_hosts):
+        request = objects.RequestSpec(context=mock.sentinel.ctx,
+                                      availability_zone=zone)
+        result = list(self.filt_cls.filter_all(self.hosts, request))
+        self.assertEqual(expected_hosts, [h.host for h in result])
+        # Same result as host by host
+        self.assertEqual([h for h in self.hosts
+                          if self.filt_cls.host_passes(h, request)],
+                         result)
+
+    def test_filter_all_zone(self):
+        self._test_filter_all('az1', ['host1'])
+
+    def test_filter_all_default_zone(self):
+        self._test_filter_all('nova', ['host2', 'host3'])
+
+    def test_filter_all_unknown_zone(self):
+        self._test_filter_all('az3', [])
+
+    def test_filter_all_no_zone(self):
+        self._test_filter_all(None, ['host1', 'host2', 'host3'])
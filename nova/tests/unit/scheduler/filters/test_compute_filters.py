@@ -14,6 +14,7 @@ import mock
 
 from nova import objects
 from nova.scheduler.filters import compute_filter
+from nova.scheduler import host_table
 from nova import test
 from nova.tests.unit.scheduler import fakes
 
@@ -52,3 +53,20 @@ class TestComputeFilter(test.NoDBTestCase):
         service_up_mock.return_value = False
         self.assertFalse(filt_cls.host_passes(host, spec_obj))
         service_up_mock.assert_called_once_with(service)
+
+    def test_compute_filter_array(self, service_up_mock):
+        filt_cls = compute_filter.ComputeFilter()
+        spec_obj = objects.RequestSpec(
+            flavor=objects.Flavor(memory_mb=1024))
+        services = [{'disabled': True},
+                    {'disabled': False},
+                    {'disabled': False}]
+        hosts = [fakes.FakeHostState('host%s' % i, 'node',
+                                     {'service': service})
+                 for i, service in enumerate(services)]
+        service_up_mock.side_effect = [True, False]
+        table = host_table.HostStateTable(hosts)
+        self.assertEqual([False, True, False],
+                         filt_cls.filter_array(table, spec_obj).tolist())
+        self.assertEqual([mock.call(services[1]), mock.call(services[2])],
+                         service_up_mock.call_args_list)
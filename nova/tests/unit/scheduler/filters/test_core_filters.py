@@ -14,6 +14,7 @@ import mock
 
 from nova import objects
 from nova.scheduler.filters import core_filter
+from nova.scheduler import host_table
 from nova import test
 from nova.tests.unit.scheduler import fakes
 
@@ -92,3 +93,43 @@ class TestCoreFilter(test.NoDBTestCase):
         # use the minimum ratio from aggregates
         self.assertFalse(self.filt_cls.host_passes(host, spec_obj))
         self.assertEqual(4 * 2, host.limits['vcpu'])
+
+    def test_core_filter_array(self):
+        self.filt_cls = core_filter.CoreFilter()
+        spec_obj = objects.RequestSpec(flavor=objects.Flavor(vcpus=2))
+        hosts = [
+            # passes
+            fakes.FakeHostState('host1', 'node1',
+                {'vcpus_total': 4, 'vcpus_used': 6,
+                 'cpu_allocation_ratio': 2}),
+            # fails safe
+            fakes.FakeHostState('host2', 'node2', {}),
+            # not enough free vcpus
+            fakes.FakeHostState('host3', 'node3',
+                {'vcpus_total': 4, 'vcpus_used': 7,
+                 'cpu_allocation_ratio': 2}),
+            # single instance overcommit
+            fakes.FakeHostState('host4', 'node4',
+                {'vcpus_total': 1, 'vcpus_used': 0,
+                 'cpu_allocation_ratio': 2}),
+        ]
+        table = host_table.HostStateTable(hosts)
+        self.assertEqual([True, True, False, False],
+                         self.filt_cls.filter_array(table, spec_obj).tolist())
+        self.assertEqual(4 * 2, hosts[0].limits['vcpu'])
+        self.assertEqual({}, hosts[1].limits)
+        self.assertEqual(1 * 2, hosts[3].limits['vcpu'])
+
+    @mock.patch('nova.scheduler.filters.utils.aggregate_values_from_key')
+    def test_aggregate_core_filter_array(self, agg_mock):
+        self.filt_cls = core_filter.AggregateCoreFilter()
+        spec_obj = objects.RequestSpec(
+            context=mock.sentinel.ctx, flavor=objects.Flavor(vcpus=1))
+        host = fakes.FakeHostState('host1', 'node1',
+                {'vcpus_total': 4, 'vcpus_used': 8,
+                 'cpu_allocation_ratio': 2})
+        agg_mock.return_value = set(['3'])
+        table = host_table.HostStateTable([host])
+        self.assertEqual([True],
+                         self.filt_cls.filter_array(table, spec_obj).tolist())
+        self.assertEqual(4 * 3, host.limits['vcpu'])
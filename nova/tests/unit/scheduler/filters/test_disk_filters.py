@@ -14,6 +14,7 @@ import mock
 
 from nova import objects
 from nova.scheduler.filters import disk_filter
+from nova.scheduler import host_table
 from nova import test
 from nova.tests.unit.scheduler import fakes
 
@@ -98,3 +99,36 @@ class TestDiskFilter(test.NoDBTestCase):
 
         agg_mock.return_value = set(['2'])
         self.assertTrue(filt_cls.host_passes(host, spec_obj))
+
+    def test_disk_filter_array(self):
+        self.flags(disk_allocation_ratio=1.0)
+        filt_cls = disk_filter.DiskFilter()
+        spec_obj = objects.RequestSpec(
+            flavor=objects.Flavor(root_gb=1, ephemeral_gb=1, swap=512))
+        hosts = [
+            fakes.FakeHostState('host1', 'node1',
+                {'free_disk_mb': 11 * 1024, 'total_usable_disk_gb': 13}),
+            fakes.FakeHostState('host2', 'node2',
+                {'free_disk_mb': 2 * 1024, 'total_usable_disk_gb': 13}),
+        ]
+        table = host_table.HostStateTable(hosts)
+        self.assertEqual([True, False],
+                         filt_cls.filter_array(table, spec_obj).tolist())
+        self.assertEqual(13, hosts[0].limits['disk_gb'])
+        self.assertEqual({}, hosts[1].limits)
+
+    @mock.patch('nova.scheduler.filters.utils.aggregate_values_from_key')
+    def test_aggregate_disk_filter_array(self, agg_mock):
+        filt_cls = disk_filter.AggregateDiskFilter()
+        spec_obj = objects.RequestSpec(
+            context=mock.sentinel.ctx,
+            flavor=objects.Flavor(
+                root_gb=3, ephemeral_gb=1, swap=1024))
+        host = fakes.FakeHostState('host1', 'node1',
+                {'free_disk_mb': 2 * 1024, 'total_usable_disk_gb': 4})
+        agg_mock.return_value = set(['2'])
+        table = host_table.HostStateTable([host])
+        self.assertEqual([True],
+                         filt_cls.filter_array(table, spec_obj).tolist())
+        agg_mock.assert_called_once_with(host, 'disk_allocation_ratio')
+        self.assertEqual(4 * 2, host.limits['disk_gb'])
@@ -15,6 +15,7 @@ import mock
 
 from nova import objects
 from nova.scheduler.filters import io_ops_filter
+from nova.scheduler import host_table
 from nova import test
 from nova.tests.unit.scheduler import fakes
 
@@ -60,3 +61,27 @@ class TestNumInstancesFilter(test.NoDBTestCase):
         spec_obj = objects.RequestSpec(context=mock.sentinel.ctx)
         self.assertTrue(self.filt_cls.host_passes(host, spec_obj))
         agg_mock.assert_called_once_with(host, 'max_io_ops_per_host')
+
+    def test_filter_num_iops_array(self):
+        self.flags(max_io_ops_per_host=8)
+        self.filt_cls = io_ops_filter.IoOpsFilter()
+        hosts = [fakes.FakeHostState('host%s' % i, 'node',
+                                     {'num_io_ops': i})
+                 for i in (7, 8)]
+        table = host_table.HostStateTable(hosts)
+        spec_obj = objects.RequestSpec()
+        self.assertEqual([True, False],
+                         self.filt_cls.filter_array(table, spec_obj).tolist())
+
+    @mock.patch('nova.scheduler.filters.utils.aggregate_values_from_key')
+    def test_aggregate_filter_num_iops_array(self, agg_mock):
+        self.flags(max_io_ops_per_host=7)
+        self.filt_cls = io_ops_filter.AggregateIoOpsFilter()
+        host = fakes.FakeHostState('host1', 'node1',
+                                   {'num_io_ops': 7})
+        table = host_table.HostStateTable([host])
+        spec_obj = objects.RequestSpec(context=mock.sentinel.ctx)
+        agg_mock.return_value = set(['8'])
+        self.assertEqual([True],
+                         self.filt_cls.filter_array(table, spec_obj).tolist())
+        agg_mock.assert_called_once_with(host, 'max_io_ops_per_host')
@@ -14,6 +14,7 @@ import mock
 
 from nova import objects
 from nova.scheduler.filters import num_instances_filter
+from nova.scheduler import host_table
 from nova import test
 from nova.tests.unit.scheduler import fakes
 
@@ -60,3 +61,27 @@ class TestNumInstancesFilter(test.NoDBTestCase):
         agg_mock.return_value = set(['XXX'])
         self.assertTrue(self.filt_cls.host_passes(host, spec_obj))
         agg_mock.assert_called_once_with(host, 'max_instances_per_host')
+
+    def test_filter_num_instances_array(self):
+        self.flags(max_instances_per_host=5)
+        self.filt_cls = num_instances_filter.NumInstancesFilter()
+        hosts = [fakes.FakeHostState('host%s' % i, 'node',
+                                     {'num_instances': i})
+                 for i in (4, 5, 6)]
+        table = host_table.HostStateTable(hosts)
+        spec_obj = objects.RequestSpec()
+        self.assertEqual([True, False, False],
+                         self.filt_cls.filter_array(table, spec_obj).tolist())
+
+    @mock.patch('nova.scheduler.filters.utils.aggregate_values_from_key')
+    def test_filter_aggregate_num_instances_array(self, agg_mock):
+        self.flags(max_instances_per_host=4)
+        self.filt_cls = num_instances_filter.AggregateNumInstancesFilter()
+        host = fakes.FakeHostState('host1', 'node1',
+                                   {'num_instances': 5})
+        table = host_table.HostStateTable([host])
+        spec_obj = objects.RequestSpec(context=mock.sentinel.ctx)
+        agg_mock.return_value = set(['6'])
+        self.assertEqual([True],
+                         self.filt_cls.filter_array(table, spec_obj).tolist())
+        agg_mock.assert_called_once_with(host, 'max_instances_per_host')
@@ -12,10 +12,13 @@
 
 import uuid
 
+import mock
+
 from nova import objects
 from nova.scheduler.filters import numa_topology_filter
 from nova import test
 from nova.tests.unit.scheduler import fakes
+from nova.virt import hardware
 
 
 class TestNUMATopologyFilter(test.NoDBTestCase):
@@ -123,3 +126,59 @@ class TestNUMATopologyFilter(test.NoDBTestCase):
         limits = host.limits['numa_topology']
         self.assertEqual(limits.cpu_allocation_ratio, 21)
         self.assertEqual(limits.ram_allocation_ratio, 1.3)
+
+    def test_numa_topology_filter_in_worker(self):
+        instance_topology = objects.InstanceNUMATopology(
+            cells=[objects.InstanceNUMACell(id=0, cpuset=set([1]), memory=512),
+                   objects.InstanceNUMACell(id=1, cpuset=set([3]), memory=512)
+               ])
+        spec_obj = objects.RequestSpec(numa_topology=instance_topology,
+                                       pci_requests=None,
+                                       instance_uuid=str(uuid.uuid4()))
+        attrs = {'numa_topology': fakes.NUMA_TOPOLOGY,
+                 'pci_stats': None,
+                 'cpu_allocation_ratio': 21,
+                 'ram_allocation_ratio': 1.3}
+        worker_host = fakes.FakeHostState('host1', 'node1', attrs)
+        result = self.filt_cls.filter_in_worker(worker_host, spec_obj)
+        self.assertIsInstance(result, objects.NUMATopologyLimits)
+
+        # The limits recorded in the worker end up on the host of the parent
+        host = fakes.FakeHostState('host1', 'node1', attrs)
+        self.filt_cls.apply_worker_result(host, result)
+        limits = host.limits['numa_topology']
+        self.assertEqual(21, limits.cpu_allocation_ratio)
+        self.assertEqual(1.3, limits.ram_allocation_ratio)
+
+    def test_numa_topology_filter_in_worker_no_numa_instance(self):
+        spec_obj = objects.RequestSpec(numa_topology=None,
+                                       pci_requests=None,
+                                       instance_uuid=str(uuid.uuid4()))
+        host = fakes.FakeHostState('host1', 'node1',
+                                   {'numa_topology': fakes.NUMA_TOPOLOGY})
+        self.assertIs(True, self.filt_cls.filter_in_worker(host, spec_obj))
+        self.filt_cls.apply_worker_result(host, True)
+        self.assertNotIn('numa_topology', host.limits)
+
+    @mock.patch('nova.virt.hardware.get_numa_fit_cache')
+    def test_numa_topology_filter_fit_cache(self, get_cache_mock):
+        cache = hardware.NUMAFitCache(10)
+        get_cache_mock.return_value = cache
+        instance_topology = objects.InstanceNUMATopology(
+            cells=[objects.InstanceNUMACell(id=0, cpuset=set([1]), memory=512),
+                   objects.InstanceNUMACell(id=1, cpuset=set([3]), memory=512)
+               ])
+        spec_obj = objects.RequestSpec(numa_topology=instance_topology,
+                                       pci_requests=None,
+                                       instance_uuid=str(uuid.uuid4()))
+        attrs = {'numa_topology': fakes.NUMA_TOPOLOGY,
+                 'pci_stats': None,
+                 'cpu_allocation_ratio': 16.0,
+                 'ram_allocation_ratio': 1.5}
+        hosts = [fakes.FakeHostState('host1', 'node1', attrs),
+                 fakes.FakeHostState('host2', 'node2', attrs)]
+        for host in hosts:
+            self.assertTrue(self.filt_cls.host_passes(host, spec_obj))
+        # The second host has the same free resources as the first one
+        self.assertEqual(1, cache.misses)
+        self.assertEqual(1, cache.hits)
@@ -14,6 +14,7 @@ import mock
 
 from nova import objects
 from nova.scheduler.filters import ram_filter
+from nova.scheduler import host_table
 from nova import test
 from nova.tests.unit.scheduler import fakes
 
@@ -102,3 +103,39 @@ class TestAggregateRamFilter(test.NoDBTestCase):
         # use the minimum ratio from aggregates
         self.assertTrue(self.filt_cls.host_passes(host, spec_obj))
         self.assertEqual(1024 * 1.5, host.limits['memory_mb'])
+
+    def test_ram_filter_array(self):
+        spec_obj = objects.RequestSpec(
+            flavor=objects.Flavor(memory_mb=1024))
+        hosts = [
+            fakes.FakeHostState('host1', 'node1',
+                {'free_ram_mb': 1023, 'total_usable_ram_mb': 1024,
+                 'ram_allocation_ratio': 1.0}),
+            fakes.FakeHostState('host2', 'node2',
+                {'free_ram_mb': -1024, 'total_usable_ram_mb': 2048,
+                 'ram_allocation_ratio': 2.0}),
+            fakes.FakeHostState('host3', 'node3',
+                {'free_ram_mb': 512, 'total_usable_ram_mb': 512,
+                 'ram_allocation_ratio': 2.0}),
+        ]
+        table = host_table.HostStateTable(hosts)
+        self.assertEqual([False, True, False],
+                         self.filt_cls.filter_array(table, spec_obj).tolist())
+        self.assertEqual({}, hosts[0].limits)
+        self.assertEqual(2048 * 2.0, hosts[1].limits['memory_mb'])
+        self.assertEqual({}, hosts[2].limits)
+
+    @mock.patch('nova.scheduler.filters.utils.aggregate_values_from_key')
+    def test_aggregate_ram_filter_array(self, agg_mock):
+        spec_obj = objects.RequestSpec(
+            context=mock.sentinel.ctx,
+            flavor=objects.Flavor(memory_mb=1024))
+        host = fakes.FakeHostState('host1', 'node1',
+                {'free_ram_mb': 1024, 'total_usable_ram_mb': 1024,
+                 'ram_allocation_ratio': 1.0})
+        agg_mock.return_value = set(['1.5'])
+        table = host_table.HostStateTable([host])
+        self.assertEqual([True],
+                         self.filt_cls.filter_array(table, spec_obj).tolist())
+        agg_mock.assert_called_once_with(host, 'ram_allocation_ratio')
+        self.assertEqual(1024 * 1.5, host.limits['memory_mb'])
@@ -0,0 +1,72 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Tests For AggregateIndex.
+"""
+
+from nova import objects
+from nova.scheduler import aggregate_index
+from nova import test
+
+
+class AggregateIndexTestCase(test.NoDBTestCase):
+
+    def setUp(self):
+        super(AggregateIndexTestCase, self).setUp()
+        self.index = aggregate_index.AggregateIndex()
+        self.agg1 = objects.Aggregate(
+            id=1, hosts=['host1', 'host2'],
+            metadata={'availability_zone': 'az1', 'ssd': 'true, fast'})
+        self.agg2 = objects.Aggregate(
+            id=2, hosts=['host2', 'host3'],
+            metadata={'ssd': 'true'})
+        self.index.update_aggregate(self.agg1)
+        self.index.update_aggregate(self.agg2)
+
+    def test_lookups(self):
+        self.assertEqual(set(['host1', 'host2']),
+                         self.index.hosts_with_value('availability_zone',
+                                                     'az1'))
+        self.assertEqual(set(['host1', 'host2', 'host3']),
+                         self.index.hosts_with_value('ssd', 'true'))
+        self.assertEqual(set(['host1', 'host2']),
+                         self.index.hosts_with_value('ssd', 'fast'))
+        self.assertEqual(set(['host1', 'host2', 'host3']),
+                         self.index.hosts_with_key('ssd'))
+        self.assertEqual(set(), self.index.hosts_with_value('ssd', 'false'))
+        self.assertEqual(set(), self.index.hosts_with_key('foo'))
+        self.assertEqual(set(['true', 'fast']), set(self.index.values('ssd')))
+        self.assertEqual(set(['availability_zone', 'ssd']),
+                         set(self.index.keys()))
+
+    def test_update_aggregate(self):
+        self.agg1.hosts = ['host1']
+        self.agg1.metadata = {'ssd': 'true'}
+        self.index.update_aggregate(self.agg1)
+        self.assertEqual(set(), self.index.hosts_with_key('availability_zone'))
+        self.assertEqual(set(), self.index.hosts_with_value('ssd', 'fast'))
+        self.assertEqual(set(['host1', 'host2', 'host3']),
+                         self.index.hosts_with_value('ssd', 'true'))
+        self.assertEqual(['ssd'], self.index.keys())
+
+    def test_delete_aggregate(self):
+        self.index.delete_aggregate(1)
+        # host2 still gets ssd=true from the second aggregate
+        self.assertEqual(set(['host2', 'host3']),
+                         self.index.hosts_with_value('ssd', 'true'))
+        self.assertEqual(['true'], self.index.values('ssd'))
+        self.assertEqual(set(), self.index.hosts_with_key('availability_zone'))
+
+    def test_delete_unknown_aggregate(self):
+        self.index.delete_aggregate(42)
+        self.assertEqual(set(['host1', 'host2', 'host3']),
+                         self.index.hosts_with_key('ssd'))
@@ -24,6 +24,7 @@ from nova.scheduler.client import query as scheduler_query_client
 from nova.scheduler.client import report as scheduler_report_client
 from nova.scheduler import rpcapi as scheduler_rpcapi
 from nova import test
+from nova.tests import uuidsentinel as uuids
 """Tests for Scheduler Client."""
 
 
@@ -90,6 +91,15 @@ class SchedulerQueryClientTestCase(test.NoDBTestCase):
         mock_delete_agg.assert_called_once_with(
             self.context, aggregate)
 
+    @mock.patch.object(scheduler_rpcapi.SchedulerAPI, 'update_compute_node')
+    def test_update_compute_node(self, mock_update_cn):
+        compute_node = objects.ComputeNode(host='host1',
+                                           hypervisor_hostname='node1')
+        self.client.update_compute_node(self.context, compute_node, 2,
+                                        epoch=uuids.epoch)
+        mock_update_cn.assert_called_once_with(
+            self.context, compute_node, 2, epoch=uuids.epoch)
+
 
 class SchedulerClientTestCase(test.NoDBTestCase):
 
@@ -153,6 +163,14 @@ class SchedulerClientTestCase(test.NoDBTestCase):
         mock_delete_agg.assert_called_once_with(
             'context', aggregate)
 
+    @mock.patch.object(scheduler_query_client.SchedulerQueryClient,
+                       'update_compute_node')
+    def test_update_compute_node(self, mock_update_cn):
+        self.client.update_compute_node('context', mock.sentinel.cn, 3,
+                                        epoch=mock.sentinel.epoch)
+        mock_update_cn.assert_called_once_with('context', mock.sentinel.cn, 3,
+                                               epoch=mock.sentinel.epoch)
+
     @mock.patch.object(scheduler_report_client.SchedulerReportClient,
                        'update_resource_stats')
     def test_update_resource_stats(self, mock_update_resource_stats):
@@ -22,6 +22,7 @@ from nova import exception
 from nova import objects
 from nova.scheduler import filter_scheduler
 from nova.scheduler import host_manager
+from nova.scheduler import profiler
 from nova.scheduler import utils as scheduler_utils
 from nova.scheduler import weights
 from nova import test  # noqa
@@ -54,7 +55,8 @@ class FilterSchedulerTestCase(test_scheduler.SchedulerTestCase):
 
         self.next_weight = 1.0
 
-        def _fake_weigh_objects(_self, functions, hosts, options):
+        def _fake_weigh_objects(_self, functions, hosts, options,
+                                limit=None):
             self.next_weight += 2.0
             host_state = hosts[0]
             return [weights.WeighedHost(host_state, self.next_weight)]
@@ -209,7 +211,8 @@ class FilterSchedulerTestCase(test_scheduler.SchedulerTestCase):
 
         self.next_weight = 50
 
-        def _fake_weigh_objects(_self, functions, hosts, options):
+        def _fake_weigh_objects(_self, functions, hosts, options,
+                                limit=None):
             this_weight = self.next_weight
             self.next_weight = 0
             host_state = hosts[0]
@@ -239,6 +242,77 @@ class FilterSchedulerTestCase(test_scheduler.SchedulerTestCase):
 
         self.assertEqual(50, hosts[0].weight)
 
+    def _test_schedule_batch(self, num_instances, filtered_hosts=None,
+                             refiltered_hosts=None):
+        self.flags(scheduler_batch_placement=True)
+        host1 = mock.Mock(host='host1')
+        host2 = mock.Mock(host='host2')
+        # Consuming an instance on a host makes it less attractive than the
+        # other one for the next instance.
+        reweights = {host1: [0.5, 0.3], host2: [0.4, 0.2]}
+
+        def fake_get_weighed_host(host, spec_obj):
+            return weights.WeighedHost(host, reweights[host].pop(0))
+
+        def fake_filtered_hosts(hosts, spec_obj, index):
+            hosts = list(hosts)
+            if index and filtered_hosts is not None:
+                return [h for h in hosts if h in filtered_hosts]
+            return hosts
+
+        def fake_refiltered_hosts(hosts, spec_obj, index):
+            if refiltered_hosts is not None:
+                return [h for h in hosts if h in refiltered_hosts]
+            return hosts
+
+        spec_obj = objects.RequestSpec(num_instances=num_instances,
+                                       instance_group=None)
+        hm = self.driver.host_manager
+        with test.nested(
+            mock.patch.object(self.driver, '_get_all_host_states',
+                              return_value=iter([host1, host2])),
+            mock.patch.object(hm, 'get_filtered_hosts',
+                              side_effect=fake_filtered_hosts),
+            mock.patch.object(hm, 'get_refiltered_hosts',
+                              side_effect=fake_refiltered_hosts),
+            mock.patch.object(hm, 'get_weighed_hosts',
+                              return_value=[weights.WeighedHost(host1, 1.0),
+                                            weights.WeighedHost(host2, 0.8)]),
+            mock.patch.object(hm, 'get_weighed_host',
+                              side_effect=fake_get_weighed_host),
+        ) as (mock_get_all, mock_filtered, mock_refiltered, mock_weighed,
+              mock_weighed_host):
+            selected = self.driver._schedule(self.context, spec_obj)
+            mock_weighed.assert_called_once_with([host1, host2], spec_obj)
+            return ([h.obj for h in selected], mock_filtered)
+
+    def test_schedule_batch(self):
+        selected, mock_filtered = self._test_schedule_batch(4)
+        self.assertEqual(['host1', 'host2', 'host1', 'host2'],
+                         [h.host for h in selected])
+        for host in selected:
+            host.consume_from_request.assert_called_with(mock.ANY)
+        # The initial pass, then only the chosen host after each placement
+        # but the last one
+        self.assertEqual(4, mock_filtered.call_count)
+        self.assertEqual(
+            [mock.call([selected[i - 1]], mock.ANY, index=i)
+             for i in range(1, 4)],
+            mock_filtered.call_args_list[1:])
+
+    def test_schedule_batch_host_filtered_out(self):
+        # Nothing fits on a host once an instance has been placed on it
+        selected, mock_filtered = self._test_schedule_batch(
+            3, filtered_hosts=[])
+        self.assertEqual(['host1', 'host2'], [h.host for h in selected])
+
+    def test_schedule_batch_host_refiltered_out(self):
+        # The placement on the first host rules out the other one
+        selected, mock_filtered = self._test_schedule_batch(
+            3, refiltered_hosts=[])
+        self.assertEqual(['host1', 'host1', 'host1'],
+                         [h.host for h in selected])
+
     @mock.patch('nova.objects.ServiceList.get_by_binary',
                 return_value=fakes.SERVICES)
     @mock.patch('nova.objects.InstanceList.get_by_host')
@@ -260,7 +334,8 @@ class FilterSchedulerTestCase(test_scheduler.SchedulerTestCase):
         selected_hosts = []
         selected_nodes = []
 
-        def _fake_weigh_objects(_self, functions, hosts, options):
+        def _fake_weigh_objects(_self, functions, hosts, options,
+                                limit=None):
             self.next_weight += 2.0
             host_state = hosts[0]
             selected_hosts.append(host_state.host)
@@ -311,6 +386,27 @@ class FilterSchedulerTestCase(test_scheduler.SchedulerTestCase):
                  dict(request_spec=expected))]
             self.assertEqual(expected, mock_info.call_args_list)
 
+    @mock.patch.object(filter_scheduler.FilterScheduler, '_schedule')
+    def test_select_destinations_profiled(self, mock_schedule):
+        self.flags(scheduler_profiling=True,
+                   scheduler_profiling_notifications=True)
+        self.addCleanup(profiler.reset_stats)
+        mock_schedule.return_value = [mock.Mock()]
+        spec_obj = objects.RequestSpec(num_instances=1,
+                                       instance_uuid='uuid1')
+
+        with mock.patch.object(self.driver.notifier, 'info') as mock_info:
+            self.driver.select_destinations(self.context, spec_obj)
+
+        mock_info.assert_any_call(self.context,
+                                  'scheduler.select_destinations.profile',
+                                  mock.ANY)
+        stats = profiler.get_stats()
+        self.assertEqual(1, stats['requests'])
+        self.assertEqual(1, stats['stage']['schedule']['count'])
+        self.assertEqual(1, stats['stage']['schedule']['hosts_out'])
+        self.assertEqual(1, stats['stage']['select_destinations']['count'])
+
     def test_select_destinations_no_valid_host(self):
 
         def _return_no_host(*args, **kwargs):
@@ -16,6 +16,8 @@ Tests For Scheduler Host Filters.
 """
 
 import inspect
+import os
+import signal
 import sys
 
 import mock
@@ -24,7 +26,9 @@ from six.moves import range
 from nova import filters
 from nova import loadables
 from nova import objects
+from nova.scheduler import host_table
 from nova import test
+from nova.tests.unit.scheduler import fakes
 
 
 class Filter1(filters.BaseFilter):
@@ -301,3 +305,231 @@ class FiltersTestCase(test.NoDBTestCase):
             cargs = mock_log.call_args[0][0]
             self.assertIn("with instance ID '%s'" % fake_uuid, cargs)
             self.assertIn(exp_output, cargs)
+
+    def test_get_filtered_objects_array_path(self):
+        class FilterA(filters.BaseFilter):
+            def filter_array(self, obj_table, spec_obj):
+                return obj_table.free_ram_mb >= 1024
+
+        class FilterB(filters.BaseFilter):
+            def filter_all(self, list_objs, spec_obj):
+                # no batch path, drop the last object
+                return list_objs[:-1]
+
+        class FilterC(filters.BaseFilter):
+            def filter_array(self, obj_table, spec_obj):
+                return obj_table.num_instances < 2
+
+        hosts = [fakes.FakeHostState('host%s' % i, 'node',
+                                     {'free_ram_mb': 512 * i,
+                                      'num_instances': 3 - i})
+                 for i in range(5)]
+        spec_obj = objects.RequestSpec()
+        with mock.patch.object(self.filter_handler, '_get_object_table',
+                               side_effect=host_table.HostStateTable):
+            result = self.filter_handler.get_filtered_objects(
+                [FilterA(), FilterB(), FilterC()], hosts, spec_obj)
+        # FilterA drops host0 and host1, FilterB drops host4 and FilterC
+        # drops host2
+        self.assertEqual([hosts[3]], result)
+
+    def test_get_filtered_objects_array_path_without_table(self):
+        class FilterA(filters.BaseFilter):
+            def filter_array(self, obj_table, spec_obj):
+                raise AssertionError('should not be called')
+
+            def filter_all(self, list_objs, spec_obj):
+                return list_objs[1:]
+
+        spec_obj = objects.RequestSpec()
+        result = self.filter_handler.get_filtered_objects(
+            [FilterA()], ['obj1', 'obj2'], spec_obj)
+        self.assertEqual(['obj2'], result)
+
+    def test_get_filtered_objects_in_workers(self):
+        class FilterA(filters.BaseFilter):
+            run_in_worker = True
+
+            def _filter_one(self, obj, spec_obj):
+                return obj.startswith('keep')
+
+            def filter_in_worker(self, obj, spec_obj):
+                return self._filter_one(obj, spec_obj) and obj.upper()
+
+            def apply_worker_result(self, obj, result):
+                applied.append((obj, result))
+
+        applied = []
+        executor = mock.Mock()
+        executor.map.side_effect = lambda func, objs: [func(o) for o in objs]
+        spec_obj = objects.RequestSpec()
+        with mock.patch.object(self.filter_handler, '_get_executor',
+                               return_value=executor):
+            result = self.filter_handler.get_filtered_objects(
+                [FilterA()], ['keep1', 'drop', 'keep2'], spec_obj)
+        self.assertEqual(['keep1', 'keep2'], result)
+        self.assertEqual([('keep1', 'KEEP1'), ('keep2', 'KEEP2')], applied)
+        self.assertEqual(1, executor.map.call_count)
+
+    def test_get_filtered_objects_not_in_workers(self):
+        executor = mock.Mock()
+        spec_obj = objects.RequestSpec()
+        with test.nested(
+            mock.patch.object(self.filter_handler, '_get_executor',
+                              return_value=executor),
+            mock.patch.object(Filter1, '_filter_one', return_value=True)
+        ) as (mock_executor, mock_filter_one):
+            result = self.filter_handler.get_filtered_objects(
+                [Filter1()], ['obj1', 'obj2'], spec_obj)
+        self.assertEqual(['obj1', 'obj2'], result)
+        self.assertFalse(executor.map.called)
+
+    def test_get_filtered_objects_ordered(self):
+        calls = []
+
+        class FilterA(filters.BaseFilter):
+            def filter_all(self, list_objs, spec_obj):
+                calls.append('FilterA')
+                return list_objs
+
+        class FilterB(FilterA):
+            def filter_all(self, list_objs, spec_obj):
+                calls.append('FilterB')
+                return list_objs
+
+        spec_obj = objects.RequestSpec()
+        with mock.patch.object(self.filter_handler, '_order_filters',
+                               side_effect=lambda f: list(reversed(f))):
+            self.filter_handler.get_filtered_objects(
+                [FilterA(), FilterB()], ['obj1'], spec_obj)
+        self.assertEqual(['FilterB', 'FilterA'], calls)
+
+    def test_get_filtered_objects_records_stats(self):
+        class FilterA(filters.BaseFilter):
+            def filter_all(self, list_objs, spec_obj):
+                return list_objs[1:]
+
+        class FilterB(filters.BaseFilter):
+            def filter_all(self, list_objs, spec_obj):
+                return list_objs
+
+        spec_obj = objects.RequestSpec()
+        self.filter_handler.get_filtered_objects(
+            [FilterA(), FilterB()], ['obj1', 'obj2', 'obj3', 'obj4'],
+            spec_obj)
+        stats_a = self.filter_handler.filter_stats['FilterA']
+        self.assertEqual(0.75, stats_a.pass_rate)
+        self.assertTrue(stats_a.cost >= 0)
+        stats_b = self.filter_handler.filter_stats['FilterB']
+        self.assertEqual(1.0, stats_b.pass_rate)
+        self.assertTrue(stats_b.cost >= 0)
+
+    def test_filter_stats(self):
+        stats = filters.FilterStats(0.5)
+        stats.update(1.0, 0, 0)
+        self.assertIsNone(stats.cost)
+        stats.update(1.0, 10, 5)
+        self.assertEqual(0.1, stats.cost)
+        self.assertEqual(0.5, stats.pass_rate)
+        stats.update(3.0, 10, 10)
+        self.assertEqual(0.2, stats.cost)
+        self.assertEqual(0.75, stats.pass_rate)
+        self.assertAlmostEqual(0.8, stats.rank())
+        stats.pass_rate = 1.0
+        self.assertEqual(float('inf'), stats.rank())
+
+    def test_order_filters(self):
+        class PinnedFilter(filters.BaseFilter):
+            pinned = True
+
+        pinned = PinnedFilter()
+        filter_a = Filter1()
+        filter_b = Filter2()
+        filter_c = Filter1()
+        keys = {filter_a: 3, filter_b: 1, filter_c: 3}
+        ordered = filters.order_filters(
+            [pinned, filter_a, filter_b, filter_c], keys.get)
+        self.assertEqual([pinned, filter_b, filter_a, filter_c], ordered)
+        ordered = filters.order_filters(
+            [filter_a, pinned, filter_b, filter_c], keys.get)
+        self.assertEqual([filter_b, pinned, filter_a, filter_c], ordered)
+
+
+def _double(x):
+    return x * 2
+
+
+def _get_pid(x):
+    return os.getpid()
+
+
+def _fail_on_7(x):
+    if x == 7:
+        raise ValueError()
+    return x
+
+
+class WorkerPoolTestCase(test.NoDBTestCase):
+
+    def _get_pool(self, *args, **kwargs):
+        pool = filters.WorkerPool(*args, **kwargs)
+
+        def _stop_workers():
+            for worker in list(pool._all):
+                worker.stop()
+        self.addCleanup(_stop_workers)
+        return pool
+
+    def test_map(self):
+        pool = self._get_pool(3)
+        self.assertEqual([i * 2 for i in range(10)],
+                         pool.map(_double, range(10)))
+
+    def test_map_reuses_workers(self):
+        pool = self._get_pool(2)
+        pids = set(pool.map(_get_pid, range(10)))
+        self.assertEqual(set(worker.pid for worker in pool._all), pids)
+        self.assertNotIn(os.getpid(), pids)
+        self.assertEqual(pids, set(pool.map(_get_pid, range(10))))
+        self.assertEqual(2, len(pool._idle))
+
+    @mock.patch.object(filters, '_Worker')
+    def test_map_too_few_objects(self, mock_worker):
+        pool = self._get_pool(4, min_objects_per_worker=5)
+        self.assertEqual([2, 4, 6, 8, 10, 12, 14, 16, 18],
+                         pool.map(_double, range(1, 10)))
+        self.assertFalse(mock_worker.called)
+
+    def test_map_workers_busy(self):
+        pool = self._get_pool(2)
+        busy = pool._acquire(2)
+        self.assertEqual([os.getpid()] * 4, pool.map(_get_pid, range(4)))
+        pool._release(busy)
+        self.assertNotIn(os.getpid(), pool.map(_get_pid, range(4)))
+
+    def test_map_worker_failure(self):
+        pool = self._get_pool(2)
+        self.assertEqual(list(range(10)), pool.map(_fail_on_7, range(10)))
+        # The worker is still used
+        self.assertEqual(2, len(pool._idle))
+
+    def test_map_not_picklable(self):
+        pool = self._get_pool(2)
+        self.assertEqual([i * 2 for i in range(10)],
+                         pool.map(lambda x: x * 2, range(10)))
+        self.assertEqual(2, len(pool._idle))
+
+    def test_map_worker_killed(self):
+        pool = self._get_pool(2)
+        pool.map(_double, range(10))
+        killed = pool._all[0]
+        os.kill(killed.pid, signal.SIGKILL)
+        self.assertEqual([i * 2 for i in range(10)],
+                         pool.map(_double, range(10)))
+        self.assertFalse(killed.alive)
+        self.assertNotIn(killed, pool._all)
+
+        # Replaced by the next call
+        pids = set(pool.map(_get_pid, range(10)))
+        self.assertEqual(2, len(pids))
+        self.assertNotIn(killed.pid, pids)
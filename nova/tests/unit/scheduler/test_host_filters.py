@@ -17,6 +17,9 @@ Tests For Scheduler Host Filters.
 from nova.scheduler import filters
 from nova.scheduler.filters import all_hosts_filter
 from nova.scheduler.filters import compute_filter
+from nova.scheduler.filters import json_filter
+from nova.scheduler.filters import numa_topology_filter
+from nova.scheduler.filters import retry_filter
 from nova import test
 from nova.tests.unit.scheduler import fakes
 
@@ -35,3 +38,44 @@ class HostFiltersTestCase(test.NoDBTestCase):
         filt_cls = all_hosts_filter.AllHostsFilter()
         host = fakes.FakeHostState('host1', 'node1', {})
         self.assertTrue(filt_cls.host_passes(host, {}))
+
+    def test_filter_handler_executor(self):
+        filter_handler = filters.HostFilterHandler()
+        self.assertIsNone(filter_handler._get_executor())
+        self.flags(scheduler_filter_workers=4,
+                   scheduler_filter_worker_min_hosts=50)
+        executor = filter_handler._get_executor()
+        self.assertEqual(4, executor.workers)
+        self.assertEqual(50, executor.min_objects_per_worker)
+
+    def test_filter_handler_order_filters(self):
+        filter_handler = filters.HostFilterHandler()
+        numa = numa_topology_filter.NUMATopologyFilter()
+        json = json_filter.JsonFilter()
+        all_hosts = all_hosts_filter.AllHostsFilter()
+        compute = compute_filter.ComputeFilter()
+        ordered = [numa, json, all_hosts, compute]
+        self.assertEqual(ordered, filter_handler._order_filters(ordered))
+        self.flags(scheduler_order_filters_by_cost=True)
+        self.assertEqual([all_hosts, compute, json, numa],
+                         filter_handler._order_filters(ordered))
+
+    def test_filter_handler_adaptive_order_filters(self):
+        self.flags(scheduler_adaptive_filter_ordering=True)
+        filter_handler = filters.HostFilterHandler()
+        retry = retry_filter.RetryFilter()
+        numa = numa_topology_filter.NUMATopologyFilter()
+        json = json_filter.JsonFilter()
+        all_hosts = all_hosts_filter.AllHostsFilter()
+        ordered = [retry, numa, json, all_hosts]
+        # Nothing is known yet about the filters
+        self.assertEqual(ordered, filter_handler._order_filters(ordered))
+
+        # NUMATopologyFilter costs 0.01 / 0.5 per removed host, JsonFilter
+        # 0.001 / 0.1 and AllHostsFilter never removes any
+        filter_handler.get_filter_stats(retry).update(0.0, 10, 10)
+        filter_handler.get_filter_stats(numa).update(0.1, 10, 5)
+        filter_handler.get_filter_stats(json).update(0.01, 10, 9)
+        filter_handler.get_filter_stats(all_hosts).update(0.0, 10, 10)
+        self.assertEqual([retry, json, numa, all_hosts],
+                         filter_handler._order_filters(ordered))
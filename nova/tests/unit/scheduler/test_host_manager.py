@@ -31,6 +31,7 @@ from nova.compute import vm_states
 from nova import exception
 from nova import objects
 from nova.objects import base as obj_base
+from nova.objects import instance as instance_obj
 from nova.pci import stats as pci_stats
 from nova.scheduler import filters
 from nova.scheduler import host_manager
@@ -38,10 +39,14 @@ from nova import test
 from nova.tests.unit import fake_instance
 from nova.tests.unit import matchers
 from nova.tests.unit.scheduler import fakes
+from nova.tests import uuidsentinel as uuids
+from nova.virt import hardware
 
 CONF = cfg.CONF
 CONF.import_opt('scheduler_tracks_instance_changes',
                 'nova.scheduler.host_manager')
+CONF.import_opt('scheduler_tracks_compute_node_changes',
+                'nova.scheduler.host_manager')
 
 
 class FakeFilterClass1(filters.BaseHostFilter):
@@ -223,6 +228,28 @@ class HostManagerTestCase(test.NoDBTestCase):
                 fake_properties)
         self._verify_result(info, result)
 
+    def test_get_refiltered_hosts_no_placement_filters(self):
+        with mock.patch.object(self.host_manager.filter_handler,
+                               'get_filtered_objects') as mock_filter:
+            result = self.host_manager.get_refiltered_hosts(
+                self.fake_hosts, objects.RequestSpec(), 1)
+            self.assertFalse(mock_filter.called)
+        self.assertEqual(self.fake_hosts, result)
+
+    @mock.patch.object(FakeFilterClass1, 'depends_on_previous_placements',
+                       True)
+    def test_get_refiltered_hosts(self):
+        fake_properties = objects.RequestSpec()
+        with mock.patch.object(self.host_manager.filter_handler,
+                               'get_filtered_objects',
+                               return_value=None) as mock_filter:
+            result = self.host_manager.get_refiltered_hosts(
+                self.fake_hosts, fake_properties, 1)
+            mock_filter.assert_called_once_with(
+                self.host_manager.default_filters, self.fake_hosts,
+                fake_properties, 1)
+        self.assertEqual([], result)
+
     @mock.patch.object(FakeFilterClass2, '_filter_one', return_value=True)
     def test_get_filtered_hosts_with_specified_filters(self, mock_filter_one):
         fake_properties = objects.RequestSpec(ignore_hosts=[],
@@ -572,7 +599,9 @@ class HostManagerTestCase(test.NoDBTestCase):
                 inst_dict=hm._get_instance_info(context, cn1))
         mock_get_by_host.assert_called_once_with(context, cn1.host)
         self.assertTrue(host_state.instances)
-        self.assertEqual(host_state.instances['uuid1'], inst1)
+        instance = host_state.instances['uuid1']
+        self.assertIsInstance(instance, instance_obj.CompactInstance)
+        self.assertEqual(inst1.uuid, instance.uuid)
 
     @mock.patch('nova.objects.InstanceList.get_by_host')
     def test_recreate_instance_info(self, mock_get_by_host):
@@ -799,6 +828,189 @@ class HostManagerChangedNodesTestCase(test.NoDBTestCase):
         self.assertEqual(len(host_states_map), 0)
 
 
+class HostManagerComputeNodeChangesTestCase(test.NoDBTestCase):
+    """Test case for HostManager tracking compute node changes."""
+
+    @mock.patch.object(host_manager.HostManager, '_init_instance_info')
+    @mock.patch.object(host_manager.HostManager, '_init_aggregates')
+    def setUp(self, mock_init_agg, mock_init_inst):
+        super(HostManagerComputeNodeChangesTestCase, self).setUp()
+        self.flags(scheduler_tracks_compute_node_changes=True)
+        self.host_manager = host_manager.HostManager()
+        self.compute_nodes = [
+            objects.ComputeNode(host='host%s' % x,
+                                hypervisor_hostname='node%s' % x,
+                                free_ram_mb=512, vcpus_used=0)
+            for x in range(1, 3)]
+
+    @mock.patch.object(objects.ComputeNodeList, 'get_all')
+    def _load(self, mock_get_all):
+        mock_get_all.return_value = self.compute_nodes
+        nodes = self.host_manager._get_compute_nodes('fake_context')
+        mock_get_all.assert_called_once_with('fake_context')
+        return nodes
+
+    def _delta(self, host, node, **kwargs):
+        return objects.ComputeNode(host=host, hypervisor_hostname=node,
+                                   **kwargs)
+
+    def test_get_compute_nodes_not_tracked(self):
+        self.flags(scheduler_tracks_compute_node_changes=False)
+        hm = host_manager.HostManager()
+        with mock.patch.object(objects.ComputeNodeList, 'get_all',
+                               return_value=self.compute_nodes) as mock_get:
+            hm._get_compute_nodes('fake_context')
+            hm._get_compute_nodes('fake_context')
+            self.assertEqual(2, mock_get.call_count)
+        self.assertIsNone(hm._compute_node_info)
+
+    def test_get_compute_nodes_cached(self):
+        self._load()
+        with mock.patch.object(objects.ComputeNodeList,
+                               'get_all') as mock_get_all:
+            nodes = self.host_manager._get_compute_nodes('fake_context')
+            self.assertFalse(mock_get_all.called)
+        self.assertEqual(sorted(self.compute_nodes, key=id),
+                         sorted(nodes, key=id))
+
+    def test_get_compute_nodes_resync(self):
+        self.flags(scheduler_compute_node_resync_interval=60)
+        self._load()
+        self.host_manager._stale_compute_nodes.add(('host1', 'node1'))
+        self.host_manager._compute_node_info_loaded_at -= (
+            datetime.timedelta(seconds=61))
+        self._load()
+        self.assertEqual(set(), self.host_manager._stale_compute_nodes)
+
+    def test_update_compute_node_applies_delta(self):
+        self._load()
+        self.host_manager.update_compute_node(
+            'fake_context', self._delta('host1', 'node1', free_ram_mb=256),
+            1)
+        self.host_manager.update_compute_node(
+            'fake_context', self._delta('host1', 'node1', vcpus_used=2), 2)
+
+        info = self.host_manager._compute_node_info[('host1', 'node1')]
+        self.assertEqual(2, info['generation'])
+        compute = info['compute']
+        self.assertIs(self.compute_nodes[0], compute)
+        self.assertEqual(256, compute.free_ram_mb)
+        self.assertEqual(2, compute.vcpus_used)
+        self.assertEqual(set(), compute.obj_what_changed())
+        self.assertEqual(set(), self.host_manager._stale_compute_nodes)
+
+    def test_update_compute_node_outdated(self):
+        self._load()
+        self.host_manager.update_compute_node(
+            'fake_context', self._delta('host1', 'node1', free_ram_mb=256),
+            5, epoch=uuids.epoch)
+        self.host_manager.update_compute_node(
+            'fake_context', self._delta('host1', 'node1', free_ram_mb=128),
+            4, epoch=uuids.epoch)
+        info = self.host_manager._compute_node_info[('host1', 'node1')]
+        self.assertEqual(5, info['generation'])
+        self.assertEqual(256, info['compute'].free_ram_mb)
+        self.assertEqual(set(), self.host_manager._stale_compute_nodes)
+
+    def test_update_compute_node_restarted(self):
+        self._load()
+        self.host_manager.update_compute_node(
+            'fake_context', self._delta('host1', 'node1', free_ram_mb=256),
+            5, epoch=uuids.epoch)
+        # The counter starts again with the new epoch
+        self.host_manager.update_compute_node(
+            'fake_context', self._delta('host1', 'node1', free_ram_mb=128),
+            1, epoch=uuids.new_epoch)
+        self.host_manager.update_compute_node(
+            'fake_context', self._delta('host1', 'node1', vcpus_used=2),
+            2, epoch=uuids.new_epoch)
+        info = self.host_manager._compute_node_info[('host1', 'node1')]
+        self.assertEqual(2, info['generation'])
+        self.assertEqual(uuids.new_epoch, info['epoch'])
+        self.assertEqual(128, info['compute'].free_ram_mb)
+        self.assertEqual(2, info['compute'].vcpus_used)
+        self.assertEqual(set([('host1', 'node1')]),
+                         self.host_manager._stale_compute_nodes)
+
+    def test_update_compute_node_restarted_no_epoch(self):
+        self._load()
+        self.host_manager.update_compute_node(
+            'fake_context', self._delta('host1', 'node1', free_ram_mb=256),
+            5)
+        self.host_manager.update_compute_node(
+            'fake_context', self._delta('host1', 'node1', free_ram_mb=128),
+            1)
+        info = self.host_manager._compute_node_info[('host1', 'node1')]
+        self.assertEqual(1, info['generation'])
+        self.assertEqual(128, info['compute'].free_ram_mb)
+        self.assertEqual(set([('host1', 'node1')]),
+                         self.host_manager._stale_compute_nodes)
+
+    @mock.patch.object(objects.ComputeNode, 'get_by_host_and_nodename')
+    def test_update_compute_node_missed_update(self, mock_get):
+        self._load()
+        self.host_manager.update_compute_node(
+            'fake_context', self._delta('host1', 'node1', free_ram_mb=256),
+            1)
+        self.host_manager.update_compute_node(
+            'fake_context', self._delta('host1', 'node1', free_ram_mb=128),
+            3)
+        self.assertEqual(set([('host1', 'node1')]),
+                         self.host_manager._stale_compute_nodes)
+        self.assertEqual(256, self.compute_nodes[0].free_ram_mb)
+
+        reloaded = objects.ComputeNode(host='host1',
+                                       hypervisor_hostname='node1',
+                                       free_ram_mb=64)
+        mock_get.return_value = reloaded
+        nodes = self.host_manager._get_compute_nodes('fake_context')
+        mock_get.assert_called_once_with('fake_context', 'host1', 'node1')
+        self.assertIn(reloaded, nodes)
+        self.assertNotIn(self.compute_nodes[0], nodes)
+        info = self.host_manager._compute_node_info[('host1', 'node1')]
+        self.assertIsNone(info['generation'])
+
+    @mock.patch.object(objects.ComputeNode, 'get_by_host_and_nodename')
+    def test_update_compute_node_unknown(self, mock_get):
+        self._load()
+        self.host_manager.update_compute_node(
+            'fake_context', self._delta('host3', 'node3', free_ram_mb=256),
+            1)
+        self.assertEqual(set([('host3', 'node3')]),
+                         self.host_manager._stale_compute_nodes)
+
+        new_node = objects.ComputeNode(host='host3',
+                                       hypervisor_hostname='node3')
+        mock_get.return_value = new_node
+        nodes = self.host_manager._get_compute_nodes('fake_context')
+        self.assertEqual(3, len(nodes))
+        self.assertIn(new_node, nodes)
+
+    @mock.patch.object(objects.ComputeNode, 'get_by_host_and_nodename')
+    def test_update_compute_node_deleted(self, mock_get):
+        self._load()
+        self.host_manager._stale_compute_nodes.add(('host2', 'node2'))
+        mock_get.side_effect = exception.ComputeHostNotFound(host='host2')
+        nodes = self.host_manager._get_compute_nodes('fake_context')
+        self.assertEqual([self.compute_nodes[0]], nodes)
+
+    def test_update_compute_node_before_load(self):
+        self.host_manager.update_compute_node(
+            'fake_context', self._delta('host1', 'node1', free_ram_mb=256),
+            1)
+        self.assertIsNone(self.host_manager._compute_node_info)
+        self.assertEqual(set(), self.host_manager._stale_compute_nodes)
+
+    @mock.patch.object(objects.ServiceList, 'get_by_binary')
+    def test_get_service_refs_cached(self, mock_get_by_binary):
+        mock_get_by_binary.return_value = fakes.SERVICES
+        self.host_manager._get_service_refs('fake_context')
+        refs = self.host_manager._get_service_refs('fake_context')
+        mock_get_by_binary.assert_called_once_with('fake_context',
+                                                   'nova-compute')
+        self.assertEqual(set(s.host for s in fakes.SERVICES), set(refs))
+
+
 class HostStateTestCase(test.NoDBTestCase):
     """Test case for HostState class."""
 
@@ -947,10 +1159,10 @@ class HostStateTestCase(test.NoDBTestCase):
 
         self.assertIsNone(host.updated)
         host.consume_from_request(spec_obj)
-        numa_fit_mock.assert_called_once_with(fake_host_numa_topology,
-                                              fake_numa_topology,
-                                              limits=None, pci_requests=None,
-                                              pci_stats=None)
+        numa_fit_mock.assert_called_once_with(
+            fake_host_numa_topology, fake_numa_topology, limits=None,
+            pci_requests=None, pci_stats=None,
+            cache=hardware.get_numa_fit_cache())
         numa_usage_mock.assert_called_once_with(host, fake_instance)
         sync_mock.assert_called_once_with(("fakehost", "fakenode"))
         self.assertEqual(fake_host_numa_topology, host.numa_topology)
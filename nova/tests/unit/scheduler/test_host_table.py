@@ -0,0 +1,94 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Tests For HostStateTable.
+"""
+
+from nova.scheduler import host_table
+from nova import test
+from nova.tests.unit.scheduler import fakes
+
+
+class HostStateTableTestCase(test.NoDBTestCase):
+
+    def setUp(self):
+        super(HostStateTableTestCase, self).setUp()
+        self.hosts = [
+            fakes.FakeHostState('host%s' % i, 'node%s' % i,
+                                {'free_ram_mb': 512 * i,
+                                 'service': {'disabled': i == 2}})
+            for i in range(4)]
+        self.table = host_table.HostStateTable(self.hosts)
+
+    def test_numeric_column(self):
+        self.assertEqual([0, 512, 1024, 1536],
+                         self.table.free_ram_mb.tolist())
+        # columns are only read once
+        self.hosts[0].free_ram_mb = 42
+        self.assertEqual(0, self.table.free_ram_mb[0])
+
+    def test_numeric_column_none_is_zero(self):
+        self.hosts[1].ram_allocation_ratio = None
+        self.assertEqual(0, self.table.ram_allocation_ratio[1])
+
+    def test_boolean_column(self):
+        self.assertEqual([False, False, True, False],
+                         self.table.service_disabled.tolist())
+
+    def test_unknown_column(self):
+        self.assertRaises(AttributeError, getattr, self.table, 'foo')
+
+    def test_compress(self):
+        self.table.free_ram_mb
+        table = self.table.compress([True, False, True, False])
+        self.assertEqual([self.hosts[0], self.hosts[2]], table.objs)
+        self.assertEqual([0, 1024], table.free_ram_mb.tolist())
+
+    def test_select(self):
+        self.table.free_ram_mb
+        table = self.table.select([self.hosts[3], self.hosts[1]])
+        self.assertEqual([self.hosts[3], self.hosts[1]], table.objs)
+        self.assertEqual([1536, 512], table.free_ram_mb.tolist())
+
+    def test_select_unknown_object(self):
+        other = fakes.FakeHostState('other', 'other', {'free_ram_mb': 1})
+        table = self.table.select([self.hosts[1], other])
+        self.assertEqual([self.hosts[1], other], table.objs)
+        self.assertEqual([512, 1], table.free_ram_mb.tolist())
+
+    def test_map(self):
+        result = self.table.map(lambda h: h.free_ram_mb * 2)
+        self.assertEqual([0, 1024, 2048, 3072], result.tolist())
+
+    def test_map_where(self):
+        calls = []
+
+        def _func(host_state):
+            calls.append(host_state)
+            return True
+
+        result = self.table.map(_func, dtype=bool,
+                                where=[False, True, True, False])
+        self.assertEqual([False, True, True, False], result.tolist())
+        self.assertEqual([self.hosts[1], self.hosts[2]], calls)
+
+    def test_set_limits(self):
+        self.table.set_limits('vcpu', [1, 2, 3, 4],
+                              [True, False, False, True])
+        self.assertEqual({'vcpu': 1.0}, self.hosts[0].limits)
+        self.assertEqual({}, self.hosts[1].limits)
+        self.assertEqual({'vcpu': 4.0}, self.hosts[3].limits)
+
+    def test_set_limits_scalar(self):
+        self.table.set_limits('disk_gb', 10, [True, True, False, False])
+        self.assertEqual({'disk_gb': 10.0}, self.hosts[1].limits)
+        self.assertEqual({}, self.hosts[2].limits)
@@ -0,0 +1,157 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Tests For the scheduler profiler.
+"""
+
+import mock
+
+from nova import context
+from nova import objects
+from nova.scheduler import profiler
+from nova import test
+
+
+class RequestProfileTestCase(test.NoDBTestCase):
+
+    def test_record_counts_db_queries_since_previous_record(self):
+        profile = profiler.RequestProfile('req-1', 'uuid1')
+        profile.db_queries = 3
+        profile.record('filter', 'RamFilter', 0.001, 10, 5)
+        profile.db_queries = 4
+        profile.record('filter', 'DiskFilter', 0.002, 5, 5)
+        profile.record('stage', 'schedule', 0.01, db_queries=4)
+        self.assertEqual([3, 1, 4],
+                         [r['db_queries'] for r in profile.records])
+        self.assertEqual({'request_id': 'req-1',
+                          'instance_uuid': 'uuid1',
+                          'records': profile.records},
+                         profile.to_dict())
+
+
+class ProfileStatsTestCase(test.NoDBTestCase):
+
+    def test_add(self):
+        stats = profiler.ProfileStats()
+        for elapsed in (0.0005, 0.003, 0.2):
+            profile = profiler.RequestProfile('req')
+            profile.record('filter', 'RamFilter', elapsed, 10, 4)
+            stats.add(profile)
+        result = stats.to_dict()
+        self.assertEqual(3, result['requests'])
+        histogram = result['filter']['RamFilter']
+        self.assertEqual(3, histogram['count'])
+        self.assertAlmostEqual(203.5, histogram['sum_ms'])
+        self.assertEqual(30, histogram['hosts_in'])
+        self.assertEqual(12, histogram['hosts_out'])
+        self.assertEqual(len(profiler.BUCKETS_MS) + 1,
+                         len(histogram['buckets']))
+        self.assertEqual([None, 0], histogram['buckets'][-1])
+        counts = dict((bound, count) for bound, count
+                      in histogram['buckets'])
+        self.assertEqual(1, counts[0.5])
+        self.assertEqual(1, counts[5])
+        self.assertEqual(1, counts[250])
+
+        stats.reset()
+        self.assertEqual({'requests': 0}, stats.to_dict())
+
+    def test_percentile_ms(self):
+        histogram = {'count': 100,
+                     'buckets': [[1, 50], [2.5, 0], [5, 49], [None, 1]]}
+        self.assertEqual(1, profiler.percentile_ms(histogram, 50))
+        self.assertEqual(5, profiler.percentile_ms(histogram, 99))
+        self.assertIsNone(profiler.percentile_ms(histogram, 100))
+        self.assertIsNone(profiler.percentile_ms(
+            {'count': 0, 'buckets': [[1, 0], [None, 0]]}, 50))
+
+
+class ProfileRequestTestCase(test.NoDBTestCase):
+
+    def setUp(self):
+        super(ProfileRequestTestCase, self).setUp()
+        self.context = context.RequestContext('fake_user', 'fake_project')
+        self.spec_obj = objects.RequestSpec(instance_uuid='uuid1')
+        self.notifier = mock.Mock()
+        self.addCleanup(profiler.reset_stats)
+        profiler.reset_stats()
+
+    def test_disabled(self):
+        with profiler.profile_request(self.context, self.spec_obj,
+                                      self.notifier) as profile:
+            self.assertIsNone(profile)
+            self.assertIsNone(profiler.get_current())
+            with profiler.Stage('schedule'):
+                profiler.record('filter', 'RamFilter', 0.001, 1, 1)
+        self.assertFalse(self.notifier.info.called)
+        self.assertEqual({'requests': 0}, profiler.get_stats())
+
+    @mock.patch.object(profiler, 'LOG')
+    def test_enabled(self, mock_log):
+        self.flags(scheduler_profiling=True)
+        with profiler.profile_request(self.context, self.spec_obj,
+                                      self.notifier) as profile:
+            self.assertIs(profile, profiler.get_current())
+            with profiler.Stage('schedule', hosts_in=10) as stage:
+                profiler.record('filter', 'RamFilter', 0.001, 10, 5)
+                profiler.record('weigher', 'RAMWeigher', 0.001, 5, 5)
+                stage.hosts_out = 1
+        self.assertIsNone(profiler.get_current())
+        self.assertEqual(
+            [('filter', 'RamFilter'), ('weigher', 'RAMWeigher'),
+             ('stage', 'schedule'), ('stage', 'select_destinations')],
+            [(r['kind'], r['name']) for r in profile.records])
+        self.assertEqual(10, profile.records[2]['hosts_in'])
+        self.assertEqual(1, profile.records[2]['hosts_out'])
+        self.assertEqual(self.context.request_id, profile.request_id)
+        self.assertEqual('uuid1', profile.instance_uuid)
+
+        stats = profiler.get_stats()
+        self.assertEqual(1, stats['requests'])
+        self.assertEqual(1, stats['filter']['RamFilter']['count'])
+        self.assertEqual(1, stats['weigher']['RAMWeigher']['count'])
+        self.assertFalse(self.notifier.info.called)
+        self.assertTrue(mock_log.info.called)
+
+    def test_enabled_notification(self):
+        self.flags(scheduler_profiling=True,
+                   scheduler_profiling_notifications=True)
+        with profiler.profile_request(self.context, self.spec_obj,
+                                      self.notifier) as profile:
+            pass
+        self.notifier.info.assert_called_once_with(
+            self.context, 'scheduler.select_destinations.profile',
+            profile.to_dict())
+
+    def test_enabled_error(self):
+        self.flags(scheduler_profiling=True)
+
+        def _profile():
+            with profiler.profile_request(self.context, self.spec_obj):
+                raise test.TestingException()
+
+        self.assertRaises(test.TestingException, _profile)
+        self.assertIsNone(profiler.get_current())
+        self.assertEqual(1, profiler.get_stats()['requests'])
+
+    def test_db_queries(self):
+        self.flags(scheduler_profiling=True)
+        with profiler.profile_request(self.context,
+                                      self.spec_obj) as profile:
+            with profiler.Stage('get_all_host_states'):
+                profiler._count_db_query(None, None, 'SELECT 1', (), None,
+                                         False)
+                profiler._count_db_query(None, None, 'SELECT 1', (), None,
+                                         False)
+            profiler.record('filter', 'RamFilter', 0.001, 1, 1)
+        self.assertEqual([2, 0, 2],
+                         [r['db_queries'] for r in profile.records])
@@ -122,3 +122,27 @@ class SchedulerRpcAPITestCase(test.NoDBTestCase):
                 instance_uuids=['fake1', 'fake2'],
                 fanout=True,
                 version='4.2')
+
+    def test_update_compute_node(self):
+        self._test_scheduler_api('update_compute_node', rpc_method='cast',
+                compute_node='fake_compute_node',
+                generation=1,
+                epoch='fake_epoch',
+                fanout=True,
+                version='4.4')
+
+    def test_get_profile_stats(self):
+        self._test_scheduler_api('get_profile_stats', rpc_method='call',
+                version='4.5')
+
+    def test_update_compute_node_old_scheduler(self):
+        ctxt = context.RequestContext('fake_user', 'fake_project')
+        rpcapi = scheduler_rpcapi.SchedulerAPI()
+        with test.nested(
+            mock.patch.object(rpcapi.client, 'can_send_version',
+                              return_value=False),
+            mock.patch.object(rpcapi.client, 'prepare')
+        ) as (mock_csv, mock_prepare):
+            rpcapi.update_compute_node(ctxt, 'fake_compute_node', 1)
+            mock_csv.assert_called_once_with('4.4')
+            self.assertFalse(mock_prepare.called)
@@ -106,6 +106,18 @@ class SchedulerManagerTestCase(test.NoDBTestCase):
                                                 mock.sentinel.host_name,
                                                 mock.sentinel.instance_uuid)
 
+    def test_update_compute_node(self):
+        with mock.patch.object(self.manager.driver.host_manager,
+                               'update_compute_node') as mock_update:
+            self.manager.update_compute_node(mock.sentinel.context,
+                                             mock.sentinel.compute_node,
+                                             mock.sentinel.generation,
+                                             epoch=mock.sentinel.epoch)
+            mock_update.assert_called_once_with(mock.sentinel.context,
+                                                mock.sentinel.compute_node,
+                                                mock.sentinel.generation,
+                                                epoch=mock.sentinel.epoch)
+
     def test_sync_instance_info(self):
         with mock.patch.object(self.manager.driver.host_manager,
                                'sync_instance_info') as mock_sync:
@@ -116,6 +128,12 @@ class SchedulerManagerTestCase(test.NoDBTestCase):
                                               mock.sentinel.host_name,
                                               mock.sentinel.instance_uuids)
 
+    @mock.patch('nova.scheduler.profiler.get_stats')
+    def test_get_profile_stats(self, mock_get_stats):
+        self.assertEqual(mock_get_stats.return_value,
+                         self.manager.get_profile_stats(self.context))
+        mock_get_stats.assert_called_once_with()
+
 
 class SchedulerTestCase(test.NoDBTestCase):
     """Test case for base scheduler driver class."""
@@ -151,3 +151,21 @@ class SoftAntiAffinityWeigherTestCase(SoftWeigherTestBase):
                       expected_weight=0.0,
                       expected_host='host2')
         self.assertEqual(1, mock_log.warn.call_count)
+
+
+class VectorizedSoftAffinityWeigherTestCase(SoftAffinityWeigherTestCase):
+    """Run the same tests through the array weighing path."""
+
+    def setUp(self):
+        super(VectorizedSoftAffinityWeigherTestCase, self).setUp()
+        self.flags(scheduler_use_vectorized_weighers=True)
+
+
+class VectorizedSoftAntiAffinityWeigherTestCase(
+        SoftAntiAffinityWeigherTestCase):
+    """Run the same tests through the array weighing path."""
+
+    def setUp(self):
+        super(VectorizedSoftAntiAffinityWeigherTestCase,
+              self).setUp()
+        self.flags(scheduler_use_vectorized_weighers=True)
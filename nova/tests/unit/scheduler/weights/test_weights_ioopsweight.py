@@ -66,3 +66,11 @@ class IoOpsWeigherTestCase(test.NoDBTestCase):
         self._do_test(io_ops_weight_multiplier=2.0,
                       expected_weight=2.0,
                       expected_host='host4')
+
+
+class VectorizedIoOpsWeigherTestCase(IoOpsWeigherTestCase):
+    """Run the same tests through the array weighing path."""
+
+    def setUp(self):
+        super(VectorizedIoOpsWeigherTestCase, self).setUp()
+        self.flags(scheduler_use_vectorized_weighers=True)
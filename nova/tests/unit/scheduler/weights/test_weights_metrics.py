@@ -181,3 +181,11 @@ class MetricsWeigherTestCase(test.NoDBTestCase):
         self.flags(required=False, group='metrics')
         setting = [idle + '=0.0001', user + '=-1']
         self._do_test(setting, 1.0, 'host5')
+
+
+class VectorizedMetricsWeigherTestCase(MetricsWeigherTestCase):
+    """Run the same tests through the array weighing path."""
+
+    def setUp(self):
+        super(VectorizedMetricsWeigherTestCase, self).setUp()
+        self.flags(scheduler_use_vectorized_weighers=True)
@@ -109,3 +109,11 @@ class RamWeigherTestCase(test.NoDBTestCase):
         weighed_host = weights[-1]
         self.assertEqual(0, weighed_host.weight)
         self.assertEqual('negative', weighed_host.obj.host)
+
+
+class VectorizedRamWeigherTestCase(RamWeigherTestCase):
+    """Run the same tests through the array weighing path."""
+
+    def setUp(self):
+        super(VectorizedRamWeigherTestCase, self).setUp()
+        self.flags(scheduler_use_vectorized_weighers=True)
@@ -0,0 +1,142 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+
+import fixtures
+
+from nova import objects
+from nova import test
+from nova.tests.benchmarks import instances as instances_benchmark
+from nova.tests.benchmarks import quota as quota_benchmark
+from nova.tests.benchmarks import scheduler as scheduler_benchmark
+
+
+class SchedulerBenchmarkTestCase(test.NoDBTestCase):
+
+    def setUp(self):
+        super(SchedulerBenchmarkTestCase, self).setUp()
+        self.fleet = scheduler_benchmark.Fleet(50, seed=1)
+        self.requests = scheduler_benchmark.generate_requests(20, seed=1)
+
+    def test_fleet(self):
+        self.assertEqual(50, len(self.fleet))
+        self.assertEqual(50, len(self.fleet.services))
+        self.assertEqual(50, sum(self.fleet.profiles.values()))
+        self.assertTrue(any(compute.numa_topology
+                            for compute in self.fleet.compute_nodes))
+        self.assertTrue(any(compute.pci_device_pools
+                            for compute in self.fleet.compute_nodes))
+        zones = [agg for agg in self.fleet.aggregates
+                 if 'availability_zone' in agg.metadata]
+        self.assertEqual(scheduler_benchmark.NUM_AVAILABILITY_ZONES,
+                         len(zones))
+        self.assertEqual(50, sum(len(agg.hosts) for agg in zones))
+
+    def test_fleet_seed(self):
+        def _resources(fleet):
+            return [(compute.host, compute.vcpus, compute.vcpus_used,
+                     compute.numa_topology)
+                    for compute in fleet.compute_nodes]
+
+        fleet = scheduler_benchmark.Fleet(50, seed=1)
+        self.assertEqual(_resources(self.fleet), _resources(fleet))
+
+    def test_generate_requests(self):
+        self.assertEqual(20, len(self.requests))
+        for primitive in self.requests:
+            spec_obj = objects.RequestSpec.obj_from_primitive(primitive)
+            self.assertIn(spec_obj.flavor.name, scheduler_benchmark.FLAVORS)
+
+    def test_trace(self):
+        path = os.path.join(self.useFixture(fixtures.TempDir()).path,
+                            'trace.json')
+        scheduler_benchmark.save_trace(path, self.requests)
+        requests = scheduler_benchmark.load_trace(path)
+        self.assertEqual(
+            [primitive['nova_object.data']['instance_uuid']
+             for primitive in self.requests],
+            [objects.RequestSpec.obj_from_primitive(primitive).instance_uuid
+             for primitive in requests])
+
+    def test_run_benchmark(self):
+        for name in ('default', 'full'):
+            result = scheduler_benchmark.run_benchmark(
+                self.fleet, self.requests,
+                scheduler_benchmark.CONFIGURATIONS[name])
+            self.assertEqual(50, result['hosts'])
+            self.assertEqual(20, result['requests'])
+            self.assertLess(result['failures'], 20)
+            self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+            self.assertLessEqual(result['p99_ms'], result['max_ms'])
+            self.assertGreater(result['filter_checks_per_sec'], 0)
+            self.assertGreater(result['host_state_bytes'], 0)
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(50, scheduler_benchmark._percentile(values, 50))
+        self.assertEqual(99, scheduler_benchmark._percentile(values, 99))
+        self.assertEqual(0.0, scheduler_benchmark._percentile([], 99))
+
+
+class QuotaBenchmarkTestCase(test.TestCase):
+
+    def test_run_benchmark(self):
+        for driver_cls in quota_benchmark.DRIVERS.values():
+            result = quota_benchmark.run_benchmark(driver_cls, boots=6,
+                                                   users=2)
+            self.assertEqual(6, result['boots'])
+            self.assertEqual(0, result['failures'])
+            self.assertEqual(6, result['instances_in_use'])
+            self.assertEqual(0, result['instances_reserved'])
+            self.assertGreater(result['boots_per_sec'], 0)
+            self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+
+
+class InstancesBenchmarkTestCase(test.NoDBTestCase):
+
+    def test_run_benchmark(self):
+        db_instances = instances_benchmark.generate_db_instances(20, seed=1)
+        regular = instances_benchmark.run_benchmark(db_instances)
+        compact = instances_benchmark.run_benchmark(db_instances,
+                                                    form='compact')
+        promoted = instances_benchmark.run_benchmark(db_instances,
+                                                     form='promoted')
+        self.assertEqual('regular', regular['form'])
+        self.assertEqual('compact', compact['form'])
+        self.assertEqual('promoted', promoted['form'])
+        self.assertEqual(20, compact['instances'])
+        self.assertLess(compact['bytes_per_instance'],
+                        regular['bytes_per_instance'])
+        # The fields of a promoted instance are back in its attribute dict
+        self.assertGreater(promoted['bytes_per_instance'],
+                           compact['bytes_per_instance'])
+        self.assertGreaterEqual(compact['read_ms'], 0)
+
+    def test_load_instances(self):
+        db_instances = instances_benchmark.generate_db_instances(2, seed=1)
+        regular = instances_benchmark.load_instances(db_instances)
+        compact = instances_benchmark.load_instances(db_instances,
+                                                     form='compact')
+        promoted = instances_benchmark.load_instances(db_instances,
+                                                      form='promoted')
+        self.assertEqual([objects.Instance] * 2,
+                         [type(instance) for instance in regular])
+        self.assertEqual([None] * 2, [instance._compact_layout
+                                      for instance in promoted])
+        self.assertEqual(
+            [objects.base.obj_to_primitive(instance) for instance in regular],
+            [objects.base.obj_to_primitive(instance) for instance in compact])
+        self.assertEqual(
+            [objects.base.obj_to_primitive(instance) for instance in regular],
+            [objects.base.obj_to_primitive(instance)
+             for instance in promoted])
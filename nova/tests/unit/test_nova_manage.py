@@ -13,11 +13,13 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import os
 from six.moves import StringIO
 import sys
 
 import fixtures
 import mock
+from oslo_serialization import jsonutils
 
 from nova.cmd import manage
 from nova import context
@@ -388,7 +390,8 @@ class DBCommandsTestCase(test.NoDBTestCase):
     def _test_archive_deleted_rows(self, mock_db_archive, verbose=False):
         self.useFixture(fixtures.MonkeyPatch('sys.stdout', StringIO()))
         self.commands.archive_deleted_rows(20, verbose=verbose)
-        mock_db_archive.assert_called_once_with(20)
+        mock_db_archive.assert_called_once_with(20, marks=None,
+                                                workers=1)
         output = sys.stdout.getvalue()
         if verbose:
             expected = '''\
@@ -415,10 +418,64 @@ class DBCommandsTestCase(test.NoDBTestCase):
     def test_archive_deleted_rows_verbose_no_results(self, mock_db_archive):
         self.useFixture(fixtures.MonkeyPatch('sys.stdout', StringIO()))
         self.commands.archive_deleted_rows(20, verbose=True)
-        mock_db_archive.assert_called_once_with(20)
+        mock_db_archive.assert_called_once_with(20, marks=None,
+                                                workers=1)
         output = sys.stdout.getvalue()
         self.assertIn('Nothing was archived.', output)
 
+    def test_archive_deleted_rows_negative_workers(self):
+        self.assertEqual(1, self.commands.archive_deleted_rows(20, workers=0))
+
+    @mock.patch.object(db, 'archive_deleted_rows',
+                       side_effect=[dict(instances=10), {}])
+    def test_archive_deleted_rows_until_complete(self, mock_db_archive):
+        self.useFixture(fixtures.MonkeyPatch('sys.stdout', StringIO()))
+        self.commands.archive_deleted_rows(None, until_complete=True,
+                                           workers='2')
+        self.assertEqual([mock.call(1000, marks={}, workers=2)] * 2,
+                         mock_db_archive.call_args_list)
+        output = sys.stdout.getvalue()
+        self.assertIn('Archived 10 rows', output)
+
+    @mock.patch('time.sleep')
+    @mock.patch.object(db, 'archive_deleted_rows')
+    def test_archive_deleted_rows_until_complete_marks(self, mock_db_archive,
+                                                       mock_sleep):
+        def fake_archive(max_rows, marks, workers):
+            if marks:
+                # Nothing left past the mark
+                marks.clear()
+                return {}
+            if mock_db_archive.call_count == 1:
+                marks['instances'] = 5
+                return dict(instances=5)
+            return {}
+
+        mock_db_archive.side_effect = fake_archive
+        self.useFixture(fixtures.MonkeyPatch('sys.stdout', StringIO()))
+        self.commands.archive_deleted_rows(5, until_complete=True,
+                                           sleep='0.5')
+        # A last pass from the start of the tables finds nothing left
+        self.assertEqual(3, mock_db_archive.call_count)
+        self.assertEqual([mock.call(0.5)] * 2, mock_sleep.call_args_list)
+
+    @mock.patch.object(db, 'archive_deleted_rows')
+    def test_archive_deleted_rows_marks_file(self, mock_db_archive):
+        def fake_archive(max_rows, marks, workers):
+            marks['instances'] = marks.get('instances', 0) + max_rows
+            return dict(instances=max_rows)
+
+        mock_db_archive.side_effect = fake_archive
+        marks_file = os.path.join(self.useFixture(fixtures.TempDir()).path,
+                                  'marks.json')
+        self.commands.archive_deleted_rows(5, marks_file=marks_file)
+        with open(marks_file) as f:
+            self.assertEqual({'instances': 5}, jsonutils.loads(f.read()))
+        # The next run resumes from the mark
+        self.commands.archive_deleted_rows(5, marks_file=marks_file)
+        with open(marks_file) as f:
+            self.assertEqual({'instances': 10}, jsonutils.loads(f.read()))
+
     @mock.patch.object(migration, 'db_null_instance_uuid_scan',
                        return_value={'foo': 0})
     def test_null_instance_uuid_scan_no_records_found(self, mock_scan):
@@ -459,6 +516,46 @@ class DBCommandsTestCase(test.NoDBTestCase):
         self.commands.sync(version=4)
         sqla_sync.assert_called_once_with(version=4, database='main')
 
+    def _write_profile_report(self, report_dir, name, count):
+        histogram = {'count': count, 'statements': 3 * count, 'rows': count,
+                     'sum_ms': 2.0 * count,
+                     'buckets': [[1, 0], [2.5, count], [None, 0]],
+                     'max_calls_per_request': count, 'operations': {}}
+        report = {'started_at': '2016-01-01T00:00:00',
+                  'functions': {'instance_get_by_uuid': histogram},
+                  'slow_statements': [
+                      {'statement': 'SELECT * FROM instances',
+                       'elapsed_ms': 150.0, 'function': 'instance_get_all',
+                       'operation': 'GET ServersController.detail',
+                       'request_id': 'req-%d' % count}]}
+        with open(os.path.join(report_dir, name), 'w') as f:
+            f.write(jsonutils.dumps(report))
+
+    def test_profile_report(self):
+        report_dir = self.useFixture(fixtures.TempDir()).path
+        self._write_profile_report(report_dir, 'nova-api-a-1.json', 2)
+        self._write_profile_report(report_dir, 'nova-compute-b-2.json', 8)
+        output = StringIO()
+        self.useFixture(fixtures.MonkeyPatch('sys.stdout', output))
+        self.assertIsNone(self.commands.profile_report(report_dir))
+        result = output.getvalue()
+        self.assertIn('Processes: 2', result)
+        self.assertIn('instance_get_by_uuid', result)
+        # 10 calls issuing 30 statements, 2 ms each, 8 at most for a request
+        self.assertIn('     10         30        3.0', result)
+        self.assertIn('2.00      2.5      2.5            8', result)
+        self.assertIn('GET ServersController.detail  req-8', result)
+        self.assertIn('SELECT * FROM instances', result)
+
+    def test_profile_report_no_dir(self):
+        self.useFixture(fixtures.MonkeyPatch('sys.stdout', StringIO()))
+        self.assertEqual(1, self.commands.profile_report())
+
+    def test_profile_report_no_report(self):
+        report_dir = self.useFixture(fixtures.TempDir()).path
+        self.useFixture(fixtures.MonkeyPatch('sys.stdout', StringIO()))
+        self.assertEqual(1, self.commands.profile_report(report_dir))
+
 
 class ApiDbCommandsTestCase(test.TestCase):
     def setUp(self):
@@ -488,6 +585,44 @@ class ServiceCommandsTestCase(test.TestCase):
         self.assertEqual(2, self.commands.disable('nohost', 'noservice'))
 
 
+class SchedulerCommandsTestCase(test.NoDBTestCase):
+    def setUp(self):
+        super(SchedulerCommandsTestCase, self).setUp()
+        self.output = StringIO()
+        self.useFixture(fixtures.MonkeyPatch('sys.stdout', self.output))
+        self.commands = manage.SchedulerCommands()
+
+    @mock.patch('nova.scheduler.rpcapi.SchedulerAPI.get_profile_stats')
+    def test_profile(self, mock_get_stats):
+        histogram = {'count': 2, 'sum_ms': 3.0,
+                     'buckets': [[1, 1], [2.5, 1], [None, 0]],
+                     'hosts_in': 20, 'hosts_out': 10, 'db_queries': 0}
+        mock_get_stats.return_value = {
+            'requests': 2,
+            'stage': {'schedule': histogram},
+            'filter': {'RamFilter': histogram}}
+        self.commands.profile()
+        result = self.output.getvalue()
+        self.assertIn('Profiled requests: 2', result)
+        self.assertIn('schedule', result)
+        self.assertIn('RamFilter', result)
+        self.assertIn('1.50', result)
+
+    @mock.patch('nova.scheduler.rpcapi.SchedulerAPI.get_profile_stats')
+    def test_profile_kind(self, mock_get_stats):
+        histogram = {'count': 1, 'sum_ms': 1.0,
+                     'buckets': [[1, 1], [None, 0]],
+                     'hosts_in': 10, 'hosts_out': 5, 'db_queries': 0}
+        mock_get_stats.return_value = {
+            'requests': 1,
+            'stage': {'schedule': histogram},
+            'filter': {'RamFilter': histogram}}
+        self.commands.profile(kind='filter')
+        result = self.output.getvalue()
+        self.assertNotIn('schedule', result)
+        self.assertIn('RamFilter', result)
+
+
 class CellCommandsTestCase(test.TestCase):
     def setUp(self):
         super(CellCommandsTestCase, self).setUp()
@@ -16,6 +16,7 @@
 
 import datetime
 
+import mock
 from oslo_config import cfg
 from oslo_utils import timeutils
 from six.moves import range
@@ -1818,7 +1819,7 @@ class DbQuotaDriverTestCase(test.TestCase):
         def fake_get_project_quotas(context, resources, project_id,
                                     quota_class=None, defaults=True,
                                     usages=True, remains=False,
-                                    project_quotas=None):
+                                    project_quotas=None, limits=None):
             self.calls.append('get_project_quotas')
             result = {}
             for k, v in resources.items():
@@ -1846,7 +1847,7 @@ class DbQuotaDriverTestCase(test.TestCase):
                                                    project_id, quotas,
                                                    quota_class=None,
                                                    defaults=True, usages=None,
-                                                   remains=False):
+                                                   remains=False, limits=None):
             self.calls.append('_process_quotas')
             result = {}
             for k, v in resources.items():
@@ -2090,7 +2091,7 @@ class DbQuotaDriverTestCase(test.TestCase):
         def fake_get_project_quotas(context, resources, project_id,
                                     quota_class=None, defaults=True,
                                     usages=True, remains=False,
-                                    project_quotas=None):
+                                    project_quotas=None, limits=None):
             self.calls.append('get_project_quotas')
             return {k: dict(limit=v.default) for k, v in resources.items()}
 
@@ -2172,6 +2173,65 @@ class DbQuotaDriverTestCase(test.TestCase):
                 server_group_members=10,
                 ))
 
+    def test_get_quotas_limits(self):
+        self._stub_quota_class_get_default()
+        self._stub_quota_class_get_all_by_name()
+        limits = {'default': {'class_name': 'default', 'cores': 30},
+                  'class': {'class_name': 'test_class', 'ram': 1024},
+                  'project': {'project_id': 'test_project', 'instances': 7},
+                  'user': {'project_id': 'test_project',
+                           'user_id': 'fake_user', 'instances': 3}}
+        keys = ['instances', 'cores', 'ram', 'floating_ips']
+        context = FakeContext('test_project', 'test_class')
+        quotas = self.driver._get_quotas(context, quota.QUOTAS._resources,
+                                         keys, True,
+                                         project_id='test_project',
+                                         limits=limits)
+        user_quotas = self.driver._get_quotas(context,
+                                              quota.QUOTAS._resources,
+                                              keys, True,
+                                              project_id='test_project',
+                                              user_id='fake_user',
+                                              limits=limits)
+
+        self.assertEqual([], self.calls)
+        self.assertEqual(dict(instances=7, cores=30, ram=1024,
+                              floating_ips=10), quotas)
+        self.assertEqual(dict(instances=3, cores=30, ram=1024,
+                              floating_ips=10), user_quotas)
+
+    def test_get_quotas_limits_other_class(self):
+        self._stub_quota_class_get_default()
+        self._stub_quota_class_get_all_by_name()
+        limits = {'default': {'class_name': 'default'},
+                  'class': {'class_name': 'other_class', 'ram': 1024},
+                  'project': {'project_id': 'test_project'},
+                  'user': {'project_id': 'test_project', 'user_id': None}}
+        quotas = self.driver._get_quotas(
+            FakeContext('test_project', 'test_class'),
+            quota.QUOTAS._resources, ['ram'], True,
+            project_id='test_project', limits=limits)
+
+        self.assertEqual(['quota_class_get_all_by_name',
+                          'quota_class_get_default'], self.calls)
+        self.assertEqual(dict(ram=25 * 1024), quotas)
+
+    @mock.patch.object(db, 'quota_get_all_by_project')
+    @mock.patch.object(db, 'quota_get_all_limits')
+    def test_limit_check_limits(self, mock_get_limits, mock_get_project):
+        mock_get_limits.return_value = {
+            'default': {'class_name': 'default'},
+            'class': {'class_name': 'test_class'},
+            'project': {'project_id': 'test_project', 'metadata_items': 3},
+            'user': {'project_id': 'test_project', 'user_id': 'fake_user'}}
+        context = FakeContext('test_project', 'test_class')
+        self.assertRaises(exception.OverQuota, self.driver.limit_check,
+                          context, quota.QUOTAS._resources,
+                          dict(metadata_items=4))
+        mock_get_limits.assert_called_once_with(
+            context, 'test_project', 'fake_user', 'test_class')
+        self.assertFalse(mock_get_project.called)
+
     def test_limit_check_under(self):
         self._stub_get_project_quotas()
         self.assertRaises(exception.InvalidQuotaValue,
@@ -2347,6 +2407,59 @@ class DbQuotaDriverTestCase(test.TestCase):
         self.assertEqual(calls, exemplar)
 
 
+class OptimisticDbQuotaDriverTestCase(test.NoDBTestCase):
+    def setUp(self):
+        super(OptimisticDbQuotaDriverTestCase, self).setUp()
+        self.flags(reservation_expire=86400, until_refresh=5, max_age=60)
+        self.driver = quota.OptimisticDbQuotaDriver()
+        self.context = FakeContext('test_project', 'test_class')
+        self.useFixture(test.TimeOverride())
+
+    @mock.patch.object(db, 'quota_reserve')
+    @mock.patch.object(db, 'quota_reserve_optimistic',
+                       return_value=['resv-1'])
+    @mock.patch.object(db, 'quota_get_all_by_project', return_value={})
+    def test_reserve(self, mock_get, mock_reserve, mock_locking_reserve):
+        quotas = {'instances': 10}
+        with mock.patch.object(self.driver, '_get_quotas',
+                               return_value=quotas):
+            result = self.driver.reserve(self.context,
+                                         quota.QUOTAS._resources,
+                                         dict(instances=2))
+        self.assertEqual(['resv-1'], result)
+        expire = timeutils.utcnow() + datetime.timedelta(seconds=86400)
+        mock_reserve.assert_called_once_with(
+            self.context, quota.QUOTAS._resources, quotas, quotas,
+            dict(instances=2), expire, 5, 60, project_id='test_project',
+            user_id='fake_user')
+        self.assertFalse(mock_locking_reserve.called)
+
+    @mock.patch.object(db, 'reservation_commit_optimistic')
+    def test_commit(self, mock_commit):
+        self.driver.commit(self.context, ['resv-1'])
+        mock_commit.assert_called_once_with(self.context, ['resv-1'],
+                                            project_id='test_project',
+                                            user_id='fake_user')
+
+    @mock.patch.object(db, 'reservation_rollback_optimistic')
+    def test_rollback(self, mock_rollback):
+        self.driver.rollback(self.context, ['resv-1'],
+                             project_id='other_project', user_id='other_user')
+        mock_rollback.assert_called_once_with(self.context, ['resv-1'],
+                                              project_id='other_project',
+                                              user_id='other_user')
+
+    @mock.patch.object(db, 'reservation_expire_optimistic')
+    def test_expire(self, mock_expire):
+        self.driver.expire(self.context)
+        mock_expire.assert_called_once_with(self.context)
+
+    def test_quota_driver_option(self):
+        self.flags(quota_driver='nova.quota.OptimisticDbQuotaDriver')
+        self.assertIsInstance(quota.QuotaEngine()._driver,
+                              quota.OptimisticDbQuotaDriver)
+
+
 class FakeSession(object):
     def begin(self):
         return self
@@ -823,6 +823,12 @@ class MetadataToDictTestCase(test.NoDBTestCase):
                          utils.metadata_to_dict(metadata,
                                                 include_deleted=False))
 
+    def test_metadata_to_dict_dict(self):
+        metadata = {'foo1': 'bar'}
+        result = utils.metadata_to_dict(metadata)
+        self.assertEqual(metadata, result)
+        self.assertIsNot(metadata, result)
+
     def test_metadata_to_dict_empty(self):
         self.assertEqual({}, utils.metadata_to_dict([]))
         self.assertEqual({}, utils.metadata_to_dict([], include_deleted=True))
@@ -17,6 +17,8 @@ Tests For weights.
 """
 
 import mock
+from oslo_utils import importutils
+import testtools
 
 from nova.scheduler import weights as scheduler_weights
 from nova.scheduler.weights import ram
@@ -24,6 +26,8 @@ from nova import test
 from nova.tests.unit.scheduler import fakes
 from nova import weights
 
+numpy = importutils.try_import('numpy')
+
 
 class TestWeigher(test.NoDBTestCase):
     def test_no_multiplier(self):
@@ -72,3 +76,83 @@ class TestWeigher(test.NoDBTestCase):
         self.assertEqual(1, len(weighed_host))
         self.assertEqual('host1', weighed_host[0].obj.host)
         self.assertFalse(mock_weigh.called)
+
+    @testtools.skipIf(numpy is None, 'numpy is not installed')
+    def test_normalization_array(self):
+        # weight_list, expected_result, minval, maxval
+        map_ = (
+            ((0.0, 0.0), (0.0, 0.0), None, None),
+            ((1.0, 1.0), (0.0, 0.0), None, None),
+
+            ((20.0, 50.0), (0.0, 1.0), None, None),
+            ((20.0, 50.0), (0.0, 0.375), None, 100.0),
+            ((20.0, 50.0), (0.4, 1.0), 0.0, None),
+            ((20.0, 50.0), (0.2, 0.5), 0.0, 100.0),
+        )
+        for seq, result, minval, maxval in map_:
+            ret = weights.normalize_array(numpy.array(seq), minval=minval,
+                                          maxval=maxval)
+            self.assertEqual(result, tuple(ret))
+
+    def _get_hosts(self):
+        host_values = [
+            ('host1', 'node1', {'free_ram_mb': 512}),
+            ('host2', 'node2', {'free_ram_mb': 8192}),
+            ('host3', 'node3', {'free_ram_mb': 1024}),
+            ('host4', 'node4', {'free_ram_mb': 8192}),
+        ]
+        return [fakes.FakeHostState(host, node, values)
+                for host, node, values in host_values]
+
+    def test_get_weighed_objects_limit(self):
+        weight_handler = scheduler_weights.HostWeightHandler()
+        weighed_hosts = weight_handler.get_weighed_objects(
+            [ram.RAMWeigher()], self._get_hosts(), {}, limit=3)
+        self.assertEqual(['host2', 'host4', 'host3'],
+                         [h.obj.host for h in weighed_hosts])
+
+    @testtools.skipIf(numpy is None, 'numpy is not installed')
+    def test_get_weighed_objects_array(self):
+        self.flags(scheduler_use_vectorized_weighers=True)
+        weight_handler = scheduler_weights.HostWeightHandler()
+        weighed_hosts = weight_handler.get_weighed_objects(
+            [ram.RAMWeigher()], self._get_hosts(), {})
+        self.assertEqual(['host2', 'host4', 'host3', 'host1'],
+                         [h.obj.host for h in weighed_hosts])
+        self.assertEqual(1.0, weighed_hosts[0].weight)
+        # RAMWeigher.minval is 0
+        self.assertEqual(512.0 / 8192, weighed_hosts[-1].weight)
+
+    @testtools.skipIf(numpy is None, 'numpy is not installed')
+    def test_get_weighed_objects_array_limit_keeps_ties_order(self):
+        self.flags(scheduler_use_vectorized_weighers=True)
+        weight_handler = scheduler_weights.HostWeightHandler()
+        weighed_hosts = weight_handler.get_weighed_objects(
+            [ram.RAMWeigher()], self._get_hosts(), {}, limit=1)
+        self.assertEqual(['host2'], [h.obj.host for h in weighed_hosts])
+
+    @testtools.skipIf(numpy is None, 'numpy is not installed')
+    def test_get_weighed_objects_array_fallback(self):
+        self.flags(scheduler_use_vectorized_weighers=True)
+
+        class FakeWeigher(scheduler_weights.BaseHostWeigher):
+            def _weigh_object(self, host_state, weight_properties):
+                return -host_state.free_ram_mb
+
+        weight_handler = scheduler_weights.HostWeightHandler()
+        weighed_hosts = weight_handler.get_weighed_objects(
+            [FakeWeigher()], self._get_hosts(), {}, limit=2)
+        self.assertEqual(['host1', 'host3'],
+                         [h.obj.host for h in weighed_hosts])
+        self.assertIsInstance(weighed_hosts[0], scheduler_weights.WeighedHost)
+
+    def test_get_weighed_object(self):
+        weight_handler = scheduler_weights.HostWeightHandler()
+        weighers = [ram.RAMWeigher()]
+        weight_handler.get_weighed_objects(weighers, self._get_hosts(), {})
+        host = fakes.FakeHostState('host5', 'node5', {'free_ram_mb': 4096})
+        weighed_host = weight_handler.get_weighed_object(weighers, host, {})
+        self.assertIsInstance(weighed_host, scheduler_weights.WeighedHost)
+        self.assertIs(host, weighed_host.obj)
+        # Normalized with the bounds of the previous weighing, 0 and 8192
+        self.assertEqual(0.5, weighed_host.weight)
@@ -142,6 +142,10 @@ VIR_DOMAIN_BLOCK_REBASE_RELATIVE = 8
 
 VIR_CONNECT_LIST_DOMAINS_ACTIVE = 1
 VIR_CONNECT_LIST_DOMAINS_INACTIVE = 2
+VIR_CONNECT_LIST_DOMAINS_RUNNING = 16
+VIR_CONNECT_LIST_DOMAINS_PAUSED = 32
+VIR_CONNECT_LIST_DOMAINS_SHUTOFF = 64
+VIR_CONNECT_LIST_DOMAINS_OTHER = 128
 
 # secret type
 VIR_SECRET_USAGE_TYPE_NONE = 0
@@ -903,6 +907,19 @@ class Connection(object):
             if flags & VIR_CONNECT_LIST_DOMAINS_INACTIVE:
                 if vm.state == VIR_DOMAIN_SHUTOFF:
                     vms.append(vm)
+            if flags & VIR_CONNECT_LIST_DOMAINS_RUNNING:
+                if vm.state == VIR_DOMAIN_RUNNING:
+                    vms.append(vm)
+            if flags & VIR_CONNECT_LIST_DOMAINS_PAUSED:
+                if vm.state == VIR_DOMAIN_PAUSED:
+                    vms.append(vm)
+            if flags & VIR_CONNECT_LIST_DOMAINS_SHUTOFF:
+                if vm.state == VIR_DOMAIN_SHUTOFF:
+                    vms.append(vm)
+            if flags & VIR_CONNECT_LIST_DOMAINS_OTHER:
+                if vm.state not in (VIR_DOMAIN_RUNNING, VIR_DOMAIN_PAUSED,
+                                    VIR_DOMAIN_SHUTOFF):
+                    vms.append(vm)
         return vms
 
     def _emit_lifecycle(self, dom, event, detail):
@@ -0,0 +1,100 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+
+import fixtures
+
+from nova import test
+from nova.virt.libvirt import diskinfocache
+
+XML = '<domain><name>instance-00000001</name></domain>'
+
+
+class DiskInfoCacheTestCase(test.NoDBTestCase):
+
+    def setUp(self):
+        super(DiskInfoCacheTestCase, self).setUp()
+        self.tmpdir = self.useFixture(fixtures.TempDir()).path
+        self.qcow2 = self._write('disk', 100)
+        self.raw = self._write('disk.local', 50)
+        self.disk_info = [
+            {'type': 'qcow2', 'path': self.qcow2,
+             'virt_disk_size': 1000, 'backing_file': 'base',
+             'disk_size': 100, 'over_committed_disk_size': 900},
+            {'type': 'raw', 'path': self.raw,
+             'virt_disk_size': 50, 'backing_file': '',
+             'disk_size': 50, 'over_committed_disk_size': 0}]
+        self.cache = diskinfocache.DiskInfoCache()
+
+    def _write(self, name, size):
+        path = os.path.join(self.tmpdir, name)
+        with open(path, 'w') as f:
+            f.write('x' * size)
+        return path
+
+    def test_get_hit(self):
+        self.assertIsNone(self.cache.get('uuid1', XML))
+        self.cache.set('uuid1', XML, self.disk_info)
+        self.assertEqual(self.disk_info, self.cache.get('uuid1', XML))
+        self.assertEqual({'guests': 1, 'hits': 1, 'misses': 1},
+                         self.cache.get_stats())
+
+    def test_get_disks_grew(self):
+        self.cache.set('uuid1', XML, self.disk_info)
+        with open(self.qcow2, 'a') as f:
+            f.write('x' * 100)
+        with open(self.raw, 'a') as f:
+            f.write('x' * 10)
+        qcow2, raw = self.cache.get('uuid1', XML)
+        self.assertEqual(200, qcow2['disk_size'])
+        self.assertEqual(1000, qcow2['virt_disk_size'])
+        self.assertEqual(800, qcow2['over_committed_disk_size'])
+        self.assertEqual(60, raw['disk_size'])
+        self.assertEqual(60, raw['virt_disk_size'])
+        self.assertEqual(0, raw['over_committed_disk_size'])
+        # The cached information isn't changed.
+        self.assertEqual(100, self.disk_info[0]['disk_size'])
+
+    def test_get_xml_changed(self):
+        self.cache.set('uuid1', XML, self.disk_info)
+        self.assertIsNone(self.cache.get('uuid1', XML + ' '))
+        self.assertEqual(1, self.cache.misses)
+
+    def test_get_disk_replaced(self):
+        self.cache.set('uuid1', XML, self.disk_info)
+        os.rename(self._write('disk.new', 100), self.qcow2)
+        self.assertIsNone(self.cache.get('uuid1', XML))
+        self.assertEqual(0, self.cache.get_stats()['guests'])
+
+    def test_get_disk_removed(self):
+        self.cache.set('uuid1', XML, self.disk_info)
+        os.unlink(self.raw)
+        self.assertIsNone(self.cache.get('uuid1', XML))
+
+    def test_set_disk_removed(self):
+        os.unlink(self.raw)
+        self.cache.set('uuid1', XML, self.disk_info)
+        self.assertIsNone(self.cache.get('uuid1', XML))
+
+    def test_invalidate(self):
+        self.cache.set('uuid1', XML, self.disk_info)
+        self.cache.invalidate('uuid1')
+        self.cache.invalidate('uuid2')
+        self.assertIsNone(self.cache.get('uuid1', XML))
+
+    def test_retain(self):
+        self.cache.set('uuid1', XML, self.disk_info)
+        self.cache.set('uuid2', XML, [])
+        self.cache.retain(['uuid2', 'uuid3'])
+        self.assertIsNone(self.cache.get('uuid1', XML))
+        self.assertEqual([], self.cache.get('uuid2', XML))
@@ -10050,6 +10050,58 @@ class LibvirtConnTestCase(test.NoDBTestCase):
         drvr = libvirt_driver.LibvirtDriver(fake.FakeVirtAPI(), False)
         self.assertEqual(0, drvr._get_disk_over_committed_size_total())
 
+    @mock.patch.object(host.Host, "list_instance_domains")
+    def test_disk_over_committed_size_total_cached(self, mock_list):
+        tmpdir = self.useFixture(fixtures.TempDir()).path
+        domains = []
+        for i in range(2):
+            path = os.path.join(tmpdir, 'disk%d' % i)
+            with open(path, 'w') as f:
+                f.write('x' * 10)
+            domain = mock.Mock()
+            domain.name.return_value = 'instance%d' % i
+            domain.UUIDString.return_value = 'uuid%d' % i
+            domain.XMLDesc.return_value = (
+                '<domain><name>%d</name></domain>' % i)
+            domains.append(domain)
+        mock_list.return_value = domains
+
+        drvr = libvirt_driver.LibvirtDriver(fake.FakeVirtAPI(), False)
+
+        def get_info(instance_name, xml, **kwargs):
+            path = os.path.join(tmpdir, 'disk' + instance_name[-1])
+            return [{'type': 'qcow2', 'path': path,
+                     'virt_disk_size': 100, 'backing_file': 'base',
+                     'disk_size': 10, 'over_committed_disk_size': 90}]
+
+        with mock.patch.object(drvr,
+                               "_get_instance_disk_info") as mock_info:
+            mock_info.side_effect = get_info
+
+            self.assertEqual(180, drvr._get_disk_over_committed_size_total())
+            self.assertEqual(2, mock_info.call_count)
+
+            # Only the guest whose domain changed is inspected again, and
+            # the disk which grew is seen.
+            domains[1].XMLDesc.return_value = (
+                '<domain><name>1</name><memory/></domain>')
+            with open(os.path.join(tmpdir, 'disk0'), 'a') as f:
+                f.write('x' * 10)
+            self.assertEqual(170, drvr._get_disk_over_committed_size_total())
+            self.assertEqual(3, mock_info.call_count)
+            mock_info.assert_called_with('instance1',
+                                         domains[1].XMLDesc.return_value)
+
+            # The guests which are gone are forgotten.
+            mock_list.return_value = domains[:1]
+            self.assertEqual(80, drvr._get_disk_over_committed_size_total())
+            self.assertEqual(3, mock_info.call_count)
+            self.assertEqual(1, drvr._disk_info_cache.get_stats()['guests'])
+
+            drvr._disk_info_cache.invalidate('uuid0')
+            drvr._get_disk_over_committed_size_total()
+            self.assertEqual(4, mock_info.call_count)
+
     def test_cpu_info(self):
         drvr = libvirt_driver.LibvirtDriver(fake.FakeVirtAPI(), True)
 
@@ -22,6 +22,7 @@ import mock
 import six
 
 from nova.compute import arch
+from nova.compute import power_state
 from nova import exception
 from nova import objects
 from nova import test
@@ -618,6 +619,54 @@ class HostTestCase(test.NoDBTestCase):
         self.assertEqual(dom0, result[0]._domain)
         self.assertEqual(dom1, result[1]._domain)
 
+    @mock.patch.object(libvirt_guest.Guest, "get_power_state",
+                       return_value=power_state.CRASHED)
+    @mock.patch.object(fakelibvirt.Connection, "listAllDomains")
+    def test_get_power_states_fast(self, mock_list_all, mock_get_state):
+        vm0 = FakeVirtDomain(id=0, name="Domain-0")
+        vm1 = FakeVirtDomain(id=3, name="instance00000001")
+        vm2 = FakeVirtDomain(id=17, name="instance00000002")
+        vm3 = FakeVirtDomain(name="instance00000003")
+        vm4 = FakeVirtDomain(id=18, name="instance00000004")
+        vms = {fakelibvirt.VIR_CONNECT_LIST_DOMAINS_RUNNING: [vm0, vm1],
+               fakelibvirt.VIR_CONNECT_LIST_DOMAINS_PAUSED: [vm2],
+               fakelibvirt.VIR_CONNECT_LIST_DOMAINS_SHUTOFF: [vm3],
+               fakelibvirt.VIR_CONNECT_LIST_DOMAINS_OTHER: [vm4]}
+        mock_list_all.side_effect = vms.get
+
+        states = self.host.get_power_states()
+
+        self.assertEqual({vm1.UUIDString(): power_state.RUNNING,
+                          vm2.UUIDString(): power_state.PAUSED,
+                          vm3.UUIDString(): power_state.SHUTDOWN,
+                          vm4.UUIDString(): power_state.CRASHED}, states)
+        self.assertEqual(4, mock_list_all.call_count)
+        # Only the domain in another state is queried
+        mock_get_state.assert_called_once_with(self.host)
+
+    @mock.patch.object(host.Host, "list_guests")
+    @mock.patch.object(fakelibvirt.Connection, "listAllDomains")
+    def test_get_power_states_fallback(self, mock_list_all, mock_list_guests):
+        mock_list_all.side_effect = fakelibvirt.make_libvirtError(
+            fakelibvirt.libvirtError,
+            error_code=fakelibvirt.VIR_ERR_NO_SUPPORT,
+            msg='API not supported')
+        guest1 = mock.Mock(uuid='uuid1')
+        guest1.get_power_state.return_value = power_state.RUNNING
+        guest2 = mock.Mock(uuid='uuid2')
+        # Undefined since it was listed
+        guest2.get_power_state.side_effect = fakelibvirt.make_libvirtError(
+            fakelibvirt.libvirtError,
+            error_code=fakelibvirt.VIR_ERR_NO_DOMAIN,
+            msg='Domain not found')
+        mock_list_guests.return_value = [guest1, guest2]
+
+        self.assertEqual({'uuid1': power_state.RUNNING},
+                         self.host.get_power_states())
+        mock_list_guests.assert_called_once_with(only_running=False,
+                                                 only_guests=True)
+        self.assertTrue(self.host._skip_list_all_domains)
+
     def test_cpu_features_bug_1217630(self):
         self.host.get_connection()
 
@@ -1554,6 +1554,118 @@ class VirtNUMAHostTopologyTestCase(test.NoDBTestCase):
             self.assertIsNone(fitted_instance1)
 
 
+class NUMAFitCacheTestCase(test.NoDBTestCase):
+
+    def setUp(self):
+        super(NUMAFitCacheTestCase, self).setUp()
+        self.cache = hw.NUMAFitCache(2)
+        self.host = objects.NUMATopology(
+                cells=[
+                    objects.NUMACell(id=1, cpuset=set([1, 2]), memory=2048,
+                                     cpu_usage=2, memory_usage=2048,
+                                     mempages=[], siblings=[],
+                                     pinned_cpus=set([])),
+                    objects.NUMACell(id=2, cpuset=set([3, 4]), memory=2048,
+                                     cpu_usage=2, memory_usage=2048,
+                                     mempages=[], siblings=[],
+                                     pinned_cpus=set([]))])
+        self.limits = objects.NUMATopologyLimits(
+            cpu_allocation_ratio=2, ram_allocation_ratio=2)
+        self.instance2 = objects.InstanceNUMATopology(
+                cells=[
+                    objects.InstanceNUMACell(
+                        id=0, cpuset=set([1, 2, 3, 4]), memory=1024)])
+        self.instance3 = objects.InstanceNUMATopology(
+                cells=[
+                    objects.InstanceNUMACell(
+                        id=0, cpuset=set([1, 2]), memory=1024)])
+
+    def test_lru_eviction(self):
+        self.cache.put('a', 1)
+        self.cache.put('b', 2)
+        self.assertEqual((True, 1), self.cache.get('a'))
+        self.cache.put('c', 3)
+        self.assertEqual((False, None), self.cache.get('b'))
+        self.assertEqual((True, 1), self.cache.get('a'))
+        self.assertEqual((True, 3), self.cache.get('c'))
+        self.assertEqual({'hits': 3, 'misses': 1, 'entries': 2, 'size': 2},
+                         self.cache.get_stats())
+
+    def test_clear(self):
+        self.cache.put('a', 1)
+        self.cache.get('a')
+        self.cache.clear()
+        self.assertEqual(0, len(self.cache))
+        self.assertEqual(0, self.cache.hits)
+        self.assertEqual(0, self.cache.misses)
+
+    @mock.patch.object(hw, '_numa_fit_instance_to_host',
+                       wraps=hw._numa_fit_instance_to_host)
+    def test_fit_cached(self, fit_mock):
+        fitted1 = hw.numa_fit_instance_to_host(
+            self.host, self.instance3, self.limits, cache=self.cache)
+        fitted2 = hw.numa_fit_instance_to_host(
+            self.host.obj_clone(), self.instance3, self.limits,
+            cache=self.cache)
+        self.assertEqual(1, fit_mock.call_count)
+        self.assertEqual(1, self.cache.hits)
+        self.assertEqual(1, self.cache.misses)
+        self.assertEqual(1, fitted2.cells[0].id)
+        self.assertEqual(fitted1.obj_to_primitive(),
+                         fitted2.obj_to_primitive())
+        # Callers get their own copy
+        self.assertIsNot(fitted1, fitted2)
+        self.assertIsNot(fitted1.cells[0], fitted2.cells[0])
+        # The requested topology is left alone
+        self.assertEqual(0, self.instance3.cells[0].id)
+
+    def test_fit_cached_failure(self):
+        for i in range(2):
+            self.assertIsNone(hw.numa_fit_instance_to_host(
+                self.host, self.instance2, self.limits, cache=self.cache))
+        self.assertEqual(1, self.cache.hits)
+
+    def test_fit_cache_key_usage(self):
+        hw.numa_fit_instance_to_host(
+            self.host, self.instance3, self.limits, cache=self.cache)
+        self.host.cells[0].memory_usage = 0
+        hw.numa_fit_instance_to_host(
+            self.host, self.instance3, self.limits, cache=self.cache)
+        hw.numa_fit_instance_to_host(
+            self.host, self.instance3, cache=self.cache)
+        self.assertEqual(0, self.cache.hits)
+        self.assertEqual(3, self.cache.misses)
+
+    def test_fit_cache_key_pinning(self):
+        pinned = self.instance3.obj_clone()
+        pinned.cells[0].cpu_policy = fields.CPUAllocationPolicy.DEDICATED
+        pinned.cells[0].cpu_pinning = {}
+        self.assertNotEqual(
+            hw._numa_fit_cache_key(self.host, self.instance3, None),
+            hw._numa_fit_cache_key(self.host, pinned, None))
+
+    @mock.patch.object(stats.PciDeviceStats, 'support_requests',
+                       return_value=True)
+    def test_fit_pci_not_cached(self, support_mock):
+        pci_reqs = [objects.InstancePCIRequest(count=1,
+                                               spec=[{'vendor_id': '8086'}])]
+        for i in range(2):
+            hw.numa_fit_instance_to_host(
+                self.host, self.instance3, self.limits,
+                pci_requests=pci_reqs, pci_stats=stats.PciDeviceStats(),
+                cache=self.cache)
+        self.assertEqual(0, len(self.cache))
+        self.assertEqual(2, support_mock.call_count)
+
+    def test_get_numa_fit_cache(self):
+        self.flags(numa_fit_cache_size=10)
+        cache = hw.get_numa_fit_cache()
+        self.assertEqual(10, cache.size)
+        self.assertIs(cache, hw.get_numa_fit_cache())
+        self.flags(numa_fit_cache_size=0)
+        self.assertIsNone(hw.get_numa_fit_cache())
+
+
 class NumberOfSerialPortsTest(test.NoDBTestCase):
     def test_flavor(self):
         flavor = objects.Flavor(vcpus=8, memory_mb=2048,
@@ -1012,6 +1012,9 @@ def last_bytes(file_like_object, num):
 
 
 def metadata_to_dict(metadata, include_deleted=False):
+    if isinstance(metadata, dict):
+        # Already built by the database API
+        return dict(metadata)
     result = {}
     for item in metadata:
         if not include_deleted and item.get('deleted'):
@@ -196,6 +196,18 @@ class ComputeDriver(object):
         # TODO(Vek): Need to pass context in for access to auth_token
         raise NotImplementedError()
 
+    def get_power_states(self):
+        """Return the power state of all the virtual machines at once.
+
+        Used by the periodic sync of the power states to find the instances
+        whose power state changed without querying them one by one.
+
+        :returns: a dict of the power states from nova.compute.power_state
+                  by instance uuid, for all the virtual machines that the
+                  hypervisor knows about
+        """
+        raise NotImplementedError()
+
     def get_num_instances(self):
         """Return the total number of virtual machines.
 
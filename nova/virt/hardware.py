@@ -1136,9 +1136,117 @@ def numa_get_constraints(flavor, image_meta):
     return _add_cpu_pinning_constraint(flavor, image_meta, numa_topology)
 
 
+class NUMAFitCache(object):
+    """Least recently used cache of numa_fit_instance_to_host() results.
+
+    Hosts with the same free NUMA resources get the same fit for a given
+    request, so the result of trying all the permutations of the host cells
+    can be reused. The keys are built by _numa_fit_cache_key() and the
+    values are an InstanceNUMATopology, or None if the instance didn't fit.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self._results = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._results)
+
+    def get(self, key):
+        """Return a (found, result) tuple for key, and count a hit or miss.
+        """
+        try:
+            result = self._results.pop(key)
+        except KeyError:
+            self.misses += 1
+            return False, None
+        # Move it back to the most recently used end
+        self._results[key] = result
+        self.hits += 1
+        return True, result
+
+    def put(self, key, result):
+        """Remember result for key, evicting the least recently used ones."""
+        self._results.pop(key, None)
+        self._results[key] = result
+        while len(self._results) > self.size:
+            self._results.popitem(last=False)
+
+    def clear(self):
+        self._results.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def get_stats(self):
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'entries': len(self._results),
+                'size': self.size}
+
+
+_NUMA_FIT_CACHE = None
+
+
+def get_numa_fit_cache():
+    """Return the NUMAFitCache of this process.
+
+    :returns: a NUMAFitCache sized by CONF.numa_fit_cache_size, or None if
+              the cache is disabled.
+    """
+    global _NUMA_FIT_CACHE
+    size = CONF.numa_fit_cache_size
+    if not size:
+        return None
+    if _NUMA_FIT_CACHE is None or _NUMA_FIT_CACHE.size != size:
+        _NUMA_FIT_CACHE = NUMAFitCache(size)
+    return _NUMA_FIT_CACHE
+
+
+def _obj_field(obj, name, default=None):
+    if obj.obj_attr_is_set(name):
+        return getattr(obj, name)
+    return default
+
+
+def _numa_fit_cache_key(host_topology, instance_topology, limits):
+    """Build a hashable key of everything a NUMA fit depends on.
+
+    That is the free resources, pinned CPUs, siblings and pages of each host
+    cell, the requested instance cells and the limits. The ids of the
+    instance cells and their previous pinning are overwritten by the fit, so
+    only whether pinning is requested is part of the key.
+    """
+    host_cells = tuple(
+        (cell.id, tuple(sorted(cell.cpuset)), cell.memory,
+         cell.cpu_usage, cell.memory_usage,
+         tuple(sorted(_obj_field(cell, 'pinned_cpus', ()))),
+         tuple(tuple(sorted(siblings))
+               for siblings in _obj_field(cell, 'siblings', ())),
+         tuple((pages.size_kb, pages.total, pages.used)
+               for pages in _obj_field(cell, 'mempages', ())))
+        for cell in host_topology.cells)
+    instance_cells = []
+    for cell in instance_topology.cells:
+        cpu_topology = cell.cpu_topology
+        if cpu_topology is not None:
+            cpu_topology = (cpu_topology.sockets, cpu_topology.cores,
+                            cpu_topology.threads)
+        instance_cells.append(
+            (tuple(sorted(cell.cpuset)), cell.memory, cell.pagesize,
+             cell.cpu_policy, cell.cpu_thread_policy,
+             cell.cpu_pinning_requested, cpu_topology))
+    limits_key = None
+    if limits:
+        limits_key = (limits.cpu_allocation_ratio,
+                      limits.ram_allocation_ratio)
+    return host_cells, tuple(instance_cells), limits_key
+
+
 def numa_fit_instance_to_host(
         host_topology, instance_topology, limits=None,
-        pci_requests=None, pci_stats=None):
+        pci_requests=None, pci_stats=None, cache=None):
     """Fit the instance topology onto the host topology given the limits
 
     :param host_topology: objects.NUMATopology object to fit an instance on
@@ -1146,36 +1254,59 @@ def numa_fit_instance_to_host(
     :param limits: objects.NUMATopologyLimits that defines limits
     :param pci_requests: instance pci_requests
     :param pci_stats: pci_stats for the host
+    :param cache: an optional NUMAFitCache, see get_numa_fit_cache()
 
     Given a host and instance topology and optionally limits - this method
     will attempt to fit instance cells onto all permutations of host cells
     by calling the _numa_fit_instance_cell method, and return a new
     InstanceNUMATopology with it's cell ids set to host cell id's of
     the first successful permutation, or None.
+
+    If a cache is passed and no PCI devices are requested, the result is
+    looked up in or stored into the cache. The instance topology is then
+    fitted as a copy, so that the result only depends on the key.
     """
     if (not (host_topology and instance_topology) or
         len(host_topology) < len(instance_topology)):
         return
-    else:
-        # TODO(ndipanov): We may want to sort permutations differently
-        # depending on whether we want packing/spreading over NUMA nodes
-        for host_cell_perm in itertools.permutations(
-                host_topology.cells, len(instance_topology)):
-            cells = []
-            for host_cell, instance_cell in zip(
-                    host_cell_perm, instance_topology.cells):
-                got_cell = _numa_fit_instance_cell(
-                    host_cell, instance_cell, limits)
-                if got_cell is None:
-                    break
-                cells.append(got_cell)
-            if len(cells) == len(host_cell_perm):
-                if not pci_requests:
-                    return objects.InstanceNUMATopology(cells=cells)
-                elif ((pci_stats is not None) and
-                    pci_stats.support_requests(pci_requests,
-                                                     cells)):
-                    return objects.InstanceNUMATopology(cells=cells)
+
+    if cache is not None and not pci_requests:
+        key = _numa_fit_cache_key(host_topology, instance_topology, limits)
+        found, fitted = cache.get(key)
+        if not found:
+            fitted = _numa_fit_instance_to_host(
+                host_topology, instance_topology.obj_clone(), limits)
+            cache.put(key, fitted)
+        # Don't hand out the cached object, the callers modify it
+        return fitted.obj_clone() if fitted else None
+
+    return _numa_fit_instance_to_host(
+        host_topology, instance_topology, limits, pci_requests, pci_stats)
+
+
+def _numa_fit_instance_to_host(
+        host_topology, instance_topology, limits,
+        pci_requests=None, pci_stats=None):
+    """Try the permutations of the host cells for numa_fit_instance_to_host.
+    """
+    # TODO(ndipanov): We may want to sort permutations differently
+    # depending on whether we want packing/spreading over NUMA nodes
+    for host_cell_perm in itertools.permutations(
+            host_topology.cells, len(instance_topology)):
+        cells = []
+        for host_cell, instance_cell in zip(
+                host_cell_perm, instance_topology.cells):
+            got_cell = _numa_fit_instance_cell(
+                host_cell, instance_cell, limits)
+            if got_cell is None:
+                break
+            cells.append(got_cell)
+        if len(cells) == len(host_cell_perm):
+            if not pci_requests:
+                return objects.InstanceNUMATopology(cells=cells)
+            elif ((pci_stats is not None) and
+                    pci_stats.support_requests(pci_requests, cells)):
+                return objects.InstanceNUMATopology(cells=cells)
 
 
 def _numa_pagesize_usage_from_cell(hostcell, instancecell, sign):
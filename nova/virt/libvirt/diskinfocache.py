@@ -0,0 +1,106 @@
+# Copyright (c) 2016 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import hashlib
+import os
+import stat
+
+from oslo_utils import encodeutils
+
+
+def _hash_xml(xml):
+    return hashlib.sha1(encodeutils.safe_encode(xml)).hexdigest()
+
+
+def _stat_disk(path):
+    """Return the identity of a disk and its size if it is a regular file."""
+    st = os.stat(path)
+    size = st.st_size if stat.S_ISREG(st.st_mode) else None
+    return (st.st_dev, st.st_ino), size
+
+
+class DiskInfoCache(object):
+    """Cache of the disk information of the guests of a host.
+
+    The disk information of a guest, as returned by
+    LibvirtDriver._get_instance_disk_info(), is reused as long as the domain
+    XML of the guest and the files of its disks are the same. Parsing the
+    XML and running qemu-img info on each disk is then only done for the
+    guests which changed.
+
+    The guests write to their disks all the time, so the disk files are
+    identified by their device and inode rather than by their modification
+    time, and the sizes of the disks which are regular files are read again
+    each time, which is a stat() per disk.
+    """
+
+    def __init__(self):
+        # uuid -> (xml hash, disk info, disk identities)
+        self._entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, uuid, xml):
+        """Return the disk information of a guest, or None if it has to be
+        read again.
+        """
+        entry = self._entries.get(uuid)
+        if entry is None or entry[0] != _hash_xml(xml):
+            self.misses += 1
+            return None
+        xml_hash, disk_info, identities = entry
+        result = []
+        for info, identity in zip(disk_info, identities):
+            try:
+                current, size = _stat_disk(info['path'])
+            except OSError:
+                current = size = None
+            if current != identity:
+                self.invalidate(uuid)
+                self.misses += 1
+                return None
+            info = dict(info)
+            if size is not None:
+                info['disk_size'] = size
+                if info['type'] == 'qcow2':
+                    info['over_committed_disk_size'] = (
+                        int(info['virt_disk_size']) - size)
+                else:
+                    info['virt_disk_size'] = size
+            result.append(info)
+        self.hits += 1
+        return result
+
+    def set(self, uuid, xml, disk_info):
+        try:
+            identities = [_stat_disk(info['path'])[0] for info in disk_info]
+        except OSError:
+            # Removed since it was read, so not worth caching
+            self.invalidate(uuid)
+            return
+        self._entries[uuid] = (_hash_xml(xml), disk_info, identities)
+
+    def invalidate(self, uuid):
+        self._entries.pop(uuid, None)
+
+    def retain(self, uuids):
+        """Forget the guests which aren't in uuids anymore."""
+        for uuid in set(self._entries) - set(uuids):
+            del self._entries[uuid]
+
+    def get_stats(self):
+        return {'guests': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses}
@@ -95,6 +95,7 @@ from nova.virt.image import model as imgmodel
 from nova.virt import images
 from nova.virt.libvirt import blockinfo
 from nova.virt.libvirt import config as vconfig
+from nova.virt.libvirt import diskinfocache
 from nova.virt.libvirt import firewall as libvirt_firewall
 from nova.virt.libvirt import guest as libvirt_guest
 from nova.virt.libvirt import host
@@ -523,6 +524,7 @@ class LibvirtDriver(driver.ComputeDriver):
             CONF.libvirt.sysinfo_serial)
 
         self.job_tracker = instancejobtracker.InstanceJobTracker()
+        self._disk_info_cache = diskinfocache.DiskInfoCache()
         self._remotefs = remotefs.RemoteFilesystem()
 
     def _get_volume_drivers(self):
@@ -703,6 +705,9 @@ class LibvirtDriver(driver.ComputeDriver):
 
         return uuids
 
+    def get_power_states(self):
+        return self._host.get_power_states()
+
     def plug_vifs(self, instance, network_info):
         """Plug VIFs into networks."""
         for vif in network_info:
@@ -876,6 +881,7 @@ class LibvirtDriver(driver.ComputeDriver):
 
     def cleanup(self, context, instance, network_info, block_device_info=None,
                 destroy_disks=True, migrate_data=None, destroy_vifs=True):
+        self._disk_info_cache.invalidate(instance.uuid)
         if destroy_vifs:
             self._unplug_vifs(instance, network_info, True)
 
@@ -1497,6 +1503,7 @@ class LibvirtDriver(driver.ComputeDriver):
                         self._attach_pci_devices(guest,
                             pci_manager.get_instance_pci_devs(instance))
                         self._attach_sriov_ports(context, instance, guest)
+                self._disk_info_cache.invalidate(instance.uuid)
                 LOG.info(_LI("Snapshot extracted, beginning image upload"),
                          instance=instance)
 
@@ -2515,6 +2522,7 @@ class LibvirtDriver(driver.ComputeDriver):
         self._create_domain_and_network(context, xml, instance, network_info,
                                         disk_info,
                                         block_device_info=block_device_info)
+        self._disk_info_cache.invalidate(instance.uuid)
         LOG.debug("Instance is running", instance=instance)
 
         def _wait_for_boot():
@@ -6560,6 +6568,7 @@ class LibvirtDriver(driver.ComputeDriver):
                                   block_device_info=block_device_info,
                                   write_to_disk=True)
         self._host.write_instance_config(xml)
+        self._disk_info_cache.invalidate(instance.uuid)
 
     def _get_instance_disk_info(self, instance_name, xml,
                                 block_device_info=None):
@@ -6662,14 +6671,29 @@ class LibvirtDriver(driver.ComputeDriver):
                                              block_device_info))
 
     def _get_disk_over_committed_size_total(self):
-        """Return total over committed disk size for all instances."""
+        """Return total over committed disk size for all instances.
+
+        The disk information of the guests is cached, so that only the
+        guests whose domain XML or disk files changed since the previous call
+        are inspected again.
+        """
         # Disk size that all instance uses : virtual_size - disk_size
         disk_over_committed_size = 0
+        uuids = []
+        cached = inspected = 0
         for guest in self._host.list_guests():
             try:
+                uuid = guest.uuid
+                uuids.append(uuid)
                 xml = guest.get_xml_desc()
 
-                disk_infos = self._get_instance_disk_info(guest.name, xml)
+                disk_infos = self._disk_info_cache.get(uuid, xml)
+                if disk_infos is None:
+                    inspected += 1
+                    disk_infos = self._get_instance_disk_info(guest.name, xml)
+                    self._disk_info_cache.set(uuid, xml, disk_infos)
+                else:
+                    cached += 1
                 for info in disk_infos:
                     disk_over_committed_size += int(
                         info['over_committed_disk_size'])
@@ -6707,6 +6731,11 @@ class LibvirtDriver(driver.ComputeDriver):
                           'error': e})
             # NOTE(gtt116): give other tasks a chance.
             greenthread.sleep(0)
+        self._disk_info_cache.retain(uuids)
+        LOG.debug('Disk information of %(cached)d guests read from the cache, '
+                  '%(inspected)d guests inspected. Cache totals: %(stats)s',
+                  {'cached': cached, 'inspected': inspected,
+                   'stats': self._disk_info_cache.get_stats()})
         return disk_over_committed_size
 
     def unfilter_instance(self, instance, network_info):
@@ -6989,6 +7018,7 @@ class LibvirtDriver(driver.ComputeDriver):
                                         block_device_info=block_device_info,
                                         power_on=power_on,
                                         vifs_already_plugged=True)
+        self._disk_info_cache.invalidate(instance.uuid)
         if power_on:
             timer = loopingcall.FixedIntervalLoopingCall(
                                                     self._wait_for_running,
@@ -7037,6 +7067,7 @@ class LibvirtDriver(driver.ComputeDriver):
                                         block_device_info=block_device_info,
                                         power_on=power_on,
                                         vifs_already_plugged=True)
+        self._disk_info_cache.invalidate(instance.uuid)
 
         if power_on:
             timer = loopingcall.FixedIntervalLoopingCall(
@@ -45,6 +45,7 @@ from oslo_utils import units
 from oslo_utils import versionutils
 import six
 
+from nova.compute import power_state
 from nova import context as nova_context
 from nova import exception
 from nova.i18n import _
@@ -745,6 +746,64 @@ class Host(object):
 
         return doms
 
+    def get_power_states(self, only_guests=True):
+        """Get the power state of each nova instance by uuid
+
+        :param only_guests: True to filter out any host domain (eg Dom-0)
+
+        The domains which are running, paused or shut off are listed with
+        one listAllDomains() call for each of these states, so that their
+        state doesn't have to be queried one domain at a time. Only the
+        state of the domains in any other state, like crashed or suspended,
+        is queried for each of them. A domain changing state while they are
+        listed may be missing or have a stale state.
+
+        :returns: dict of the power states by instance uuid
+        """
+        if not self._skip_list_all_domains:
+            try:
+                return self._get_power_states_fast(only_guests)
+            except (libvirt.libvirtError, AttributeError) as ex:
+                LOG.info(_LI("Unable to use bulk domain list APIs, "
+                             "falling back to slow code path: %(ex)s"),
+                         {'ex': ex})
+                self._skip_list_all_domains = True
+
+        states = {}
+        for guest in self.list_guests(only_running=False,
+                                      only_guests=only_guests):
+            try:
+                states[guest.uuid] = guest.get_power_state(self)
+            except libvirt.libvirtError:
+                # Undefined since it was listed
+                continue
+        return states
+
+    def _get_power_states_fast(self, only_guests=True):
+        conn = self.get_connection()
+        states = {}
+        others = []
+        for flag, state in ((libvirt.VIR_CONNECT_LIST_DOMAINS_RUNNING,
+                             power_state.RUNNING),
+                            (libvirt.VIR_CONNECT_LIST_DOMAINS_PAUSED,
+                             power_state.PAUSED),
+                            (libvirt.VIR_CONNECT_LIST_DOMAINS_SHUTOFF,
+                             power_state.SHUTDOWN),
+                            (libvirt.VIR_CONNECT_LIST_DOMAINS_OTHER, None)):
+            for dom in conn.listAllDomains(flag):
+                if only_guests and dom.ID() == 0:
+                    continue
+                if state is None:
+                    others.append(libvirt_guest.Guest(dom))
+                else:
+                    states[dom.UUIDString()] = state
+        for guest in others:
+            try:
+                states[guest.uuid] = guest.get_power_state(self)
+            except libvirt.libvirtError:
+                continue
+        return states
+
     def get_online_cpus(self):
         """Get the set of CPUs that are online on the host
 
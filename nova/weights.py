@@ -18,11 +18,15 @@ Pluggable Weighing support
 """
 
 import abc
+import time
 
+from oslo_utils import importutils
 import six
 
 from nova import loadables
 
+np = importutils.try_import('numpy')
+
 
 def normalize(weight_list, minval=None, maxval=None):
     """Normalize the values in a list between 0 and 1.0.
@@ -53,6 +57,26 @@ def normalize(weight_list, minval=None, maxval=None):
     return ((i - minval) / range_ for i in weight_list)
 
 
+def normalize_array(weights, minval=None, maxval=None):
+    """Normalize the values of a NumPy array between 0 and 1.0.
+
+    This is the array counterpart of normalize(), with the same semantics
+    for minval and maxval.
+    """
+    if maxval is None:
+        maxval = weights.max()
+    if minval is None:
+        minval = weights.min()
+
+    maxval = float(maxval)
+    minval = float(minval)
+
+    if minval == maxval:
+        return np.zeros(len(weights))
+
+    return (weights - minval) / (maxval - minval)
+
+
 class WeighedObject(object):
     """Object with weight information."""
     def __init__(self, obj, weight):
@@ -117,18 +141,65 @@ class BaseWeigher(object):
 
         return weights
 
+    def weigh_array(self, obj_table, weight_properties):
+        """Weigh all the rows of a columnar table at once.
+
+        Override in a subclass which can compute the weights of all the
+        objects of obj_table in one go, and return an array with one weight
+        per row. Returning None means that there is no batch path for this
+        weigher and that weigh_objects() should be used instead.
+        """
+        return None
+
+    def _update_bounds(self, weights):
+        """Record the min and max values of a weight array, like
+        weigh_objects() does for each weight.
+        """
+        low = weights.min()
+        high = weights.max()
+        if self.minval is None or low < self.minval:
+            self.minval = low
+        if self.maxval is None or high > self.maxval:
+            self.maxval = high
+
 
 class BaseWeightHandler(loadables.BaseLoader):
     object_class = WeighedObject
 
-    def get_weighed_objects(self, weighers, obj_list, weighing_properties):
-        """Return a sorted (descending), normalized list of WeighedObjects."""
+    def _get_object_table(self, objs):
+        """Return a columnar table of objs for weighers with a batch path.
+
+        Override this in a subclass to enable BaseWeigher.weigh_array().
+        Returning None means that the objects are weighed one by one.
+        """
+        return None
+
+    def _weigher_done(self, weigher, elapsed, count):
+        """Called after each weigher run, with the time it took and the
+        number of objects it weighed.
+        """
+        pass
+
+    def get_weighed_objects(self, weighers, obj_list, weighing_properties,
+                            limit=None):
+        """Return a sorted (descending), normalized list of WeighedObjects.
+
+        If limit is set, only the first limit objects are returned.
+        """
+        obj_list = list(obj_list)
+        if len(obj_list) > 1:
+            obj_table = self._get_object_table(obj_list)
+            if obj_table is not None:
+                return self._get_weighed_objects_from_table(
+                    weighers, obj_table, weighing_properties, limit)
+
         weighed_objs = [self.object_class(obj, 0.0) for obj in obj_list]
 
         if len(weighed_objs) <= 1:
             return weighed_objs
 
         for weigher in weighers:
+            start_time = time.time()
             weights = weigher.weigh_objects(weighed_objs, weighing_properties)
 
             # Normalize the weights
@@ -139,5 +210,71 @@ class BaseWeightHandler(loadables.BaseLoader):
             for i, weight in enumerate(weights):
                 obj = weighed_objs[i]
                 obj.weight += weigher.weight_multiplier() * weight
+            self._weigher_done(weigher, time.time() - start_time,
+                               len(weighed_objs))
+
+        weighed_objs = sorted(weighed_objs, key=lambda x: x.weight,
+                              reverse=True)
+        if limit is not None:
+            weighed_objs = weighed_objs[:limit]
+        return weighed_objs
+
+    def get_weighed_object(self, weighers, obj, weighing_properties):
+        """Return a single WeighedObject for obj.
 
-        return sorted(weighed_objs, key=lambda x: x.weight, reverse=True)
+        The weights are normalized with the minval and maxval the weighers
+        recorded while weighing the previous lists of objects, so that the
+        result can be compared with the ones of get_weighed_objects().
+        """
+        weighed_obj = self.object_class(obj, 0.0)
+        for weigher in weighers:
+            weights = weigher.weigh_objects([weighed_obj],
+                                            weighing_properties)
+            weight = list(normalize(weights,
+                                    minval=weigher.minval,
+                                    maxval=weigher.maxval))[0]
+            weighed_obj.weight += weigher.weight_multiplier() * weight
+        return weighed_obj
+
+    def _get_weighed_objects_from_table(self, weighers, obj_table,
+                                        weighing_properties, limit):
+        """Array version of get_weighed_objects().
+
+        The weights of each weigher are normalized and summed as arrays, and
+        WeighedObjects are only built for the objects which are returned.
+        """
+        num_objs = len(obj_table)
+        totals = np.zeros(num_objs)
+        fallback_objs = None
+        for weigher in weighers:
+            start_time = time.time()
+            weights = weigher.weigh_array(obj_table, weighing_properties)
+            if weights is None:
+                # No batch path, so weigh the objects one by one
+                if fallback_objs is None:
+                    fallback_objs = [self.object_class(obj, 0.0)
+                                     for obj in obj_table.objs]
+                weights = np.array(weigher.weigh_objects(
+                    fallback_objs, weighing_properties), dtype=float)
+            else:
+                weights = np.asarray(weights, dtype=float)
+                weigher._update_bounds(weights)
+
+            totals += weigher.weight_multiplier() * normalize_array(
+                weights, minval=weigher.minval, maxval=weigher.maxval)
+            self._weigher_done(weigher, time.time() - start_time, num_objs)
+
+        if limit is not None and limit < num_objs:
+            # Only keep the rows which can make it to the top limit, ties
+            # with the last one included so that the result is the same as
+            # with a full (stable) sort.
+            threshold = np.partition(totals, num_objs - limit)[
+                num_objs - limit]
+            candidates = np.flatnonzero(totals >= threshold)
+        else:
+            candidates = np.arange(num_objs)
+        order = candidates[np.argsort(-totals[candidates], kind='mergesort')]
+        if limit is not None:
+            order = order[:limit]
+        return [self.object_class(obj_table.objs[i], float(totals[i]))
+                for i in order]